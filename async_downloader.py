@@ -0,0 +1,800 @@
+"""
+基于asyncio的下载核心，用于同时下载大量小文件
+
+所有传输在一个后台线程的事件循环中进行，共享按主机复用的HTTP连接池，每个进行中的任务
+只占用一个协程和一个读缓冲区，而不是一个线程。yt-dlp的提取和需要合并、转码的下载放到
+少量线程的执行器中运行。AsyncBatchDownloader与BatchDownloader的接口相同，
+图形界面和命令行可以直接替换使用。只用标准库，不依赖Qt。
+"""
+import asyncio
+import os
+import re
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote, urljoin, urlsplit
+
+from download_queue import DownloadQueue, JobCancelled, JobState
+from downloader_core import DownloadFailed, VideoDownloadTask, format_speed, metadata_cache
+from metrics import SIZE_BUCKETS, SPEED_BUCKETS, get_registry
+from playlist import PLAYLIST_OPTIONS, is_playlist_url
+from retry_policy import FAILURE_LABELS, RetryPolicy, classify_failure
+
+# 不经过yt-dlp提取、直接下载的文件扩展名
+DIRECT_MEDIA_EXTENSIONS = ('mp4', 'm4a', 'm4v', 'webm', 'mkv', 'mov', 'mp3', 'ogg', 'opus',
+                           'flac', 'wav', 'aac', 'ts', 'flv', 'jpg', 'png', 'vtt', 'srt')
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+_UNSAFE_FILENAME = re.compile(r'[\\/:*?"<>|\x00-\x1f]+')
+
+
+def is_direct_media_url(url):
+    """URL的路径以媒体文件扩展名结尾时返回True"""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        return False
+    return os.path.splitext(parts.path)[1][1:].lower() in DIRECT_MEDIA_EXTENSIONS
+
+
+def safe_filename(name, max_length=150):
+    name = _UNSAFE_FILENAME.sub('_', name).strip(' .')
+    return name[:max_length] or 'video'
+
+
+def pick_http_format(info, resolution=None):
+    """
+    从提取结果中选出可以一次下载完成的格式（音视频在同一个HTTP文件中），
+    返回 {'url', 'ext', 'format_id', 'headers', 'size'}；需要合并或不是HTTP直链时返回None
+    """
+    if info.get('_type') in ('playlist', 'multi_video'):
+        return None
+    limit = int(resolution.rstrip('p')) if resolution else None
+    candidates = []
+    for f in info.get('formats') or [info]:
+        if not f.get('url') or f.get('protocol', 'https') not in ('http', 'https'):
+            continue
+        if f.get('vcodec') == 'none' or f.get('acodec') == 'none':
+            continue
+        if limit and (f.get('height') or 0) > limit:
+            continue
+        candidates.append(f)
+    if not candidates:
+        return None
+    best = max(candidates, key=lambda f: (f.get('height') or 0, f.get('tbr') or 0))
+    return {'url': best['url'], 'ext': best.get('ext') or 'mp4', 'format_id': best.get('format_id'),
+            'headers': dict(best.get('http_headers') or {}),
+            'size': best.get('filesize') or best.get('filesize_approx')}
+
+
+class HTTPStatusError(OSError):
+    """服务器返回了错误状态码，消息格式与yt-dlp相同，便于classify_failure分类"""
+
+    def __init__(self, status, reason):
+        super().__init__(f"HTTP Error {status}: {reason}")
+        self.status = status
+
+
+class AsyncResponse:
+    """连接池返回的响应，按Content-Length、分块编码或读到连接关闭为止读取响应体"""
+
+    def __init__(self, pool, key, reader, writer, status, reason, headers, head_request=False):
+        self.pool = pool
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        length = headers.get('content-length')
+        self.length = int(length) if length and length.isdigit() else None
+        self.chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+        self.keep_alive = headers.get('connection', '').lower() != 'close'
+        self._remaining = 0 if head_request or status in (204, 304) else self.length
+        self._chunk_left = 0
+        self._done = self._remaining == 0
+        self._released = False
+
+    async def _read(self, n):
+        return await asyncio.wait_for(self.reader.read(n), self.pool.timeout)
+
+    async def _readline(self):
+        return await asyncio.wait_for(self.reader.readline(), self.pool.timeout)
+
+    async def read_chunk(self, size=64 * 1024):
+        """返回下一段数据，读完时返回b''；连接在响应结束前断开时抛出ConnectionError"""
+        if self._done:
+            return b''
+        if self.chunked:
+            if not self._chunk_left:
+                line = await self._readline()
+                if not line:
+                    raise ConnectionError("IncompleteRead: 连接在分块之间关闭")
+                self._chunk_left = int(line.split(b';', 1)[0].strip() or b'0', 16)
+                if not self._chunk_left:
+                    # 最后一个分块，跳过trailer
+                    while (await self._readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    self._done = True
+                    return b''
+            data = await self._read(min(size, self._chunk_left))
+            if not data:
+                raise ConnectionError("IncompleteRead: 连接在分块中间关闭")
+            self._chunk_left -= len(data)
+            if not self._chunk_left:
+                await self._readline()
+            return data
+        if self._remaining is None:
+            data = await self._read(size)
+            if not data:
+                self._done = True
+                self.keep_alive = False
+            return data
+        data = await self._read(min(size, self._remaining))
+        if not data:
+            raise ConnectionError(f"IncompleteRead: 还有 {self._remaining} 字节未收到")
+        self._remaining -= len(data)
+        self._done = not self._remaining
+        return data
+
+    async def read(self):
+        parts = []
+        while True:
+            data = await self.read_chunk()
+            if not data:
+                return b''.join(parts)
+            parts.append(data)
+
+    def release(self, reusable=True):
+        """归还连接；响应体没有读完或出错时关闭连接"""
+        if self._released:
+            return
+        self._released = True
+        self.pool._release(self.key, self.reader, self.writer,
+                           reusable and self._done and self.keep_alive)
+
+
+class AsyncConnectionPool:
+    """
+    按主机复用的HTTP/1.1连接池
+
+    每个主机最多max_per_host个同时使用的连接，超出时request()等待（为None时不限制）；
+    空闲连接保留下来给下一个请求，复用的连接已被服务器关闭时换一个新连接重发一次。
+    """
+
+    def __init__(self, max_per_host=16, timeout=30, user_agent='Mozilla/5.0'):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self._idle = {}
+        self._slots = {}
+        self._ssl = None
+        self.created = 0
+        self.reused = 0
+
+    def _slot(self, key):
+        if self.max_per_host is None:
+            return None
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = asyncio.Semaphore(self.max_per_host)
+        return slot
+
+    def _ssl_context(self):
+        if self._ssl is None:
+            self._ssl = ssl.create_default_context()
+        return self._ssl
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        self.created += 1
+        return await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=self._ssl_context() if scheme == 'https' else None),
+            self.timeout)
+
+    async def request(self, url, headers=None, method='GET', max_redirects=5):
+        """发送请求并读取响应头，返回AsyncResponse；调用方读完后须调用release()"""
+        for _ in range(max_redirects + 1):
+            parts = urlsplit(url)
+            if parts.scheme not in ('http', 'https') or not parts.hostname:
+                raise ValueError(f"不支持的URL: {url}")
+            key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+            slot = self._slot(key)
+            if slot is not None:
+                await slot.acquire()
+            try:
+                response = await self._send(key, parts, method, headers or {})
+            except BaseException:
+                if slot is not None:
+                    slot.release()
+                raise
+            location = response.headers.get('location')
+            if response.status in REDIRECT_STATUSES and location:
+                await response.read()
+                response.release()
+                url = urljoin(url, location)
+                if response.status == 303:
+                    method = 'GET'
+                continue
+            return response
+        raise HTTPStatusError(310, "Too many redirects")
+
+    async def _send(self, key, parts, method, headers):
+        host = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+        path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {host}", f"User-Agent: {self.user_agent}",
+                 "Accept: */*", "Accept-Encoding: identity"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items()
+                     if name.lower() not in ('host', 'accept-encoding', 'connection'))
+        payload = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+        idle = self._idle.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if writer.is_closing() or reader.at_eof():
+                writer.close()
+                continue
+            try:
+                self.reused += 1
+                return await self._exchange(key, reader, writer, payload, method)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # 空闲连接已被服务器关闭，换一个连接重发
+                writer.close()
+        reader, writer = await self._connect(key)
+        try:
+            return await self._exchange(key, reader, writer, payload, method)
+        except BaseException:
+            writer.close()
+            raise
+
+    async def _exchange(self, key, reader, writer, payload, method):
+        writer.write(payload)
+        await asyncio.wait_for(writer.drain(), self.timeout)
+        status_line = await asyncio.wait_for(reader.readline(), self.timeout)
+        if not status_line:
+            raise ConnectionError("空闲连接已关闭")
+        try:
+            _, status, reason = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+            status = int(status)
+        except ValueError:
+            raise ConnectionError(f"无效的响应: {status_line[:80]!r}")
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), self.timeout)
+            if line in (b'\r\n', b'\n'):
+                break
+            if not line:
+                raise asyncio.IncompleteReadError(b'', None)
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return AsyncResponse(self, key, reader, writer, status, reason, headers,
+                             head_request=method == 'HEAD')
+
+    def _release(self, key, reader, writer, reusable):
+        if reusable and not writer.is_closing():
+            self._idle.setdefault(key, []).append((reader, writer))
+        else:
+            writer.close()
+        slot = self._slot(key)
+        if slot is not None:
+            slot.release()
+
+    def close(self):
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+    def stats(self):
+        return {'created': self.created, 'reused': self.reused,
+                'idle': sum(len(c) for c in self._idle.values())}
+
+
+class AsyncDownloadQueue(DownloadQueue):
+    """
+    在事件循环中调度任务的DownloadQueue
+
+    runner(job) 是协程函数。max_workers为同时进行的任务数，可以设到几百上千；
+    每个任务是一个asyncio任务而不是线程。其他方法可以在任何线程中调用。
+    暂停的运行中任务在下一次checkpoint()时挂起，取消时直接取消协程。
+    """
+
+    def __init__(self, runner, max_workers=64, per_host_limit=16, on_event=None):
+        super().__init__(runner, max_workers=max_workers, per_host_limit=per_host_limit,
+                         on_event=on_event)
+        self.loop = asyncio.new_event_loop()
+        self._tasks = {}
+        self.peak_running = 0
+        self._loop_thread = threading.Thread(target=self._run_loop, daemon=True,
+                                             name="async-download-loop")
+        self._loop_thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _ensure_workers(self):
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._schedule)
+
+    def _schedule(self):
+        """在事件循环线程中启动可以开始的任务"""
+        started = []
+        with self._cond:
+            while not self._shutdown:
+                job = self._take_next()
+                if job is None:
+                    break
+                job.state = JobState.RUNNING
+                job.started_at = job.started_at or time.time()
+                if self._first_start is None:
+                    self._first_start = job.started_at
+                self._running += 1
+                self._running_per_host[job.host] = self._running_per_host.get(job.host, 0) + 1
+                started.append(job)
+            self.peak_running = max(self.peak_running, self._running)
+        for job in started:
+            self._tasks[job.id] = self.loop.create_task(self._run(job))
+
+    async def _run(self, job):
+        self._emit(job, 'started')
+        event = 'finished'
+        try:
+            job.result = await self.runner(job)
+            job.state = JobState.FINISHED
+        except (JobCancelled, asyncio.CancelledError):
+            job.state = JobState.CANCELLED
+            event = 'cancelled'
+        except Exception as e:
+            if job.cancelled:
+                job.state = JobState.CANCELLED
+                event = 'cancelled'
+            else:
+                job.error = str(e)
+                job.state = JobState.FAILED
+                event = 'failed'
+        job.finished_at = time.time()
+        self._tasks.pop(job.id, None)
+        with self._cond:
+            self._running -= 1
+            self._running_per_host[job.host] -= 1
+            self._cond.notify_all()
+        self._emit(job, event)
+        self._schedule()
+
+    async def checkpoint(self, job):
+        """在协程中调用：暂停时挂起，取消时抛出JobCancelled"""
+        if not job._resume_event.is_set():
+            while not job._resume_event.is_set() and not job.cancelled:
+                await asyncio.sleep(0.2)
+        if job.cancelled:
+            raise JobCancelled()
+
+    def resume(self, job_id):
+        resumed = super().resume(job_id)
+        if resumed:
+            self._ensure_workers()
+        return resumed
+
+    def cancel(self, job_id):
+        cancelled = super().cancel(job_id)
+        if cancelled and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._cancel_task, job_id)
+        return cancelled
+
+    def _cancel_task(self, job_id):
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+
+    def stats(self):
+        stats = super().stats()
+        stats['peak_active'] = self.peak_running
+        return stats
+
+    def shutdown(self, cancel_pending=True):
+        super().shutdown(cancel_pending)
+        if self.loop.is_closed():
+            return
+        if cancel_pending:
+            self.loop.call_soon_threadsafe(lambda: [task.cancel() for task in list(self._tasks.values())])
+
+    def close(self, timeout=5, finalize=None):
+        """停止事件循环，finalize在停止前于事件循环线程中调用；调用前应先shutdown()"""
+        if self.loop.is_closed():
+            return
+        deadline = time.monotonic() + timeout
+        while self._tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if finalize is not None:
+            self.loop.call_soon_threadsafe(finalize)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._loop_thread.join(timeout)
+        if not self.loop.is_running():
+            self.loop.close()
+
+
+class AsyncBatchDownloader:
+    """
+    与BatchDownloader接口相同的批量下载器，适合成千上万个小文件
+
+    直接指向媒体文件的URL不经过yt-dlp；其他URL在执行器中提取，选中的格式是单个HTTP文件时
+    在事件循环中下载，需要合并音视频、分片协议或转码时在执行器中交给VideoDownloadTask。
+    下载写入 .part 文件，重试时用Range续传。设置store时保存任务，重启后从 .part 继续。
+    不支持单个任务限速和边下边播（progressive），这两项选项被忽略。
+    """
+
+    def __init__(self, max_workers=64, per_host_limit=16, on_event=None, on_message=None,
+                 on_progress=None, quiet=True, cache=None, archive=None,
+                 transcode_preset='veryfast', transcode_threads=0, format_rules=None,
+                 progress_messages=True, bandwidth=None, store=None, retry_policy=None,
+                 playlist_window=20, playlist_extractors=(), on_target=None,
+                 extract_workers=4, chunk_size=64 * 1024, progress_interval=0.5, timeout=30):
+        self.on_event = on_event
+        self.on_message = on_message
+        self.on_progress = on_progress
+        self.quiet = quiet
+        self.cache = cache or metadata_cache
+        self.archive = archive
+        self.transcode_preset = transcode_preset
+        self.transcode_threads = transcode_threads
+        self.format_rules = format_rules
+        self.progress_messages = progress_messages
+        self.bandwidth = bandwidth
+        self.store = store
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.playlist_window = playlist_window
+        self.playlist_extractors = tuple(playlist_extractors)
+        self.on_target = on_target
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+        self.metrics = get_registry()
+        self._closing = False
+        self._counter_lock = threading.Lock()
+        self.archive_hits = 0
+        self.archive_misses = 0
+        self.extractions = 0
+        self.fallbacks = 0
+        # 提取和需要yt-dlp完成的下载；全局限速的等待放在单独的线程中，不阻塞事件循环
+        self.executor = ThreadPoolExecutor(max_workers=extract_workers, thread_name_prefix='async-extract')
+        self._throttle_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='async-throttle')
+        # 每个主机的并发由队列的per_host_limit限制（运行时可以调整），连接池本身不再限制
+        self.pool = AsyncConnectionPool(max_per_host=None, timeout=timeout)
+        self.queue = AsyncDownloadQueue(self.run_job, max_workers=max_workers,
+                                        per_host_limit=per_host_limit, on_event=self._on_event)
+
+    def add_urls(self, urls, download_dir, resolution=None, priority=0, engine='ffmpeg',
+                 byte_budget=None, rate_limit=None, playlist_filter=None, progressive=False):
+        options = {'download_dir': download_dir, 'resolution': resolution, 'engine': engine,
+                   'byte_budget': byte_budget, 'rate_limit': rate_limit}
+        options.update(playlist_filter or {})
+        return self.queue.submit_many(urls, priority=priority, options=options)
+
+    def restore(self):
+        """重新提交store中上次未完成的任务，返回恢复的任务列表"""
+        if self.store is None:
+            return []
+        jobs = []
+        for record in self.store.unfinished():
+            job = self.queue.submit(record['url'], priority=record.get('priority', 0),
+                                    options=record['options'])
+            if record.get('state') == JobState.PAUSED:
+                self.queue.pause(job.id)
+            jobs.append(job)
+        return jobs
+
+    def _on_event(self, job, event):
+        if self.store is not None and not self._closing:
+            # 在事件循环线程中调用，只有暂停和继续立即写入，其余合并写入
+            if event in ('finished', 'failed', 'cancelled'):
+                self.store.remove(job, force=False)
+            else:
+                self.store.save(job, force=event in ('paused', 'resumed'))
+        if self.on_event:
+            self.on_event(job, event)
+
+    def _message(self, job, msg):
+        if self.on_message:
+            self.on_message(job, msg)
+
+    def _in_executor(self, function, *args, executor=None):
+        return asyncio.get_running_loop().run_in_executor(executor or self.executor, function, *args)
+
+    # ---- 单个任务 ----
+
+    async def run_job(self, job):
+        options = job.options
+        if options.get('playlist') or (options.get('expand_playlist', True) and is_playlist_url(job.url)):
+            return await self.expand_playlist_job(job)
+        trace = {'trace': f'job-{job.id}', 'url': job.url}
+        if self.archive is not None:
+            entry = await self._in_executor(self.archive.lookup, job.url, options.get('resolution'))
+            with self._counter_lock:
+                if entry is not None:
+                    self.archive_hits += 1
+                else:
+                    self.archive_misses += 1
+            if entry is not None:
+                self._message(job, f"已下载过，跳过: {entry['path']}")
+                return entry['path']
+
+        media = options.get('media')
+        if media is None and not is_direct_media_url(job.url) and (
+                options.get('byte_budget') or self.format_rules):
+            # 按大小预算或评分规则选择格式
+            return await self._fallback(job)
+        if media is None and is_direct_media_url(job.url):
+            path = unquote(urlsplit(job.url).path)
+            stem, ext = os.path.splitext(os.path.basename(path))
+            media = {'url': job.url, 'ext': ext[1:].lower(), 'format_id': None, 'headers': {},
+                     'size': None, 'title': stem}
+        if media is None:
+            with self.metrics.span('extract', attrs=trace, engine='async'):
+                info = await self._in_executor(self._extract, job.url)
+            media = pick_http_format(info, options.get('resolution'))
+            if media is not None:
+                media['title'] = info.get('title') or info.get('id') or 'video'
+        if media is None:
+            # 需要合并音视频或者是分片协议
+            return await self._fallback(job)
+        return await self.transfer(job, media, trace)
+
+    def _extract(self, url):
+        import yt_dlp
+
+        info = self.cache.get(url)
+        if info is None:
+            with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
+                info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+            self.cache.put(url, info)
+            with self._counter_lock:
+                self.extractions += 1
+        return info
+
+    async def transfer(self, job, media, trace):
+        options = job.options
+        timestamp = options.setdefault('timestamp', time.strftime("%Y%m%d_%H%M%S"))
+        options['media'] = media
+        download_dir = options['download_dir']
+        path = os.path.join(download_dir, f"{safe_filename(media['title'])}_{timestamp}.{media['ext']}")
+        tmp_path = path + '.part'
+        os.makedirs(download_dir, exist_ok=True)
+        if self.store is not None:
+            # 保存文件名和直链，重启后从 .part 续传
+            self.store.save(job, force=False)
+        if self.on_target:
+            self.on_target(job, path)
+
+        attempt = 0
+        with self.metrics.span('task', attrs=trace, engine='async') as span:
+            while True:
+                await self.queue.checkpoint(job)
+                try:
+                    size = await self._fetch(job, media, path, tmp_path, trace)
+                    break
+                except (JobCancelled, asyncio.CancelledError):
+                    raise
+                except Exception as e:
+                    kind = classify_failure(e)
+                    attempt += 1
+                    job.failures.append(kind)
+                    if not self.retry_policy.should_retry(kind, attempt):
+                        raise DownloadFailed(f"{FAILURE_LABELS[kind]}: {str(e)}")
+                    job.retries += 1
+                    delay = self.retry_policy.delay(kind, attempt)
+                    self.metrics.inc('retries_total', kind=kind)
+                    self.metrics.event('retry', kind=kind, attempt=attempt, delay=round(delay, 3),
+                                       error=str(e)[:200], **trace)
+                    self._message(job, f"{FAILURE_LABELS[kind]}，{delay:.0f}秒后重试（第{attempt}次）: {str(e)}")
+                    deadline = time.monotonic() + delay
+                    while time.monotonic() < deadline:
+                        await self.queue.checkpoint(job)
+                        await asyncio.sleep(min(0.25, max(0.0, deadline - time.monotonic())))
+            os.replace(tmp_path, path)
+            span.set(bytes=size)
+        if self.archive is not None:
+            await self._in_executor(self.archive.record, job.url, path, options.get('resolution'),
+                                    media.get('format_id'))
+        return path
+
+    async def _fetch(self, job, media, path, tmp_path, trace):
+        """下载到临时文件，已有的部分用Range续传，返回文件大小"""
+        try:
+            offset = os.path.getsize(tmp_path)
+        except OSError:
+            offset = 0
+        headers = dict(media['headers'])
+        if offset:
+            headers['Range'] = f"bytes={offset}-"
+        response = await self.pool.request(media['url'], headers)
+        reusable = False
+        try:
+            if response.status == 416 and offset:
+                # 临时文件已经完整
+                await response.read()
+                reusable = True
+                return offset
+            if response.status >= 400:
+                raise HTTPStatusError(response.status, response.reason)
+            if response.status != 206:
+                offset = 0
+            total = offset + response.length if response.length is not None else media.get('size')
+            downloaded = offset
+            started = time.perf_counter()
+            wall_started = time.time()
+            last_report = 0.0
+            throttled = self.bandwidth is not None and (self.bandwidth.bucket.rate or self.bandwidth.schedule)
+            with open(tmp_path, 'ab' if offset else 'wb') as f:
+                while True:
+                    data = await response.read_chunk(self.chunk_size)
+                    if not data:
+                        break
+                    f.write(data)
+                    downloaded += len(data)
+                    delta = self.queue.record_bytes(job, path, downloaded)
+                    self.metrics.inc('downloaded_bytes_total', delta, engine='async')
+                    now = time.monotonic()
+                    if now - last_report >= self.progress_interval:
+                        last_report = now
+                        self._progress(job, 'downloading', path, tmp_path, downloaded, total,
+                                       time.perf_counter() - started, offset)
+                    await self.queue.checkpoint(job)
+                    if throttled:
+                        await self._in_executor(self.bandwidth.consume, len(data),
+                                                executor=self._throttle_executor)
+            if total and downloaded < total:
+                raise ConnectionError(f"IncompleteRead: {downloaded}/{total} 字节")
+            reusable = True
+        finally:
+            response.release(reusable)
+        seconds = time.perf_counter() - started
+        self._progress(job, 'finished', path, tmp_path, downloaded, downloaded, seconds, offset)
+        if downloaded > offset and seconds > 0:
+            self.metrics.observe('download_speed_bytes_per_second', (downloaded - offset) / seconds,
+                                 SPEED_BUCKETS, engine='async')
+        self.metrics.observe('download_size_bytes', downloaded, SIZE_BUCKETS, engine='async')
+        self.metrics.record_span('transfer', seconds, started=wall_started, engine='async',
+                                 attrs=dict(trace, file=os.path.basename(path), bytes=downloaded))
+        return downloaded
+
+    def _progress(self, job, status, path, tmp_path, downloaded, total, elapsed, offset):
+        if not self.on_progress and not (self.progress_messages and self.on_message):
+            return
+        speed = (downloaded - offset) / elapsed if elapsed > 0 else None
+        d = {'status': status, 'filename': path, 'tmpfilename': tmp_path,
+             'downloaded_bytes': downloaded, 'total_bytes': total, 'elapsed': elapsed, 'speed': speed,
+             'eta': (total - downloaded) / speed if speed and total else None}
+        if self.on_progress:
+            self.on_progress(job, d)
+        if self.progress_messages and status == 'downloading':
+            percent = f"{downloaded * 100 / total:.1f}%" if total else 'N/A'
+            self._message(job, f"下载进度: {percent} 速度: {format_speed(speed or 0)}")
+
+    async def _fallback(self, job):
+        """在执行器中用VideoDownloadTask下载（合并、分片协议、转码）"""
+        with self._counter_lock:
+            self.fallbacks += 1
+
+        def job_hook(d):
+            if d.get('status') in ('downloading', 'finished'):
+                downloaded = d.get('downloaded_bytes') or d.get('total_bytes') or 0
+                self.queue.record_bytes(job, d.get('filename', ''), downloaded)
+            if self.on_progress:
+                self.on_progress(job, d)
+            job.checkpoint()
+
+        task = VideoDownloadTask(
+            job.url, job.options['download_dir'],
+            preferred_resolution=job.options.get('resolution'),
+            engine=job.options.get('engine', 'ffmpeg'),
+            cache=self.cache,
+            archive=self.archive,
+            on_message=lambda msg: self._message(job, msg),
+            job_hook=job_hook,
+            quiet=self.quiet,
+            transcode_preset=self.transcode_preset,
+            transcode_threads=self.transcode_threads,
+            format_rules=self.format_rules,
+            byte_budget=job.options.get('byte_budget'),
+            progress_messages=self.progress_messages,
+            timestamp=job.options.get('timestamp'),
+            retry_policy=self.retry_policy,
+            on_target=(lambda path: self.on_target(job, path)) if self.on_target else None,
+            trace_id=f'job-{job.id}',
+        )
+        try:
+            return await self._in_executor(task.run)
+        except asyncio.CancelledError:
+            # 执行器中的线程无法直接取消，通过checkpoint让它尽快退出
+            job._cancelled = True
+            job._resume_event.set()
+            raise
+        finally:
+            job.timings['postprocess'] = sum(task.postprocess_times.values())
+            job.retries = task.retries
+            job.failures = list(task.failures)
+            job.wasted_bytes = task.wasted_bytes
+
+    async def expand_playlist_job(self, job):
+        """在执行器中列出播放列表并提交子任务，提交的规则与BatchDownloader相同"""
+        return await self._in_executor(self._expand_playlist, job)
+
+    def _expand_playlist(self, job):
+        from playlist import PlaylistFilter, iter_playlist
+
+        self._message(job, "正在获取播放列表...")
+        options = {k: v for k, v in job.options.items() if k not in PLAYLIST_OPTIONS}
+        options['expand_playlist'] = False
+        options.pop('store_key', None)
+        done = job.options.get('playlist_done', 0)
+        pending = []
+        count = 0
+        for index, url, entry in iter_playlist(job.url, PlaylistFilter.from_options(job.options),
+                                               start=done, extractors=self.playlist_extractors):
+            while True:
+                pending = [child for child in pending if child.state in (JobState.PENDING, JobState.RUNNING)]
+                waiting = sum(1 for child in pending if child.state == JobState.PENDING)
+                if waiting < self.playlist_window or len(pending) == waiting:
+                    break
+                job.checkpoint()
+                time.sleep(0.1)
+            job.checkpoint()
+            pending.append(self.queue.submit(url, priority=job.priority, options=options))
+            count += 1
+            job.options['playlist_done'] = index
+            if self.store is not None:
+                self.store.save(job, force=False)
+            if count % 100 == 0:
+                self._message(job, f"已添加 {count} 个视频...")
+        return f"播放列表已展开: {count} 个视频"
+
+    # ---- 统计和关闭 ----
+
+    def wait(self, timeout=None):
+        done = self.queue.wait(timeout)
+        if self.store is not None:
+            self.store.flush()
+        return done
+
+    def archive_stats(self):
+        with self._counter_lock:
+            lookups = self.archive_hits + self.archive_misses
+            return {
+                'hits': self.archive_hits,
+                'misses': self.archive_misses,
+                'hit_rate': self.archive_hits / lookups if lookups else 0.0,
+            }
+
+    def retry_stats(self):
+        by_kind = {}
+        retried_jobs = retries = wasted = 0
+        for job in list(self.queue.jobs.values()):
+            retries += job.retries
+            wasted += job.wasted_bytes
+            retried_jobs += 1 if job.retries else 0
+            for kind in job.failures:
+                by_kind[kind] = by_kind.get(kind, 0) + 1
+        return {'retries': retries, 'retried_jobs': retried_jobs, 'wasted_bytes': wasted,
+                'failures': by_kind}
+
+    def stats(self):
+        stats = self.queue.stats()
+        stats['retries'] = self.retry_stats()
+        stats['connections'] = self.pool.stats()
+        stats['extractions'] = self.extractions
+        stats['fallbacks'] = self.fallbacks
+        if self.archive is not None:
+            stats['archive'] = self.archive_stats()
+        return stats
+
+    def shutdown(self):
+        """停止所有任务并关闭事件循环；设置了store时未完成的任务保留在store中"""
+        self._closing = True
+        if self.store is not None:
+            self.store.flush()
+        self.queue.shutdown()
+        self.queue.close(finalize=self.pool.close)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self._throttle_executor.shutdown(wait=False, cancel_futures=True)
+
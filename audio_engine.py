@@ -0,0 +1,403 @@
+"""
+音频引擎：ffmpeg把音轨解码为PCM，分块写入固定容量的环形缓冲区；
+输出端（sink）按固定块大小调用render()取样本，音量在这里用numpy乘法实时生效。
+暂停、跳转和循环只改变缓冲区和解码位置，不重启线程。
+
+播放位置按输出端实际取走的样本计算，可以作为视频同步的主时钟
+（av_clock.MasterClock.set_audio_source(engine.position)）。
+输出端：PygameSink送到声卡；NullSink按实时速度丢弃样本，FileSink写WAV文件，用于没有声卡的环境和测试。
+"""
+import subprocess
+import threading
+import time
+import wave
+from collections import deque
+
+import numpy as np
+
+from toolchain import get_toolchain
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+
+
+def to_int16(block):
+    return (np.clip(block, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+class AudioRing:
+    """
+    固定容量的float32环形缓冲区（帧数 x 声道数）
+
+    written/consumed为累计写入和取出的帧数；markers记录每段数据开头对应的文件时间，
+    跳转和循环后的数据与之前的不连续，靠它换算播放位置。
+    """
+
+    def __init__(self, capacity, channels):
+        self.capacity = capacity
+        self.data = np.zeros((capacity, channels), dtype=np.float32)
+        self.written = 0
+        self.consumed = 0
+        self.markers = deque()
+
+    def available(self):
+        return self.written - self.consumed
+
+    def free(self):
+        return self.capacity - self.available()
+
+    def write(self, frames, pts=None):
+        """写入不超过free()帧；pts不为None时表示新的一段从这里开始"""
+        if pts is not None:
+            self.markers.append((self.written, pts))
+        count = len(frames)
+        start = self.written % self.capacity
+        first = min(count, self.capacity - start)
+        self.data[start:start + first] = frames[:first]
+        self.data[:count - first] = frames[first:]
+        self.written += count
+
+    def read(self, out):
+        """把缓冲区中的帧复制到out的开头，返回复制的帧数"""
+        count = min(len(out), self.available())
+        start = self.consumed % self.capacity
+        first = min(count, self.capacity - start)
+        out[:first] = self.data[start:start + first]
+        out[first:count] = self.data[:count - first]
+        self.consumed += count
+        while len(self.markers) > 1 and self.markers[1][0] <= self.consumed:
+            self.markers.popleft()
+        return count
+
+    def time_at_consumed(self, sample_rate):
+        """最后取出的样本对应的文件时间"""
+        if not self.markers:
+            return None
+        position, pts = self.markers[0]
+        return pts + (self.consumed - position) / sample_rate
+
+    def clear(self):
+        self.consumed = self.written
+        self.markers.clear()
+
+
+class AudioEngine:
+    """
+    一个文件的音频播放状态
+
+    构造后解码线程立即开始填充缓冲区，play()之前输出静音；文件没有音轨时has_audio为False。
+    loop为True时读到结尾自动从头继续解码。
+    """
+
+    def __init__(self, path, sample_rate=SAMPLE_RATE, channels=CHANNELS, buffer_seconds=2.0,
+                 chunk_frames=4096, loop=False):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.chunk_frames = chunk_frames
+        self.loop = loop
+        self.ring = AudioRing(int(buffer_seconds * sample_rate), channels)
+        self.volume = 1.0
+        self.paused = True
+        self.latency = 0.0  # 输出端的延迟（秒），由sink设置
+        self.has_audio = None
+        self.underruns = 0
+        self.loops = 0
+        self._cond = threading.Condition()
+        self._ready = threading.Event()
+        self._position = 0.0
+        self._rendered_at = None
+        self._block_seconds = 0.0
+        self._seek_target = 0.0
+        self._generation = 0
+        self._eof = False
+        self._running = True
+        self._process = None
+        self._thread = threading.Thread(target=self._decode, daemon=True, name="audio-decoder")
+        self._thread.start()
+
+    def _open(self, t):
+        cmd = [get_toolchain().ffmpeg_path or 'ffmpeg', '-v', 'error', '-nostdin']
+        if t > 0:
+            cmd += ['-ss', f'{t:.3f}']
+        cmd += ['-i', self.path, '-vn', '-sn', '-map', '0:a:0', '-f', 'f32le',
+                '-ac', str(self.channels), '-ar', str(self.sample_rate), 'pipe:1']
+        return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def _close_process(self):
+        process, self._process = self._process, None
+        if process is not None:
+            try:
+                process.kill()
+                process.wait(timeout=2)
+                process.stdout.close()
+            except Exception:
+                pass
+
+    def _decode(self):
+        frame_bytes = 4 * self.channels
+        pts = 0.0
+        new_segment = False
+        while True:
+            with self._cond:
+                while self._running and self._seek_target is None and (
+                        self._eof or self.ring.free() < self.chunk_frames):
+                    self._cond.wait()
+                if not self._running:
+                    break
+                target, self._seek_target = self._seek_target, None
+                generation = self._generation
+
+            if target is not None:
+                self._close_process()
+                self._process = self._open(target)
+                pts = target
+                new_segment = True
+                continue
+
+            data = self._process.stdout.read(self.chunk_frames * frame_bytes)
+            data = data[:len(data) - len(data) % frame_bytes]
+            with self._cond:
+                if generation != self._generation:
+                    # 解码期间发生了跳转，丢弃这一块
+                    continue
+                if not data:
+                    if self.has_audio is None:
+                        # 第一次解码就没有数据：文件没有音轨
+                        self.has_audio = False
+                        self._ready.set()
+                    if self.loop and self.has_audio:
+                        self._seek_target = 0.0
+                        self.loops += 1
+                    else:
+                        self._eof = True
+                    self._cond.notify_all()
+                    continue
+                frames = np.frombuffer(data, dtype=np.float32).reshape(-1, self.channels)
+                self.ring.write(frames, pts if new_segment else None)
+                new_segment = False
+                pts += len(frames) / self.sample_rate
+                if self.has_audio is None:
+                    self.has_audio = True
+                    self._ready.set()
+                self._cond.notify_all()
+        self._close_process()
+
+    def wait_ready(self, timeout=5.0):
+        """等到知道文件是否有音轨，返回has_audio"""
+        self._ready.wait(timeout)
+        return bool(self.has_audio)
+
+    def render(self, frames, wait=False):
+        """
+        输出端取frames帧，返回float32数组（不足的部分为静音），已经乘以音量
+
+        wait为True时等到缓冲区有足够的数据或解码结束（写文件时用），否则缓冲区不足记为一次欠载。
+        """
+        out = np.zeros((frames, self.channels), dtype=np.float32)
+        with self._cond:
+            if wait:
+                while (self._running and not self.paused and not self._eof
+                       and self.ring.available() < frames):
+                    self._cond.wait(0.1)
+            if self.paused or not self.has_audio:
+                return out
+            count = self.ring.read(out)
+            if count:
+                self._position = self.ring.time_at_consumed(self.sample_rate)
+                self._rendered_at = time.monotonic()
+                self._block_seconds = count / self.sample_rate
+                self._cond.notify_all()
+            if count < frames and not self._eof:
+                self.underruns += 1
+            volume = self.volume
+        if volume != 1.0:
+            out *= volume
+        return out
+
+    @property
+    def finished(self):
+        with self._cond:
+            return (self._eof and self.ring.available() == 0) or self.has_audio is False
+
+    def position(self):
+        """
+        当前听到的位置（秒）；没有音轨或已经播完时返回None，主时钟改用自己的计时
+
+        render()之间按经过的时间在最后一块之内插值，位置不会按块跳变。
+        """
+        with self._cond:
+            if not self.has_audio or (self._eof and self.ring.available() == 0):
+                return None
+            position = self._position
+            if self._rendered_at is not None:
+                elapsed = 0.0 if self.paused else time.monotonic() - self._rendered_at
+                position += min(elapsed, self._block_seconds) - self._block_seconds
+            return max(0.0, position - self.latency)
+
+    def play(self):
+        with self._cond:
+            self.paused = False
+            self._cond.notify_all()
+
+    def pause(self):
+        with self._cond:
+            self.paused = True
+
+    def seek(self, t):
+        """跳转到t秒：清空缓冲区，解码线程从新位置继续"""
+        with self._cond:
+            self.ring.clear()
+            self._generation += 1
+            self._seek_target = max(0.0, t)
+            self._position = max(0.0, t)
+            self._rendered_at = None
+            self._eof = False
+            self._cond.notify_all()
+
+    def set_volume(self, volume):
+        """音量（1.0为原始音量），下一块输出立即生效"""
+        with self._cond:
+            self.volume = max(0.0, float(volume))
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._close_process()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+
+    def stats(self):
+        with self._cond:
+            return {'underruns': self.underruns, 'loops': self.loops,
+                    'buffered_seconds': self.ring.available() / self.sample_rate}
+
+
+class NullSink:
+    """
+    没有声卡时的输出端：在后台线程中按实时速度从引擎取样本并丢弃
+
+    engine可以随时替换（播放下一个文件），为None时什么也不取。
+    """
+
+    latency = 0.0
+
+    def __init__(self, engine=None, block_frames=1024, realtime=True, sample_rate=SAMPLE_RATE):
+        self.engine = engine
+        self.block_frames = block_frames
+        self.realtime = realtime
+        self.sample_rate = sample_rate
+        self.blocks = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def set_engine(self, engine):
+        if engine is not None:
+            engine.latency = self.latency
+        self.engine = engine
+
+    def start(self):
+        if self.engine is not None:
+            self.engine.latency = self.latency
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="audio-sink")
+            self._thread.start()
+
+    def _run(self):
+        interval = self.block_frames / self.sample_rate
+        next_at = time.monotonic()
+        while not self._stopped.is_set():
+            engine = self.engine
+            if engine is not None:
+                if not self.realtime and engine.finished:
+                    break
+                self.write(engine.render(self.block_frames, wait=not self.realtime))
+                self.blocks += 1
+            if self.realtime or engine is None:
+                next_at += interval
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    self._stopped.wait(delay)
+                else:
+                    next_at = time.monotonic()
+
+    def write(self, block):
+        pass
+
+    def wait(self, timeout=None):
+        """非实时模式下等到引擎播完"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+
+
+class FileSink(NullSink):
+    """把输出写入WAV文件（16位），默认不按实时速度，播完为止"""
+
+    def __init__(self, path, engine=None, block_frames=1024, realtime=False,
+                 sample_rate=SAMPLE_RATE, channels=CHANNELS):
+        super().__init__(engine, block_frames, realtime, sample_rate)
+        self.wav = wave.open(path, 'wb')
+        self.wav.setnchannels(channels)
+        self.wav.setsampwidth(2)
+        self.wav.setframerate(sample_rate)
+
+    def write(self, block):
+        self.wav.writeframes(to_int16(block).tobytes())
+
+    def close(self):
+        super().close()
+        if self.wav is not None:
+            self.wav.close()
+            self.wav = None
+
+
+class PygameSink(NullSink):
+    """
+    通过pygame.mixer输出到声卡：后台线程在声道的队列空出时送入下一块
+
+    mixer只负责播放，音量已经在render()中乘过。
+    """
+
+    def __init__(self, engine=None, block_frames=2048, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+        import pygame
+
+        super().__init__(engine, block_frames, True, sample_rate)
+        pygame.mixer.init(frequency=sample_rate, size=-16, channels=channels, buffer=1024)
+        self.pygame = pygame
+        self.channel = pygame.mixer.Channel(0)
+        # 正在播放的一块之后还排着一块
+        self.latency = 1.5 * block_frames / sample_rate
+
+    def _run(self):
+        poll = self.block_frames / self.sample_rate / 4
+        while not self._stopped.is_set():
+            engine = self.engine
+            if engine is not None and self.channel.get_queue() is None:
+                sound = self.pygame.mixer.Sound(buffer=to_int16(engine.render(self.block_frames)).tobytes())
+                if self.channel.get_busy():
+                    self.channel.queue(sound)
+                else:
+                    self.channel.play(sound)
+                self.blocks += 1
+            self._stopped.wait(poll)
+
+    def close(self):
+        super().close()
+        self.channel.stop()
+        self.pygame.mixer.quit()
+
+
+def open_sink(engine=None):
+    """打开声卡输出，没有可用的音频设备时使用NullSink（画面仍按实时速度播放）"""
+    try:
+        return PygameSink(engine)
+    except Exception as e:
+        print(f"无法打开音频设备，静音播放: {e}")
+        return NullSink(engine)
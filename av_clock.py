@@ -0,0 +1,133 @@
+import threading
+import time
+
+
+class MasterClock:
+    """
+    播放主时钟
+
+    基于单调时钟计时；设置了音频位置源后以音频播放位置为准，
+    每次读取时用音频位置重新锚定，视频跟随音频。
+    """
+
+    def __init__(self, time_source=time.monotonic):
+        self.time_source = time_source
+        self.audio_source = None
+        self._lock = threading.Lock()
+        self._anchor_position = 0.0
+        self._anchor_time = None
+        self._paused_at = None
+
+    def set_audio_source(self, audio_source):
+        """audio_source() 返回音频当前播放位置（秒），不可用时返回None"""
+        self.audio_source = audio_source
+
+    def start(self, position=0.0):
+        with self._lock:
+            self._anchor_position = position
+            self._anchor_time = self.time_source()
+            self._paused_at = None
+
+    def anchor(self, position):
+        """用外部报告的播放位置（例如音频开始播放的时刻）重新锚定时钟"""
+        self.start(position)
+
+    def pause(self):
+        with self._lock:
+            if self._paused_at is None and self._anchor_time is not None:
+                self._paused_at = self._position_locked()
+
+    def resume(self):
+        with self._lock:
+            if self._paused_at is not None:
+                self._anchor_position = self._paused_at
+                self._anchor_time = self.time_source()
+                self._paused_at = None
+
+    @property
+    def running(self):
+        return self._anchor_time is not None and self._paused_at is None
+
+    def _position_locked(self):
+        if self._paused_at is not None:
+            return self._paused_at
+        if self._anchor_time is None:
+            return 0.0
+        return self._anchor_position + (self.time_source() - self._anchor_time)
+
+    def time(self):
+        """当前播放位置（秒）"""
+        if self.audio_source is not None and self._paused_at is None:
+            position = self.audio_source()
+            if position is not None:
+                with self._lock:
+                    self._anchor_position = position
+                    self._anchor_time = self.time_source()
+                return position
+        with self._lock:
+            return self._position_locked()
+
+
+class FrameScheduler:
+    """
+    根据主时钟决定每一帧的处理方式：等待后显示、立即显示（迟到）或丢弃，
+    解码跟不上时重复上一帧，并统计漂移、丢帧和迟到帧
+    """
+
+    SHOW = 'show'
+    DROP = 'drop'
+
+    def __init__(self, clock, fps, late_tolerance=None, drop_threshold=None):
+        self.clock = clock
+        self.frame_interval = 1.0 / fps if fps and fps > 0 else 0.033
+        # 晚于这个时间显示的帧计为迟到帧
+        self.late_tolerance = late_tolerance if late_tolerance is not None else self.frame_interval / 2
+        # 晚于这个时间的帧直接丢弃
+        self.drop_threshold = drop_threshold if drop_threshold is not None else self.frame_interval * 2
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.presented_frames = 0
+        self.dropped_frames = 0
+        self.late_frames = 0
+        self.repeated_frames = 0
+        self.last_drift = 0.0
+        self.max_drift = 0.0
+        self._drift_total = 0.0
+
+    def schedule(self, pts):
+        """
+        返回 (动作, 等待秒数)
+
+        帧还没到显示时间时返回需要等待的时间；已经落后超过drop_threshold时返回DROP
+        """
+        lateness = self.clock.time() - pts
+        if lateness > self.drop_threshold:
+            self.dropped_frames += 1
+            return self.DROP, 0.0
+        return self.SHOW, max(0.0, -lateness)
+
+    def frame_presented(self, pts):
+        """在帧实际显示后调用，记录显示时刻与时间戳之间的漂移"""
+        drift = self.clock.time() - pts
+        self.presented_frames += 1
+        self.last_drift = drift
+        self.max_drift = max(self.max_drift, abs(drift))
+        self._drift_total += abs(drift)
+        if drift > self.late_tolerance:
+            self.late_frames += 1
+
+    def frame_repeated(self):
+        """解码没有及时提供新帧，重复显示上一帧"""
+        self.repeated_frames += 1
+
+    def stats(self):
+        return {
+            'presented_frames': self.presented_frames,
+            'dropped_frames': self.dropped_frames,
+            'late_frames': self.late_frames,
+            'repeated_frames': self.repeated_frames,
+            'last_drift': self.last_drift,
+            'max_drift': self.max_drift,
+            'average_drift': self._drift_total / self.presented_frames if self.presented_frames else 0.0,
+        }
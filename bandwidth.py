@@ -0,0 +1,218 @@
+"""
+带宽调度：所有下载共享的全局令牌桶、单个任务的速度上限和按时段切换的限速
+
+速度单位都是字节/秒，None或0表示不限速。限速可以在下载过程中随时修改，
+正在等待令牌的下载线程会在下一次检查时使用新的速度。
+"""
+import re
+import threading
+import time
+
+_RATE_UNITS = {'': 1, 'B': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_rate(text):
+    """解析 '500K'、'2M'、'1.5MiB'、'0' 等速度写法，返回字节/秒，0或空表示不限速"""
+    if text is None:
+        return None
+    if isinstance(text, (int, float)):
+        return text or None
+    match = re.fullmatch(r'\s*([\d.]+)\s*([KMG]?)(?:I?B)?(?:/S)?\s*', text.upper())
+    if not match:
+        raise ValueError(f"无法解析的速度: {text}")
+    rate = float(match.group(1)) * _RATE_UNITS[match.group(2)]
+    return int(rate) or None
+
+
+def _parse_clock(text):
+    hours, minutes = text.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+class ScheduleWindow:
+    """每天 start-end（HH:MM）时段内的全局限速，end早于start时表示跨越午夜"""
+
+    def __init__(self, start, end, rate):
+        self.start = _parse_clock(start) if isinstance(start, str) else start
+        self.end = _parse_clock(end) if isinstance(end, str) else end
+        self.rate = rate
+
+    def contains(self, minute_of_day):
+        if self.start <= self.end:
+            return self.start <= minute_of_day < self.end
+        return minute_of_day >= self.start or minute_of_day < self.end
+
+    def __repr__(self):
+        return (f"<ScheduleWindow {self.start // 60:02d}:{self.start % 60:02d}-"
+                f"{self.end // 60:02d}:{self.end % 60:02d} rate={self.rate}>")
+
+
+def parse_schedule(text):
+    """解析 '01:00-07:00=0,07:00-01:00=2M' 形式的时段限速"""
+    windows = []
+    for part in (text or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        span, _, rate = part.partition('=')
+        start, _, end = span.partition('-')
+        windows.append(ScheduleWindow(start.strip(), end.strip(), parse_rate(rate.strip() or '0')))
+    return windows
+
+
+class TokenBucket:
+    """令牌桶限速器，consume(n) 阻塞到可以发送n字节为止"""
+
+    def __init__(self, rate=None, burst=None, time_source=time.monotonic):
+        self.time_source = time_source
+        self._cond = threading.Condition()
+        self._rate = None
+        self._burst_setting = burst
+        self._burst = 0
+        self._tokens = 0.0
+        self._updated = time_source()
+        self.consumed = 0
+        self.waited = 0.0
+        self.set_rate(rate)
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def set_rate(self, rate):
+        """修改速度，立即对正在等待的线程生效"""
+        with self._cond:
+            self._refill()
+            self._rate = rate or None
+            # 桶容量约为0.25秒的流量，避免限速后出现较大的突发
+            self._burst = self._burst_setting or (max(16 * 1024, int(self._rate / 4)) if self._rate else 0)
+            self._tokens = min(self._tokens, self._burst)
+            self._cond.notify_all()
+
+    def _refill(self):
+        now = self.time_source()
+        if self._rate:
+            self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def consume(self, nbytes):
+        while nbytes > 0:
+            with self._cond:
+                if not self._rate:
+                    self.consumed += nbytes
+                    return
+                chunk = min(nbytes, self._burst)
+                started = self.time_source()
+                while True:
+                    self._refill()
+                    if not self._rate:
+                        break
+                    chunk = min(chunk, self._burst)
+                    if self._tokens >= chunk:
+                        self._tokens -= chunk
+                        break
+                    # 速度可能被修改，最多等待0.2秒后重新计算
+                    self._cond.wait(min((chunk - self._tokens) / self._rate, 0.2))
+                self.waited += self.time_source() - started
+                self.consumed += chunk
+            nbytes -= chunk
+
+
+class JobRateLimiter:
+    """单个任务的限速器，同时受任务自己的上限和全局限速约束"""
+
+    def __init__(self, scheduler, job_id, rate=None):
+        self.scheduler = scheduler
+        self.job_id = job_id
+        self.bucket = TokenBucket(rate, time_source=scheduler.time_source)
+
+    @property
+    def active(self):
+        """当前是否有任何限速（任务上限、全局限速或时段限速）"""
+        return bool(self.bucket.rate or self.scheduler.bucket.rate or self.scheduler.schedule)
+
+    def set_rate(self, rate):
+        self.bucket.set_rate(rate)
+
+    def consume(self, nbytes):
+        self.bucket.consume(nbytes)
+        self.scheduler.consume(nbytes)
+
+
+class BandwidthScheduler:
+    """
+    全局带宽调度器
+
+    global_rate为默认的全局限速；schedule中的时段匹配当前时间时改用该时段的限速。
+    limiter_for(job_id) 返回任务的限速器，可以交给ParallelDownloader的rate_limiter参数。
+    """
+
+    def __init__(self, global_rate=None, schedule=None, per_job_rate=None,
+                 time_source=time.monotonic, clock=time.localtime):
+        self.time_source = time_source
+        self.clock = clock
+        self.global_rate = global_rate
+        self.schedule = list(schedule or [])
+        self.per_job_rate = per_job_rate
+        self.bucket = TokenBucket(time_source=time_source)
+        self._lock = threading.Lock()
+        self._limiters = {}
+        self._checked_at = None
+        self.apply_schedule()
+
+    def current_rate(self):
+        """当前时段生效的全局限速"""
+        now = self.clock()
+        minute = now.tm_hour * 60 + now.tm_min
+        for window in self.schedule:
+            if window.contains(minute):
+                return window.rate
+        return self.global_rate
+
+    def apply_schedule(self):
+        rate = self.current_rate()
+        if rate != self.bucket.rate:
+            self.bucket.set_rate(rate)
+        self._checked_at = self.time_source()
+
+    def set_global_rate(self, rate):
+        self.global_rate = rate
+        self.apply_schedule()
+
+    def set_schedule(self, schedule):
+        self.schedule = list(schedule or [])
+        self.apply_schedule()
+
+    def set_job_rate(self, job_id, rate):
+        with self._lock:
+            limiter = self._limiters.get(job_id)
+        if limiter is not None:
+            limiter.set_rate(rate)
+
+    def limiter_for(self, job_id, rate=None):
+        with self._lock:
+            limiter = self._limiters.get(job_id)
+            if limiter is None:
+                limiter = JobRateLimiter(self, job_id, rate or self.per_job_rate)
+                self._limiters[job_id] = limiter
+            return limiter
+
+    def release(self, job_id):
+        with self._lock:
+            self._limiters.pop(job_id, None)
+
+    def consume(self, nbytes):
+        # 每秒检查一次是否进入了新的时段
+        if self.time_source() - self._checked_at >= 1.0:
+            self.apply_schedule()
+        self.bucket.consume(nbytes)
+
+    def stats(self):
+        with self._lock:
+            jobs = {job_id: limiter.bucket.rate for job_id, limiter in self._limiters.items()}
+        return {
+            'global_rate': self.bucket.rate,
+            'consumed': self.bucket.consumed,
+            'waited': self.bucket.waited,
+            'job_rates': jobs,
+        }
@@ -0,0 +1,238 @@
+"""
+大量小文件的下载：对比线程下载核心和asyncio下载核心在不同并发数下的任务吞吐量、
+线程数和每个进行中任务的内存占用
+
+本地服务器是一个用asyncio实现的HTTP/1.1替身（支持keep-alive和Range，每个请求附加固定延迟，
+模拟远程服务器的往返时间），在单独的进程中运行；每种配置也在单独的进程中运行，内存互不影响。
+所有URL指向同一个短视频的硬链接。
+
+用法:
+    python benchmarks/bench_async.py --jobs 1000 --latency 0.2 --configs threads:16,async:64,async:512
+    python benchmarks/bench_async.py --extract    # 每个任务都先经过yt-dlp提取
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import unquote, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import generate_video
+
+CONTENT_TYPES = {'.mp4': 'video/mp4', '.webm': 'video/webm', '.m4a': 'audio/mp4'}
+
+
+# ---- HTTP替身服务器 ----
+
+async def serve_connection(reader, writer, root, latency, files):
+    try:
+        while True:
+            head = await reader.readuntil(b'\r\n\r\n')
+            lines = head.decode('latin-1').split('\r\n')
+            method, target, _ = lines[0].split(' ', 2)
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(':')
+                if value:
+                    headers[name.strip().lower()] = value.strip()
+            if latency:
+                await asyncio.sleep(latency)
+            path = os.path.join(root, os.path.basename(unquote(urlsplit(target).path)))
+            try:
+                # 所有文件是同一个文件的硬链接，按inode只读取一次
+                inode = os.stat(path).st_ino
+                if inode not in files:
+                    with open(path, 'rb') as f:
+                        files[inode] = f.read()
+                data = files[inode]
+            except OSError:
+                writer.write(b'HTTP/1.1 404 File not found\r\nContent-Length: 0\r\n\r\n')
+                await writer.drain()
+                continue
+            status = '200 OK'
+            extra = ''
+            range_header = headers.get('range', '')
+            if range_header.startswith('bytes='):
+                start_text, _, end_text = range_header[6:].partition('-')
+                start = int(start_text or 0)
+                end = min(int(end_text), len(data) - 1) if end_text else len(data) - 1
+                if start >= len(data):
+                    writer.write(f'HTTP/1.1 416 Range Not Satisfiable\r\nContent-Range: bytes */{len(data)}\r\n'
+                                 f'Content-Length: 0\r\n\r\n'.encode('latin-1'))
+                    await writer.drain()
+                    continue
+                status = '206 Partial Content'
+                extra = f'Content-Range: bytes {start}-{end}/{len(data)}\r\n'
+                data = data[start:end + 1]
+            content_type = CONTENT_TYPES.get(os.path.splitext(path)[1], 'application/octet-stream')
+            writer.write(f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(data)}\r\n'
+                         f'Accept-Ranges: bytes\r\n{extra}\r\n'.encode('latin-1'))
+            if method != 'HEAD':
+                writer.write(data)
+            await writer.drain()
+            if headers.get('connection', '').lower() == 'close':
+                break
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(root, latency):
+    files = {}
+    server = await asyncio.start_server(
+        lambda reader, writer: serve_connection(reader, writer, root, latency, files),
+        '127.0.0.1', 0, backlog=4096)
+    print(server.sockets[0].getsockname()[1], flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def start_stand_in(root, latency):
+    """在子进程中启动服务器，返回 (进程, base_url)"""
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', root,
+                                '--latency', str(latency)], stdout=subprocess.PIPE, text=True)
+    port = int(process.stdout.readline())
+    return process, f'http://127.0.0.1:{port}'
+
+
+# ---- 单个配置（在子进程中运行） ----
+
+def run_client(core, concurrency, urls, out_dir, extract):
+    import process_stats
+
+    from download_queue import JobState
+
+    if core == 'async':
+        import async_downloader
+        if extract:
+            async_downloader.is_direct_media_url = lambda url: False
+        batch = async_downloader.AsyncBatchDownloader(max_workers=concurrency, per_host_limit=concurrency,
+                                                      progress_messages=False)
+    else:
+        from downloader_core import BatchDownloader
+        batch = BatchDownloader(max_workers=concurrency, per_host_limit=concurrency, quiet=True,
+                                progress_messages=False)
+    baseline = process_stats.snapshot()
+    peak = {'rss_bytes': baseline['rss_bytes'], 'threads': baseline['threads'], 'active': 0}
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            snapshot = process_stats.snapshot()
+            peak['rss_bytes'] = max(peak['rss_bytes'], snapshot['rss_bytes'] or 0)
+            peak['threads'] = max(peak['threads'], snapshot['threads'])
+            peak['active'] = max(peak['active'], batch.queue._running)
+            done.wait(0.02)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    started = time.perf_counter()
+    batch.add_urls(urls, out_dir, engine='native')
+    batch.wait()
+    elapsed = time.perf_counter() - started
+    done.set()
+    sampler.join()
+    stats = batch.stats()
+    batch.shutdown()
+    errors = sorted({job.error for job in batch.queue.jobs.values() if job.state == JobState.FAILED})
+    active = stats.get('peak_active') or peak['active']
+    result = {
+        'core': core,
+        'concurrency': concurrency,
+        'jobs': len(urls),
+        'finished': stats['jobs'][JobState.FINISHED],
+        'seconds': round(elapsed, 3),
+        'jobs_per_second': round(len(urls) / elapsed, 1),
+        'peak_active': active,
+        'peak_threads': peak['threads'],
+        'baseline_rss_mib': round(baseline['rss_bytes'] / 2 ** 20, 1),
+        'peak_rss_mib': round(peak['rss_bytes'] / 2 ** 20, 1),
+        'kib_per_active_job': round((peak['rss_bytes'] - baseline['rss_bytes']) / max(1, active) / 1024, 1),
+        'errors': errors[:3],
+    }
+    if 'connections' in stats:
+        result['connections'] = stats['connections']
+        result['extractions'] = stats['extractions']
+        result['fallbacks'] = stats['fallbacks']
+    return result
+
+
+def run_config(core, concurrency, work_dir, extract):
+    url_file = os.path.join(work_dir, 'urls.txt')
+    out_dir = tempfile.mkdtemp(dir=work_dir)
+    command = [sys.executable, os.path.abspath(__file__), '--run', f'{core}:{concurrency}',
+               '--url-file', url_file, '--output', out_dir]
+    if extract:
+        command.append('--extract')
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="大量小文件下载的吞吐量和内存占用")
+    parser.add_argument('--jobs', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=1, help="测试视频的时长（秒）")
+    parser.add_argument('--size', default='160x90')
+    parser.add_argument('--latency', type=float, default=0.2, help="服务器对每个请求的延迟（秒）")
+    parser.add_argument('--configs', default='threads:16,async:64,async:256,async:1024',
+                        help="逗号分隔的 核心:并发数")
+    parser.add_argument('--extract', action='store_true', help="异步核心对每个URL也先用yt-dlp提取")
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'ytdl_fixtures'))
+    # 内部使用：服务器进程和单个配置的进程
+    parser.add_argument('--serve', help=argparse.SUPPRESS)
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    parser.add_argument('--url-file', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        asyncio.run(serve(args.serve, args.latency))
+        return
+    if args.run:
+        # 两种核心都会加载yt-dlp，先加载好，不计入配置之间比较的内存基线
+        importlib.import_module('yt_dlp')
+        core, concurrency = args.run.split(':')
+        with open(args.url_file, encoding='utf-8') as f:
+            urls = f.read().split()
+        print(json.dumps(run_client(core, int(concurrency), urls, args.output, args.extract)))
+        return
+
+    clip = generate_video(os.path.join(args.fixtures, f'clip_{args.size}_{args.duration:g}s.mp4'),
+                          duration=args.duration, size=args.size, fps=15)
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        serve_dir = os.path.join(work_dir, 'serve')
+        os.makedirs(serve_dir)
+        for i in range(args.jobs):
+            os.link(clip, os.path.join(serve_dir, f'clip_{i:05d}.mp4'))
+        server, base_url = start_stand_in(serve_dir, args.latency)
+        try:
+            with open(os.path.join(work_dir, 'urls.txt'), 'w', encoding='utf-8') as f:
+                f.write('\n'.join(f'{base_url}/clip_{i:05d}.mp4' for i in range(args.jobs)))
+            for config in args.configs.split(','):
+                core, concurrency = config.split(':')
+                results.append(run_config(core, int(concurrency), work_dir, args.extract))
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(json.dumps({
+        'jobs': args.jobs,
+        'file_bytes': os.path.getsize(clip),
+        'latency': args.latency,
+        'extract': args.extract,
+        'cpus': os.cpu_count(),
+        'results': results,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""
+音频引擎的时钟和控制测试，不需要声卡：
+NullSink按实时速度播放时播放位置相对于挂钟的误差、跳转到听到新位置的延迟、
+循环和反复跳转时线程数是否不变，以及FileSink写出的音量增益；
+NullSink收到的样本数与挂钟时间不符、误差或延迟超过上限时以非零状态退出
+
+用法:
+    python benchmarks/bench_audio.py --seconds 5 --seeks 20
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import generate_video
+
+DURATION = 20
+# 各项检查的上限
+MAX_CLOCK_ERROR_MS = 20.0
+MAX_SEEK_LATENCY_MS = 250.0
+MAX_GAIN_ERROR = 0.01
+
+
+def counting_sink(engine, realtime=True):
+    """统计收到的帧数和非静音帧数的NullSink"""
+    from audio_engine import NullSink
+
+    class CountingSink(NullSink):
+        frames = 0
+        audible_frames = 0
+
+        def write(self, block):
+            self.frames += len(block)
+            self.audible_frames += int(np.count_nonzero(np.any(block != 0, axis=1)))
+
+    return CountingSink(engine, realtime=realtime)
+
+
+def clock_case(path, seconds):
+    """实时播放seconds秒，每50毫秒比较一次播放位置和挂钟经过的时间，并检查NullSink收到的帧数"""
+    from audio_engine import AudioEngine
+
+    engine = AudioEngine(path)
+    engine.wait_ready()
+    sink = counting_sink(engine)
+    sink_started = time.monotonic()
+    sink.start()
+    engine.play()
+    started = None
+    errors = []
+    while True:
+        time.sleep(0.05)
+        position = engine.position()
+        now = time.monotonic()
+        if started is None:
+            # 第一块输出之后开始计时，只看之后的漂移
+            if position:
+                started = now - position
+            continue
+        errors.append(position - (now - started))
+        if now - started >= seconds:
+            break
+    stats = engine.stats()
+    sink.close()
+    elapsed = time.monotonic() - sink_started
+    engine.close()
+    # 实时输出端按挂钟取样本，允许两块的误差（启动和关闭时各一块）
+    expected = elapsed * engine.sample_rate
+    max_error_ms = max(abs(e) for e in errors) * 1000
+    problems = []
+    if abs(sink.frames - expected) > 2 * sink.block_frames + expected * 0.01:
+        problems.append(f"sink frames {sink.frames} != {expected:.0f}")
+    if sink.audible_frames < sink.frames * 0.98:
+        problems.append(f"audible frames {sink.audible_frames} of {sink.frames}")
+    if max_error_ms > MAX_CLOCK_ERROR_MS:
+        problems.append(f"max_error_ms {max_error_ms:.2f} > {MAX_CLOCK_ERROR_MS}")
+    if stats['underruns']:
+        problems.append(f"underruns {stats['underruns']}")
+    return {'case': 'clock', 'seconds': seconds, 'samples': len(errors),
+            'max_error_ms': round(max_error_ms, 2),
+            'final_drift_ms': round(errors[-1] * 1000, 2), 'underruns': stats['underruns'],
+            'sink_frames': sink.frames, 'expected_frames': round(expected), 'problems': problems}
+
+
+def seek_case(path, seeks, duration):
+    """随机跳转，测量从seek()到播放位置越过目标的时间，线程数应保持不变"""
+    from audio_engine import AudioEngine, NullSink
+
+    engine = AudioEngine(path)
+    engine.wait_ready()
+    sink = NullSink(engine)
+    sink.start()
+    engine.play()
+    time.sleep(0.2)
+    threads = threading.active_count()
+    rng = np.random.default_rng(0)
+    latencies = []
+    for target in rng.uniform(0, duration - 2, seeks):
+        started = time.perf_counter()
+        engine.seek(target)
+        while (engine.position() or 0.0) <= target:
+            time.sleep(0.001)
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.1)
+    # 循环播放点同样只是一次跳转
+    engine.seek(duration - 0.2)
+    time.sleep(0.3)
+    engine.seek(0)
+    time.sleep(0.1)
+    result = {'case': 'seek', 'seeks': seeks,
+              'average_latency_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+              'max_latency_ms': round(max(latencies) * 1000, 2),
+              'threads_unchanged': threading.active_count() == threads}
+    result['problems'] = []
+    if result['max_latency_ms'] > MAX_SEEK_LATENCY_MS:
+        result['problems'].append(f"max_latency_ms {result['max_latency_ms']} > {MAX_SEEK_LATENCY_MS}")
+    if not result['threads_unchanged']:
+        result['problems'].append("thread count changed")
+    sink.close()
+    engine.close()
+    return result
+
+
+def render_wav(path, out, volume):
+    from audio_engine import AudioEngine, FileSink
+
+    engine = AudioEngine(path)
+    engine.set_volume(volume)
+    engine.wait_ready()
+    sink = FileSink(out, engine)
+    engine.play()
+    sink.start()
+    sink.wait()
+    sink.close()
+    engine.close()
+    with wave.open(out) as wav:
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16).astype(np.float64)
+        seconds = wav.getnframes() / wav.getframerate()
+    return float(np.sqrt(np.mean(samples ** 2))), seconds, engine
+
+
+def volume_case(path, directory, volume):
+    """整个文件分别按原始音量和volume写出WAV，比较均方根"""
+    full, seconds, _ = render_wav(path, os.path.join(directory, 'full.wav'), 1.0)
+    scaled, _, engine = render_wav(path, os.path.join(directory, 'scaled.wav'), volume)
+    gain = scaled / full
+    problems = []
+    if abs(gain - volume) > MAX_GAIN_ERROR:
+        problems.append(f"gain {gain:.4f} != {volume}")
+    # AAC编码器在结尾补齐的样本不超过一帧（1024个）
+    if abs(seconds - DURATION) > 0.1:
+        problems.append(f"rendered_seconds {seconds:.3f} != {DURATION}")
+    return {'case': 'volume', 'volume': volume, 'rendered_seconds': round(seconds, 3),
+            'measured_gain': round(gain, 4), 'underruns': engine.underruns, 'problems': problems}
+
+
+def loop_case(path, seconds):
+    """loop=True时不按实时速度取样本seconds秒，统计从头循环的次数"""
+    from audio_engine import AudioEngine
+
+    engine = AudioEngine(path, loop=True)
+    engine.wait_ready()
+    sink = counting_sink(engine, realtime=False)
+    engine.play()
+    sink.start()
+    # 循环期间反复查看线程数，应当一直是同一组线程
+    counts = set()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        counts.add(threading.active_count())
+        time.sleep(0.05)
+    sink.close()
+    engine.close()
+    rendered = sink.frames / engine.sample_rate
+    problems = []
+    # 收到的样本应当正好是循环次数个文件长度，加上最后一遍中的一部分
+    if abs(rendered / DURATION - engine.loops) > 1:
+        problems.append(f"loops {engine.loops} for {rendered:.1f}s of samples")
+    if sink.audible_frames < sink.frames * 0.98:
+        problems.append(f"audible frames {sink.audible_frames} of {sink.frames}")
+    if engine.underruns:
+        problems.append(f"underruns {engine.underruns}")
+    if len(counts) != 1:
+        problems.append("thread count changed")
+    return {'case': 'loop', 'loops': engine.loops, 'rendered_seconds': round(rendered, 1),
+            'underruns': engine.underruns, 'threads_unchanged': len(counts) == 1, 'problems': problems}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="音频引擎的时钟和控制测试")
+    parser.add_argument('--seconds', type=float, default=5.0, help="实时播放的时长")
+    parser.add_argument('--seeks', type=int, default=20)
+    parser.add_argument('--volume', type=float, default=0.5)
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'ytdl_fixtures'))
+    args = parser.parse_args()
+
+    path = generate_video(os.path.join(args.fixtures, f'engine_1280x720_{DURATION}s.mp4'), duration=DURATION,
+                          size='1280x720')
+    results = [clock_case(path, args.seconds), seek_case(path, args.seeks, DURATION), loop_case(path, 2.0)]
+    with tempfile.TemporaryDirectory() as directory:
+        results.append(volume_case(path, directory, args.volume))
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False))
+    if any(result['problems'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
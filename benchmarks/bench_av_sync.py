@@ -0,0 +1,161 @@
+"""
+音视频同步测试：无界面运行MediaPlayer的渲染循环，模拟较慢的帧处理，
+输出主时钟调度的漂移、丢帧、迟到帧和重复帧计数
+
+--synthetic 不解码也不启动Qt，用虚拟时间和合成的时间戳驱动MasterClock和FrameScheduler，
+检查几种负载下的漂移、丢帧和迟到帧不超过上限，超过时以非零状态退出
+
+用法:
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_av_sync.py --render-ms 20
+    python benchmarks/bench_av_sync.py --synthetic
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import generate_video
+
+
+# 合成场景：名称、帧率、时长、每帧解码/显示耗时（毫秒）、解码耗时的随机抖动（毫秒）、
+# 音频回调的周期（秒，None为不跟随音频）和回调的延迟抖动（毫秒），以及漂移（秒）、丢帧比例和迟到帧比例的上限
+SYNTHETIC_CASES = [
+    dict(name='steady_60fps', fps=60, seconds=10, decode_ms=2, render_ms=5, jitter_ms=0, audio_period=None,
+         max_drift=0.003, max_dropped=0.0, max_late=0.0),
+    dict(name='jittery_decode', fps=30, seconds=10, decode_ms=5, render_ms=5, jitter_ms=20, audio_period=None,
+         max_drift=1 / 15, max_dropped=0.05, max_late=0.2),
+    dict(name='slow_render', fps=60, seconds=10, decode_ms=2, render_ms=20, jitter_ms=0, audio_period=None,
+         max_drift=1 / 30, max_dropped=0.3, max_late=1.0),
+    dict(name='audio_clock', fps=30, seconds=10, decode_ms=2, render_ms=5, jitter_ms=0, audio_period=1024 / 48000,
+         audio_jitter_ms=5, max_drift=0.006, max_dropped=0.0, max_late=0.0),
+]
+
+
+class VirtualTime:
+    """代替time.monotonic的虚拟时间，只在模拟的耗时和等待中前进"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += max(0.0, seconds)
+
+
+def run_synthetic(case, seed=0):
+    """按MediaPlayer渲染循环的顺序调度合成的时间戳，返回调度统计和超出上限的项目"""
+    from av_clock import FrameScheduler, MasterClock
+
+    rng = random.Random(seed)
+    virtual = VirtualTime()
+    clock = MasterClock(time_source=virtual)
+    period = case['audio_period']
+    if period:
+        # 声卡按块回调，每次回调比预定时间晚0~audio_jitter_ms；和AudioEngine.position()一样在块内插值
+        delays = [rng.uniform(0, case['audio_jitter_ms']) / 1000.0
+                  for _ in range(int(case['seconds'] / period) + 2)]
+
+        def audio_position():
+            block = int(virtual.now / period)
+            if virtual.now < block * period + delays[block]:
+                block -= 1
+            if block < 0:
+                return 0.0
+            return block * period + min(virtual.now - (block * period + delays[block]), period)
+
+        clock.set_audio_source(audio_position)
+    scheduler = FrameScheduler(clock, case['fps'])
+    clock.start(0)
+    total = int(case['seconds'] * case['fps'])
+    for index in range(total):
+        pts = index / case['fps']
+        virtual.advance((case['decode_ms'] + rng.uniform(0, case['jitter_ms'])) / 1000.0)
+        action, wait_time = scheduler.schedule(pts)
+        if action == FrameScheduler.DROP:
+            continue
+        while wait_time > 0:
+            # time.sleep至少睡眠约1毫秒
+            virtual.advance(min(max(wait_time, 0.001), 0.05))
+            wait_time = pts - clock.time()
+        scheduler.frame_presented(pts)
+        virtual.advance(case['render_ms'] / 1000.0)
+
+    stats = scheduler.stats()
+    failures = []
+    if stats['max_drift'] > case['max_drift']:
+        failures.append(f"max_drift {stats['max_drift']:.4f} > {case['max_drift']:.4f}")
+    if stats['dropped_frames'] > total * case['max_dropped']:
+        failures.append(f"dropped_frames {stats['dropped_frames']} > {total * case['max_dropped']:.0f}")
+    if stats['late_frames'] > stats['presented_frames'] * case['max_late']:
+        failures.append(f"late_frames {stats['late_frames']} > {stats['presented_frames'] * case['max_late']:.0f}")
+    if stats['presented_frames'] + stats['dropped_frames'] != total:
+        failures.append(f"handled {stats['presented_frames'] + stats['dropped_frames']} of {total} frames")
+    return dict(case=case['name'], frames=total, sync=stats, failures=failures)
+
+
+def synthetic_main():
+    results = [run_synthetic(case) for case in SYNTHETIC_CASES]
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False))
+    if any(result['failures'] for result in results):
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="音视频同步测试")
+    parser.add_argument('--size', default='1280x720')
+    parser.add_argument('--fps', type=int, default=60)
+    parser.add_argument('--duration', type=int, default=6)
+    parser.add_argument('--render-ms', type=float, default=20.0, help="模拟每帧的显示耗时")
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'ytdl_fixtures'))
+    parser.add_argument('--synthetic', action='store_true', help="只用合成的时间戳检查调度，不解码")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        synthetic_main()
+        return
+
+    from decode_engine import FrameDecoder
+    from main import MediaPlayer, PlaybackSession
+
+    path = os.path.join(args.fixtures, f'sync_{args.size}_{args.fps}fps_{args.duration}s.mp4')
+    generate_video(path, duration=args.duration, size=args.size, fps=args.fps)
+
+    # 只有画面的会话，时钟不跟随音频
+    player = MediaPlayer()
+    session = PlaybackSession(path)
+    session.decoder = FrameDecoder(path, buffer_bytes=player.frame_cache_bytes)
+    player.playing = True
+
+    # 直接连接的槽在渲染线程中执行，用来模拟显示耗时
+    player.frame_ready.connect(lambda frame: time.sleep(args.render_ms / 1000.0))
+
+    started = time.monotonic()
+    stopper = threading.Timer(args.duration - 0.5, lambda: setattr(player, 'playing', False))
+    stopper.start()
+    player.play_session(session)
+    session.close()
+    wall = time.monotonic() - started
+
+    stats = player.sync_stats()
+    played = stats['presented_frames'] + stats['dropped_frames']
+    print(json.dumps({
+        'clip': path,
+        'render_ms': args.render_ms,
+        'wall_seconds': round(wall, 3),
+        'clock_seconds': round(player.clock.time(), 3),
+        'frames_handled': played,
+        'sync': stats,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+带宽调度验证：从本地服务器下载测试文件，按固定间隔采样已下载字节数，
+对比全局限速、单任务限速和运行中修改限速时实际达到的速度
+
+用法:
+    python benchmarks/bench_bandwidth.py --rate 2M
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import generate_video
+from benchmarks.media_server import start_server
+
+
+def run_batch(urls, scheduler, engine, change=None, sample_interval=0.25):
+    """下载urls并返回 [(时间, 累计字节)] 采样；change=(秒, 回调) 在指定时间修改限速"""
+    from downloader_core import BatchDownloader
+    from metadata_cache import MetadataCache
+
+    samples = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        batch = BatchDownloader(max_workers=len(urls), per_host_limit=len(urls), quiet=True,
+                                cache=MetadataCache(), bandwidth=scheduler)
+        batch.add_urls(urls, out_dir, engine=engine)
+        started = time.perf_counter()
+        changed = change is None
+        while not batch.wait(timeout=sample_interval):
+            elapsed = time.perf_counter() - started
+            samples.append((elapsed, batch.stats()['total_bytes']))
+            if not changed and elapsed >= change[0]:
+                change[1]()
+                changed = True
+        samples.append((time.perf_counter() - started, batch.stats()['total_bytes']))
+        failed = [job.error for job in batch.queue.jobs.values() if job.error]
+        batch.shutdown()
+    return samples, failed
+
+
+def rate_between(samples, start, end):
+    """start到end秒之间的平均速度（字节/秒）"""
+    window = [s for s in samples if start <= s[0] <= end]
+    if len(window) < 2:
+        return None
+    (t0, b0), (t1, b1) = window[0], window[-1]
+    return round((b1 - b0) / (t1 - t0)) if t1 > t0 else None
+
+
+def main():
+    from bandwidth import BandwidthScheduler, parse_rate
+
+    parser = argparse.ArgumentParser(description="带宽调度验证")
+    parser.add_argument('--rate', default='2M', help="全局限速")
+    parser.add_argument('--job-rate', default='512K', help="单任务限速")
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'ytdl_fixtures'))
+    args = parser.parse_args()
+    rate = parse_rate(args.rate)
+    job_rate = parse_rate(args.job_rate)
+
+    path = os.path.join(args.fixtures, 'engine_1280x720_20s.mp4')
+    generate_video(path, duration=20, size='1280x720', extra_args=['-b:v', '4M'])
+    # 每个任务使用不同的文件名，避免输出文件重名
+    names = []
+    for i in range(3):
+        name = f'bandwidth_{i}.mp4'
+        if not os.path.exists(os.path.join(args.fixtures, name)):
+            os.link(path, os.path.join(args.fixtures, name))
+        names.append(name)
+    server, base_url = start_server(args.fixtures)
+    urls = [f"{base_url}/{name}" for name in names]
+
+    results = []
+
+    samples, failed = run_batch(urls, BandwidthScheduler(global_rate=rate), 'native')
+    results.append({'case': 'global_native_3_jobs', 'limit': rate,
+                    'achieved': rate_between(samples, 1.0, samples[-1][0] - 0.5), 'errors': failed})
+
+    samples, failed = run_batch(urls[:1], BandwidthScheduler(global_rate=rate), 'ffmpeg')
+    results.append({'case': 'global_ytdlp_downloader', 'limit': rate,
+                    'achieved': rate_between(samples, 1.0, samples[-1][0] - 0.5), 'errors': failed})
+
+    samples, failed = run_batch(urls[:2], BandwidthScheduler(per_job_rate=job_rate), 'native')
+    results.append({'case': 'per_job_2_jobs', 'limit': job_rate * 2,
+                    'achieved': rate_between(samples, 1.0, samples[-1][0] - 0.5), 'errors': failed})
+
+    scheduler = BandwidthScheduler(global_rate=rate // 2)
+    samples, failed = run_batch(urls[:1], scheduler, 'native',
+                                change=(3.0, lambda: scheduler.set_global_rate(rate * 2)))
+    results.append({'case': 'runtime_change', 'limit_before': rate // 2, 'limit_after': rate * 2,
+                    'achieved_before': rate_between(samples, 0.5, 3.0),
+                    'achieved_after': rate_between(samples, 3.5, samples[-1][0] - 0.5),
+                    'errors': failed})
+
+    server.shutdown()
+
+    # 界面的情况：开始时没有限速，默认ffmpeg引擎，下载过程中才设置限速；
+    # 服务器限制为限速的4倍，设置限速时下载还没有结束
+    server, base_url = start_server(args.fixtures, bandwidth=rate * 4)
+    scheduler = BandwidthScheduler()
+    samples, failed = run_batch([f"{base_url}/{names[0]}"], scheduler, 'ffmpeg',
+                                change=(0.5, lambda: scheduler.set_global_rate(rate)))
+    results.append({'case': 'limit_set_after_start', 'limit_after': rate,
+                    'achieved_after': rate_between(samples, 1.0, samples[-1][0] - 0.5),
+                    'errors': failed})
+    server.shutdown()
+
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
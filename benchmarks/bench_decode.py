@@ -0,0 +1,91 @@
+"""
+解码性能测试：对比moviepy逐时间戳get_frame与FrameDecoder顺序解码的帧率和每帧CPU时间
+
+用法:
+    python benchmarks/bench_decode.py --size 1920x1080 --duration 10
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import generate_video
+
+
+def cpu_seconds():
+    """当前进程及已结束子进程的CPU时间"""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def measure(name, decode_all):
+    cpu_start = cpu_seconds()
+    wall_start = time.perf_counter()
+    frames = decode_all()
+    wall = time.perf_counter() - wall_start
+    cpu = cpu_seconds() - cpu_start
+    return {
+        'path': name,
+        'frames': frames,
+        'seconds': round(wall, 3),
+        'fps': round(frames / wall, 1) if wall > 0 else 0.0,
+        'cpu_ms_per_frame': round(cpu * 1000 / frames, 3) if frames else None,
+    }
+
+
+def decode_moviepy(path):
+    from moviepy.editor import VideoFileClip
+
+    def run():
+        clip = VideoFileClip(path, audio=False)
+        frames = 0
+        t = 0.0
+        interval = 1.0 / clip.fps
+        # 与原来的MediaPlayer.run一样按时间戳取帧
+        while t < clip.duration:
+            clip.get_frame(t)
+            frames += 1
+            t += interval
+        clip.close()
+        return frames
+    return run
+
+
+def decode_engine(path, backend):
+    from decode_engine import FrameDecoder
+
+    def run():
+        decoder = FrameDecoder(path, backend=backend)
+        frames = 0
+        while decoder.read(timeout=5.0) is not None:
+            frames += 1
+        decoder.close()
+        return frames
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解码性能测试")
+    parser.add_argument('--size', default='1920x1080')
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--duration', type=int, default=10)
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'ytdl_fixtures'))
+    args = parser.parse_args()
+
+    path = os.path.join(args.fixtures, f'decode_{args.size}_{args.fps}fps_{args.duration}s.mp4')
+    generate_video(path, duration=args.duration, size=args.size, fps=args.fps)
+
+    results = [
+        measure('moviepy.get_frame', decode_moviepy(path)),
+        measure('FrameDecoder(cv2)', decode_engine(path, 'cv2')),
+        measure('FrameDecoder(ffmpeg)', decode_engine(path, 'ffmpeg')),
+    ]
+    print(json.dumps({'clip': path, 'results': results}, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
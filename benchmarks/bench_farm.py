@@ -0,0 +1,116 @@
+"""
+多进程下载：从限速的本地服务器下载一组测试视频，对比不同工作进程数的吞吐量，
+再在下载中途强制结束一个工作进程，检查它的任务是否被重新分配并全部完成
+
+用法:
+    python benchmarks/bench_farm.py --videos 8 --workers 1,4 --bandwidth 1000000
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import ensure_fixtures
+from benchmarks.media_server import start_server
+
+
+def run_farm(urls, workers, work_dir, engine, lease, kill_after=None):
+    from download_farm import DownloadFarm
+
+    queue_path = os.path.join(work_dir, f'farm_{workers}_{int(time.time() * 1000)}.sqlite3')
+    farm = DownloadFarm(queue_path, workers=workers, lease_seconds=lease)
+    farm.add_urls(urls, os.path.splitext(queue_path)[0] + '_out', engine=engine)
+    killed = {}
+
+    def kill_one():
+        # 等到有任务正在下载，强制结束持有它的进程
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline and not killed:
+            running = farm.queue.jobs(state='running')
+            pids = {w['id']: w['pid'] for w in farm.queue.workers()}
+            for job in running:
+                pid = pids.get(job['worker'])
+                if pid:
+                    time.sleep(kill_after)
+                    os.kill(pid, signal.SIGKILL)
+                    killed.update(job=job['id'], pid=pid, at=round(time.monotonic() - started, 2))
+                    return
+            time.sleep(0.05)
+
+    started = time.monotonic()
+    farm.start()
+    killer = None
+    if kill_after is not None:
+        killer = threading.Thread(target=kill_one, daemon=True)
+        killer.start()
+    done = farm.wait(timeout=600)
+    elapsed = time.monotonic() - started
+    stats = farm.stats()
+    jobs = farm.queue.jobs()
+    farm.shutdown()
+    result = {
+        'workers': workers,
+        'completed': done,
+        'seconds': round(elapsed, 2),
+        'jobs_per_second': round(len(urls) / elapsed, 3),
+        'bytes_per_second': round(stats['total_bytes'] / elapsed),
+        'jobs': stats['jobs'],
+        'reassigned': stats['reassigned'],
+        'restarts': stats['restarts'],
+        'jobs_per_worker': sorted(w['finished'] for w in stats['workers']),
+        'downloaded_bytes': stats['metrics']['counters'].get(f'downloaded_bytes_total{{engine={engine}}}'),
+    }
+    if kill_after is not None:
+        result['killed'] = killed
+        killed_job = next((job for job in jobs if job['id'] == killed.get('job')), None)
+        if killed_job is not None:
+            result['killed_job'] = {key: killed_job[key] for key in ('state', 'attempts', 'reassigned', 'worker')}
+            result['killed_job']['resumed_bytes'] = killed_job['stats'].get('resumed_bytes')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程下载的吞吐量和故障恢复")
+    parser.add_argument('--videos', type=int, default=8)
+    parser.add_argument('--duration', type=int, default=10)
+    parser.add_argument('--workers', default='1,4', help="逗号分隔的工作进程数")
+    parser.add_argument('--bandwidth', type=int, default=1000000, help="每个连接的带宽（字节/秒）")
+    parser.add_argument('--engine', choices=['ffmpeg', 'native'], default='native')
+    parser.add_argument('--lease', type=float, default=3.0, help="租约秒数，故障测试中决定多久后重新分配")
+    parser.add_argument('--kill-after', type=float, default=2.0, help="任务开始多少秒后结束工作进程，负数不测试")
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'ytdl_fixtures'))
+    args = parser.parse_args()
+
+    paths = ensure_fixtures(args.fixtures, count=args.videos, duration=args.duration)
+    server, base_url = start_server(args.fixtures, bandwidth=args.bandwidth)
+    urls = [f"{base_url}/{os.path.basename(path)}" for path in paths]
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        counts = [int(n) for n in args.workers.split(',')]
+        for workers in counts:
+            results.append(run_farm(urls, workers, work_dir, args.engine, args.lease))
+        if args.kill_after >= 0:
+            fault = run_farm(urls, max(counts), work_dir, args.engine, args.lease, kill_after=args.kill_after)
+    server.shutdown()
+
+    output = {
+        'videos': len(urls),
+        'total_bytes': sum(os.path.getsize(path) for path in paths),
+        'per_connection_bandwidth': args.bandwidth,
+        'cpus': os.cpu_count(),
+        'results': results,
+    }
+    if args.kill_after >= 0:
+        output['worker_killed'] = fault
+    print(json.dumps(output, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
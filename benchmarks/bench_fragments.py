@@ -0,0 +1,71 @@
+"""
+下载引擎对比：从按连接限速的本地Range服务器下载同一个文件，
+对比ffmpeg外部下载器和内置并行引擎的耗时与吞吐量
+
+用法:
+    python benchmarks/bench_fragments.py --bandwidth 2000000 --duration 30
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import generate_video
+from benchmarks.media_server import start_server
+
+
+def run_engine(url, engine, out_dir):
+    from downloader_core import VideoDownloadTask, DownloadFailed
+    from metadata_cache import MetadataCache
+
+    task = VideoDownloadTask(url, out_dir, engine=engine, cache=MetadataCache(), quiet=True)
+    result = {}
+    started = time.perf_counter()
+    try:
+        result['path'] = task.run()
+    except DownloadFailed as e:
+        result['error'] = str(e)
+    elapsed = time.perf_counter() - started
+    size = os.path.getsize(result['path']) if 'path' in result else 0
+    return {
+        'engine': engine,
+        'seconds': round(elapsed, 3),
+        'bytes': size,
+        'throughput': round(size / elapsed) if elapsed else 0,
+        'error': result.get('error') if 'path' not in result else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="下载引擎对比")
+    parser.add_argument('--bandwidth', type=int, default=2000000, help="每个连接的带宽（字节/秒）")
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--duration', type=int, default=30)
+    parser.add_argument('--size', default='1280x720')
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'ytdl_fixtures'))
+    args = parser.parse_args()
+
+    path = os.path.join(args.fixtures, f'engine_{args.size}_{args.duration}s.mp4')
+    generate_video(path, duration=args.duration, size=args.size, extra_args=['-b:v', '4M'])
+    server, base_url = start_server(args.fixtures, latency=args.latency, bandwidth=args.bandwidth)
+    url = f"{base_url}/{os.path.basename(path)}"
+
+    results = []
+    for engine in ('ffmpeg', 'native'):
+        with tempfile.TemporaryDirectory() as out_dir:
+            results.append(run_engine(url, engine, out_dir))
+    server.shutdown()
+
+    print(json.dumps({
+        'file_bytes': os.path.getsize(path),
+        'per_connection_bandwidth': args.bandwidth,
+        'results': results,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
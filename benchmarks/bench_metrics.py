@@ -0,0 +1,94 @@
+"""
+指标的开销和输出：测量计数器、直方图和区间每次记录的耗时（有无JSON lines输出），
+再用两种引擎从本地服务器下载，检查日志中记录的阶段并抓取一次 /metrics
+
+用法:
+    python benchmarks/bench_metrics.py --ops 100000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import generate_video
+from benchmarks.media_server import start_server
+
+
+def per_op_ns(fn, ops):
+    started = time.perf_counter()
+    for _ in range(ops):
+        fn()
+    return round((time.perf_counter() - started) / ops * 1e9)
+
+
+def overhead(ops, log_path):
+    from metrics import MetricsRegistry, JsonLinesSink
+
+    registry = MetricsRegistry()
+
+    def span():
+        with registry.span('bench', engine='native'):
+            pass
+
+    result = {
+        'inc_ns': per_op_ns(lambda: registry.inc('bench_total', engine='native'), ops),
+        'observe_ns': per_op_ns(lambda: registry.observe('bench_seconds', 0.01, engine='native'), ops),
+        'span_ns': per_op_ns(span, ops),
+    }
+    sink = registry.add_sink(JsonLinesSink(log_path))
+    result['span_with_log_ns'] = per_op_ns(span, ops)
+    sink.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="指标开销和输出")
+    parser.add_argument('--ops', type=int, default=100000)
+    parser.add_argument('--duration', type=int, default=10)
+    parser.add_argument('--bandwidth', type=int, default=0)
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'ytdl_fixtures'))
+    args = parser.parse_args()
+
+    import metrics
+    from benchmarks.bench_fragments import run_engine
+
+    with tempfile.TemporaryDirectory() as work:
+        cost = overhead(args.ops, os.path.join(work, 'overhead.jsonl'))
+
+        path = os.path.join(args.fixtures, f'metrics_{args.duration}s.mp4')
+        generate_video(path, duration=args.duration, size='640x360')
+        server, base_url = start_server(args.fixtures, bandwidth=args.bandwidth)
+        url = f"{base_url}/{os.path.basename(path)}"
+
+        log_path = os.path.join(work, 'metrics.jsonl')
+        outputs = metrics.configure(log_path=log_path, port=0)
+        downloads = [run_engine(url, engine, os.path.join(work, engine)) for engine in ('ffmpeg', 'native')]
+        with urllib.request.urlopen(outputs['server'].url, timeout=5) as response:
+            text = response.read().decode('utf-8')
+        metrics.shutdown()
+        server.shutdown()
+
+        with open(log_path, encoding='utf-8') as f:
+            events = [json.loads(line) for line in f]
+
+    stages = Counter((e.get('engine', '-'), e['stage']) for e in events if e['type'] == 'span')
+    samples = [line for line in text.splitlines() if line and not line.startswith('#')]
+    print(json.dumps({
+        'ops': args.ops,
+        'overhead': cost,
+        'downloads': downloads,
+        'log_events': len(events),
+        'spans': {f'{engine}/{stage}': count for (engine, stage), count in sorted(stages.items())},
+        'prometheus_samples': len(samples),
+        'prometheus_metrics': sorted({line.split('{')[0].split(' ')[0] for line in samples}),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+批量后期处理：在本地生成的测试视频上执行同一组步骤（换容器、提取音频、截取片段、缩小分辨率），
+对比每个步骤单独读取文件和共用一次解码的总耗时，以及不同进程数的吞吐量；
+测试视频中包含一个VP9/Opus的webm文件（yt-dlp常见的下载结果），任何步骤失败时以非零退出码结束
+
+用法:
+    python benchmarks/bench_pipeline.py --videos 4 --duration 20 --workers 1,2
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import ensure_fixtures, generate_video
+
+DEFAULT_STEPS = [
+    {'step': 'remux', 'format': 'mkv'},
+    {'step': 'audio', 'codec': 'mp3'},
+    {'step': 'clip', 'start': 2, 'end': 6},
+    {'step': 'resize', 'height': 180},
+]
+
+
+def run(paths, steps, workers, shared, work_dir):
+    from media_pipeline import PipelineRunner
+
+    # 每次都复制一份源文件，避免读取上一轮的输出
+    directory = tempfile.mkdtemp(dir=work_dir)
+    copies = []
+    for path in paths:
+        copy = os.path.join(directory, os.path.basename(path))
+        shutil.copy(path, copy)
+        copies.append(copy)
+    runner = PipelineRunner(steps, workers=workers, shared=shared)
+    # 先启动进程池，不把进程启动时间算进处理时间
+    runner._pool().submit(os.getpid).result()
+    stats = runner.run_all(copies)
+    runner.shutdown()
+    return {
+        'workers': workers,
+        'shared': shared,
+        'seconds': round(stats['seconds'], 3),
+        'files_per_second': round(stats['files_per_second'], 3),
+        'passes': stats['passes'],
+        'errors': [e['error'] for e in stats['errors']],
+        'step_seconds': {name: round(seconds, 3) for name, seconds in stats['step_seconds'].items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量后期处理的耗时")
+    parser.add_argument('--videos', type=int, default=4)
+    parser.add_argument('--duration', type=int, default=20)
+    parser.add_argument('--size', default='1280x720')
+    parser.add_argument('--workers', default='1,2', help="逗号分隔的进程数")
+    parser.add_argument('--webm', type=int, default=1, help="额外加入的VP9/Opus webm测试视频数")
+    parser.add_argument('--steps', help="步骤的JSON文件或字符串，默认为换容器、MP3、4秒片段和180p副本")
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'ytdl_fixtures'))
+    args = parser.parse_args()
+
+    from media_pipeline import load_pipeline
+
+    steps = load_pipeline(args.steps) if args.steps else load_pipeline(DEFAULT_STEPS)
+    paths = ensure_fixtures(args.fixtures, count=args.videos, duration=args.duration, size=args.size)
+    for i in range(args.webm):
+        paths.append(generate_video(
+            os.path.join(args.fixtures, f'webm_{args.size}_{args.duration}s_{i}.webm'),
+            duration=args.duration, size=args.size, vcodec='libvpx-vp9', acodec='libopus',
+            extra_args=['-deadline', 'realtime', '-cpu-used', '8']))
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for workers in [int(n) for n in args.workers.split(',')]:
+            for shared in (False, True):
+                results.append(run(paths, steps, workers, shared, work_dir))
+
+    print(json.dumps({
+        'videos': len(paths),
+        'formats': sorted({os.path.splitext(path)[1] for path in paths}),
+        'duration': args.duration,
+        'size': args.size,
+        'cpus': os.cpu_count(),
+        'steps': [step['name'] for step in steps],
+        'results': results,
+    }, ensure_ascii=False, indent=2))
+    if any(result['errors'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
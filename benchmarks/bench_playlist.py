@@ -0,0 +1,174 @@
+"""
+播放列表展开验证：用合成的分页播放列表（fake_playlist）对比
+一次性列出全部条目和流式展开的首条耗时、峰值内存和请求的页数，
+并用本地服务器验证第一批视频在列表还没列完时就开始下载；
+条目数、请求的页数（范围只覆盖开头几页时不能请求整个列表）或边列边下载不符合预期时以非零状态退出
+
+用法:
+    python benchmarks/bench_playlist.py --entries 10000
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_playlist import make_fake_playlist_ie
+from benchmarks.fixtures import generate_video
+from benchmarks.media_server import start_server
+
+PAGE_SIZE = 50
+
+
+def legacy_expand(url, extractor):
+    """原来的方式：extract_info处理整个列表后才返回"""
+    import yt_dlp
+
+    with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True, 'extract_flat': 'in_playlist'}) as ydl:
+        ydl.add_info_extractor(extractor())
+        info = ydl.extract_info(url, download=False, ie_key=extractor.ie_key())
+    return [entry.get('url') for entry in info.get('entries') or [] if entry]
+
+
+def measure(name, run):
+    """返回首条耗时、总耗时和峰值内存"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    first, count = run(lambda: time.perf_counter() - started)
+    total = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'case': name, 'entries': count, 'first_entry_seconds': round(first, 4),
+            'total_seconds': round(total, 3), 'peak_memory_kb': round(peak / 1024)}
+
+
+def check(result, entries=None, max_pages=None):
+    """在结果中记录与预期不符的项目"""
+    problems = []
+    if entries is not None and result['entries'] != entries:
+        problems.append(f"entries {result['entries']} != {entries}")
+    if max_pages is not None and result['pages'] > max_pages:
+        problems.append(f"pages {result['pages']} > {max_pages}")
+    result['problems'] = problems
+    return result
+
+
+def pages_for(last_index):
+    """列出前last_index条最多需要的页数（再加一页用于发现列表结束或越过范围）"""
+    return math.ceil(last_index / PAGE_SIZE) + 1
+
+
+def enumeration_cases(entries):
+    from playlist import PlaylistFilter, iter_playlist
+
+    url = f'fakeplaylist:{entries}'
+    results = []
+
+    extractor = make_fake_playlist_ie('http://127.0.0.1:9/v{index}.mp4', page_size=PAGE_SIZE, use_cache=True)
+
+    def legacy(elapsed):
+        urls = legacy_expand(url, extractor)
+        return elapsed(), len(urls)
+    results.append(check(dict(measure('legacy_full_list', legacy), pages=extractor.pages_fetched),
+                         entries=entries))
+
+    extractor = make_fake_playlist_ie('http://127.0.0.1:9/v{index}.mp4', page_size=PAGE_SIZE)
+
+    def streaming(elapsed):
+        first, count = None, 0
+        for _ in iter_playlist(url, extractors=[extractor]):
+            if first is None:
+                first = elapsed()
+            count += 1
+        return first, count
+    results.append(check(dict(measure('streaming', streaming), pages=extractor.pages_fetched),
+                         entries=entries, max_pages=pages_for(entries)))
+
+    # 范围在逐条提取之前生效，超出范围后不再请求后续的页；
+    # 时长为30+序号秒，第二个范围中的条目都超过120秒被过滤掉
+    for items, expected in (('1-20', 20), ('1-20,101-120', 20)):
+        extractor = make_fake_playlist_ie('http://127.0.0.1:9/v{index}.mp4', page_size=PAGE_SIZE,
+                                          duration=lambda i: 30 + i % 600)
+
+        def ranged(elapsed):
+            playlist_filter = PlaylistFilter(items, max_duration=120)
+            first, count = None, 0
+            for _ in iter_playlist(url, playlist_filter, extractors=[extractor]):
+                if first is None:
+                    first = elapsed()
+                count += 1
+            return first, count
+        result = dict(measure(f'range_{items}_max_120s', ranged), pages=extractor.pages_fetched)
+        results.append(check(result, entries=min(expected, entries),
+                             max_pages=pages_for(PlaylistFilter(items).last_index)))
+    return results
+
+
+def pipelined_download(fixtures, count=8, page_size=2, page_delay=0.5):
+    """分页较慢时，第一个视频应在列表列完之前开始下载"""
+    from downloader_core import BatchDownloader
+    from metadata_cache import MetadataCache
+
+    path = os.path.join(fixtures, 'fixture_640x360_30fps_5s_0.mp4')
+    generate_video(path, duration=5, size='640x360')
+    for i in range(count):
+        name = os.path.join(fixtures, f'playlist_{i}.mp4')
+        if not os.path.exists(name):
+            os.link(path, name)
+    server, base_url = start_server(fixtures)
+    extractor = make_fake_playlist_ie(base_url + '/playlist_{index}.mp4', page_size=page_size,
+                                      page_delay=page_delay)
+    events = []
+    started = time.perf_counter()
+
+    def on_event(job, event):
+        events.append((time.perf_counter() - started, job.id, event))
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        batch = BatchDownloader(max_workers=3, per_host_limit=3, quiet=True, cache=MetadataCache(),
+                                on_event=on_event, playlist_extractors=[extractor])
+        parent = batch.queue.submit(f'fakeplaylist:{count}', options={
+            'download_dir': out_dir, 'engine': 'native', 'playlist': True})
+        batch.wait()
+        jobs = list(batch.queue.jobs.values())
+        batch.shutdown()
+    server.shutdown()
+    listing_done = next(t for t, job_id, event in events if job_id == parent.id and event == 'finished')
+    first_child = min(t for t, job_id, event in events if job_id != parent.id and event == 'started')
+    videos = sum(1 for job in jobs if job is not parent and job.state == 'finished')
+    problems = []
+    if videos != count:
+        problems.append(f"videos {videos} != {count}")
+    if first_child >= listing_done:
+        problems.append("第一个视频在列表列完之后才开始下载")
+    return {
+        'case': 'pipelined_download',
+        'videos': videos,
+        'pages': extractor.pages_fetched,
+        'first_video_started_seconds': round(first_child, 3),
+        'listing_finished_seconds': round(listing_done, 3),
+        'all_finished_seconds': round(max(t for t, _, _ in events), 3),
+        'errors': [job.error for job in jobs if job.error],
+        'problems': problems,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="播放列表展开验证")
+    parser.add_argument('--entries', type=int, default=10000)
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'ytdl_fixtures'))
+    args = parser.parse_args()
+    results = enumeration_cases(args.entries) + [pipelined_download(args.fixtures)]
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False))
+    if any(result['problems'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
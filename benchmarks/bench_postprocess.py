@@ -0,0 +1,77 @@
+"""
+后期处理基准：对比原来总是执行的FFmpegVideoConvertor与SmartRemuxPP在不同编码组合下的用时
+
+用法:
+    python benchmarks/bench_postprocess.py --duration 20 --size 1280x720
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import generate_video
+
+CASES = [
+    # (名称, 扩展名, 视频编码器, 音频编码器, 信息字典中的编码)
+    ('h264_aac_mkv', 'mkv', 'libx264', 'aac', ('avc1.64001F', 'mp4a.40.2')),
+    ('vp9_opus_webm', 'webm', 'libvpx-vp9', 'libopus', ('vp09.00.40.08', 'opus')),
+    ('vp8_vorbis_webm', 'webm', 'libvpx', 'libvorbis', ('vp8', 'vorbis')),
+]
+
+
+def run_pp(pp, source, ext, codecs):
+    info = {'filepath': source, 'ext': ext, 'vcodec': codecs[0], 'acodec': codecs[1],
+            '__files_to_move': {}}
+    started = time.perf_counter()
+    files_to_delete, info = pp.run(info)
+    elapsed = time.perf_counter() - started
+    return elapsed, info['filepath']
+
+
+def main():
+    import yt_dlp
+    from yt_dlp.postprocessor.ffmpeg import FFmpegVideoConvertorPP
+    from postprocessing import SmartRemuxPP
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'ytdl_fixtures'))
+    parser.add_argument('--duration', type=int, default=20)
+    parser.add_argument('--size', default='1280x720')
+    parser.add_argument('--preset', default='veryfast')
+    args = parser.parse_args()
+
+    ydl = yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True})
+    results = []
+    for name, ext, vcodec, acodec, codecs in CASES:
+        fixture = generate_video(
+            os.path.join(args.fixtures, f'pp_{name}_{args.size}_{args.duration}s.{ext}'),
+            duration=args.duration, size=args.size, vcodec=vcodec, acodec=acodec,
+            extra_args=['-deadline', 'realtime', '-cpu-used', '8'] if 'vpx' in vcodec else None)
+        for label, make_pp in (
+                ('legacy_convertor', lambda: FFmpegVideoConvertorPP(ydl, preferedformat='mp4')),
+                ('smart_remux', lambda: SmartRemuxPP(ydl, preset=args.preset))):
+            work_dir = tempfile.mkdtemp()
+            try:
+                source = os.path.join(work_dir, os.path.basename(fixture))
+                shutil.copy(fixture, source)
+                pp = make_pp()
+                elapsed, output = run_pp(pp, source, ext, codecs)
+                results.append({
+                    'case': name,
+                    'postprocessor': label,
+                    'action': getattr(pp, 'last_action', 'convert'),
+                    'seconds': round(elapsed, 3),
+                    'output_bytes': os.path.getsize(output),
+                })
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+            print(json.dumps(results[-1]))
+
+
+if __name__ == '__main__':
+    main()
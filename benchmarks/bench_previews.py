@@ -0,0 +1,88 @@
+"""
+预览生成的吞吐量：在一个目录中放入大量视频（测试视频的硬链接），
+对比逐个文件精确seek抽帧和进程池关键帧抽帧每秒处理的文件数
+
+用法:
+    python benchmarks/bench_previews.py --files 200 --workers 4
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import generate_video
+
+
+def prepare_directory(fixtures, directory, files):
+    """用几个不同尺寸和时长的测试视频的硬链接填满目录"""
+    sources = [
+        generate_video(os.path.join(fixtures, 'engine_1280x720_20s.mp4'), duration=20, size='1280x720'),
+        generate_video(os.path.join(fixtures, 'fixture_640x360_30fps_5s_0.mp4'), duration=5, size='640x360'),
+        generate_video(os.path.join(fixtures, 'retry_1280x720_10s.mp4'), duration=10, size='1280x720'),
+    ]
+    paths = []
+    for i in range(files):
+        path = os.path.join(directory, f'video_{i:04d}.mp4')
+        os.link(sources[i % len(sources)], path)
+        paths.append(path)
+    return paths
+
+
+def legacy_seconds(paths, count):
+    """原来的方式：在当前进程中逐个打开文件，精确seek到每个时间点（从关键帧解码到目标帧）"""
+    import cv2
+    from previews import sample_times
+
+    started = time.perf_counter()
+    for path in paths:
+        cap = cv2.VideoCapture(path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps
+        for t in sample_times(duration, count):
+            cap.set(cv2.CAP_PROP_POS_MSEC, t * 1000.0)
+            cap.read()
+        cap.release()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="预览生成吞吐量")
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--frames', type=int, default=9)
+    parser.add_argument('--legacy-sample', type=int, default=20, help="逐个抽帧方式只测这么多个文件")
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'ytdl_fixtures'))
+    args = parser.parse_args()
+
+    from previews import PreviewGenerator
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = prepare_directory(args.fixtures, directory, args.files)
+        legacy_files = paths[:args.legacy_sample]
+        legacy = legacy_seconds(legacy_files, args.frames)
+
+        generator = PreviewGenerator(workers=args.workers, count=args.frames)
+        # 先启动工作进程，不把进程启动时间算进吞吐量
+        generator.submit(paths[0]).result()
+        stats = generator.generate_all(paths, force=True)
+        cached = generator.generate_all(paths)
+        generator.shutdown()
+
+    print(json.dumps({
+        'files': args.files,
+        'workers': args.workers,
+        'frames_per_file': args.frames,
+        'legacy_files_per_second': round(len(legacy_files) / legacy, 2),
+        'keyframe_files_per_second': round(stats['files_per_second'], 2),
+        'keyframe_seconds': round(stats['seconds'], 3),
+        'cached_files_per_second': round(cached['files_per_second'], 1),
+        'errors': [e['error'] for e in stats['errors']],
+    }, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
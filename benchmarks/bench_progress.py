@@ -0,0 +1,123 @@
+"""
+进度显示压力测试：多个线程模拟高频的yt-dlp进度回调，对比
+原来每次回调发信号并QTextEdit.append的方式与ProgressAggregator定时拉取的方式，
+测量界面事件循环的延迟（定时器实际触发间隔）和日志框的行数
+
+用法:
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_progress.py --jobs 16 --rate 200 --seconds 5
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def produce(stop, job_id, rate, callback):
+    """以每秒rate次的频率生成进度字典"""
+    downloaded = 0
+    interval = 1.0 / rate
+    while not stop.is_set():
+        downloaded += 64 * 1024
+        callback(job_id, {'status': 'downloading', 'filename': f'job{job_id}.mp4',
+                          'downloaded_bytes': downloaded, 'total_bytes': 500 * 1024 * 1024,
+                          '_percent_str': f"{downloaded / (5 * 1024 * 1024):.1f}%",
+                          '_speed_str': 'N/A'})
+        time.sleep(interval)
+
+
+def run(mode, jobs, rate, seconds):
+    from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+    from PyQt6.QtWidgets import QApplication, QListWidget, QPlainTextEdit, QTextEdit
+    from progress_aggregator import ProgressAggregator
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    job_list = QListWidget()
+    for job_id in range(jobs):
+        job_list.addItem(f"#{job_id}")
+
+    if mode == 'legacy':
+        log = QTextEdit()
+
+        class Bridge(QObject):
+            progress = pyqtSignal(int, str)
+
+        bridge = Bridge()
+        bridge.progress.connect(lambda job_id, msg: log.append(f"[#{job_id}] {msg}"))
+
+        def callback(job_id, d):
+            bridge.progress.emit(job_id, f"下载进度: {d['_percent_str']} 速度: {d['_speed_str']}")
+
+        line_count = lambda: log.document().blockCount()
+    else:
+        log = QPlainTextEdit()
+        log.setMaximumBlockCount(500)
+        aggregator = ProgressAggregator()
+        callback = aggregator.update
+
+        def refresh():
+            lines, log_lines = aggregator.poll()
+            for job_id, status in lines.items():
+                job_list.item(job_id).setText(f"#{job_id} {status}")
+            if log_lines:
+                log.appendPlainText("\n".join(log_lines))
+
+        poll_timer = QTimer()
+        poll_timer.timeout.connect(refresh)
+        poll_timer.start(250)
+        line_count = lambda: log.blockCount()
+
+    log.resize(600, 200)
+    log.show()
+    job_list.show()
+
+    # 用50ms定时器的实际触发间隔衡量事件循环是否跟得上
+    ticks = []
+    probe = QTimer()
+    probe.timeout.connect(lambda: ticks.append(time.perf_counter()))
+    probe.start(50)
+
+    stop = threading.Event()
+    threads = [threading.Thread(target=produce, args=(stop, job_id, rate, callback), daemon=True)
+               for job_id in range(jobs)]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        app.processEvents()
+    stop.set()
+    for thread in threads:
+        thread.join()
+    probe.stop()
+    # 停止生产后，积压的信号还需要多久才能处理完
+    drain_started = time.perf_counter()
+    app.processEvents()
+    drain_seconds = time.perf_counter() - drain_started
+
+    gaps = sorted(b - a for a, b in zip(ticks, ticks[1:])) or [0.0]
+    return {
+        'mode': mode,
+        'jobs': jobs,
+        'callbacks_per_second': jobs * rate,
+        'timer_gap_p50_ms': round(gaps[len(gaps) // 2] * 1000, 1),
+        'timer_gap_max_ms': round(gaps[-1] * 1000, 1),
+        'drain_seconds': round(drain_seconds, 3),
+        'log_lines': line_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="进度显示压力测试")
+    parser.add_argument('--jobs', type=int, default=16)
+    parser.add_argument('--rate', type=int, default=200, help="每个任务每秒的进度回调次数")
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+    for mode in ('legacy', 'aggregator'):
+        print(json.dumps(run(mode, args.jobs, args.rate, args.seconds)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+边下边播的首帧时间：从限速的本地服务器下载测试视频，
+对比下载完成后再打开播放和从正在下载的文件直接解码的首帧用时
+
+用法:
+    python benchmarks/bench_progressive.py --bandwidth 2000000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import generate_video
+from benchmarks.media_server import start_server
+
+
+def download(url, out_dir, progressive, on_target=None):
+    from downloader_core import VideoDownloadTask
+    from metadata_cache import MetadataCache
+
+    task = VideoDownloadTask(url, out_dir, quiet=True, cache=MetadataCache(), engine='ffmpeg',
+                             progressive=progressive, on_target=on_target)
+    return task.run()
+
+
+def first_frame(decoder):
+    """读到第一帧为止，返回是否读到"""
+    while True:
+        item = decoder.read(timeout=0.5)
+        if item is not None:
+            return True
+        if decoder.eof:
+            return False
+
+
+def legacy_case(url, out_dir):
+    """下载完成后才打开文件"""
+    from decode_engine import FrameDecoder
+
+    started = time.perf_counter()
+    path = download(url, out_dir, progressive=False)
+    downloaded = time.perf_counter() - started
+    decoder = FrameDecoder(path)
+    first_frame(decoder)
+    ttff = time.perf_counter() - started
+    decoder.close()
+    return {'case': 'after_download', 'download_seconds': round(downloaded, 3),
+            'time_to_first_frame': round(ttff, 3)}
+
+
+def progressive_case(url, out_dir):
+    """下载开始后立即从正在写入的文件解码，并一直读到最后一帧"""
+    from decode_engine import CaptureSource, FrameDecoder
+    from progressive import ProgressiveSource
+
+    target = {}
+    target_ready = threading.Event()
+    done = threading.Event()
+    result = {}
+
+    def on_target(path):
+        target['path'] = path
+        target_ready.set()
+
+    def run():
+        try:
+            result['path'] = download(url, out_dir, progressive=True, on_target=on_target)
+        except Exception as e:
+            result['error'] = str(e)
+        finally:
+            done.set()
+            target_ready.set()
+
+    started = time.perf_counter()
+    threading.Thread(target=run, daemon=True).start()
+    target_ready.wait()
+    if 'path' not in target:
+        return {'case': 'progressive', 'error': result.get('error')}
+    decoder = FrameDecoder(target['path'], source=ProgressiveSource(target['path'], done.is_set))
+    first_frame(decoder)
+    ttff = time.perf_counter() - started
+    frames = 1
+    while first_frame(decoder):
+        frames += 1
+    done.wait()
+    elapsed = time.perf_counter() - started
+    waited = decoder.source.waited
+    decoder.close()
+    # 下载完成的分片MP4应当可以正常打开
+    final = CaptureSource(result['path'], hwaccel=False) if 'path' in result else None
+    if final is not None:
+        final.close()
+    return {'case': 'progressive', 'time_to_first_frame': round(ttff, 3),
+            'download_seconds': round(elapsed, 3), 'frames': frames,
+            'final_file_frames': final.frame_count if final else None,
+            'waited_for_writer_seconds': round(waited, 3), 'error': result.get('error')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="边下边播的首帧时间")
+    parser.add_argument('--bandwidth', type=int, default=2000000, help="服务器每个连接的带宽（字节/秒）")
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'ytdl_fixtures'))
+    args = parser.parse_args()
+
+    generate_video(os.path.join(args.fixtures, 'engine_1280x720_20s.mp4'), duration=20, size='1280x720')
+    server, base_url = start_server(args.fixtures, bandwidth=args.bandwidth)
+    url = f'{base_url}/engine_1280x720_20s.mp4'
+    for case in (legacy_case, progressive_case):
+        with tempfile.TemporaryDirectory() as out_dir:
+            print(json.dumps(case(url, out_dir), ensure_ascii=False))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
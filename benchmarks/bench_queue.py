@@ -0,0 +1,56 @@
+"""
+下载队列吞吐量测试：从本地限速服务器并发下载测试视频
+
+用法:
+    python benchmarks/bench_queue.py --files 8 --workers 4 --bandwidth 1000000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import ensure_fixtures
+from benchmarks.media_server import start_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="下载队列吞吐量测试")
+    parser.add_argument('--files', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--per-host', type=int, default=4)
+    parser.add_argument('--bandwidth', type=int, default=1000000, help="每个连接的带宽（字节/秒）")
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'ytdl_fixtures'))
+    args = parser.parse_args()
+
+    from downloader_core import BatchDownloader, metadata_cache
+
+    paths = ensure_fixtures(args.fixtures, count=args.files)
+    server, base_url = start_server(args.fixtures, bandwidth=args.bandwidth)
+    urls = [f"{base_url}/{os.path.basename(p)}" for p in paths]
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        batch = BatchDownloader(max_workers=args.workers, per_host_limit=args.per_host, quiet=True)
+        batch.add_urls(urls, out_dir)
+        batch.queue.wait()
+        stats = batch.queue.stats()
+        batch.shutdown()
+    server.shutdown()
+
+    failed = [job.error for job in batch.queue.jobs.values() if job.error]
+    print(json.dumps({
+        'files': args.files,
+        'workers': args.workers,
+        'elapsed': round(stats['elapsed'], 3),
+        'total_bytes': stats['total_bytes'],
+        'average_speed': round(stats['average_speed']),
+        'jobs': stats['jobs'],
+        'metadata_cache': metadata_cache.stats(),
+        'errors': failed,
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+渲染路径微基准：对比原来update_frame的 copy + resize + QImage + QPixmap + setPixmap 路径
+与FrameRenderer预分配缓冲区 + VideoWidget.paintEvent路径的每帧耗时和临时内存分配
+
+用法:
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_render.py --size 3840x2160 --frames 120
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def legacy_update_frame(label, container_size, frame):
+    """原MainWindow.update_frame的实现"""
+    import cv2
+    from PyQt6.QtGui import QImage, QPixmap
+
+    current = frame.copy()
+    h, w = frame.shape[:2]
+    scale = min(container_size[0] / w, container_size[1] / h)
+    new_size = (int(w * scale), int(h * scale))
+    scaled_frame = cv2.resize(frame, new_size, interpolation=cv2.INTER_AREA)
+    h, w = scaled_frame.shape[:2]
+    qt_image = QImage(scaled_frame.data, w, h, 3 * w, QImage.Format.Format_RGB888)
+    label.setPixmap(QPixmap.fromImage(qt_image))
+    label.repaint()
+    return current
+
+
+def measure(name, frames, render):
+    tracemalloc.start()
+    timings = []
+    transient = []
+    for frame in frames:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        render(frame)
+        timings.append(time.perf_counter() - start)
+        transient.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    timings.sort()
+    return {
+        'path': name,
+        'frames': len(frames),
+        'ms_per_frame': round(sum(timings) * 1000 / len(timings), 3),
+        'p95_ms': round(timings[int(len(timings) * 0.95) - 1] * 1000, 3),
+        'python_bytes_per_frame': int(sum(transient) / len(transient)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="渲染路径微基准")
+    parser.add_argument('--size', default='3840x2160', help="源帧大小")
+    parser.add_argument('--widget', default='1280x720', help="显示区域大小")
+    parser.add_argument('--frames', type=int, default=120)
+    args = parser.parse_args()
+
+    import numpy as np
+    from PyQt6.QtWidgets import QApplication, QLabel
+    from main import VideoWidget
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    width, height = (int(v) for v in args.size.split('x'))
+    widget_w, widget_h = (int(v) for v in args.widget.split('x'))
+
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(4)]
+    frames = [frames[i % len(frames)] for i in range(args.frames)]
+
+    label = QLabel()
+    label.resize(widget_w, widget_h)
+    label.show()
+    legacy = measure('update_frame(QLabel.setPixmap)', frames,
+                     lambda f: legacy_update_frame(label, (widget_w, widget_h), f))
+    label.hide()
+
+    widget = VideoWidget()
+    widget.resize(widget_w, widget_h)
+    widget.show()
+    app.processEvents()
+
+    def render(frame):
+        # 解码线程中的缩放 + 界面线程中的绘制
+        widget.renderer.submit(frame)
+        widget.repaint()
+
+    pipeline = measure('FrameRenderer+VideoWidget.paintEvent', frames, render)
+    pipeline['buffer_allocations'] = widget.renderer.allocations
+
+    print(json.dumps({
+        'source': args.size,
+        'widget': args.widget,
+        'results': [legacy, pipeline],
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
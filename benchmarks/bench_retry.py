@@ -0,0 +1,171 @@
+"""
+故障注入验证：本地服务器按计划返回5xx/429、中途断开连接或文件不存在，
+检查每种故障的分类、重试次数、浪费的字节数，以及断点续传后的文件是否与原文件一致；
+任何一项与EXPECTED不符时以非零状态退出
+
+用法:
+    python benchmarks/bench_retry.py
+"""
+import argparse
+import errno
+import filecmp
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import generate_video
+from benchmarks.media_server import FaultPlan, start_server
+
+MiB = 1024 * 1024
+RESET_BYTES = 131072
+
+# 每种故障预期的结果：任务状态、download_with_retries的重试次数、失败分类和浪费字节数的范围；
+# 按引擎不同的项写在引擎名下。yt-dlp提取器自己重试的请求（例如第一个503）不计入重试次数。
+EXPECTED = {
+    'transient_503': {'state': 'finished', 'retries': 4, 'failures': ['network'] * 4, 'wasted': (0, 0)},
+    'throttled_429': {'state': 'finished', 'retries': 1, 'failures': ['throttled'], 'wasted': (0, 0)},
+    'connection_reset': {
+        'state': 'finished',
+        # ffmpeg断开后正常退出，按filesize检查出文件不完整，删除后改用yt-dlp的下载器重试
+        'ffmpeg': {'retries': 1, 'failures': ['network'], 'wasted': (1, 2 * RESET_BYTES)},
+        # 内置引擎在内部重试断开的字节范围，只浪费断开前收到的字节
+        'native': {'retries': 0, 'failures': [], 'wasted': (RESET_BYTES, 6 * RESET_BYTES)},
+    },
+    'reset_after_retry': {
+        'state': 'finished',
+        'ffmpeg': {'retries': 1, 'failures': ['network'], 'wasted': (1, 2 * RESET_BYTES)},
+        'native': {'retries': 0, 'failures': [], 'wasted': (RESET_BYTES, 8 * RESET_BYTES)},
+    },
+    'not_found': {'state': 'failed', 'retries': 0, 'failures': ['unavailable'], 'wasted': (0, 0)},
+    'format_unavailable': {'state': 'finished', 'retries': 1, 'failures': ['format_unavailable'],
+                           'wasted': (0, 0)},
+}
+
+
+def media_duration(path):
+    """用ffmpeg -i读取文件时长（秒）"""
+    result = subprocess.run(['ffmpeg', '-hide_banner', '-i', path], capture_output=True, text=True)
+    match = re.search(r'Duration: (\d+):(\d+):([\d.]+)', result.stderr)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return round(int(hours) * 3600 + int(minutes) * 60 + float(seconds), 2)
+
+
+def run_case(fixtures, name, faults, engine, options=None, policy=None):
+    from downloader_core import BatchDownloader
+    from metadata_cache import MetadataCache
+
+    plan = FaultPlan({name: faults})
+    server, base_url = start_server(fixtures, bandwidth=8 * MiB, faults=plan)
+    with tempfile.TemporaryDirectory() as out_dir:
+        batch = BatchDownloader(max_workers=1, quiet=True, cache=MetadataCache(), retry_policy=policy)
+        job = batch.queue.submit(f"{base_url}/{name}", options=dict(
+            {'download_dir': out_dir, 'engine': engine}, **(options or {})))
+        started = time.perf_counter()
+        batch.wait()
+        seconds = time.perf_counter() - started
+        source = os.path.join(fixtures, name)
+        # ffmpeg外部下载器会重新封装，文件内容与原文件不同，只比较时长
+        identical = (job.result is not None and os.path.exists(source)
+                     and filecmp.cmp(job.result, source, shallow=False))
+        duration = media_duration(job.result) if job.result else None
+        batch.shutdown()
+    server.shutdown()
+    return {
+        'engine': engine,
+        'state': job.state,
+        'retries': job.retries,
+        'failures': job.failures,
+        'wasted_bytes': job.wasted_bytes,
+        'injected': [fault for _, fault in plan.injected],
+        'identical': identical,
+        'duration': duration,
+        'seconds': round(seconds, 2),
+        'error': job.error,
+    }
+
+
+def check_case(case, result, duration):
+    """返回结果与EXPECTED不符的项目"""
+    expected = {key: value for key, value in EXPECTED[case].items() if key not in ('ffmpeg', 'native')}
+    expected.update(EXPECTED[case].get(result['engine'], {}))
+    problems = []
+    for key in ('state', 'retries', 'failures'):
+        if result[key] != expected[key]:
+            problems.append(f"{key} {result[key]!r} != {expected[key]!r}")
+    low, high = expected['wasted']
+    if not low <= result['wasted_bytes'] <= high:
+        problems.append(f"wasted_bytes {result['wasted_bytes']} not in [{low}, {high}]")
+    if result['state'] == 'finished' and (result['duration'] is None or abs(result['duration'] - duration) > 0.1):
+        problems.append(f"duration {result['duration']} != {duration}")
+    return problems
+
+
+def classification_table():
+    """无法在本地复现的错误（磁盘已满、地区限制等）只检查分类结果"""
+    import yt_dlp
+    from retry_policy import classify_failure
+
+    disk_full = yt_dlp.utils.DownloadError(
+        "ERROR: unable to write data: [Errno 28] No space left on device",
+        exc_info=(OSError, OSError(errno.ENOSPC, "No space left on device"), None))
+    samples = [
+        ("ERROR: unable to download video data: HTTP Error 503: Service Unavailable", 'network'),
+        ("ERROR: unable to download video data: HTTP Error 429: Too Many Requests", 'throttled'),
+        ("ERROR: [youtube] x: Requested format is not available", 'format_unavailable'),
+        ("ERROR: [youtube] x: The uploader has not made this video available in your country", 'geo_auth'),
+        ("ERROR: [youtube] x: Sign in to confirm your age", 'geo_auth'),
+        ("ERROR: [youtube] x: Video unavailable. This video has been removed", 'unavailable'),
+        (disk_full, 'disk'),
+    ]
+    return [{'error': str(error)[:60], 'expected': expected, 'classified': classify_failure(error)}
+            for error, expected in samples]
+
+
+def main():
+    from retry_policy import RetryPolicy
+
+    parser = argparse.ArgumentParser(description="故障注入验证")
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'ytdl_fixtures'))
+    args = parser.parse_args()
+
+    name = 'retry_1280x720_10s.mp4'
+    duration = 10
+    generate_video(os.path.join(args.fixtures, name), duration=duration, size='1280x720',
+                   extra_args=['-b:v', '4M'])
+    # 缩短退避时间，让验证在几秒内完成
+    policy = RetryPolicy(base_delay=0.2, throttled_delay=0.5)
+
+    cases = [
+        ('transient_503', name, ['503', '503', '503', '503', '503'], {}),
+        ('throttled_429', name, ['429', '429'], {}),
+        # 断开次数超过yt-dlp内部的重试次数，由download_with_retries从断点继续
+        ('connection_reset', name, ['ok'] + [f'reset:{RESET_BYTES}'] * 6, {}),
+        # 第一次失败后改用yt-dlp下载器，之后的断开从临时文件续传
+        ('reset_after_retry', name, ['503', 'ok'] + [f'reset:{RESET_BYTES}'] * 8, {}),
+        ('not_found', 'missing.mp4', [], {}),
+        ('format_unavailable', name, [], {'selected_format': 'no-such-format'}),
+    ]
+    failed = False
+    for engine in ('ffmpeg', 'native'):
+        for case, target, faults, options in cases:
+            result = run_case(args.fixtures, target, faults, engine, options, policy)
+            result['problems'] = check_case(case, result, duration)
+            failed = failed or bool(result['problems'])
+            print(json.dumps(dict(case=case, **result), ensure_ascii=False))
+    for row in classification_table():
+        failed = failed or row['classified'] != row['expected']
+        print(json.dumps(dict(case='classify', **row), ensure_ascii=False))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
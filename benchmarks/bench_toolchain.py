@@ -0,0 +1,94 @@
+"""
+统计批量下载时启动的ffmpeg探测子进程数量（不计下载和转码本身），
+并对比每个任务执行一次 ffmpeg -version 与共享探测结果的耗时
+
+用法:
+    python benchmarks/bench_toolchain.py --jobs 8
+"""
+import argparse
+import collections
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import generate_video
+from benchmarks.media_server import start_server
+
+PROBE_FLAGS = ('-version', '-encoders', '-decoders', '-hwaccels', '-bsfs', '-hide_banner')
+
+
+def count_spawns():
+    """替换Popen.__init__，按命令统计探测子进程的启动次数"""
+    counts = collections.Counter()
+    original = subprocess.Popen.__init__
+
+    def init(self, args, *a, **kw):
+        argv = [str(arg) for arg in (args if isinstance(args, (list, tuple)) else [args])]
+        if os.path.basename(argv[0]).startswith('ff') and '-i' not in argv:
+            counts[' '.join([os.path.basename(argv[0])] + [a for a in argv[1:] if a in PROBE_FLAGS])] += 1
+        return original(self, args, *a, **kw)
+
+    subprocess.Popen.__init__ = init
+    return counts
+
+
+def legacy_check_seconds(jobs):
+    """原来每个任务都执行一次的 ffmpeg -version"""
+    started = time.perf_counter()
+    for _ in range(jobs):
+        subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ffmpeg探测开销")
+    parser.add_argument('--jobs', type=int, default=8)
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'ytdl_fixtures'))
+    args = parser.parse_args()
+
+    path = os.path.join(args.fixtures, 'fixture_640x360_30fps_5s_0.mp4')
+    generate_video(path, duration=5, size='640x360')
+    names = []
+    for i in range(args.jobs):
+        name = f'toolchain_{i}.mp4'
+        if not os.path.exists(os.path.join(args.fixtures, name)):
+            os.link(path, os.path.join(args.fixtures, name))
+        names.append(name)
+
+    counts = count_spawns()
+    from downloader_core import BatchDownloader
+    from metadata_cache import MetadataCache
+    from toolchain import get_toolchain
+
+    server, base_url = start_server(args.fixtures)
+    with tempfile.TemporaryDirectory() as out_dir:
+        batch = BatchDownloader(max_workers=4, per_host_limit=4, quiet=True, cache=MetadataCache())
+        batch.add_urls([f"{base_url}/{name}" for name in names], out_dir, engine='native')
+        batch.wait()
+        failed = [job.error for job in batch.queue.jobs.values() if job.error]
+        batch.shutdown()
+    server.shutdown()
+
+    started = time.perf_counter()
+    for _ in range(args.jobs):
+        get_toolchain().available
+    shared_seconds = time.perf_counter() - started
+
+    print(json.dumps({
+        'jobs': args.jobs,
+        'probe_spawns': dict(counts),
+        'probe_spawns_total': sum(counts.values()),
+        'legacy_check_seconds': round(legacy_check_seconds(args.jobs), 4),
+        'shared_check_seconds': round(shared_seconds, 6),
+        'toolchain': get_toolchain().summary(),
+        'errors': failed,
+    }, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
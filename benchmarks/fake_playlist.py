@@ -0,0 +1,38 @@
+"""
+用于测试的yt-dlp提取器：fakeplaylist:<条目数> 返回分页的合成播放列表
+
+每页page_size个条目，获取每一页前等待page_delay秒，pages_fetched记录实际请求过的页数，
+用来验证展开是否按需分页。条目指向media_url模板（{index}替换为从0开始的序号）。
+"""
+import time
+
+from yt_dlp.extractor.common import InfoExtractor
+from yt_dlp.utils import OnDemandPagedList
+
+
+def make_fake_playlist_ie(media_url, page_size=50, page_delay=0.0, duration=None, use_cache=False):
+    """返回配置好的提取器类，每次调用得到独立的计数"""
+
+    class FakePlaylistIE(InfoExtractor):
+        IE_NAME = 'fakeplaylist'
+        _VALID_URL = r'fakeplaylist:(?P<count>\d+)'
+        pages_fetched = 0
+
+        def _real_extract(self, url):
+            count = int(self._match_valid_url(url).group('count'))
+
+            def fetch_page(page):
+                FakePlaylistIE.pages_fetched += 1
+                if page_delay:
+                    time.sleep(page_delay)
+                for index in range(page * page_size, min(count, (page + 1) * page_size)):
+                    yield self.url_result(media_url.format(index=index), video_id=f'fake{index}',
+                                          video_title=f'Fake video {index}',
+                                          duration=duration(index) if duration else None)
+
+            # 默认不缓存已经获取的页，与按生成器分页的真实提取器一致；
+            # 一次性处理整个列表（extract_info的默认处理）需要按下标访问，要打开缓存
+            return self.playlist_result(OnDemandPagedList(fetch_page, page_size, use_cache=use_cache),
+                                        playlist_id=f'fake{count}', playlist_title=f'Fake playlist ({count})')
+
+    return FakePlaylistIE
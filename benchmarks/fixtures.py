@@ -0,0 +1,34 @@
+"""
+使用FFmpeg在本地生成测试用的媒体文件
+"""
+import os
+import subprocess
+
+
+def generate_video(path, duration=5, size='640x360', fps=30,
+                   vcodec='libx264', acodec='aac', extra_args=None):
+    """生成带测试图案和正弦波音频的视频文件，已存在则直接返回"""
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    cmd = [
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=size={size}:rate={fps}:duration={duration}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=48000:duration={duration}',
+        '-c:v', vcodec, '-c:a', acodec, '-shortest',
+    ]
+    if vcodec == 'libx264':
+        cmd += ['-preset', 'ultrafast', '-pix_fmt', 'yuv420p']
+    cmd += list(extra_args or [])
+    cmd.append(path)
+    subprocess.run(cmd, check=True)
+    return path
+
+
+def ensure_fixtures(directory, count=4, duration=5, size='640x360', fps=30):
+    """在目录中生成count个测试视频，返回文件路径列表"""
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f'fixture_{size}_{fps}fps_{duration}s_{i}.mp4')
+        paths.append(generate_video(path, duration=duration, size=size, fps=fps))
+    return paths
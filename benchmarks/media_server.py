@@ -0,0 +1,188 @@
+"""
+本地HTTP媒体服务器，支持Range请求，可配置延迟、带宽限制和故障注入
+
+用法:
+    python benchmarks/media_server.py --root fixtures --port 8765 --bandwidth 2000000
+    python benchmarks/media_server.py --root fixtures --fault video.mp4=503,reset:1048576,ok
+"""
+import argparse
+import os
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FaultPlan:
+    """
+    按顺序对某个文件的请求注入故障
+
+    每个文件对应一个故障列表，第n次请求使用第n项，用完后正常响应。故障写法:
+    '503'、'429' 等返回该状态码；'reset:N' 发送N字节后断开连接；'ok' 正常响应。
+    """
+
+    def __init__(self, faults=None):
+        self._lock = threading.Lock()
+        self._faults = {name: list(items) for name, items in (faults or {}).items()}
+        self.injected = []
+
+    @classmethod
+    def parse(cls, specs):
+        """解析 'video.mp4=503,reset:1048576,ok' 形式的列表"""
+        faults = {}
+        for spec in specs or []:
+            name, _, items = spec.partition('=')
+            faults[name.strip()] = [item.strip() for item in items.split(',') if item.strip()]
+        return cls(faults)
+
+    def next_fault(self, path):
+        name = os.path.basename(path.split('?')[0])
+        with self._lock:
+            items = self._faults.get(name)
+            if not items:
+                return None
+            fault = items.pop(0)
+            if fault != 'ok':
+                self.injected.append((name, fault))
+            return None if fault == 'ok' else fault
+
+
+class MediaRequestHandler(SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0       # 每个请求的额外延迟（秒）
+    bandwidth = 0       # 每个连接的带宽限制（字节/秒），0表示不限速
+    chunk_size = 64 * 1024
+    faults = None       # FaultPlan，为None时不注入故障
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端关闭keep-alive连接属于正常情况
+            pass
+
+    def send_head(self):
+        if self.latency:
+            time.sleep(self.latency)
+        self._reset_after = None
+        fault = self.faults.next_fault(self.path) if self.faults else None
+        if fault and fault.startswith('reset:'):
+            self._reset_after = int(fault[6:])
+        elif fault:
+            status = int(fault)
+            self.send_response(status)
+            if status == 429:
+                self.send_header('Retry-After', '1')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) or not os.path.exists(path):
+            return super().send_head()
+
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        range_header = self.headers.get('Range')
+        if range_header and range_header.startswith('bytes='):
+            first, _, last = range_header[6:].split(',')[0].partition('-')
+            try:
+                if first:
+                    start = int(first)
+                    end = int(last) if last else size - 1
+                else:
+                    start = max(0, size - int(last))
+            except ValueError:
+                self.send_error(400, "Invalid Range")
+                return None
+            end = min(end, size - 1)
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return None
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Last-Modified', self.date_time_string(os.path.getmtime(path)))
+        self.end_headers()
+
+        f = open(path, 'rb')
+        f.seek(start)
+        self._remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        remaining = getattr(self, '_remaining', None)
+        started = time.monotonic()
+        sent = 0
+        while remaining is None or remaining > 0:
+            size = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+            data = source.read(size)
+            if not data:
+                break
+            try:
+                outputfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端提前断开（例如ffmpeg探测完毕后关闭连接）
+                return
+            sent += len(data)
+            if remaining is not None:
+                remaining -= len(data)
+            if self._reset_after is not None and sent >= self._reset_after:
+                # 模拟连接中断：响应体不完整，直接关闭连接
+                self.close_connection = True
+                return
+            if self.bandwidth:
+                # 按照发送量计算应该耗费的时间来限速
+                expected = sent / self.bandwidth
+                delay = expected - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+
+def start_server(root, port=0, latency=0.0, bandwidth=0, handler_class=MediaRequestHandler,
+                 faults=None):
+    """在后台线程中启动服务器，返回 (server, base_url)；faults为FaultPlan"""
+    handler = type('ConfiguredMediaHandler', (handler_class,), {
+        'latency': latency,
+        'bandwidth': bandwidth,
+        'faults': faults,
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), partial(handler, directory=root))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    return server, f'http://{host}:{port}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地测试媒体服务器")
+    parser.add_argument('--root', default='.', help="服务的目录")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help="每个请求的延迟（秒）")
+    parser.add_argument('--bandwidth', type=int, default=0, help="每个连接的带宽（字节/秒）")
+    parser.add_argument('--fault', action='append', help="故障注入，例如 video.mp4=503,reset:1048576,ok")
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.root, args.port, args.latency, args.bandwidth,
+                                    faults=FaultPlan.parse(args.fault) if args.fault else None)
+    print(f"服务已启动: {base_url}  目录: {os.path.abspath(args.root)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
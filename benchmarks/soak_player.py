@@ -0,0 +1,116 @@
+"""
+播放器的长时间测试：同一个MediaPlayer依次打开、播放到第一帧并停止大量文件，
+定期记录进程的内存（RSS）、子进程数和线程数，结束后这些值应当回到基线附近；
+有文件打不开、RSS在第一次采样之后继续增长超过上限、停止后仍有子进程或线程数增加时以非零状态退出
+
+用法:
+    QT_QPA_PLATFORM=offscreen python benchmarks/soak_player.py --files 500
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import ensure_fixtures, generate_video
+
+
+def main():
+    parser = argparse.ArgumentParser(description="播放器打开和关闭大量文件的资源占用")
+    parser.add_argument('--files', type=int, default=500)
+    parser.add_argument('--sample-every', type=int, default=50)
+    parser.add_argument('--play-ms', type=float, default=0, help="显示第一帧之后继续播放的毫秒数")
+    parser.add_argument('--max-rss-growth-mb', type=float, default=32.0,
+                        help="第一次采样之后RSS允许增长的上限（之前是解码器和缓存的预热）")
+    parser.add_argument('--max-children', type=int, default=4, help="播放时允许的子进程数上限")
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'ytdl_fixtures'))
+    args = parser.parse_args()
+
+    from PyQt6.QtCore import QCoreApplication
+    import process_stats
+    from main import MediaPlayer
+
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+    paths = ensure_fixtures(args.fixtures, count=3, duration=5)
+    paths.append(generate_video(os.path.join(args.fixtures, 'engine_1280x720_20s.mp4'), duration=20, size='1280x720'))
+
+    player = MediaPlayer()
+    baseline = process_stats.snapshot()
+    samples = []
+    failures = 0
+    first_frames = []
+    peak_rss = baseline['rss_bytes'] or 0
+    max_children = 0
+    max_cache = 0
+    started = time.perf_counter()
+    for i in range(args.files):
+        if not player.load_media(paths[i % len(paths)]):
+            failures += 1
+            continue
+        deadline = time.monotonic() + 5.0
+        while player.first_frame_seconds is None and time.monotonic() < deadline:
+            time.sleep(0.005)
+        if player.first_frame_seconds is None:
+            failures += 1
+        else:
+            first_frames.append(player.first_frame_seconds)
+        time.sleep(args.play_ms / 1000.0)
+        stats = player.resource_stats()
+        peak_rss = max(peak_rss, stats['rss_bytes'] or 0)
+        max_children = max(max_children, stats['child_processes'] or 0)
+        max_cache = max(max_cache, stats['frame_cache_bytes'])
+        player.stop()
+        app.processEvents()
+        if (i + 1) % args.sample_every == 0:
+            stats = player.resource_stats()
+            stats['files'] = i + 1
+            samples.append(stats)
+            print(json.dumps(stats, ensure_ascii=False), flush=True)
+    elapsed = time.perf_counter() - started
+    final = player.resource_stats()
+    player.shutdown()
+    after_shutdown = process_stats.snapshot()
+
+    mb = 1024 * 1024
+    reference = samples[0] if samples else baseline
+    problems = []
+    if failures:
+        problems.append(f"{failures} files failed to show a frame")
+    rss_growth = ((final['rss_bytes'] or 0) - (reference['rss_bytes'] or 0)) / mb
+    if rss_growth > args.max_rss_growth_mb:
+        problems.append(f"RSS grew {rss_growth:.1f} MB after the first sample (limit {args.max_rss_growth_mb})")
+    if max_children > args.max_children:
+        problems.append(f"{max_children} child processes while playing (limit {args.max_children})")
+    if final['child_processes']:
+        problems.append(f"{final['child_processes']} child processes left after stop")
+    if final['threads'] > reference['threads']:
+        problems.append(f"threads grew from {reference['threads']} to {final['threads']}")
+    if max_cache > final['frame_cache_budget']:
+        problems.append(f"frame cache {max_cache} bytes over budget {final['frame_cache_budget']}")
+    print(json.dumps({
+        'files': args.files,
+        'failures': failures,
+        'seconds': round(elapsed, 2),
+        'sessions_played': final['sessions_played'],
+        'average_first_frame_ms': round(sum(first_frames) / len(first_frames) * 1000, 1) if first_frames else None,
+        'baseline_rss_mb': round((baseline['rss_bytes'] or 0) / mb, 1),
+        'first_sample_rss_mb': round((samples[0]['rss_bytes'] or 0) / mb, 1) if samples else None,
+        'final_rss_mb': round((final['rss_bytes'] or 0) / mb, 1),
+        'peak_rss_mb': round(peak_rss / mb, 1),
+        'max_child_processes_while_playing': max_children,
+        'child_processes_after_stop': final['child_processes'],
+        'threads_after_stop': final['threads'],
+        'threads_after_shutdown': after_shutdown['threads'],
+        'max_frame_cache_mb': round(max_cache / mb, 1),
+        'frame_cache_budget_mb': round(final['frame_cache_budget'] / mb, 1),
+        'problems': problems,
+    }, ensure_ascii=False, indent=2))
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+"""
+热点路径基准套件：在本地用FFmpeg生成测试媒体，从可配置延迟和带宽的本地服务器提供，
+依次测量元数据提取和格式选择、下载吞吐量、合并和转换、解码帧率、显示一帧的耗时，
+以及每一项的内存峰值（RSS），结果写成一个JSON文件，用 --compare 和上一次的结果对比
+
+用法:
+    QT_QPA_PLATFORM=offscreen python benchmarks/suite.py --output results.json
+    QT_QPA_PLATFORM=offscreen python benchmarks/suite.py --compare results.json --tolerance 0.15
+    python benchmarks/suite.py --cases extract,decode
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import generate_video
+from benchmarks.media_server import start_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MB = 1024 * 1024
+
+# 指标名的后缀决定比较方向：这些越大越好，其余（耗时、内存）越小越好
+HIGHER_IS_BETTER = ('_per_second', '_fps')
+# 只记录、不参与比较的指标
+INFORMATIONAL = ('frames', 'bytes', 'runs', 'formats', 'case_seconds')
+
+
+class PeakRSS:
+    """在后台线程中定期采样RSS，记录期间的峰值"""
+
+    def __init__(self, interval=0.02):
+        import process_stats
+
+        self.rss = process_stats.rss_bytes
+        self.interval = interval
+        self.start_rss = self.rss() or 0
+        self.peak = self.start_rss
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, self.rss() or 0)
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.rss() or 0)
+        return {'peak_rss_mb': round(self.peak / MB, 1),
+                'rss_growth_mb': round((self.peak - self.start_rss) / MB, 1)}
+
+
+def timed_runs(func, runs):
+    """执行runs次，返回每次的耗时（秒）"""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def synthetic_info(count=60):
+    """和YouTube类似的格式列表：多种分辨率、编码和码率的纯视频格式，加几个纯音频格式"""
+    formats = []
+    heights = (144, 240, 360, 480, 720, 1080, 1440, 2160)
+    codecs = ('avc1.64001F', 'vp09.00.40.08', 'av01.0.08M.08')
+    for i in range(count - 4):
+        height = heights[i % len(heights)]
+        formats.append({'format_id': f'v{i}', 'vcodec': codecs[i % len(codecs)], 'acodec': 'none',
+                        'height': height, 'width': height * 16 // 9, 'fps': (30, 60)[i % 2],
+                        'tbr': height * 3.0 + i, 'ext': 'mp4'})
+    for i, (codec, abr) in enumerate((('mp4a.40.2', 128), ('opus', 160), ('opus', 70), ('mp4a.40.5', 48))):
+        formats.append({'format_id': f'a{i}', 'vcodec': 'none', 'acodec': codec, 'abr': abr,
+                        'tbr': abr, 'ext': 'm4a'})
+    return {'id': 'synthetic', 'duration': 600, 'formats': formats}
+
+
+def case_extract(ctx):
+    """yt-dlp提取本地文件的元数据（每次新的YoutubeDL，不用缓存），以及格式评分选择"""
+    import yt_dlp
+    from format_ranking import FormatRanker, load_rules
+
+    url = ctx['url']
+
+    def extract():
+        with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
+            ydl.sanitize_info(ydl.extract_info(url, download=False))
+
+    extract_times = timed_runs(extract, ctx['runs'])
+    info = synthetic_info()
+    ranker = FormatRanker(load_rules())
+    select_times = timed_runs(lambda: ranker.select(info), 200)
+    return {
+        'runs': ctx['runs'],
+        'extract_seconds': round(statistics.median(extract_times), 4),
+        'formats': len(info['formats']),
+        'format_select_ms': round(statistics.median(select_times) * 1000, 3),
+    }
+
+
+def case_download(ctx):
+    """两种下载引擎从限速服务器下载同一个文件的吞吐量"""
+    from benchmarks.bench_fragments import run_engine
+
+    results = {}
+    for engine in ('ffmpeg', 'native'):
+        with tempfile.TemporaryDirectory() as out_dir:
+            result = run_engine(ctx['url'], engine, out_dir)
+        if result['error']:
+            raise RuntimeError(f"{engine}: {result['error']}")
+        results[f'{engine}_seconds'] = result['seconds']
+        results[f'{engine}_bytes_per_second'] = result['throughput']
+    results['bytes'] = os.path.getsize(ctx['video'])
+    return results
+
+
+def case_postprocess(ctx):
+    """合并纯视频和纯音频文件（FFmpegMergerPP），以及SmartRemuxPP重新封装和转码为mp4"""
+    import yt_dlp
+    from yt_dlp.postprocessor.ffmpeg import FFmpegMergerPP
+    from benchmarks.bench_postprocess import run_pp
+    from postprocessing import SmartRemuxPP
+
+    fixtures, size, duration = ctx['fixtures'], ctx['size'], ctx['duration']
+    video_only = generate_video(os.path.join(fixtures, f'suite_video_{size}_{duration}s.mp4'),
+                                duration=duration, size=size, extra_args=['-an'])
+    audio_only = generate_video(os.path.join(fixtures, f'suite_audio_{duration}s.m4a'),
+                                duration=duration, size=size, extra_args=['-vn'])
+    mkv = generate_video(os.path.join(fixtures, f'suite_h264_{size}_{duration}s.mkv'),
+                         duration=duration, size=size)
+    webm = generate_video(os.path.join(fixtures, f'suite_vp8_{size}_{duration}s.webm'),
+                          duration=duration, size=size, vcodec='libvpx', acodec='libvorbis',
+                          extra_args=['-deadline', 'realtime', '-cpu-used', '8'])
+
+    ydl = yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True})
+    results = {}
+    work_dir = tempfile.mkdtemp()
+    try:
+        parts = [shutil.copy(path, work_dir) for path in (video_only, audio_only)]
+        info = {'filepath': os.path.join(work_dir, 'merged.mp4'), 'ext': 'mp4',
+                '__files_to_merge': parts,
+                'requested_formats': [{'vcodec': 'avc1', 'acodec': 'none', 'protocol': 'http'},
+                                      {'vcodec': 'none', 'acodec': 'mp4a.40.2', 'protocol': 'http'}]}
+        started = time.perf_counter()
+        FFmpegMergerPP(ydl).run(info)
+        results['merge_seconds'] = round(time.perf_counter() - started, 3)
+        for name, path, codecs in (('remux', mkv, ('avc1.64001F', 'mp4a.40.2')),
+                                   ('transcode', webm, ('vp8', 'vorbis'))):
+            source = shutil.copy(path, work_dir)
+            elapsed, _ = run_pp(SmartRemuxPP(ydl), source, os.path.splitext(path)[1][1:], codecs)
+            results[f'{name}_seconds'] = round(elapsed, 3)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def case_decode(ctx):
+    """FrameDecoder两种后端顺序解码整个文件的帧率"""
+    from benchmarks.bench_decode import decode_engine, measure
+
+    results = {}
+    for backend in ('cv2', 'ffmpeg'):
+        result = measure(backend, decode_engine(ctx['video'], backend))
+        results[f'{backend}_fps'] = result['fps']
+        results[f'{backend}_cpu_ms_per_frame'] = result['cpu_ms_per_frame']
+        results['frames'] = result['frames']
+    return results
+
+
+def case_render(ctx):
+    """MainWindow.update_frame的路径：FrameRenderer缩放后由VideoWidget绘制，每帧耗时"""
+    import numpy as np
+    from PyQt6.QtWidgets import QApplication
+    from main import VideoWidget
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    widget = VideoWidget()
+    widget.resize(1280, 720)
+    widget.show()
+    app.processEvents()
+    rng = np.random.default_rng(0)
+    results = {}
+    for label, (width, height) in (('1080p', (1920, 1080)), ('2160p', (3840, 2160))):
+        frames = [rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(4)]
+
+        def render(frame):
+            widget.renderer.submit(frame)
+            widget.repaint()
+
+        # 第一帧分配缩放缓冲区，不计入
+        render(frames[0])
+        timings = []
+        for i in range(ctx['frames']):
+            started = time.perf_counter()
+            render(frames[i % len(frames)])
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        results[f'render_{label}_ms'] = round(statistics.median(timings) * 1000, 3)
+        results[f'render_{label}_p95_ms'] = round(timings[int(len(timings) * 0.95) - 1] * 1000, 3)
+    widget.close()
+    results['frames'] = ctx['frames']
+    return results
+
+
+CASES = {
+    'extract': case_extract,
+    'download': case_download,
+    'postprocess': case_postprocess,
+    'decode': case_decode,
+    'render': case_render,
+}
+
+
+def environment():
+    """结果对应的代码版本和运行环境"""
+    import cv2
+    import yt_dlp
+    from toolchain import get_toolchain
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'yt_dlp': yt_dlp.version.__version__,
+        'opencv': cv2.__version__,
+        'ffmpeg': get_toolchain().version,
+    }
+
+
+def compare(current, baseline, tolerance):
+    """返回比上一次结果差超过tolerance（比例）的指标列表"""
+    regressions = []
+    for case, metrics in current['results'].items():
+        old_metrics = baseline.get('results', {}).get(case) or {}
+        for key, value in metrics.items():
+            old = old_metrics.get(key)
+            if (key in INFORMATIONAL or not isinstance(value, (int, float)) or not isinstance(old, (int, float))
+                    or old <= 0):
+                continue
+            higher_is_better = key.endswith(HIGHER_IS_BETTER)
+            change = (value - old) / old
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append({'case': case, 'metric': key, 'baseline': old, 'current': value,
+                                    'change': round(change, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="热点路径基准套件")
+    parser.add_argument('--cases', default=','.join(CASES), help="逗号分隔，可选: " + ','.join(CASES))
+    parser.add_argument('--output', help="结果写入的JSON文件，默认只打印")
+    parser.add_argument('--compare', help="上一次的结果文件，指标变差超过 --tolerance 时返回非零退出码")
+    parser.add_argument('--tolerance', type=float, default=0.15)
+    parser.add_argument('--size', default='1280x720')
+    parser.add_argument('--duration', type=int, default=10)
+    parser.add_argument('--bandwidth', type=int, default=8000000, help="服务器每个连接的带宽（字节/秒）")
+    parser.add_argument('--latency', type=float, default=0.02, help="服务器每个请求的延迟（秒）")
+    parser.add_argument('--runs', type=int, default=5, help="元数据提取的重复次数")
+    parser.add_argument('--frames', type=int, default=60, help="渲染测量的帧数")
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'ytdl_fixtures'))
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.cases.split(',') if name.strip()]
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        parser.error(f"未知的测试项: {', '.join(unknown)}")
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+    video = generate_video(os.path.join(args.fixtures, f'suite_{args.size}_{args.duration}s.mp4'),
+                           duration=args.duration, size=args.size, extra_args=['-b:v', '4M'])
+    server, base_url = start_server(args.fixtures, latency=args.latency, bandwidth=args.bandwidth)
+    ctx = {'fixtures': args.fixtures, 'video': video, 'url': f'{base_url}/{os.path.basename(video)}',
+           'size': args.size, 'duration': args.duration, 'runs': args.runs, 'frames': args.frames}
+
+    output = {'environment': environment(),
+              'parameters': {key: getattr(args, key) for key in
+                             ('size', 'duration', 'bandwidth', 'latency', 'runs', 'frames')},
+              'results': {}, 'errors': {}}
+    for name in names:
+        rss = PeakRSS()
+        started = time.perf_counter()
+        try:
+            metrics = CASES[name](ctx)
+        except Exception as e:
+            output['errors'][name] = f"{type(e).__name__}: {e}"
+            rss.stop()
+            continue
+        metrics['case_seconds'] = round(time.perf_counter() - started, 3)
+        metrics.update(rss.stop())
+        output['results'][name] = metrics
+        print(json.dumps({name: metrics}, ensure_ascii=False), file=sys.stderr, flush=True)
+    server.shutdown()
+
+    status = 0
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        output['baseline'] = baseline.get('environment')
+        output['regressions'] = compare(output, baseline, args.tolerance)
+        status = 1 if output['regressions'] else 0
+    if output['errors']:
+        status = status or 2
+
+    text = json.dumps(output, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+    sys.exit(status)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,375 @@
+"""
+无界面的命令行下载入口，不导入Qt，每行输出一个JSON事件
+
+用法:
+    python cli.py URL [URL ...] -o downloads -r 1080p -j 4
+    python cli.py -f urls.txt --engine native
+    python cli.py -f urls.txt --core async -j 256
+    python cli.py -f urls.txt --farm downloads/farm.sqlite3 --workers 4
+"""
+import time
+
+_started = time.perf_counter()
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+
+import metrics
+from bandwidth import BandwidthScheduler, ScheduleWindow, parse_rate, parse_schedule
+from download_archive import DownloadArchive, ARCHIVE_FILENAME
+from job_store import JobStore, STORE_FILENAME
+from download_queue import JobState, parse_url_list, load_url_file
+from downloader_core import BatchDownloader, metadata_cache
+from format_ranking import load_rules
+from media_pipeline import PipelineRunner, load_pipeline
+from playlist import PlaylistFilter
+from toolchain import get_toolchain
+
+
+class JsonLinesReporter:
+    """把下载事件写成JSON行，同一任务的进度事件按时间间隔合并"""
+
+    def __init__(self, stream=sys.stdout, progress_interval=0.5):
+        self.stream = stream
+        self.progress_interval = progress_interval
+        self._last_progress = {}
+        self._lock = threading.Lock()
+
+    def write(self, event, **fields):
+        record = {'event': event, 'time': round(time.time(), 3)}
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+    def on_event(self, job, event):
+        fields = {'job': job.id, 'url': job.url}
+        if event == 'finished':
+            fields['result'] = job.result
+            fields['bytes'] = job.bytes_downloaded
+            fields['seconds'] = round(job.elapsed(), 3)
+            fields['timings'] = {key: round(value, 3) for key, value in job.timings.items()}
+            fields['retries'] = job.retries
+            fields['wasted_bytes'] = job.wasted_bytes
+        elif event == 'failed':
+            fields['error'] = job.error
+            fields['failures'] = job.failures
+        self.write(event, **fields)
+
+    def on_message(self, job, msg):
+        self.write('message', job=job.id, message=msg)
+
+    def on_progress(self, job, d):
+        if d.get('status') != 'downloading':
+            return
+        now = time.monotonic()
+        if now - self._last_progress.get(job.id, 0) < self.progress_interval:
+            return
+        self._last_progress[job.id] = now
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        downloaded = d.get('downloaded_bytes') or 0
+        self.write('progress', job=job.id,
+                   downloaded_bytes=downloaded,
+                   total_bytes=total,
+                   percent=round(downloaded * 100 / total, 1) if total else None,
+                   speed=d.get('speed'),
+                   eta=d.get('eta'))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="YouTube视频批量下载（无界面）")
+    parser.add_argument('urls', nargs='*', help="视频、播放列表或频道URL")
+    parser.add_argument('-f', '--file', help="URL列表文件，每行一个，#开头为注释")
+    parser.add_argument('-o', '--output', default='downloads', help="存储目录")
+    parser.add_argument('-r', '--resolution', help="期望分辨率，例如 1080p；默认选择最佳格式")
+    parser.add_argument('--format-rules', help="格式评分规则的JSON文件，见format_ranking.DEFAULT_RULES")
+    parser.add_argument('--max-size', type=float, help="单个视频的大小预算（MiB），超出预算的格式会被扣分")
+    parser.add_argument('-j', '--concurrency', type=int,
+                        help="同时下载的任务数，默认为3（--core async时为64）")
+    parser.add_argument('--per-host', type=int,
+                        help="同一主机的最大并发数，默认为2（--core async时为16）")
+    parser.add_argument('--core', choices=['threads', 'async'], default='threads',
+                        help="下载核心：threads每个任务一个线程；async在一个事件循环中下载，适合大量小文件")
+    parser.add_argument('--engine', choices=['ffmpeg', 'native'], default='ffmpeg', help="下载引擎")
+    parser.add_argument('--limit-rate', help="所有下载共享的总速度上限，例如 2M、500K")
+    parser.add_argument('--job-rate', help="单个任务的速度上限")
+    parser.add_argument('--schedule', help="按时段限速，例如 '01:00-07:00=0,07:00-01:00=2M'（0为不限速）")
+    parser.add_argument('--transcode-preset', default='veryfast',
+                        help="编码与mp4不兼容、必须转码时使用的x264预设")
+    parser.add_argument('--transcode-threads', type=int, default=0, help="转码线程数，0为自动")
+    parser.add_argument('--archive', help=f"下载记录数据库路径，默认为存储目录下的 {ARCHIVE_FILENAME}")
+    parser.add_argument('--no-archive', action='store_true', help="不使用下载记录，总是重新下载")
+    parser.add_argument('--dedup', action='store_true', help="内容相同的文件用硬链接合并")
+    parser.add_argument('--no-resume', action='store_true',
+                        help=f"不恢复上次未完成的任务（记录保存在存储目录下的 {STORE_FILENAME}）")
+    parser.add_argument('--playlist-items', help="只下载播放列表中的这些序号，例如 '1-10,15,20-'")
+    parser.add_argument('--match-title', help="只下载标题匹配此正则表达式的视频")
+    parser.add_argument('--reject-title', help="跳过标题匹配此正则表达式的视频")
+    parser.add_argument('--min-duration', type=float, help="跳过短于此时长（秒）的视频")
+    parser.add_argument('--max-duration', type=float, help="跳过长于此时长（秒）的视频")
+    parser.add_argument('--previews', action='store_true',
+                        help="为下载完成的视频生成关键帧总览图和缩略图（存放在 .previews 目录）")
+    parser.add_argument('--pipeline', metavar='STEPS',
+                        help="下载完成后执行的后期处理步骤（JSON文件或字符串），例如 "
+                             "'[{\"step\": \"audio\", \"codec\": \"mp3\"}, {\"step\": \"resize\", \"height\": 360}]'")
+    parser.add_argument('--verbose', action='store_true', help="同时输出下载过程中的文字消息")
+    parser.add_argument('--farm', metavar='QUEUE',
+                        help="多进程模式：任务写入此SQLite队列文件，由--workers个工作进程领取；"
+                             "其他主机用同一个共享路径（不带URL）加入")
+    parser.add_argument('--workers', type=int, help="多进程模式下本机的工作进程数，默认为CPU核数")
+    parser.add_argument('--lease', type=float, default=30.0,
+                        help="多进程模式下任务租约的秒数，工作进程失联超过这个时间后任务重新分配")
+    parser.add_argument('--metrics-log', help="把各阶段的计时和重试等事件写入此JSON lines文件"
+                                              "（多进程模式下每个工作进程写入 名称.<pid>.jsonl）")
+    parser.add_argument('--metrics-port', type=int,
+                        help="在此端口提供Prometheus格式的 /metrics（0为自动选择端口；"
+                             "多进程模式下由主进程合并各工作进程的指标）")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    urls = list(args.urls)
+    if args.file:
+        urls.extend(load_url_file(args.file))
+    urls = parse_url_list('\n'.join(urls))
+    store = None
+    if not args.no_resume and not args.farm:
+        store = JobStore(os.path.join(args.output, STORE_FILENAME))
+    if not urls and not args.farm and not (store and store.unfinished()):
+        build_parser().error("请提供至少一个URL或URL列表文件")
+    playlist_filter = {key: value for key, value in (
+        ('playlist_items', args.playlist_items), ('match_title', args.match_title),
+        ('reject_title', args.reject_title), ('min_duration', args.min_duration),
+        ('max_duration', args.max_duration)) if value is not None}
+    try:
+        PlaylistFilter.from_options(playlist_filter)
+    except (ValueError, re.error) as e:
+        build_parser().error(str(e))
+    steps = None
+    if args.pipeline:
+        try:
+            steps = load_pipeline(args.pipeline)
+        except (OSError, ValueError) as e:
+            build_parser().error(f"后期处理步骤无效: {str(e)}")
+
+    if args.farm:
+        return farm_main(args, urls, playlist_filter, steps)
+
+    archive = None
+    if not args.no_archive:
+        archive = DownloadArchive(args.archive or os.path.join(args.output, ARCHIVE_FILENAME),
+                                  dedup=args.dedup)
+
+    bandwidth = None
+    if args.limit_rate or args.job_rate or args.schedule:
+        bandwidth = BandwidthScheduler(global_rate=parse_rate(args.limit_rate),
+                                       schedule=parse_schedule(args.schedule),
+                                       per_job_rate=parse_rate(args.job_rate))
+
+    # 命令行参数优先，其次是YTDL_METRICS_LOG / YTDL_METRICS_PORT环境变量
+    outputs = metrics.configure(args.metrics_log, args.metrics_port)
+    outputs.update(metrics.configure_from_env())
+
+    # 在后台探测ffmpeg的能力，任务开始时直接使用结果
+    toolchain = get_toolchain()
+    toolchain.warm_up()
+    reporter = JsonLinesReporter()
+    if 'server' in outputs:
+        reporter.write('metrics', url=outputs['server'].url)
+    previews = None
+    if args.previews:
+        # 只有生成预览时才加载预览模块
+        from previews import PreviewGenerator
+        previews = PreviewGenerator()
+    pipeline = start_pipeline(steps, reporter)
+
+    def on_event(job, event):
+        reporter.on_event(job, event)
+        # 下载完成一个就生成一个预览、执行一次后期处理，与其余下载并行
+        if event == 'finished' and isinstance(job.result, str) and os.path.isfile(job.result):
+            if previews is not None:
+                previews.submit(job.result)
+            if pipeline is not None:
+                pipeline.submit(job.result)
+
+    batch_class = BatchDownloader
+    if args.core == 'async':
+        from async_downloader import AsyncBatchDownloader as batch_class
+    concurrency = args.concurrency or (64 if args.core == 'async' else 3)
+    batch = batch_class(
+        max_workers=concurrency,
+        per_host_limit=args.per_host or (16 if args.core == 'async' else 2),
+        on_event=on_event,
+        on_message=reporter.on_message if args.verbose else None,
+        on_progress=reporter.on_progress,
+        quiet=True,
+        archive=archive,
+        transcode_preset=args.transcode_preset,
+        transcode_threads=args.transcode_threads,
+        format_rules=load_rules(args.format_rules) if args.format_rules else None,
+        bandwidth=bandwidth,
+        store=store,
+    )
+    restored = batch.restore() if store is not None else []
+    # 已经作为未完成任务恢复的URL不再重复添加
+    restored_urls = {job.url for job in restored}
+    urls = [url for url in urls if url not in restored_urls]
+    reporter.write('startup', seconds=round(time.perf_counter() - _started, 3),
+                   jobs=len(urls) + len(restored), restored=len(restored),
+                   concurrency=concurrency, core=args.core)
+    batch.add_urls(urls, args.output, resolution=args.resolution, engine=args.engine,
+                   byte_budget=int(args.max_size * 1024 * 1024) if args.max_size else None,
+                   playlist_filter=playlist_filter)
+    try:
+        batch.wait()
+    except KeyboardInterrupt:
+        reporter.write('interrupted')
+        batch.shutdown()
+        if previews is not None:
+            previews.shutdown(wait=False)
+        if pipeline is not None:
+            pipeline.shutdown(wait=False)
+        metrics.shutdown()
+        return 130
+    stats = batch.stats()
+    batch.shutdown()
+    if previews is not None:
+        previews.shutdown()
+    if pipeline is not None:
+        pipeline.shutdown()
+
+    summary = dict(jobs=stats['jobs'],
+                   total_bytes=stats['total_bytes'],
+                   seconds=round(stats['elapsed'], 3),
+                   average_speed=round(stats['average_speed']),
+                   retries=stats['retries'],
+                   metadata_cache=metadata_cache.stats(),
+                   toolchain={'version': toolchain.version, 'probes': toolchain.probes})
+    if args.core == 'async':
+        summary['async'] = {key: stats[key] for key in ('peak_active', 'connections', 'extractions',
+                                                        'fallbacks')}
+    if bandwidth is not None:
+        bandwidth_stats = bandwidth.stats()
+        summary['bandwidth'] = {'global_rate': bandwidth_stats['global_rate'],
+                                'global_wait_seconds': round(bandwidth_stats['waited'], 3)}
+    if archive is not None:
+        archive_stats = archive.stats()
+        summary['archive'] = dict(stats['archive'], stale=archive_stats['stale'],
+                                  deduplicated=archive_stats['deduplicated'],
+                                  bytes_saved=archive_stats['bytes_saved'])
+        archive.close()
+    if previews is not None:
+        summary['previews'] = {'generated': previews.generated, 'cached': previews.cached,
+                               'failed': previews.failed}
+    if pipeline is not None:
+        summary['pipeline'] = pipeline_summary(pipeline)
+    reporter.write('summary', **summary)
+    metrics.shutdown()
+    return 1 if stats['jobs'][JobState.FAILED] else 0
+
+
+def start_pipeline(steps, reporter):
+    """按步骤创建后期处理进程池，每个文件处理完后输出一个pipeline事件"""
+    if not steps:
+        return None
+
+    def on_result(result):
+        if 'error' in result:
+            reporter.write('pipeline_failed', path=result['path'], error=result['error'])
+            return
+        reporter.write('pipeline', path=result['path'], cached=result['cached'],
+                       seconds=round(result['seconds'], 3),
+                       steps=[{'name': step['name'], 'output': step['output'], 'cached': step['cached'],
+                               'seconds': round(step['seconds'], 3)} for step in result['steps']],
+                       passes=len(result['passes']))
+
+    return PipelineRunner(steps, on_result=on_result)
+
+
+def pipeline_summary(pipeline):
+    return {'processed': pipeline.processed, 'cached': pipeline.cached, 'failed': pipeline.failed}
+
+
+def farm_main(args, urls, playlist_filter, steps=None):
+    """多进程模式：URL写入共享队列，本机启动工作进程，结束后输出整个队列的汇总"""
+    from download_farm import DownloadFarm, FarmMetricsView
+
+    reporter = JsonLinesReporter()
+    pipeline = start_pipeline(steps, reporter)
+    workers = args.workers or os.cpu_count() or 1
+    global_rate = parse_rate(args.limit_rate)
+    archive_path = None if args.no_archive else (args.archive or os.path.join(args.output, ARCHIVE_FILENAME))
+
+    def on_job(job):
+        fields = {'job': job['id'], 'url': job['url'], 'worker': job['worker'],
+                  'attempts': job['attempts'], 'reassigned': job['reassigned']}
+        if job['state'] == JobState.FINISHED:
+            fields['result'] = job['result']
+            fields.update(job['stats'])
+        else:
+            fields['error'] = job['error']
+        reporter.write(job['state'], **fields)
+        if pipeline is not None and job['state'] == JobState.FINISHED and job['result'] \
+                and os.path.isfile(job['result']):
+            pipeline.submit(job['result'])
+
+    farm = DownloadFarm(
+        args.farm, workers=workers, on_job=on_job,
+        lease_seconds=args.lease,
+        archive_path=archive_path,
+        transcode_preset=args.transcode_preset,
+        transcode_threads=args.transcode_threads,
+        format_rules=load_rules(args.format_rules) if args.format_rules else None,
+        job_rate=parse_rate(args.job_rate),
+        # 总速度上限和时段限速按本机的工作进程平均分配
+        global_rate=global_rate / workers if global_rate else None,
+        schedule=[ScheduleWindow(window.start, window.end, window.rate / workers if window.rate else window.rate)
+                  for window in parse_schedule(args.schedule)],
+        metrics_log=args.metrics_log,
+    )
+    # 指标服务在主进程中合并各工作进程心跳里的指标
+    metrics_port = args.metrics_port
+    if metrics_port is None and os.environ.get('YTDL_METRICS_PORT'):
+        metrics_port = int(os.environ['YTDL_METRICS_PORT'])
+    metrics_server = None
+    if metrics_port is not None:
+        metrics_server = metrics.MetricsServer(FarmMetricsView(farm.queue), port=metrics_port)
+        reporter.write('metrics', url=metrics_server.url)
+    farm.add_urls(urls, args.output, resolution=args.resolution, engine=args.engine,
+                  byte_budget=int(args.max_size * 1024 * 1024) if args.max_size else None,
+                  playlist_filter=playlist_filter)
+    reporter.write('startup', seconds=round(time.perf_counter() - _started, 3), jobs=len(urls),
+                   queued=farm.queue.unfinished(), workers=workers, farm=os.path.abspath(args.farm))
+    farm.start()
+    try:
+        farm.wait()
+    except KeyboardInterrupt:
+        reporter.write('interrupted')
+        if metrics_server is not None:
+            metrics_server.close()
+        farm.shutdown()
+        if pipeline is not None:
+            pipeline.shutdown(wait=False)
+        return 130
+    stats = farm.stats()
+    if metrics_server is not None:
+        metrics_server.close()
+    farm.shutdown()
+    if pipeline is not None:
+        pipeline.shutdown()
+    reporter.write('summary', jobs=stats['jobs'], total_bytes=stats['total_bytes'],
+                   seconds=round(stats['elapsed'], 3), average_speed=round(stats['average_speed']),
+                   retries=stats['retries'], reassigned=stats['reassigned'], restarts=stats['restarts'],
+                   workers=stats['workers'], metrics=stats['metrics']['counters'],
+                   **({'pipeline': pipeline_summary(pipeline)} if pipeline is not None else {}))
+    return 1 if stats['jobs'][JobState.FAILED] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,313 @@
+import subprocess
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from metrics import get_registry
+from toolchain import get_toolchain
+
+# 前向跳转小于这个秒数时直接顺序解码，不做关键帧seek
+SHORT_SEEK_SECONDS = 2.0
+
+
+class CaptureSource:
+    """基于cv2.VideoCapture的解码源，优先尝试硬件加速"""
+
+    def __init__(self, path, hwaccel=True):
+        self.path = path
+        self.hwaccel = False
+        self.cap = None
+        if hwaccel and hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+            try:
+                cap = cv2.VideoCapture(path, cv2.CAP_FFMPEG,
+                                       [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+                if cap.isOpened():
+                    self.cap = cap
+                    self.hwaccel = cap.get(cv2.CAP_PROP_HW_ACCELERATION) not in (0, cv2.VIDEO_ACCELERATION_NONE)
+            except cv2.error:
+                self.cap = None
+        if self.cap is None:
+            self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise IOError(f"无法打开视频文件: {path}")
+
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.duration = self.frame_count / self.fps if self.frame_count else 0.0
+        self.position = 0.0
+
+    def read(self):
+        """解码下一帧，返回 (时间戳, RGB帧)，到达结尾返回None"""
+        ok, frame = self.cap.read()
+        if not ok:
+            return None
+        # 读取之后POS_MSEC是刚解码这一帧的时间戳
+        pts = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        self.position = pts + 1.0 / self.fps
+        return pts, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    def skip(self):
+        """只解码不转换，用于短距离前进"""
+        ok = self.cap.grab()
+        if ok:
+            self.position += 1.0 / self.fps
+        return ok
+
+    def seek(self, t):
+        # FFmpeg后端会跳到目标之前最近的关键帧，再向前解码到目标帧
+        self.cap.set(cv2.CAP_PROP_POS_MSEC, t * 1000.0)
+        self.position = t
+
+    def close(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class PipeSource:
+    """通过ffmpeg rawvideo管道解码，seek时用输入端-ss做关键帧定位"""
+
+    def __init__(self, path, width=None, height=None, fps=None, duration=None, hwaccel=True):
+        self.path = path
+        if width is None:
+            probe = CaptureSource(path, hwaccel=False)
+            width, height, fps, duration = probe.width, probe.height, probe.fps, probe.duration
+            probe.close()
+        self.width = width
+        self.height = height
+        self.fps = fps or 30.0
+        self.duration = duration or 0.0
+        self.frame_count = int(self.duration * self.fps)
+        self.hwaccel = hwaccel
+        self.frame_size = width * height * 3
+        self.process = None
+        self.position = 0.0
+        self._start(0.0)
+
+    def _start(self, t):
+        self.close()
+        toolchain = get_toolchain()
+        cmd = [toolchain.ffmpeg_path or 'ffmpeg', '-loglevel', 'error', '-nostdin']
+        if self.hwaccel and toolchain.hwaccels:
+            cmd += ['-hwaccel', 'auto']
+        if t > 0:
+            cmd += ['-ss', f'{t:.3f}']
+        cmd += ['-i', self.path, '-an', '-sn', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-']
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                        bufsize=self.frame_size * 2)
+        self.position = t
+
+    def read(self):
+        data = self.process.stdout.read(self.frame_size)
+        if len(data) < self.frame_size:
+            return None
+        pts = self.position
+        self.position += 1.0 / self.fps
+        frame = np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, 3)
+        return pts, frame
+
+    def skip(self):
+        return self.read() is not None
+
+    def seek(self, t):
+        self._start(t)
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.process.stdout.close()
+                self.process.kill()
+                self.process.wait(timeout=2)
+            except Exception:
+                pass
+            self.process = None
+
+
+class FrameDecoder:
+    """
+    顺序解码引擎：生产者线程从持久的解码源中连续读取帧，放入有界环形缓冲区，
+    播放线程只取已经解码好的帧
+
+    buffer_bytes限制缓冲区占用的内存：大分辨率的视频缓冲的帧数相应减少（至少2帧）。
+    """
+
+    def __init__(self, path, buffer_size=8, backend='cv2', hwaccel=True, source=None, buffer_bytes=None):
+        self.path = path
+        if source is not None:
+            # 外部构造的解码源，例如从正在下载的文件解码的progressive.ProgressiveSource
+            self.source = source
+        elif backend == 'ffmpeg':
+            self.source = PipeSource(path, hwaccel=hwaccel)
+        else:
+            self.source = CaptureSource(path, hwaccel=hwaccel)
+        self.fps = self.source.fps
+        self.duration = self.source.duration
+        self.width = self.source.width
+        self.height = self.source.height
+        self.frame_bytes = (self.width or 0) * (self.height or 0) * 3
+        if buffer_bytes and self.frame_bytes:
+            buffer_size = max(2, min(buffer_size, buffer_bytes // self.frame_bytes))
+        self.buffer_size = buffer_size
+
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._seek_target = None
+        self._generation = 0
+        self._eof = False
+        self._running = True
+        self.error = None  # 解码源出错时记录异常，之后按结尾处理
+        self.decoded_frames = 0
+        self.decode_time = 0.0
+        # 每帧的解码耗时按解码源分别统计
+        self.metrics = get_registry()
+        self._source_label = type(self.source).__name__
+        self._thread = threading.Thread(target=self._produce, daemon=True, name="frame-decoder")
+        self._thread.start()
+
+    @property
+    def eof(self):
+        with self._cond:
+            return self._eof and not self._buffer
+
+    @property
+    def stalled(self):
+        """缓冲区已空，解码源在等待数据（例如文件还在下载）"""
+        with self._cond:
+            empty = not self._buffer
+        return empty and getattr(self.source, 'waiting', False)
+
+    def _produce(self):
+        while True:
+            with self._cond:
+                while self._running and self._seek_target is None and (
+                        self._eof or len(self._buffer) >= self.buffer_size):
+                    self._cond.wait()
+                if not self._running:
+                    return
+                target = self._seek_target
+                self._seek_target = None
+                generation = self._generation
+
+            if target is not None:
+                try:
+                    self._do_seek(target)
+                except Exception as e:
+                    if not self._running:
+                        return
+                    self._fail(e)
+                    continue
+                with self._cond:
+                    self._eof = False
+                continue
+
+            start = time.perf_counter()
+            try:
+                item = self.source.read()
+            except Exception as e:
+                # close()为了让阻塞的读取返回而关闭了解码源
+                if not self._running:
+                    return
+                self._fail(e)
+                continue
+            elapsed = time.perf_counter() - start
+
+            with self._cond:
+                if generation != self._generation:
+                    # 解码期间发生了seek，丢弃这一帧
+                    continue
+                if item is None:
+                    self._eof = True
+                else:
+                    self._buffer.append(item)
+                    self.decoded_frames += 1
+                    self.decode_time += elapsed
+                    self.metrics.observe('decode_frame_seconds', elapsed, source=self._source_label)
+                self._cond.notify_all()
+
+    def _fail(self, error):
+        """解码源出错：记录错误并按结尾处理，等待中的read()立即返回，生产者线程不退出"""
+        self.metrics.inc('decode_errors_total', source=self._source_label)
+        with self._cond:
+            self.error = error
+            self._eof = True
+            self._cond.notify_all()
+
+    def _do_seek(self, t):
+        distance = t - self.source.position
+        if 0 <= distance <= SHORT_SEEK_SECONDS:
+            # 短距离前进：顺序跳过帧比重新定位关键帧更便宜
+            frame_time = 1.0 / self.fps
+            while self.source.position + frame_time / 2 < t:
+                if not self.source.skip():
+                    break
+        else:
+            self.source.seek(t)
+
+    def seek(self, t):
+        """跳转到t秒，清空缓冲区并让生产者线程重新定位"""
+        t = max(0.0, min(t, self.duration or t))
+        with self._cond:
+            self._buffer.clear()
+            self._generation += 1
+            self._seek_target = t
+            self._eof = False
+            self._cond.notify_all()
+
+    def read(self, timeout=1.0):
+        """按顺序取出下一帧 (时间戳, 帧)，到达结尾或超时返回None"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self._buffer:
+                if self._eof and self._seek_target is None:
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            item = self._buffer.popleft()
+            self._cond.notify_all()
+            return item
+
+    def frame_at(self, t, timeout=1.0):
+        """取出时间戳不超过t的最新一帧，并丢弃更早的帧"""
+        frame = None
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                while self._buffer and self._buffer[0][0] <= t + 1e-6:
+                    frame = self._buffer.popleft()
+                    self._cond.notify_all()
+                if frame is not None or self._buffer:
+                    return frame
+                if self._eof and self._seek_target is None:
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def buffered(self):
+        with self._cond:
+            return len(self._buffer)
+
+    def buffered_bytes(self):
+        return self.buffered() * self.frame_bytes
+
+    def close(self):
+        """停止生产者线程并关闭解码源，返回后不再有解码子进程"""
+        with self._cond:
+            self._running = False
+            self._buffer.clear()
+            self._cond.notify_all()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+            if self._thread.is_alive():
+                # 生产者阻塞在管道读取中（例如等待下载），先关闭解码源让读取返回
+                self.source.close()
+                self._thread.join(timeout=2.0)
+        self.source.close()
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from metadata_cache import normalize_video_key
+
+ARCHIVE_FILENAME = '.download_archive.sqlite3'
+
+
+def file_checksum(path, block_size=1024 * 1024):
+    """计算文件的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DownloadArchive:
+    """
+    已下载视频的持久化索引（SQLite）
+
+    以 (归一化视频ID, 质量) 为主键记录输出路径、大小和校验值，
+    下载前可以不经网络直接判断是否已经下载过。记录的文件不存在或大小不符时视为失效并删除。
+    开启dedup后，内容相同的文件会用硬链接合并。
+    """
+
+    def __init__(self, path, dedup=False):
+        self.path = path
+        self.dedup = dedup
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS downloads (
+                video_key TEXT NOT NULL,
+                quality TEXT NOT NULL,
+                format_id TEXT,
+                url TEXT,
+                path TEXT NOT NULL,
+                size INTEGER,
+                checksum TEXT,
+                created_at REAL,
+                PRIMARY KEY (video_key, quality)
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_downloads_checksum ON downloads (checksum)')
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.deduplicated = 0
+        self.bytes_saved = 0
+
+    @staticmethod
+    def quality_key(resolution=None):
+        return resolution or 'best'
+
+    def lookup(self, url, resolution=None):
+        """返回已下载文件的记录（dict），没有记录或文件已失效时返回None"""
+        key = normalize_video_key(url)
+        quality = self.quality_key(resolution)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT path, size, checksum, format_id FROM downloads WHERE video_key = ? AND quality = ?',
+                (key, quality)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            path, size, checksum, format_id = row
+            try:
+                valid = os.path.getsize(path) == size
+            except OSError:
+                valid = False
+            if not valid:
+                # 文件被删除或被改动，删除失效记录后重新下载
+                self._conn.execute('DELETE FROM downloads WHERE video_key = ? AND quality = ?', (key, quality))
+                self._conn.commit()
+                self.stale += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+        return {'path': path, 'size': size, 'checksum': checksum, 'format_id': format_id}
+
+    def record(self, url, path, resolution=None, format_id=None):
+        """记录一次完成的下载，计算大小和校验值；开启dedup时与已有的相同文件合并"""
+        size = os.path.getsize(path)
+        checksum = file_checksum(path)
+        if self.dedup:
+            self._link_duplicate(path, checksum, size)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO downloads '
+                '(video_key, quality, format_id, url, path, size, checksum, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (normalize_video_key(url), self.quality_key(resolution), format_id, url,
+                 os.path.abspath(path), size, checksum, time.time()))
+            self._conn.commit()
+
+    def _link_duplicate(self, path, checksum, size):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT path FROM downloads WHERE checksum = ? AND size = ?', (checksum, size)).fetchall()
+        for (existing,) in rows:
+            if os.path.abspath(existing) == os.path.abspath(path) or not os.path.exists(existing):
+                continue
+            try:
+                if os.path.samefile(existing, path):
+                    return
+                tmp_path = f"{path}.link.tmp"
+                os.link(existing, tmp_path)
+                os.replace(tmp_path, path)
+            except OSError:
+                # 跨文件系统或不支持硬链接时保留原文件
+                continue
+            with self._lock:
+                self.deduplicated += 1
+                self.bytes_saved += size
+            return
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'deduplicated': self.deduplicated,
+                'bytes_saved': self.bytes_saved,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,638 @@
+"""
+多进程下载（farm模式）：多个工作进程从共享的SQLite任务队列领取任务
+
+队列文件可以放在多台主机共享的目录中。工作进程领取任务时获得一段时间的租约，
+下载期间定期发送心跳延长租约；进程崩溃或失联后租约过期，任务回到等待状态由其他进程领取，
+并沿用上次选定的格式、文件名和临时文件从断点继续。每个任务的结果和各进程的指标都写回队列，
+stats()汇总整个队列的情况。
+
+任务本身仍由VideoDownloadTask执行，与单进程的BatchDownloader相同。
+
+用法:
+    python cli.py URL ... --farm downloads/farm.sqlite3 --workers 4
+    python cli.py --farm /shared/farm.sqlite3 --workers 4    # 其他主机加入同一队列
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from download_queue import JobCancelled, JobState
+from playlist import PLAYLIST_OPTIONS, is_playlist_url
+
+FARM_FILENAME = '.download_farm.sqlite3'
+
+# 租约过期（工作进程失联）后重新分配的次数上限，超过后任务记为失败
+MAX_ATTEMPTS = 3
+
+
+def merge_metrics(snapshots):
+    """把多个进程的指标快照（metrics.MetricsRegistry.snapshot()）相加"""
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, value in snapshot.get('counters', {}).items():
+            counters[name] = counters.get(name, 0) + value
+        for name, histogram in snapshot.get('histograms', {}).items():
+            total = histograms.setdefault(name, {'count': 0, 'sum': 0.0})
+            total['count'] += histogram['count']
+            total['sum'] += histogram['sum']
+    return {'counters': counters, 'histograms': histograms}
+
+
+def _metric_labels(name):
+    """把快照中的 名称{k=v,...} 拆成 (名称, [(k, v), ...])"""
+    base, _, rest = name.partition('{')
+    labels = [item.partition('=')[::2] for item in rest.rstrip('}').split(',')] if rest else []
+    return base, labels
+
+
+class FarmMetricsView:
+    """
+    按工作进程心跳中的指标快照合并出整个队列的指标，交给metrics.MetricsServer提供 /metrics
+
+    快照中的直方图只有次数和总和，按Prometheus的summary输出。
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def prometheus_text(self):
+        from metrics import PREFIX, _escape
+
+        def labels_text(labels):
+            return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}' if labels else ''
+
+        merged = merge_metrics(worker['metrics'] for worker in self.queue.workers())
+        lines = []
+        for kind, metrics in (('counter', merged['counters']), ('summary', merged['histograms'])):
+            typed = set()
+            for name in sorted(metrics):
+                base, labels = _metric_labels(name)
+                if base not in typed:
+                    typed.add(base)
+                    lines.append(f'# TYPE {PREFIX}{base} {kind}')
+                if kind == 'counter':
+                    lines.append(f'{PREFIX}{base}{labels_text(labels)} {metrics[name]}')
+                else:
+                    lines.append(f'{PREFIX}{base}_sum{labels_text(labels)} {metrics[name]["sum"]}')
+                    lines.append(f'{PREFIX}{base}_count{labels_text(labels)} {metrics[name]["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+class FarmQueue:
+    """
+    持久化的共享任务队列（SQLite）
+
+    状态沿用JobState：pending -> running -> finished / failed。领取、续约和完成都在
+    BEGIN IMMEDIATE事务中进行，多个进程同时操作同一个文件也不会重复领取；
+    finish()、fail()等只对仍持有租约的工作进程生效，租约被收回后迟到的结果会被忽略。
+    """
+
+    def __init__(self, path, lease_seconds=30.0, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                options TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                state TEXT NOT NULL,
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                reassigned INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                stats TEXT,
+                created_at REAL,
+                started_at REAL,
+                finished_at REAL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, priority, id)')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS workers (
+                id TEXT PRIMARY KEY,
+                host TEXT,
+                pid INTEGER,
+                state TEXT,
+                started_at REAL,
+                heartbeat_at REAL,
+                finished INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                metrics TEXT
+            )
+        ''')
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def add(self, urls, options=None, priority=0):
+        """加入任务，返回任务id列表"""
+        options_text = json.dumps(options or {}, ensure_ascii=False)
+        now = time.time()
+        with self._transaction() as conn:
+            return [conn.execute(
+                'INSERT INTO jobs (url, options, priority, state, created_at) VALUES (?, ?, ?, ?, ?)',
+                (url, options_text, priority, JobState.PENDING, now)).lastrowid for url in urls]
+
+    def _expire(self, conn, now):
+        """收回过期的租约：任务回到等待状态，重新分配次数用完的记为失败"""
+        rows = conn.execute('SELECT id, attempts, worker FROM jobs WHERE state = ? AND lease_until < ?',
+                            (JobState.RUNNING, now)).fetchall()
+        for job_id, attempts, worker in rows:
+            if attempts >= self.max_attempts:
+                conn.execute('UPDATE jobs SET state = ?, error = ?, worker = NULL, finished_at = ? WHERE id = ?',
+                             (JobState.FAILED, f"工作进程失联 {attempts} 次（最后为 {worker}）", now, job_id))
+            else:
+                conn.execute('UPDATE jobs SET state = ?, worker = NULL, lease_until = NULL, '
+                             'reassigned = reassigned + 1 WHERE id = ?', (JobState.PENDING, job_id))
+        return len(rows)
+
+    def requeue_expired(self):
+        """收回所有过期的租约，返回收回的任务数"""
+        with self._transaction() as conn:
+            return self._expire(conn, time.time())
+
+    def claim(self, worker_id):
+        """领取优先级最高的等待中任务，返回 {'id', 'url', 'options', 'attempts'}，没有时返回None"""
+        now = time.time()
+        with self._transaction() as conn:
+            self._expire(conn, now)
+            row = conn.execute('SELECT id, url, options, attempts FROM jobs WHERE state = ? '
+                               'ORDER BY priority DESC, id LIMIT 1', (JobState.PENDING,)).fetchone()
+            if row is None:
+                return None
+            job_id, url, options, attempts = row
+            conn.execute('UPDATE jobs SET state = ?, worker = ?, lease_until = ?, attempts = attempts + 1, '
+                         'started_at = COALESCE(started_at, ?) WHERE id = ?',
+                         (JobState.RUNNING, worker_id, now + self.lease_seconds, now, job_id))
+        return {'id': job_id, 'url': url, 'options': json.loads(options), 'attempts': attempts + 1}
+
+    def heartbeat(self, worker_id, job_ids=(), metrics=None):
+        """延长工作进程持有的租约，返回仍由它持有的任务id集合"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute('UPDATE workers SET heartbeat_at = ?, metrics = COALESCE(?, metrics) WHERE id = ?',
+                         (now, json.dumps(metrics) if metrics is not None else None, worker_id))
+            held = set()
+            for job_id in job_ids:
+                cursor = conn.execute('UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND state = ?',
+                                      (now + self.lease_seconds, job_id, worker_id, JobState.RUNNING))
+                if cursor.rowcount:
+                    held.add(job_id)
+        return held
+
+    def update_options(self, job_id, worker_id, updates):
+        """合并任务选项（选定的格式、文件名时间戳、临时文件），租约转移后新的进程据此续传"""
+        with self._transaction() as conn:
+            row = conn.execute('SELECT options FROM jobs WHERE id = ? AND worker = ? AND state = ?',
+                               (job_id, worker_id, JobState.RUNNING)).fetchone()
+            if row is None:
+                return False
+            options = json.loads(row[0])
+            options.update(updates)
+            conn.execute('UPDATE jobs SET options = ? WHERE id = ?', (json.dumps(options, ensure_ascii=False), job_id))
+        return True
+
+    def _settle(self, job_id, worker_id, state, result=None, error=None, stats=None):
+        column = 'finished' if state == JobState.FINISHED else 'failed'
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET state = ?, result = ?, error = ?, stats = ?, lease_until = NULL, finished_at = ? '
+                'WHERE id = ? AND worker = ? AND state = ?',
+                (state, result, error, json.dumps(stats) if stats is not None else None, time.time(),
+                 job_id, worker_id, JobState.RUNNING))
+            if cursor.rowcount:
+                conn.execute(f'UPDATE workers SET {column} = {column} + 1 WHERE id = ?', (worker_id,))
+            return bool(cursor.rowcount)
+
+    def finish(self, job_id, worker_id, result=None, stats=None):
+        return self._settle(job_id, worker_id, JobState.FINISHED, result=result, stats=stats)
+
+    def fail(self, job_id, worker_id, error, stats=None):
+        return self._settle(job_id, worker_id, JobState.FAILED, error=error, stats=stats)
+
+    def release(self, job_id, worker_id):
+        """主动交还任务（例如工作进程正常退出），不计入领取次数"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET state = ?, worker = NULL, lease_until = NULL, attempts = MAX(attempts - 1, 0) '
+                'WHERE id = ? AND worker = ? AND state = ?', (JobState.PENDING, job_id, worker_id, JobState.RUNNING))
+            return bool(cursor.rowcount)
+
+    def register_worker(self, worker_id, host=None, pid=None):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO workers (id, host, pid, state, started_at, heartbeat_at) '
+                         'VALUES (?, ?, ?, ?, ?, ?)', (worker_id, host, pid, 'running', now, now))
+
+    def worker_stopped(self, worker_id, metrics=None):
+        with self._transaction() as conn:
+            conn.execute('UPDATE workers SET state = ?, heartbeat_at = ?, metrics = COALESCE(?, metrics) WHERE id = ?',
+                         ('stopped', time.time(), json.dumps(metrics) if metrics is not None else None, worker_id))
+
+    def counts(self):
+        """各状态的任务数"""
+        with self._lock:
+            rows = self._conn.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall()
+        counts = {state: 0 for state in (JobState.PENDING, JobState.RUNNING, JobState.FINISHED, JobState.FAILED)}
+        counts.update(dict(rows))
+        return counts
+
+    def unfinished(self):
+        counts = self.counts()
+        return counts[JobState.PENDING] + counts[JobState.RUNNING]
+
+    def jobs(self, state=None, since=None):
+        """任务记录列表；since为结束时间下限，用于增量报告完成的任务"""
+        query = ('SELECT id, url, state, worker, attempts, reassigned, result, error, stats, '
+                 'started_at, finished_at FROM jobs')
+        clauses, params = [], []
+        if state is not None:
+            clauses.append('state = ?')
+            params.append(state)
+        if since is not None:
+            clauses.append('finished_at > ?')
+            params.append(since)
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        with self._lock:
+            rows = self._conn.execute(query + ' ORDER BY id', params).fetchall()
+        keys = ('id', 'url', 'state', 'worker', 'attempts', 'reassigned', 'result', 'error', 'stats',
+                'started_at', 'finished_at')
+        jobs = [dict(zip(keys, row)) for row in rows]
+        for job in jobs:
+            job['stats'] = json.loads(job['stats']) if job['stats'] else {}
+        return jobs
+
+    def workers(self):
+        """工作进程列表；运行中但超过一个租约期没有心跳的标记为lost"""
+        with self._lock:
+            rows = self._conn.execute('SELECT id, host, pid, state, started_at, heartbeat_at, finished, failed, '
+                                      'metrics FROM workers ORDER BY started_at').fetchall()
+        now = time.time()
+        workers = []
+        for worker_id, host, pid, state, started_at, heartbeat_at, finished, failed, metrics in rows:
+            if state == 'running' and now - (heartbeat_at or 0) > self.lease_seconds:
+                state = 'lost'
+            workers.append({'id': worker_id, 'host': host, 'pid': pid, 'state': state,
+                            'finished': finished, 'failed': failed,
+                            'metrics': json.loads(metrics) if metrics else {}})
+        return workers
+
+    def stats(self):
+        """汇总：各状态任务数、重新分配次数、字节数、各进程的完成数和合并后的指标"""
+        with self._lock:
+            reassigned, started, ended = self._conn.execute(
+                'SELECT COALESCE(SUM(reassigned), 0), MIN(started_at), MAX(finished_at) FROM jobs').fetchone()
+        finished = self.jobs(state=JobState.FINISHED)
+        workers = self.workers()
+        total_bytes = sum(job['stats'].get('bytes', 0) for job in finished)
+        elapsed = (ended - started) if started and ended else 0.0
+        return {
+            'jobs': self.counts(),
+            'reassigned': reassigned,
+            'total_bytes': total_bytes,
+            'elapsed': elapsed,
+            'average_speed': total_bytes / elapsed if elapsed > 0 else 0.0,
+            'retries': sum(job['stats'].get('retries', 0) for job in finished),
+            'workers': [{k: v for k, v in worker.items() if k != 'metrics'} for worker in workers],
+            'metrics': merge_metrics(worker['metrics'] for worker in workers),
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class FarmWorker:
+    """
+    工作进程：循环领取任务并用VideoDownloadTask执行，后台线程定期发送心跳
+
+    租约被收回（例如心跳因磁盘或网络故障中断太久）后，下一次进度回调会取消正在进行的下载，
+    避免和接手的进程同时写同一个文件。队列中没有等待和进行中的任务时run()返回。
+    """
+
+    def __init__(self, queue_path, worker_id=None, lease_seconds=30.0, heartbeat_interval=None,
+                 poll_interval=1.0, archive_path=None, quiet=True, transcode_preset='veryfast',
+                 transcode_threads=0, format_rules=None, job_rate=None, global_rate=None,
+                 schedule=None, on_message=None):
+        self.queue = FarmQueue(queue_path, lease_seconds=lease_seconds)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.heartbeat_interval = heartbeat_interval or lease_seconds / 3.0
+        self.poll_interval = poll_interval
+        self.archive_path = archive_path
+        self.quiet = quiet
+        self.transcode_preset = transcode_preset
+        self.transcode_threads = transcode_threads
+        self.format_rules = format_rules
+        self.job_rate = job_rate
+        self.global_rate = global_rate
+        self.schedule = schedule  # bandwidth.ScheduleWindow列表，按时段替换global_rate
+        self.on_message = on_message
+        self.current = None
+        self.jobs_done = 0
+        self._partials = {}
+        self._lease_lost = threading.Event()
+        self._stop = threading.Event()
+
+    def stop(self):
+        """停止领取新任务并取消正在进行的任务，任务交还给队列"""
+        self._stop.set()
+
+    def run(self, max_jobs=None):
+        from download_archive import DownloadArchive
+        from metrics import get_registry
+
+        registry = get_registry()
+        archive = DownloadArchive(self.archive_path) if self.archive_path else None
+        bandwidth = None
+        if self.job_rate or self.global_rate or self.schedule:
+            from bandwidth import BandwidthScheduler
+            bandwidth = BandwidthScheduler(global_rate=self.global_rate, schedule=self.schedule,
+                                           per_job_rate=self.job_rate)
+        self.queue.register_worker(self.worker_id, host=socket.gethostname(), pid=os.getpid())
+        heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True, name="farm-heartbeat")
+        heartbeat.start()
+        try:
+            while not self._stop.is_set() and (max_jobs is None or self.jobs_done < max_jobs):
+                job = self.queue.claim(self.worker_id)
+                if job is None:
+                    # 其他进程的任务还在进行时继续等待，它们失联后任务会回到队列
+                    if not self.queue.unfinished():
+                        break
+                    self._stop.wait(self.poll_interval)
+                    continue
+                self.run_job(job, archive, bandwidth)
+                self.jobs_done += 1
+        finally:
+            self._stop.set()
+            heartbeat.join(timeout=self.heartbeat_interval + 5)
+            self.queue.worker_stopped(self.worker_id, metrics=registry.snapshot())
+            self.queue.close()
+            if archive is not None:
+                archive.close()
+
+    def _heartbeat_loop(self):
+        from metrics import get_registry
+
+        while not self._stop.wait(self.heartbeat_interval):
+            current = self.current
+            try:
+                held = self.queue.heartbeat(self.worker_id, [current['id']] if current else [],
+                                            metrics=get_registry().snapshot())
+                if current is not None and current['id'] not in held and current is self.current:
+                    self._lease_lost.set()
+                if current is not None and self._partials:
+                    self.queue.update_options(current['id'], self.worker_id,
+                                              {'partial_files': dict(self._partials)})
+            except sqlite3.Error:
+                # 数据库暂时被锁定时跳过这一次，下次心跳再试
+                continue
+
+    def _job_hook(self, d):
+        if self._lease_lost.is_set() or self._stop.is_set():
+            raise JobCancelled()
+        tmpfilename = d.get('tmpfilename')
+        if d.get('status') == 'downloading' and tmpfilename:
+            self._partials[tmpfilename] = d.get('downloaded_bytes') or 0
+        elif d.get('status') == 'finished':
+            self._partials.pop(tmpfilename or d.get('filename', '') + '.part', None)
+
+    def _message(self, job, msg):
+        if self.on_message:
+            self.on_message(job, msg)
+
+    def run_job(self, job, archive=None, bandwidth=None):
+        from downloader_core import DownloadFailed, VideoDownloadTask
+
+        options = job['options']
+        self._lease_lost.clear()
+        self._partials = dict(options.get('partial_files') or {})
+        self.current = job
+        if options.get('playlist') or (options.get('expand_playlist', True) and is_playlist_url(job['url'])):
+            try:
+                return self.expand_playlist(job)
+            finally:
+                self.current = None
+
+        rate_limiter = bandwidth.limiter_for(job['id'], options.get('rate_limit')) if bandwidth else None
+        task = VideoDownloadTask(
+            job['url'], options['download_dir'],
+            preferred_resolution=options.get('resolution'),
+            engine=options.get('engine', 'ffmpeg'),
+            archive=archive,
+            on_message=lambda msg: self._message(job, msg),
+            job_hook=self._job_hook,
+            quiet=self.quiet,
+            transcode_preset=self.transcode_preset,
+            transcode_threads=self.transcode_threads,
+            format_rules=self.format_rules,
+            byte_budget=options.get('byte_budget'),
+            progress_messages=False,
+            rate_limiter=rate_limiter,
+            timestamp=options.get('timestamp'),
+            selected_format=options.get('selected_format'),
+            partial_files=dict(self._partials),
+            on_plan=lambda plan: self.queue.update_options(job['id'], self.worker_id, plan),
+            trace_id=f"farm-{job['id']}-{job['attempts']}",
+        )
+        started = time.perf_counter()
+        try:
+            path = task.run()
+        except JobCancelled:
+            # 停止时交还任务；租约已被收回时任务属于其他进程，不再改动
+            if not self._lease_lost.is_set():
+                self.queue.release(job['id'], self.worker_id)
+            return None
+        except DownloadFailed as e:
+            self.queue.fail(job['id'], self.worker_id, str(e), stats=self._task_stats(task, started))
+            return None
+        finally:
+            self.current = None
+            if bandwidth is not None:
+                bandwidth.release(job['id'])
+        stats = self._task_stats(task, started)
+        stats['bytes'] = os.path.getsize(path) if path and os.path.isfile(path) else 0
+        self.queue.finish(job['id'], self.worker_id, result=path, stats=stats)
+        return path
+
+    def _task_stats(self, task, started):
+        return {
+            'seconds': round(time.perf_counter() - started, 3),
+            'engine': task.engine,
+            'retries': task.retries,
+            'failures': list(task.failures),
+            'wasted_bytes': task.wasted_bytes,
+            'resumed_bytes': task.resumed_bytes,
+            'postprocess': round(sum(task.postprocess_times.values()), 3),
+            'archive_hit': task.archive_hit,
+            'worker_pid': os.getpid(),
+        }
+
+    def expand_playlist(self, job):
+        """把播放列表展开为独立的任务，由所有工作进程并行下载"""
+        from playlist import PlaylistFilter, iter_playlist
+
+        options = {k: v for k, v in job['options'].items() if k not in PLAYLIST_OPTIONS}
+        options['expand_playlist'] = False
+        urls = []
+        try:
+            for _, url, _ in iter_playlist(job['url'], PlaylistFilter.from_options(job['options'])):
+                if self._stop.is_set():
+                    self.queue.release(job['id'], self.worker_id)
+                    return None
+                urls.append(url)
+        except Exception as e:
+            self.queue.fail(job['id'], self.worker_id, f"获取播放列表失败: {str(e)}")
+            return None
+        self.queue.add(urls, options)
+        result = f"播放列表已展开: {len(urls)} 个视频"
+        self.queue.finish(job['id'], self.worker_id, result=result, stats={'entries': len(urls)})
+        return result
+
+
+def worker_log_path(path, pid=None):
+    """工作进程各自的指标日志：metrics.jsonl -> metrics.<pid>.jsonl，多个进程的缓冲写入不会交错"""
+    root, ext = os.path.splitext(path)
+    return f'{root}.{pid or os.getpid()}{ext}'
+
+
+def worker_main(queue_path, options=None):
+    """
+    工作进程的入口（multiprocessing的target），收到SIGTERM后交还当前任务再退出
+
+    options中的metrics_log（或YTDL_METRICS_LOG）是指标日志的路径，每个进程写入自己的文件；
+    指标服务由主进程提供（FarmMetricsView），工作进程不监听端口。
+    """
+    import signal
+    import metrics
+
+    options = dict(options or {})
+    metrics_log = options.pop('metrics_log', None) or os.environ.get('YTDL_METRICS_LOG')
+    if metrics_log:
+        metrics.configure(worker_log_path(metrics_log))
+    worker = FarmWorker(queue_path, **options)
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    # Ctrl+C同时发给整个进程组，由主进程决定何时退出
+    signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+    try:
+        worker.run()
+    finally:
+        metrics.shutdown()
+
+
+class DownloadFarm:
+    """
+    在本机启动workers个工作进程处理队列，异常退出的进程在仍有任务时重新启动
+
+    on_job(job) 在任务结束（完成或失败）后由wait()调用，job为FarmQueue.jobs()中的记录。
+    """
+
+    def __init__(self, queue_path, workers=None, on_job=None, poll_interval=0.5,
+                 max_restarts=None, **worker_options):
+        import multiprocessing
+
+        self.queue_path = queue_path
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.on_job = on_job
+        self.poll_interval = poll_interval
+        self.max_restarts = self.workers * 2 if max_restarts is None else max_restarts
+        self.worker_options = worker_options
+        self.queue = FarmQueue(queue_path, lease_seconds=worker_options.get('lease_seconds', 30.0))
+        # 工作进程不继承父进程的线程和连接
+        self._context = multiprocessing.get_context('spawn')
+        self.processes = []
+        self.restarts = 0
+        self._reported = set()
+        self._reported_until = 0.0
+
+    def add_urls(self, urls, download_dir, resolution=None, priority=0, engine='ffmpeg',
+                 byte_budget=None, rate_limit=None, playlist_filter=None):
+        options = {'download_dir': download_dir, 'resolution': resolution, 'engine': engine,
+                   'byte_budget': byte_budget, 'rate_limit': rate_limit}
+        options.update(playlist_filter or {})
+        return self.queue.add(urls, options, priority=priority)
+
+    def _spawn(self):
+        process = self._context.Process(target=worker_main, args=(self.queue_path, self.worker_options),
+                                        name="farm-worker")
+        process.start()
+        return process
+
+    def start(self):
+        self.processes = [self._spawn() for _ in range(self.workers)]
+
+    def _report(self):
+        # 各进程的时钟和提交顺序不完全一致，按结束时间留出余量再按id去重
+        for job in self.queue.jobs(since=self._reported_until - 5.0):
+            if job['state'] not in (JobState.FINISHED, JobState.FAILED) or job['id'] in self._reported:
+                continue
+            self._reported.add(job['id'])
+            self._reported_until = max(self._reported_until, job['finished_at'])
+            if self.on_job:
+                self.on_job(job)
+
+    def wait(self, timeout=None):
+        """等待队列中的任务全部结束，返回是否全部结束"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self._report()
+            alive = []
+            for process in self.processes:
+                if process.is_alive():
+                    alive.append(process)
+                elif process.exitcode != 0 and self.restarts < self.max_restarts and self.queue.unfinished():
+                    self.restarts += 1
+                    alive.append(self._spawn())
+            self.processes = alive
+            if not self.queue.unfinished():
+                break
+            if not self.processes:
+                # 没有本机的工作进程了，剩下的任务留给其他主机
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_interval)
+        for process in self.processes:
+            process.join(timeout=self.poll_interval * 10)
+        self._report()
+        return not self.queue.unfinished()
+
+    def stats(self):
+        stats = self.queue.stats()
+        stats['restarts'] = self.restarts
+        return stats
+
+    def shutdown(self, timeout=10):
+        """让工作进程交还当前任务并退出"""
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join(timeout=timeout)
+            if process.is_alive():
+                process.kill()
+        self.processes = []
+        self.queue.close()
@@ -0,0 +1,362 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+
+class JobState:
+    PENDING = 'pending'
+    RUNNING = 'running'
+    PAUSED = 'paused'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+
+class JobCancelled(Exception):
+    """任务被取消"""
+
+
+_job_ids = itertools.count(1)
+
+
+def parse_url_list(text):
+    """从粘贴的文本中解析URL列表，忽略空行和#注释，保持顺序并去重"""
+    urls = []
+    seen = set()
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        for token in line.split():
+            if token not in seen:
+                seen.add(token)
+                urls.append(token)
+    return urls
+
+
+def load_url_file(path):
+    """读取文本文件中的URL列表"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_url_list(f.read())
+
+
+class DownloadJob:
+    def __init__(self, url, priority=0, options=None):
+        self.id = next(_job_ids)
+        self.url = url
+        self.priority = priority
+        self.options = dict(options or {})
+        self.host = (urlparse(url).hostname or '').lower()
+        self.state = JobState.PENDING
+        self.result = None
+        self.error = None
+        self.bytes_downloaded = 0
+        self.timings = {}  # 各阶段用时（秒），例如 postprocess
+        self.retries = 0
+        self.failures = []  # 每次失败的类别（retry_policy.FailureKind）
+        self.wasted_bytes = 0  # 重试时丢弃、需要重新下载的字节数
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._file_bytes = {}
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+        self._cancelled = False
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def checkpoint(self):
+        """由下载线程在进度回调中调用：暂停时阻塞，取消时抛出JobCancelled"""
+        if self._cancelled:
+            raise JobCancelled()
+        self._resume_event.wait()
+        if self._cancelled:
+            raise JobCancelled()
+
+    def report_progress(self, filename, downloaded_bytes):
+        """记录某个文件的已下载字节数，返回新增字节数"""
+        previous = self._file_bytes.get(filename, 0)
+        delta = max(0, downloaded_bytes - previous)
+        self._file_bytes[filename] = downloaded_bytes
+        self.bytes_downloaded += delta
+        return delta
+
+    def elapsed(self):
+        if not self.started_at:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def __lt__(self, other):
+        return self.id < other.id
+
+    def __repr__(self):
+        return f"<DownloadJob #{self.id} {self.state} {self.url}>"
+
+
+class DownloadQueue:
+    """
+    下载队列调度器
+
+    runner(job) 在工作线程中执行单个任务并返回结果（通常为文件路径），
+    失败时抛出异常，取消时抛出JobCancelled。
+    on_event(job, event) 在任务状态变化时被调用（在工作线程中）。
+    """
+
+    def __init__(self, runner, max_workers=3, per_host_limit=2, on_event=None):
+        self.runner = runner
+        self.max_workers = max(1, int(max_workers))
+        self.per_host_limit = max(1, int(per_host_limit))
+        self.on_event = on_event
+        self.jobs = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._running_per_host = {}
+        self._running = 0
+        self._cond = threading.Condition()
+        self._threads = []
+        self._shutdown = False
+        self._first_start = None
+        self._total_bytes = 0
+        self._samples = deque()
+
+    # ---- 提交任务 ----
+
+    def submit(self, url, priority=0, options=None):
+        job = DownloadJob(url, priority, options)
+        with self._cond:
+            self.jobs[job.id] = job
+            self._push(job)
+            self._ensure_workers()
+            self._cond.notify_all()
+        self._emit(job, 'queued')
+        return job
+
+    def submit_many(self, urls, priority=0, options=None):
+        return [self.submit(url, priority, options) for url in urls]
+
+    def _push(self, job):
+        heapq.heappush(self._heap, (-job.priority, next(self._seq), job))
+
+    # ---- 调度 ----
+
+    def set_limits(self, max_workers=None, per_host_limit=None):
+        """运行时调整全局和单主机并发数"""
+        with self._cond:
+            if max_workers is not None:
+                self.max_workers = max(1, int(max_workers))
+            if per_host_limit is not None:
+                self.per_host_limit = max(1, int(per_host_limit))
+            self._ensure_workers()
+            self._cond.notify_all()
+
+    def _ensure_workers(self):
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.max_workers:
+            t = threading.Thread(target=self._worker, daemon=True,
+                                 name=f"download-worker-{len(self._threads)}")
+            self._threads.append(t)
+            t.start()
+
+    def _take_next(self):
+        """取出优先级最高且未超出主机并发限制的任务，调用方须持有锁"""
+        if self._running >= self.max_workers:
+            return None
+        skipped = []
+        job = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            candidate = entry[2]
+            if candidate.state != JobState.PENDING:
+                # 已取消或暂停的任务：暂停的保留在队列中
+                if candidate.state == JobState.PAUSED:
+                    skipped.append(entry)
+                continue
+            if self._running_per_host.get(candidate.host, 0) >= self.per_host_limit:
+                skipped.append(entry)
+                continue
+            job = candidate
+            break
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+        return job
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = None
+                while not self._shutdown:
+                    if len(self._threads) > self.max_workers:
+                        # 并发数被调小，多余的空闲线程退出
+                        self._threads.remove(threading.current_thread())
+                        return
+                    job = self._take_next()
+                    if job:
+                        break
+                    self._cond.wait()
+                if self._shutdown:
+                    return
+                job.state = JobState.RUNNING
+                job.started_at = job.started_at or time.time()
+                if self._first_start is None:
+                    self._first_start = job.started_at
+                self._running += 1
+                self._running_per_host[job.host] = self._running_per_host.get(job.host, 0) + 1
+
+            self._emit(job, 'started')
+            event = 'finished'
+            try:
+                job.result = self.runner(job)
+                job.state = JobState.FINISHED
+            except JobCancelled:
+                job.state = JobState.CANCELLED
+                event = 'cancelled'
+            except Exception as e:
+                if job.cancelled:
+                    job.state = JobState.CANCELLED
+                    event = 'cancelled'
+                else:
+                    job.error = str(e)
+                    job.state = JobState.FAILED
+                    event = 'failed'
+            job.finished_at = time.time()
+
+            with self._cond:
+                self._running -= 1
+                self._running_per_host[job.host] -= 1
+                self._cond.notify_all()
+            self._emit(job, event)
+
+    def _emit(self, job, event):
+        if self.on_event:
+            try:
+                self.on_event(job, event)
+            except Exception as e:
+                print(f"队列事件回调出错: {str(e)}")
+
+    # ---- 任务控制 ----
+
+    def pause(self, job_id):
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if not job or job.state not in (JobState.PENDING, JobState.RUNNING):
+                return False
+            # 运行中的任务在下一次进度回调时阻塞
+            job._resume_event.clear()
+            if job.state == JobState.PENDING:
+                job.state = JobState.PAUSED
+        self._emit(job, 'paused')
+        return True
+
+    def resume(self, job_id):
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if not job:
+                return False
+            job._resume_event.set()
+            if job.state == JobState.PAUSED:
+                job.state = JobState.PENDING
+                self._cond.notify_all()
+        self._emit(job, 'resumed')
+        return True
+
+    def cancel(self, job_id):
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if not job or job.state in (JobState.FINISHED, JobState.FAILED, JobState.CANCELLED):
+                return False
+            job._cancelled = True
+            job._resume_event.set()
+            if job.state in (JobState.PENDING, JobState.PAUSED):
+                job.state = JobState.CANCELLED
+                job.finished_at = time.time()
+                notify = True
+            else:
+                notify = False
+            self._cond.notify_all()
+        if notify:
+            self._emit(job, 'cancelled')
+        return True
+
+    def set_priority(self, job_id, priority):
+        """调整尚未开始的任务的优先级"""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if not job or job.state not in (JobState.PENDING, JobState.PAUSED):
+                return False
+            job.priority = priority
+            self._heap = [e for e in self._heap if e[2] is not job]
+            heapq.heapify(self._heap)
+            self._push(job)
+            self._cond.notify_all()
+        return True
+
+    def is_paused(self, job_id):
+        job = self.jobs.get(job_id)
+        return bool(job) and not job._resume_event.is_set()
+
+    # ---- 统计 ----
+
+    def record_bytes(self, job, filename, downloaded_bytes):
+        """由runner在进度回调中调用，用于统计总吞吐量"""
+        delta = job.report_progress(filename, downloaded_bytes)
+        if delta:
+            now = time.time()
+            with self._cond:
+                self._total_bytes += delta
+                self._samples.append((now, delta))
+                while self._samples and now - self._samples[0][0] > 5.0:
+                    self._samples.popleft()
+        return delta
+
+    def stats(self):
+        """返回队列的汇总统计：各状态任务数、总字节数、平均和当前吞吐量"""
+        with self._cond:
+            counts = {state: 0 for state in (JobState.PENDING, JobState.RUNNING,
+                                             JobState.PAUSED, JobState.FINISHED,
+                                             JobState.FAILED, JobState.CANCELLED)}
+            for job in self.jobs.values():
+                counts[job.state] += 1
+            now = time.time()
+            elapsed = now - self._first_start if self._first_start else 0.0
+            recent = sum(delta for ts, delta in self._samples if now - ts <= 5.0)
+            window = min(5.0, elapsed) if elapsed else 0.0
+            return {
+                'jobs': counts,
+                'total_bytes': self._total_bytes,
+                'elapsed': elapsed,
+                'average_speed': self._total_bytes / elapsed if elapsed > 0 else 0.0,
+                'current_speed': recent / window if window > 0 else 0.0,
+            }
+
+    def is_idle(self):
+        with self._cond:
+            return self._running == 0 and not any(
+                job.state == JobState.PENDING for job in self.jobs.values())
+
+    def wait(self, timeout=None):
+        """阻塞直到所有未暂停的任务完成"""
+        deadline = time.time() + timeout if timeout else None
+        with self._cond:
+            while self._running or any(job.state == JobState.PENDING for job in self.jobs.values()):
+                remaining = deadline - time.time() if deadline else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def shutdown(self, cancel_pending=True):
+        with self._cond:
+            if cancel_pending:
+                for job in self.jobs.values():
+                    if job.state in (JobState.PENDING, JobState.PAUSED, JobState.RUNNING):
+                        job._cancelled = True
+                        job._resume_event.set()
+                        if job.state != JobState.RUNNING:
+                            job.state = JobState.CANCELLED
+            self._shutdown = True
+            self._cond.notify_all()
@@ -0,0 +1,916 @@
+"""
+下载核心逻辑，不依赖Qt
+
+图形界面的DownloadManager和命令行入口cli.py共用这里的下载流程。
+yt-dlp等较重的模块在第一次下载时才导入，保证导入本模块足够快。
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from download_queue import DownloadQueue, JobCancelled, JobState
+from metadata_cache import MetadataCache
+from metrics import SIZE_BUCKETS, SPEED_BUCKETS, get_registry
+from playlist import PLAYLIST_OPTIONS, is_playlist_url
+from retry_policy import FailureKind, RetryPolicy, classify_failure
+from toolchain import get_toolchain
+
+FFMPEG_INSTALL_HINT = (
+    "未检测到FFmpeg。请按照以下步骤安装：\n"
+    "1. 访问 https://github.com/BtbN/FFmpeg-Builds/releases\n"
+    "2. 下载 ffmpeg-master-latest-win64-gpl.zip\n"
+    "3. 解压文件\n"
+    "4. 将解压后的 ffmpeg-master-latest-win64-gpl\\bin 目录添加到系统环境变量\n"
+    "5. 重启应用程序"
+)
+
+# 选中的格式不可用时依次尝试的格式
+DOWNGRADE_FORMATS = ('bestvideo*+bestaudio/best', 'best')
+
+# 边下边播只能跟随一个正在写入的文件，只选择自带音频的合并格式，不下载分开的视频和音频再合并
+PROGRESSIVE_FORMAT = 'best'
+
+# 下载的文件不小于filesize的这个比例时认为完整（ffmpeg重新封装后大小会略有变化）
+COMPLETE_RATIO = 0.97
+
+# 后期处理步骤（yt-dlp的pp_key）对应的计时阶段，其余记为postprocess
+POSTPROCESS_STAGES = {
+    'Merger': 'merge',
+    'SmartRemux': 'convert',
+    'VideoConvertor': 'convert',
+    'VideoRemuxer': 'convert',
+    'MoveFiles': 'move',
+}
+
+# 所有下载任务共享的元数据缓存，设置 YTDL_METADATA_CACHE 环境变量可启用磁盘缓存
+metadata_cache = MetadataCache(disk_dir=os.environ.get('YTDL_METADATA_CACHE') or None)
+
+
+class DownloadFailed(Exception):
+    """下载失败，消息可以直接显示给用户"""
+
+
+def format_speed(speed):
+    """格式化速度显示"""
+    if speed < 1024:
+        return f"{speed:.2f}B/s"
+    elif speed < 1024 * 1024:
+        return f"{speed/1024:.2f}KiB/s"
+    elif speed < 1024 * 1024 * 1024:
+        return f"{speed/(1024*1024):.2f}MiB/s"
+    else:
+        return f"{speed/(1024*1024*1024):.2f}GiB/s"
+
+
+def check_ffmpeg():
+    """检查是否安装了FFmpeg（使用共享的探测结果，不会每次启动子进程）"""
+    return get_toolchain().available
+
+
+def remote_size(url, headers=None, timeout=30):
+    """用只请求第一个字节的Range请求查询远程文件的大小，查询失败时返回None"""
+    import urllib.request
+
+    if not url:
+        return None
+    request = urllib.request.Request(url, headers=dict(headers or {}, Range='bytes=0-0'))
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            content_range = response.headers.get('Content-Range', '')
+            if response.status == 206 and '/' in content_range:
+                total = content_range.rsplit('/', 1)[1]
+                return int(total) if total.isdigit() else None
+            length = response.headers.get('Content-Length')
+            return int(length) if response.status == 200 and length and length.isdigit() else None
+    except (OSError, ValueError):
+        return None
+
+
+def expand_playlist(url, playlist_filter=None):
+    """列出播放列表中的视频URL（只获取列表，不解析每个视频）"""
+    from playlist import iter_playlist
+
+    return [video_url for _, video_url, _ in iter_playlist(url, playlist_filter)]
+
+
+class VideoDownloadTask:
+    """
+    单个视频的下载流程：格式选择、下载、合并转换，失败时按错误类别重试或降级
+
+    on_message(msg) 接收给用户看的进度文字，on_error(msg) 接收非致命错误，
+    job_hook(d) 接收yt-dlp的原始进度字典（可以抛出JobCancelled取消下载）。
+    """
+
+    def __init__(self, url, download_dir, preferred_resolution=None, engine='ffmpeg',
+                 cache=None, archive=None, on_message=None, on_error=None, job_hook=None,
+                 quiet=False, transcode_preset='veryfast', transcode_threads=0,
+                 format_rules=None, byte_budget=None, progress_messages=True,
+                 rate_limiter=None, timestamp=None, selected_format=None, partial_files=None,
+                 on_plan=None, retry_policy=None, progressive=False, on_target=None, trace_id=None):
+        self.url = url
+        self.download_dir = download_dir
+        self.preferred_resolution = preferred_resolution
+        self.engine = engine  # 'ffmpeg' 使用ffmpeg外部下载器，'native' 使用内置并行下载引擎
+        self.cache = cache or metadata_cache
+        self.archive = archive  # DownloadArchive，已下载过的视频直接跳过
+        self.on_message = on_message
+        self.on_error = on_error
+        self.job_hook = job_hook
+        self.quiet = quiet
+        # 只有编码与mp4不兼容时才转码，转码使用的x264预设和线程数（0为自动）
+        self.transcode_preset = transcode_preset
+        self.transcode_threads = transcode_threads
+        # 格式评分规则（见format_ranking.DEFAULT_RULES）和单个任务的字节预算
+        self.format_rules = format_rules
+        self.byte_budget = byte_budget
+        # 是否把下载进度作为文字消息发出（每秒最多一次）；界面用进度字典显示状态行时关闭
+        self.progress_messages = progress_messages
+        self._last_progress_message = 0.0
+        # 限速器（bandwidth.JobRateLimiter），consume(n) 阻塞到允许继续下载n字节
+        self.rate_limiter = rate_limiter
+        self._throttled_bytes = {}
+        # 文件名中的时间戳和选中的格式：恢复任务时沿用上次的值，才能找到之前的临时文件
+        self.timestamp = timestamp or time.strftime("%Y%m%d_%H%M%S")
+        self.selected_format = selected_format
+        # 上次下载留下的临时文件 {路径: 已确认的字节数}
+        self.partial_files = partial_files or {}
+        self.resumed_bytes = 0
+        # on_plan(dict) 在确定格式和文件名后调用，用于持久化任务状态
+        self.on_plan = on_plan
+        # 按失败类别重试（retry_policy.RetryPolicy），记录重试次数、失败类别和浪费的字节数
+        self.retry_policy = retry_policy or RetryPolicy()
+        # 边下边播：输出分片MP4，下载开始前用on_target(路径)报告正在写入的文件
+        self.progressive = progressive
+        self.on_target = on_target
+        self.retries = 0
+        self.failures = []
+        self.wasted_bytes = 0
+        self._attempt_files = {}
+        self._engine_wasted = {}
+        self._uses_ffmpeg = False
+        self.cancelled = False
+        self.archive_hit = False
+        self.postprocess_times = {}
+        self._postprocess_started = {}
+        # 各阶段的计时区间和计数写入共享的指标注册表，trace_id把同一个任务的事件关联起来
+        self.metrics = get_registry()
+        self.trace = {'trace': trace_id or uuid.uuid4().hex[:12], 'url': url}
+        self._transfers = {}
+
+    def emit(self, msg):
+        if self.on_message:
+            self.on_message(msg)
+
+    def emit_error(self, msg):
+        if self.on_error:
+            self.on_error(msg)
+
+    def get_info(self):
+        """获取视频元数据，优先使用缓存"""
+        import yt_dlp
+
+        info = self.cache.get(self.url)
+        if info is not None:
+            self.emit("使用缓存的视频信息")
+            return info
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True
+        }
+        with self.metrics.span('extract', attrs=self.trace):
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info = ydl.sanitize_info(ydl.extract_info(self.url, download=False))
+        self.cache.put(self.url, info)
+        return info
+
+    def ydl_class(self):
+        import yt_dlp
+
+        if self.engine == 'native':
+            from native_downloader import NativeYoutubeDL
+            return NativeYoutubeDL
+        return yt_dlp.YoutubeDL
+
+    def download_with_info(self, ydl_opts):
+        """用缓存的元数据下载，只有缓存不可用时才重新提取"""
+        import yt_dlp
+
+        with self.ydl_class()(ydl_opts) as ydl:
+            self.add_postprocessors(ydl)
+            info = self.cache.get(self.url)
+            if info is not None:
+                try:
+                    info = ydl.process_ie_result(info, download=True)
+                except yt_dlp.utils.DownloadCancelled:
+                    raise
+                except yt_dlp.utils.DownloadError as e:
+                    # 网络和磁盘错误交给download_with_retries处理，其余可能是直链过期
+                    if classify_failure(e) in (FailureKind.NETWORK, FailureKind.THROTTLED, FailureKind.DISK):
+                        raise
+                    info = None
+                if self.cancelled:
+                    raise yt_dlp.utils.DownloadCancelled()
+                if info is None or not os.path.exists(self.final_path(ydl, info)):
+                    # 缓存中的直链可能已经过期，丢弃缓存后重新提取
+                    self.emit("缓存的视频信息不可用，重新获取...")
+                    self.cache.invalidate(self.url)
+                    info = None
+            if info is None:
+                info = ydl.extract_info(self.url, download=True)
+                if info is not None:
+                    self.cache.put(self.url, ydl.sanitize_info(info))
+            if self.cancelled:
+                raise yt_dlp.utils.DownloadCancelled()
+            if info is None:
+                return None, None
+            return info, self.final_path(ydl, info)
+
+    @staticmethod
+    def final_path(ydl, info):
+        """后期处理（合并、转换容器）之后的最终文件路径"""
+        downloads = info.get('requested_downloads') or []
+        if downloads and downloads[-1].get('filepath'):
+            return downloads[-1]['filepath']
+        return info.get('filepath') or ydl.prepare_filename(info)
+
+    def add_postprocessors(self, ydl):
+        """转换为mp4：编码兼容时只复制流，必要时才转码"""
+        from postprocessing import SmartRemuxPP, TargetFilePP
+
+        if self.on_target:
+            ydl.add_post_processor(TargetFilePP(ydl, self.on_target), when='before_dl')
+        ydl.add_post_processor(SmartRemuxPP(ydl, preset=self.transcode_preset,
+                                            threads=self.transcode_threads),
+                               when='post_process')
+
+    def get_format_for_resolution(self):
+        """按格式评分规则选择视频+音频格式，边下边播的任务只选择合并格式"""
+        from format_ranking import FormatRanker, load_rules
+
+        try:
+            with self.metrics.span('probe', attrs=self.trace) as span:
+                self.emit("正在获取可用的视频格式...")
+                info = self.get_info()
+                if info:
+                    overrides = {}
+                    if self.preferred_resolution:
+                        overrides['target_height'] = int(self.preferred_resolution.replace('p', ''))
+                    if self.byte_budget:
+                        overrides['byte_budget'] = self.byte_budget
+                    rules = load_rules(overrides=dict(self.format_rules or {}, **overrides))
+                    choice = FormatRanker(rules).select(info, combined_only=self.progressive)
+
+                    if choice is not None:
+                        self.selected_format = choice.format_spec
+                        span.set(format=choice.format_spec, estimated_bytes=choice.size)
+                        self.emit(f"已选择格式: {choice.reason}")
+                    else:
+                        # 没有可以评分的格式时使用best
+                        self.selected_format = PROGRESSIVE_FORMAT if self.progressive else "bestvideo+bestaudio/best"
+                        self.emit("已选择最佳可用格式")
+
+        except Exception as e:
+            error_msg = f"获取视频格式失败: {str(e)}"
+            self.emit_error(error_msg)
+            self.emit(error_msg)
+
+    def build_options(self):
+        # 添加时间戳到文件名
+        output_template = os.path.join(
+            self.download_dir,
+            f'%(title)s_{self.timestamp}.%(ext)s'
+        )
+
+        ydl_opts = {
+            'format': self.selected_format or (PROGRESSIVE_FORMAT if self.progressive else None),
+            'outtmpl': output_template,
+            'progress_hooks': [self.progress_hook],
+            'postprocessor_hooks': [self.postprocessor_hook],
+            'merge_output_format': 'mp4',
+            # 与后期处理、播放使用同一个ffmpeg
+            'ffmpeg_location': get_toolchain().ffmpeg_path,
+            # 只续传检查过的临时文件；其余的.part（例如ffmpeg外部下载器重新封装的输出）不能按字节续传
+            'continuedl': bool(self.resumed_bytes),
+            'prefer_ffmpeg': True,
+            'keepvideo': False,
+            # 添加重试和超时设置，yt-dlp内部重试也按指数退避等待
+            'retries': 3,  # 重试次数，之后由download_with_retries从断点继续
+            'fragment_retries': 5,  # 片段重试次数
+            'retry_sleep_functions': {
+                'http': self.retry_policy.sleep_function(),
+                'fragment': self.retry_policy.sleep_function(),
+            },
+            'skip_unavailable_fragments': True,  # 跳过不可用片段
+            # 单个视频不忽略错误，否则只能得到None而无法判断失败原因
+            'ignoreerrors': False,
+            'socket_timeout': 30,  # 套接字超时时间
+            'extractor_retries': 5,  # 提取器重试次数
+            'file_access_retries': 5,  # 文件访问重试次数
+            'hls_prefer_native': False,  # 使用ffmpeg下载HLS
+            'external_downloader': 'ffmpeg',  # 使用ffmpeg作为外部下载器
+            'external_downloader_args': {  # ffmpeg参数
+                'ffmpeg': [
+                    '-reconnect', '1',
+                    '-reconnect_streamed', '1',
+                    '-reconnect_delay_max', '30',
+                ]
+            }
+        }
+
+        if self.engine == 'native' and not self.progressive:
+            # 内置引擎并发获取片段和字节范围，不再经过ffmpeg外部下载器
+            del ydl_opts['external_downloader']
+            del ydl_opts['external_downloader_args']
+            ydl_opts['hls_prefer_native'] = True
+            ydl_opts['concurrent_fragment_downloads'] = 8
+            self.emit("使用内置并行下载引擎")
+        elif self.resumed_bytes or (self.retries and not self.progressive):
+            # ffmpeg外部下载器不能从断点继续，续传和重试时改用yt-dlp自己的下载器；
+            # 边下边播的任务重试时仍用ffmpeg从头下载，保持分片MP4布局
+            del ydl_opts['external_downloader']
+            del ydl_opts['external_downloader_args']
+            ydl_opts['hls_prefer_native'] = True
+        elif self.rate_limiter is not None and (self.rate_limiter.active or not self.progressive):
+            # ffmpeg外部下载器无法在传输过程中限速，有带宽调度时改用yt-dlp自己的下载器，
+            # 之后修改的限速对正在进行的下载同样生效；边下边播的任务只有开始时已限速才放弃ffmpeg
+            del ydl_opts['external_downloader']
+            del ydl_opts['external_downloader_args']
+            ydl_opts['hls_prefer_native'] = True
+            if self.rate_limiter.active:
+                self.emit("已启用限速，使用yt-dlp内置下载器")
+        elif self.progressive:
+            # 内置引擎乱序写入字节范围，边下边播只能用ffmpeg按顺序写出分片MP4
+            from progressive import STREAMABLE_MP4_ARGS
+            ydl_opts['external_downloader_args']['ffmpeg'] += STREAMABLE_MP4_ARGS
+
+        # 内置引擎的片段计时区间带上任务的trace
+        ydl_opts['trace'] = self.trace
+
+        if self.rate_limiter is not None:
+            ydl_opts['rate_limiter'] = self.rate_limiter
+            # 固定读取块大小，进度回调足够频繁，限速才平稳
+            ydl_opts['buffersize'] = 64 * 1024
+            ydl_opts['noresizebuffer'] = True
+
+        self._uses_ffmpeg = 'external_downloader' in ydl_opts
+
+        if self.quiet:
+            # 无界面模式下不让yt-dlp向标准输出打印进度
+            ydl_opts['quiet'] = True
+            ydl_opts['noprogress'] = True
+            ydl_opts['no_warnings'] = True
+        return ydl_opts
+
+    def run(self):
+        """执行下载并返回文件路径，失败时抛出DownloadFailed，取消时抛出JobCancelled"""
+        with self.metrics.span('task', attrs=self.trace, engine=self.engine) as span:
+            try:
+                return self._run()
+            finally:
+                span.set(retries=self.retries, wasted_bytes=self.wasted_bytes, archive_hit=self.archive_hit)
+                if self.wasted_bytes:
+                    self.metrics.inc('wasted_bytes_total', self.wasted_bytes, engine=self.engine)
+
+    def _run(self):
+        import yt_dlp
+
+        try:
+            # 在任何网络请求之前查询下载记录
+            if self.archive is not None:
+                entry = self.archive.lookup(self.url, self.preferred_resolution)
+                if entry is not None:
+                    self.archive_hit = True
+                    self.emit(f"已下载过，跳过: {entry['path']}")
+                    return entry['path']
+
+            self.emit("开始下载视频...")
+
+            # 检查FFmpeg
+            if not check_ffmpeg():
+                self.emit(FFMPEG_INSTALL_HINT)
+                raise DownloadFailed(FFMPEG_INSTALL_HINT)
+
+            # 获取合适的格式，恢复的任务沿用上次选中的格式
+            if self.selected_format:
+                self.emit(f"继续之前的下载，格式: {self.selected_format}")
+            else:
+                self.get_format_for_resolution()
+
+            if not os.path.exists(self.download_dir):
+                os.makedirs(self.download_dir)
+                self.emit(f"创建下载目录: {self.download_dir}")
+
+            self.check_partial_files()
+            ydl_opts = self.build_options()
+            if self.on_plan:
+                self.on_plan({'selected_format': self.selected_format, 'timestamp': self.timestamp})
+
+            self.emit("正在下载视频和音频...")
+            return self.download_with_retries(ydl_opts)
+
+        except yt_dlp.utils.DownloadCancelled:
+            self.cancelled = True
+            self.emit("下载已取消")
+            raise JobCancelled()
+        except DownloadFailed:
+            raise
+        except Exception as e:
+            error_msg = str(e)
+            if "ffmpeg is not installed" in error_msg:
+                error_msg = FFMPEG_INSTALL_HINT
+            self.emit(f"下载出错: {error_msg}")
+            raise DownloadFailed(error_msg)
+
+    def check_partial_files(self):
+        """检查上次留下的临时文件，截掉不完整的尾部，统计可以续传的字节数，返回 {路径: 保留的字节数}"""
+        from job_store import check_partial_file
+
+        kept_files = {}
+        self.resumed_bytes = 0
+        for path, confirmed in self.partial_files.items():
+            kept = kept_files[path] = check_partial_file(path, confirmed)
+            if kept:
+                self.resumed_bytes += kept
+                self.emit(f"从断点继续: {os.path.basename(path)} ({kept / (1024 * 1024):.1f} MB)")
+        return kept_files
+
+    def download_with_retries(self, ydl_opts):
+        """
+        下载并返回文件路径，失败时按错误类别处理：
+
+        网络错误和限流按RetryPolicy退避后从断点继续原来的格式；只有格式不可用时才降低质量；
+        地区/登录限制、视频不存在和磁盘错误直接失败。
+        """
+        import yt_dlp
+        from retry_policy import FAILURE_LABELS
+
+        downgrades = [f for f in DOWNGRADE_FORMATS if f != self.selected_format
+                      and not (self.progressive and '+' in f)]
+        downgraded = False
+        attempt = 0
+        downgrade_count = 0
+        while True:
+            self._collect_engine_waste()
+            self._attempt_files = {}
+            try:
+                # 一次尝试包括传输（每个文件一个transfer区间）和后期处理（merge、convert、move）
+                with self.metrics.span('download', engine=self.engine,
+                                       attrs=dict(self.trace, attempt=attempt + 1, format=self.selected_format)):
+                    info, video_path = self.download_with_info(ydl_opts)
+                if info is None:
+                    raise Exception("未获取到视频信息")
+                if not os.path.exists(video_path):
+                    raise Exception("下载的文件未找到")
+                break
+            except yt_dlp.utils.DownloadCancelled:
+                raise
+            except Exception as e:
+                attempt += 1
+                kind = classify_failure(e)
+                self.failures.append(kind)
+                self.metrics.inc('download_failures_total', kind=kind, engine=self.engine)
+                self.emit(f"下载过程中出错（{FAILURE_LABELS[kind]}）: {str(e)}")
+                if kind == FailureKind.FORMAT and downgrades and downgrade_count < self.retry_policy.max_downgrades:
+                    # 原来格式的临时文件不能用于新格式，删除后重新下载
+                    self.discard_partial_files()
+                    self.selected_format = downgrades.pop(0)
+                    self.cache.invalidate(self.url)
+                    downgraded = True
+                    downgrade_count += 1
+                    self.emit(f"尝试使用较低质量重新下载，格式: {self.selected_format}")
+                elif self.retry_policy.should_retry(kind, attempt):
+                    delay = self.retry_policy.delay(kind, attempt)
+                    self.metrics.inc('download_retries_total', kind=kind, engine=self.engine)
+                    self.metrics.event('retry', kind=kind, attempt=attempt, delay=round(delay, 3), **self.trace)
+                    self.emit(f"{delay:.1f}秒后重试（第{attempt}次）...")
+                    self.retry_policy.wait(delay, self.retry_checkpoint)
+                    self.prepare_resume()
+                else:
+                    error_msg = f"{FAILURE_LABELS[kind]}: {str(e)}"
+                    self.emit(f"下载出错: {error_msg}")
+                    raise DownloadFailed(error_msg)
+                self.retries += 1
+                ydl_opts = self.build_options()
+                if self.on_plan:
+                    self.on_plan({'selected_format': self.selected_format, 'timestamp': self.timestamp})
+        self._collect_engine_waste()
+
+        size_mb = os.path.getsize(video_path) / (1024 * 1024)
+        if downgraded:
+            self.emit(f"已使用较低质量完成下载: {video_path}")
+        else:
+            self.emit(f"文件已下载到: {video_path}")
+        self.emit(f"文件大小: {size_mb:.1f} MB")
+        self.report_postprocess_time()
+        if not downgraded:
+            self.record_archive(info, video_path)
+        return video_path
+
+    def _collect_engine_waste(self):
+        """累计内置引擎在上一次下载中内部重试浪费的字节"""
+        self.wasted_bytes += sum(self._engine_wasted.values())
+        self._engine_wasted = {}
+
+    def retry_checkpoint(self):
+        """重试等待期间响应暂停和取消"""
+        self.progress_hook({'status': 'retrying'})
+
+    def prepare_resume(self):
+        """重试前检查本次下载留下的临时文件，能续传的部分保留，其余计为浪费的字节"""
+        self.partial_files.update(self._attempt_files)
+        kept_files = self.check_partial_files()
+        for path, downloaded in self._attempt_files.items():
+            self.wasted_bytes += max(0, downloaded - kept_files.get(path, 0))
+
+    def discard_partial_files(self):
+        """删除不再使用的临时文件，已下载的字节全部计为浪费"""
+        self.partial_files.update(self._attempt_files)
+        for path, downloaded in self.partial_files.items():
+            for leftover in (path, path + '.native.json', path.rsplit('.part', 1)[0] + '.ytdl'):
+                try:
+                    os.remove(leftover)
+                except OSError:
+                    pass
+            self.wasted_bytes += downloaded
+        self.partial_files = {}
+        self.resumed_bytes = 0
+
+    def throttle(self, d):
+        """按新下载的字节数向限速器申请令牌，在回调中阻塞即可让yt-dlp的下载器放慢"""
+        if self.rate_limiter is None or d.get('rate_limited'):
+            return
+        filename = d.get('filename', '')
+        downloaded = d.get('downloaded_bytes') or 0
+        delta = downloaded - self._throttled_bytes.get(filename, 0)
+        self._throttled_bytes[filename] = downloaded
+        if delta > 0:
+            self.rate_limiter.consume(delta)
+
+    def postprocessor_hook(self, d):
+        """统计每个后期处理步骤（合并、转换容器等）的用时"""
+        key = d.get('postprocessor')
+        if d['status'] == 'started':
+            self._postprocess_started[key] = time.perf_counter()
+        elif d['status'] == 'finished' and key in self._postprocess_started:
+            elapsed = time.perf_counter() - self._postprocess_started.pop(key)
+            self.postprocess_times[key] = self.postprocess_times.get(key, 0.0) + elapsed
+            self.metrics.record_span(POSTPROCESS_STAGES.get(key, 'postprocess'), elapsed,
+                                     attrs=self.trace, postprocessor=key)
+
+    def report_postprocess_time(self):
+        if not self.postprocess_times:
+            return
+        details = ", ".join(f"{key} {seconds:.2f}s" for key, seconds in self.postprocess_times.items())
+        self.emit(f"后期处理用时: {sum(self.postprocess_times.values()):.2f}s ({details})")
+
+    def record_archive(self, info, video_path):
+        """把完成的下载写入下载记录；降级下载的文件不记录，下次仍按原质量下载"""
+        if self.archive is None:
+            return
+        try:
+            self.archive.record(self.url, video_path, self.preferred_resolution,
+                                format_id=info.get('format_id'))
+        except (OSError, sqlite3.Error) as e:
+            self.emit_error(f"写入下载记录失败: {str(e)}")
+
+    def record_transfer(self, d):
+        """
+        按文件累计新下载的字节数；文件下载完成时记录一个transfer区间（ffmpeg外部下载器或内置引擎的传输时间）
+        以及平均速度和文件大小的分布。ffmpeg外部下载器只在完成时报告一次，用其中的elapsed
+        """
+        filename = d.get('filename', '')
+        downloaded = d.get('downloaded_bytes') or 0
+        finished = d['status'] == 'finished'
+        transfer = self._transfers.pop(filename, None) if finished else self._transfers.get(filename)
+        if transfer is None:
+            if finished and not downloaded:
+                # 文件已经存在，没有传输
+                return
+            # 续传时第一次报告的字节数包含之前下载的部分
+            transfer = {'started': time.perf_counter(), 'wall': None,
+                        'bytes': downloaded if self.resumed_bytes and not finished else 0}
+            if not finished:
+                transfer['wall'] = time.time()
+                self._transfers[filename] = transfer
+        delta = downloaded - transfer['bytes']
+        if delta > 0:
+            self.metrics.inc('downloaded_bytes_total', delta, engine=self.engine)
+            transfer['bytes'] = downloaded
+        if not finished:
+            return
+        seconds = d.get('elapsed') or time.perf_counter() - transfer['started']
+        size = d.get('total_bytes') or downloaded
+        if size and seconds > 0:
+            self.metrics.observe('download_speed_bytes_per_second', size / seconds, SPEED_BUCKETS,
+                                 engine=self.engine)
+            self.metrics.observe('download_size_bytes', size, SIZE_BUCKETS, engine=self.engine)
+        self.metrics.record_span('transfer', seconds, started=transfer['wall'], engine=self.engine,
+                                 attrs=dict(self.trace, file=os.path.basename(filename), bytes=size))
+
+    def check_complete(self, d):
+        """
+        检查ffmpeg外部下载器下载的HTTP文件是否完整
+
+        ffmpeg在HTTP源中途断开时也可能正常退出。格式没有filesize时用一个Range请求查询源文件大小；
+        文件明显偏小时删除它并按网络错误重试（之后改用yt-dlp的下载器从头续传）。
+        ffmpeg会重新封装文件，大小和源文件略有差别，所以只在小于COMPLETE_RATIO时才认为不完整。
+        """
+        info = d.get('info_dict') or {}
+        filename = d.get('filename')
+        if not self._uses_ffmpeg or not filename or info.get('is_live') or \
+                not str(info.get('protocol', '')).startswith('http'):
+            return
+        expected = info.get('filesize') or remote_size(info.get('url'), info.get('http_headers'))
+        if not expected or not os.path.exists(filename):
+            return
+        size = os.path.getsize(filename)
+        if size < expected * COMPLETE_RATIO:
+            os.remove(filename)
+            self.wasted_bytes += size
+            raise Exception(f"IncompleteRead: {os.path.basename(filename)} 只下载了 {size} / {expected} 字节")
+
+    def progress_hook(self, d):
+        import yt_dlp
+
+        if self.job_hook:
+            try:
+                self.job_hook(d)
+            except JobCancelled:
+                self.cancelled = True
+                raise yt_dlp.utils.DownloadCancelled()
+        if d['status'] == 'downloading':
+            self.record_transfer(d)
+            if d.get('tmpfilename'):
+                self._attempt_files[d['tmpfilename']] = d.get('downloaded_bytes') or 0
+            # 内置引擎内部重试时重新下载的字节
+            self._engine_wasted[d.get('filename')] = d.get('wasted_bytes') or 0
+            self.throttle(d)
+            now = time.monotonic()
+            if not self.progress_messages or now - self._last_progress_message < 1.0:
+                return
+            self._last_progress_message = now
+            percent = d.get('_percent_str', 'N/A')
+            speed = d.get('_speed_str', 'N/A')
+            self.emit(f"下载进度: {percent} 速度: {speed}")
+        elif d['status'] == 'finished':
+            self.record_transfer(d)
+            self.check_complete(d)
+            self._attempt_files.pop(d.get('tmpfilename') or d.get('filename', '') + '.part', None)
+            self.emit(f"下载完成，正在处理文件...")
+
+
+class BatchDownloader:
+    """
+    在DownloadQueue中执行VideoDownloadTask的批量下载器
+
+    on_event(job, event) 任务状态变化，on_message(job, msg) 进度文字，
+    on_progress(job, d) yt-dlp原始进度字典。回调都在下载线程中调用。
+    设置archive（DownloadArchive）后已下载过的视频会被跳过，stats()中统计本批次的命中率。
+    设置store（JobStore）后任务状态会被持久化，restore()重新提交上次未完成的任务。
+    """
+
+    def __init__(self, max_workers=3, per_host_limit=2, on_event=None, on_message=None,
+                 on_progress=None, quiet=False, cache=None, archive=None,
+                 transcode_preset='veryfast', transcode_threads=0, format_rules=None,
+                 progress_messages=True, bandwidth=None, store=None, retry_policy=None,
+                 playlist_window=20, playlist_extractors=(), on_target=None):
+        self.on_event = on_event
+        self.on_message = on_message
+        self.on_progress = on_progress
+        self.quiet = quiet
+        self.cache = cache or metadata_cache
+        self.archive = archive
+        self.transcode_preset = transcode_preset
+        self.transcode_threads = transcode_threads
+        self.format_rules = format_rules
+        self.progress_messages = progress_messages
+        self.bandwidth = bandwidth  # BandwidthScheduler，为None时不限速
+        self.store = store
+        self.retry_policy = retry_policy or RetryPolicy()
+        # 展开播放列表时最多预先提交的等待中子任务数，以及额外的yt-dlp提取器
+        self.playlist_window = playlist_window
+        self.playlist_extractors = tuple(playlist_extractors)
+        # on_target(job, path) 在开始写入文件前调用，用于边下边播
+        self.on_target = on_target
+        self._partials = {}
+        self._closing = False
+        self._archive_lock = threading.Lock()
+        self.archive_hits = 0
+        self.archive_misses = 0
+        self.queue = DownloadQueue(self.run_job, max_workers=max_workers,
+                                   per_host_limit=per_host_limit,
+                                   on_event=self._on_event)
+
+    def add_urls(self, urls, download_dir, resolution=None, priority=0, engine='ffmpeg',
+                 byte_budget=None, rate_limit=None, playlist_filter=None, progressive=False):
+        """
+        playlist_filter为播放列表的范围和过滤选项（playlist_items、match_title等，见playlist.PlaylistFilter）；
+        progressive为True时输出可以边下边播的分片MP4
+        """
+        options = {'download_dir': download_dir, 'resolution': resolution, 'engine': engine,
+                   'byte_budget': byte_budget, 'rate_limit': rate_limit}
+        if progressive:
+            options['progressive'] = True
+        options.update(playlist_filter or {})
+        return self.queue.submit_many(urls, priority=priority, options=options)
+
+    def restore(self):
+        """重新提交store中上次未完成的任务，返回恢复的任务列表"""
+        jobs = []
+        for record in self.store.unfinished():
+            options = dict(record['options'], partial_files=record.get('partial_files') or {})
+            job = self.queue.submit(record['url'], priority=record.get('priority', 0),
+                                    options=options)
+            if record.get('state') == JobState.PAUSED:
+                self.queue.pause(job.id)
+            jobs.append(job)
+        return jobs
+
+    def _on_event(self, job, event):
+        if self.store is not None and not self._closing:
+            if event in ('finished', 'failed', 'cancelled'):
+                self._partials.pop(job.id, None)
+                self.store.remove(job)
+            else:
+                # 批量入队时合并写入，状态变化立即写入
+                self.store.save(job, force=event != 'queued')
+        if self.on_event:
+            self.on_event(job, event)
+
+    def _message(self, job, msg):
+        if self.on_message:
+            self.on_message(job, msg)
+
+    def _job_hook(self, job, d):
+        if d.get('status') in ('downloading', 'finished'):
+            downloaded = d.get('downloaded_bytes') or d.get('total_bytes') or 0
+            self.queue.record_bytes(job, d.get('filename', ''), downloaded)
+            if self.store is not None:
+                self._save_partial(job, d, downloaded)
+        if self.on_progress:
+            self.on_progress(job, d)
+        job.checkpoint()
+
+    def _save_partial(self, job, d, downloaded):
+        """记录临时文件和已确认写入的字节数，供重启后续传"""
+        from job_store import partial_progress
+
+        partials = self._partials.setdefault(job.id, {})
+        tmpfilename = d.get('tmpfilename')
+        if d['status'] == 'finished':
+            partials.pop(tmpfilename or (d.get('filename', '') + '.part'), None)
+        elif tmpfilename:
+            partials[tmpfilename] = downloaded
+        fragments = {path: partial_progress(path) for path in partials}
+        self.store.save(job, force=d['status'] == 'finished', partial_files=dict(partials),
+                        fragments={path: f for path, f in fragments.items() if f})
+
+    def run_job(self, job):
+        if job.options.get('playlist') or (job.options.get('expand_playlist', True)
+                                           and is_playlist_url(job.url)):
+            return self.expand_playlist_job(job)
+
+        rate_limiter = None
+        if self.bandwidth is not None:
+            rate_limiter = self.bandwidth.limiter_for(job.id, job.options.get('rate_limit'))
+        task = VideoDownloadTask(
+            job.url, job.options['download_dir'],
+            preferred_resolution=job.options.get('resolution'),
+            engine=job.options.get('engine', 'ffmpeg'),
+            cache=self.cache,
+            archive=self.archive,
+            on_message=lambda msg: self._message(job, msg),
+            job_hook=lambda d: self._job_hook(job, d),
+            quiet=self.quiet,
+            transcode_preset=self.transcode_preset,
+            transcode_threads=self.transcode_threads,
+            format_rules=self.format_rules,
+            byte_budget=job.options.get('byte_budget'),
+            progress_messages=self.progress_messages,
+            rate_limiter=rate_limiter,
+            timestamp=job.options.get('timestamp'),
+            selected_format=job.options.get('selected_format'),
+            partial_files=job.options.get('partial_files'),
+            on_plan=lambda plan: self._on_plan(job, plan),
+            retry_policy=self.retry_policy,
+            progressive=job.options.get('progressive', False),
+            on_target=(lambda path: self.on_target(job, path)) if self.on_target else None,
+            trace_id=f'job-{job.id}',
+        )
+        try:
+            return task.run()
+        finally:
+            if self.bandwidth is not None:
+                self.bandwidth.release(job.id)
+            job.timings['postprocess'] = sum(task.postprocess_times.values())
+            job.retries = task.retries
+            job.failures = list(task.failures)
+            job.wasted_bytes = task.wasted_bytes
+            if self.archive is not None:
+                with self._archive_lock:
+                    if task.archive_hit:
+                        self.archive_hits += 1
+                    else:
+                        self.archive_misses += 1
+
+    def expand_playlist_job(self, job):
+        """
+        边列出播放列表边提交子任务
+
+        等待中的子任务达到playlist_window个、并且已有子任务在下载时暂停列出，
+        后面的页在需要时才请求，内存占用不随列表长度增长。
+        """
+        from playlist import PlaylistFilter, iter_playlist
+
+        self._message(job, "正在获取播放列表...")
+        options = {k: v for k, v in job.options.items() if k not in PLAYLIST_OPTIONS}
+        options['expand_playlist'] = False
+        options.pop('store_key', None)
+        done = job.options.get('playlist_done', 0)
+        pending = []
+        count = 0
+        for index, url, entry in iter_playlist(job.url, PlaylistFilter.from_options(job.options),
+                                               start=done, extractors=self.playlist_extractors):
+            while True:
+                pending = [child for child in pending if child.state in (JobState.PENDING, JobState.RUNNING)]
+                waiting = sum(1 for child in pending if child.state == JobState.PENDING)
+                if waiting < self.playlist_window or len(pending) == waiting:
+                    break
+                job.checkpoint()
+                time.sleep(0.1)
+            job.checkpoint()
+            pending.append(self.queue.submit(url, priority=job.priority, options=options))
+            count += 1
+            job.options['playlist_done'] = index
+            if self.store is not None:
+                self.store.save(job, force=False)
+            if count % 100 == 0:
+                self._message(job, f"已添加 {count} 个视频...")
+        return f"播放列表已展开: {count} 个视频"
+
+    def _on_plan(self, job, plan):
+        job.options.update(plan)
+        if self.store is not None:
+            self._partials[job.id] = dict(job.options.get('partial_files') or {})
+            self.store.save(job)
+
+    def wait(self, timeout=None):
+        done = self.queue.wait(timeout)
+        if self.store is not None:
+            self.store.flush()
+        return done
+
+    def archive_stats(self):
+        """本批次的下载记录命中情况"""
+        with self._archive_lock:
+            lookups = self.archive_hits + self.archive_misses
+            return {
+                'hits': self.archive_hits,
+                'misses': self.archive_misses,
+                'hit_rate': self.archive_hits / lookups if lookups else 0.0,
+            }
+
+    def retry_stats(self):
+        """本批次的重试次数、失败类别和重试浪费的字节数"""
+        by_kind = {}
+        retried_jobs = retries = wasted = 0
+        for job in list(self.queue.jobs.values()):
+            retries += job.retries
+            wasted += job.wasted_bytes
+            retried_jobs += 1 if job.retries else 0
+            for kind in job.failures:
+                by_kind[kind] = by_kind.get(kind, 0) + 1
+        return {'retries': retries, 'retried_jobs': retried_jobs, 'wasted_bytes': wasted,
+                'failures': by_kind}
+
+    def stats(self):
+        stats = self.queue.stats()
+        stats['retries'] = self.retry_stats()
+        if self.archive is not None:
+            stats['archive'] = self.archive_stats()
+        return stats
+
+    def shutdown(self):
+        """停止所有任务；设置了store时未完成的任务保留在store中，下次启动可以恢复"""
+        self._closing = True
+        if self.store is not None:
+            self.store.flush()
+        self.queue.shutdown()
+
+
+def download(urls, output_dir, resolution=None, concurrency=3, per_host_limit=2,
+             engine='ffmpeg', on_event=None, on_progress=None, quiet=True, archive=None):
+    """
+    阻塞式批量下载接口，返回所有任务（DownloadJob）列表
+
+    例如: download(['https://youtu.be/...'], 'downloads', resolution='720p')
+    """
+    batch = BatchDownloader(max_workers=concurrency, per_host_limit=per_host_limit,
+                            on_event=on_event, on_progress=on_progress, quiet=quiet,
+                            archive=archive)
+    batch.add_urls(urls, output_dir, resolution=resolution, engine=engine)
+    batch.wait()
+    batch.shutdown()
+    return list(batch.queue.jobs.values())
@@ -0,0 +1,213 @@
+"""
+格式评分：综合分辨率、解码成本、文件大小预算、帧率上限和音频码率，
+从yt-dlp信息字典的formats中选出视频+音频组合，并给出选择理由
+
+规则可以写在JSON配置文件中，只需要写出要覆盖的项，例如:
+    {"codec_cost": {"vp09": 4}, "max_fps": 30, "weights": {"size": 20}}
+"""
+import copy
+import json
+
+DEFAULT_RULES = {
+    # 目标分辨率（高度），为None时越高越好
+    'target_height': None,
+    # 超过该帧率的格式会被扣分，为None时不限制
+    'max_fps': None,
+    # 单个任务的字节预算（视频+音频），为None时不限制
+    'byte_budget': None,
+    # 目标音频码率（kbps）
+    'audio_bitrate': 128,
+    # 解码成本，按编码名称前缀匹配；播放机对H.264有硬件解码，成本最低
+    'codec_cost': {
+        'avc1': 0, 'avc3': 0, 'h264': 0,
+        'vp09': 2, 'vp9': 2,
+        'hev1': 2, 'hvc1': 2, 'h265': 2,
+        'av01': 3,
+        'vp8': 3,
+    },
+    'unknown_codec_cost': 2,
+    'audio_codec_cost': {'mp4a': 0, 'aac': 0, 'opus': 0.5, 'mp3': 1, 'vorbis': 1.5},
+    # 各项扣分的权重
+    'weights': {
+        'resolution': 1.0,   # 每相差100像素高度
+        'above_target': 0.5,  # 高于目标分辨率时额外的扣分系数
+        'codec': 1.0,
+        'fps': 1.0,           # 每超出帧率上限30fps
+        'size': 10.0,         # 每超出预算100%
+        'audio': 1.0,         # 每相差64kbps
+        'unknown_height': 2.0,  # 未知分辨率按0计算距离后的额外扣分
+        'unknown_size': 2.0,    # 设置了预算但无法估算大小
+    },
+}
+
+
+def load_rules(path=None, overrides=None):
+    """读取JSON规则文件并与默认规则合并，overrides中的值优先"""
+    rules = copy.deepcopy(DEFAULT_RULES)
+    layers = []
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            layers.append(json.load(f))
+    if overrides:
+        layers.append(overrides)
+    for layer in layers:
+        for key, value in layer.items():
+            if isinstance(value, dict) and isinstance(rules.get(key), dict):
+                rules[key].update(value)
+            else:
+                rules[key] = value
+    return rules
+
+
+def _codec_name(codec):
+    if not codec or codec == 'none':
+        return None
+    return codec.split('.')[0].lower()
+
+
+def estimate_size(fmt, duration=None):
+    """估算格式的文件大小（字节），无法估算时返回None"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return size
+    bitrate = fmt.get('tbr') or ((fmt.get('vbr') or 0) + (fmt.get('abr') or 0))
+    if bitrate and duration:
+        return int(bitrate * 125 * duration)
+    return None
+
+
+def _format_size(size):
+    if size is None:
+        return "未知大小"
+    return f"{size / (1024 * 1024):.1f}MiB"
+
+
+class FormatChoice:
+    """选中的格式组合：video/audio为格式字典（合并格式时audio为None）"""
+
+    def __init__(self, video, audio, score, size, reason):
+        self.video = video
+        self.audio = audio
+        self.score = score
+        self.size = size
+        self.reason = reason
+
+    @property
+    def format_spec(self):
+        """yt-dlp的format参数，选中的格式不可用时退回best"""
+        if self.audio is not None:
+            return f"{self.video['format_id']}+{self.audio['format_id']}/best"
+        return f"{self.video['format_id']}/best"
+
+    @property
+    def height(self):
+        return self.video.get('height')
+
+    def __repr__(self):
+        return f"<FormatChoice {self.format_spec} score={self.score:.2f}>"
+
+
+class FormatRanker:
+    def __init__(self, rules=None):
+        self.rules = rules or load_rules()
+
+    def _video_penalties(self, fmt, max_height):
+        rules = self.rules
+        weights = rules['weights']
+        penalties = {}
+        height = fmt.get('height')
+        target = rules['target_height'] or max_height
+        if not height:
+            penalties['resolution'] = (target or 0) / 100 * weights['resolution'] + weights['unknown_height']
+        elif target:
+            distance = abs(height - target) / 100
+            if height > target:
+                distance *= 1 + weights['above_target']
+            penalties['resolution'] = distance * weights['resolution']
+
+        name = _codec_name(fmt.get('vcodec'))
+        cost = rules['codec_cost'].get(name, rules['unknown_codec_cost']) if name else rules['unknown_codec_cost']
+        penalties['codec'] = cost * weights['codec']
+
+        fps = fmt.get('fps')
+        if rules['max_fps'] and fps and fps > rules['max_fps']:
+            penalties['fps'] = (fps - rules['max_fps']) / 30 * weights['fps']
+        return penalties
+
+    def _audio_penalty(self, fmt):
+        rules = self.rules
+        abr = fmt.get('abr')
+        if not abr and fmt.get('vcodec') == 'none':
+            abr = fmt.get('tbr')
+        penalty = abs(abr - rules['audio_bitrate']) / 64 if abr else 1.0
+        name = _codec_name(fmt.get('acodec'))
+        penalty += rules['audio_codec_cost'].get(name, 1.0)
+        return penalty * rules['weights']['audio']
+
+    def _size_penalty(self, size):
+        budget = self.rules['byte_budget']
+        if not budget:
+            return 0.0
+        if size is None:
+            return self.rules['weights']['unknown_size']
+        if size <= budget:
+            return 0.0
+        return (size - budget) / budget * self.rules['weights']['size']
+
+    def rank(self, info, combined_only=False):
+        """返回按得分排序（越低越好）的FormatChoice列表，combined_only为True时只考虑自带音频的合并格式"""
+        formats = info.get('formats') or []
+        duration = info.get('duration')
+        videos = [f for f in formats if f.get('vcodec') != 'none' and f.get('acodec') == 'none']
+        combined = [f for f in formats if f.get('vcodec') not in (None, 'none')
+                    and f.get('acodec') not in (None, 'none')]
+        audios = [f for f in formats if f.get('vcodec') == 'none' and f.get('acodec') != 'none']
+        heights = [f.get('height') or 0 for f in videos + combined]
+        max_height = max(heights) if heights else None
+
+        audio_choice = None
+        if audios:
+            audio_choice = min(audios, key=self._audio_penalty)
+
+        candidates = [(f, audio_choice) for f in videos if audio_choice is not None and not combined_only]
+        candidates += [(f, None) for f in combined]
+        choices = []
+        for fmt, audio in candidates:
+            penalties = self._video_penalties(fmt, max_height)
+            size = estimate_size(fmt, duration)
+            # 合并格式按自带的音频计分
+            penalties['audio'] = self._audio_penalty(audio or fmt)
+            if audio is not None:
+                audio_size = estimate_size(audio, duration)
+                size = size + audio_size if size is not None and audio_size is not None else size
+            size_penalty = self._size_penalty(size)
+            if size_penalty:
+                penalties['size'] = size_penalty
+            score = sum(penalties.values())
+            choices.append(FormatChoice(fmt, audio, score, size,
+                                        self._reason(fmt, audio, size, penalties)))
+        choices.sort(key=lambda c: c.score)
+        return choices
+
+    def select(self, info, combined_only=False):
+        """返回得分最高的FormatChoice，没有可用格式时返回None"""
+        choices = self.rank(info, combined_only)
+        return choices[0] if choices else None
+
+    def _reason(self, video, audio, size, penalties):
+        height = video.get('height')
+        parts = [f"{height}p" if height else "未知分辨率",
+                 _codec_name(video.get('vcodec')) or "未知编码"]
+        if video.get('fps'):
+            parts.append(f"{video['fps']:g}fps")
+        text = " ".join(parts)
+        if audio is not None:
+            abr = audio.get('abr')
+            text += f" + {_codec_name(audio.get('acodec')) or '音频'}"
+            if abr:
+                text += f" {abr:g}kbps"
+        text += f"，预计{_format_size(size)}"
+        details = ", ".join(f"{key} {value:.2f}" for key, value in penalties.items() if value)
+        if details:
+            text += f"（扣分: {details}）"
+        return text
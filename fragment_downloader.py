@@ -0,0 +1,449 @@
+import http.client
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urljoin, urlsplit
+
+from metrics import get_registry
+
+MiB = 1024 * 1024
+READ_BLOCK = 256 * 1024
+# 可以重试的4xx状态码（超时、限流），5xx都会重试
+RETRYABLE_STATUS = (408, 429)
+
+
+class DownloadInterrupted(Exception):
+    """下载中断，已完成的部分保留在磁盘上，下次可以继续"""
+
+
+class ConnectionPool:
+    """按主机复用的keep-alive连接池，每个连接同一时间只被一个线程使用"""
+
+    def __init__(self, max_idle_per_host=16, timeout=30):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def _acquire(self, scheme, netloc):
+        key = (scheme, netloc)
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self.reused += 1
+                return idle.pop()
+        return self._acquire_new(scheme, netloc)
+
+    def _release(self, scheme, netloc, conn):
+        key = (scheme, netloc)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, url, headers=None, method='GET', max_redirects=5):
+        """发送请求并返回 (response, release)，读完响应体后调用release(reusable)归还连接"""
+        for _ in range(max_redirects + 1):
+            parts = urlsplit(url)
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+            conn = self._acquire(parts.scheme, parts.netloc)
+            try:
+                conn.request(method, path, headers=headers or {})
+                response = conn.getresponse()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                # 复用的连接可能已被服务器关闭，用新连接重试一次
+                conn = self._acquire_new(parts.scheme, parts.netloc)
+                conn.request(method, path, headers=headers or {})
+                response = conn.getresponse()
+
+            if response.status in (301, 302, 303, 307, 308) and response.getheader('Location'):
+                response.read()
+                self._release(parts.scheme, parts.netloc, conn)
+                url = urljoin(url, response.getheader('Location'))
+                continue
+
+            def release(reusable=True, scheme=parts.scheme, netloc=parts.netloc, conn=conn):
+                if reusable and not response.will_close:
+                    self._release(scheme, netloc, conn)
+                else:
+                    conn.close()
+            return response, release
+        raise http.client.HTTPException(f"重定向次数过多: {url}")
+
+    def _acquire_new(self, scheme, netloc):
+        with self._lock:
+            self.created += 1
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+def _preallocate(f, size):
+    """为输出文件预分配空间，不支持fallocate的系统上退化为truncate"""
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+            return
+        except OSError:
+            pass
+    f.truncate(size)
+
+
+def _sync(f):
+    """把已写入的数据落盘，之后保存的进度才不会记录还在缓冲区里的块"""
+    f.flush()
+    os.fsync(f.fileno())
+
+
+class ParallelDownloader:
+    """
+    并发下载引擎：把单个HTTP文件按字节范围拆分，或把DASH/HLS片段并发获取，
+    按顺序写入最终文件。进度保存在 <目标文件>.native.json 中，失败后可从断点继续。
+
+    progress_hook(downloaded_bytes, total_bytes) 在工作线程中调用，抛出异常会中止下载。
+    每个字节范围或片段记录一个fragment计时区间，trace中的字段（任务的trace、URL）写入事件。
+    """
+
+    def __init__(self, workers=8, chunk_size=4 * MiB, retries=5, pool=None,
+                 progress_hook=None, rate_limiter=None, trace=None):
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.pool = pool or ConnectionPool(max_idle_per_host=self.workers)
+        self.progress_hook = progress_hook
+        self.rate_limiter = rate_limiter
+        self._lock = threading.Lock()
+        self._downloaded = 0
+        self._total = None
+        self._last_report = 0.0
+        self._abort = threading.Event()
+        self.retried = 0
+        self.wasted_bytes = 0
+        self.metrics = get_registry()
+        self.trace = dict(trace or {})
+
+    # ---- 通用 ----
+
+    def _report(self, nbytes, force=False):
+        with self._lock:
+            self._downloaded += nbytes
+            now = time.monotonic()
+            if not force and now - self._last_report < 0.1:
+                return
+            self._last_report = now
+            downloaded, total = self._downloaded, self._total
+        if self.progress_hook:
+            self.progress_hook(downloaded, total)
+
+    def _throttle(self, nbytes):
+        if self.rate_limiter:
+            self.rate_limiter.consume(nbytes)
+
+    @staticmethod
+    def _state_path(dest):
+        return dest + '.native.json'
+
+    def _load_state(self, dest, signature):
+        path = self._state_path(dest)
+        if not os.path.exists(dest):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return state if state.get('signature') == signature else None
+
+    def _save_state(self, dest, state):
+        path = self._state_path(dest)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def _clear_state(self, dest):
+        try:
+            os.remove(self._state_path(dest))
+        except OSError:
+            pass
+
+    def _fetch(self, url, headers, sink, expected=None, partial=False):
+        """
+        下载一个请求的响应体，写入sink(offset, data)，失败时按次数重试（offset从0重新开始）
+
+        partial为True时（Range请求）只接受206响应，服务器返回整个文件时不写入任何数据
+        """
+        last_error = None
+        started = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            if self._abort.is_set():
+                raise DownloadInterrupted("下载已中止")
+            received = 0
+            try:
+                response, release = self.pool.request(url, headers)
+                if response.status >= 400:
+                    response.read()
+                    release()
+                    if response.status < 500 and response.status not in RETRYABLE_STATUS:
+                        # 404、403等重试也不会成功
+                        raise DownloadInterrupted(f"HTTP {response.status}: {url}")
+                    raise http.client.HTTPException(f"HTTP {response.status}: {url}")
+                if partial and response.status != 206:
+                    # 整个文件会覆盖相邻的块，重试也不会改变服务器的行为
+                    release(reusable=False)
+                    raise DownloadInterrupted(f"服务器没有按Range返回部分内容（HTTP {response.status}）: {url}")
+                length = expected
+                if length is None:
+                    # 没有指定长度时按Content-Length检查，连接中途断开不会被当作完整的响应
+                    header = response.getheader('Content-Length')
+                    length = int(header) if header and header.isdigit() else None
+                complete = False
+                try:
+                    while True:
+                        if self._abort.is_set():
+                            raise DownloadInterrupted("下载已中止")
+                        data = response.read(READ_BLOCK)
+                        if not data:
+                            break
+                        self._throttle(len(data))
+                        sink(received, data)
+                        received += len(data)
+                        self._report(len(data))
+                    complete = True
+                finally:
+                    release(reusable=complete)
+                if length is not None and received != length:
+                    raise http.client.IncompleteRead(b'', length - received)
+                self.metrics.record_span('fragment', time.perf_counter() - started,
+                                         attrs=dict(self.trace, bytes=received, attempts=attempt + 1))
+                return received
+            except DownloadInterrupted:
+                raise
+            except (OSError, http.client.HTTPException) as e:
+                last_error = e
+                # 重新下载整个块，已计入进度的字节要扣除
+                self._report(-received)
+                with self._lock:
+                    self.retried += 1
+                    self.wasted_bytes += received
+                self.metrics.inc('fragment_retries_total')
+                # 指数退避，加随机抖动避免所有连接同时重试
+                time.sleep(min(2 ** attempt * 0.5, 10) * (0.5 + random.random()))
+        self.metrics.record_span('fragment', time.perf_counter() - started, status='error',
+                                 attrs=dict(self.trace, error=str(last_error)[:200], attempts=self.retries + 1))
+        raise DownloadInterrupted(f"下载失败: {last_error}")
+
+    def probe(self, url, headers=None):
+        """返回 (文件大小, 是否支持Range请求)"""
+        probe_headers = dict(headers or {}, Range='bytes=0-0')
+        response, release = self.pool.request(url, probe_headers)
+        response.read()
+        release()
+        if response.status == 206:
+            content_range = response.getheader('Content-Range', '')
+            total = content_range.rpartition('/')[2]
+            return (int(total) if total.isdigit() else None), True
+        length = response.getheader('Content-Length')
+        return (int(length) if length and length.isdigit() else None), False
+
+    def _run_parallel(self, tasks, handle):
+        """用线程池执行任务，任一失败时中止其余任务并抛出"""
+        self._abort.clear()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(handle, task) for task in tasks]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                self._abort.set()
+                for future in futures:
+                    future.cancel()
+                raise
+
+    # ---- 按字节范围并发下载单个文件 ----
+
+    def download_url(self, url, dest, headers=None, total_size=None):
+        size, ranged = self.probe(url, headers)
+        total_size = size or total_size
+        if not ranged or not total_size:
+            return self._download_single(url, dest, headers)
+
+        # 小文件也要拆成足够多的块，才能让所有连接都参与下载
+        chunk_size = max(256 * 1024, min(self.chunk_size, -(-total_size // (self.workers * 2))))
+        chunk_count = (total_size + chunk_size - 1) // chunk_size
+        signature = {'url': url.split('?')[0], 'size': total_size, 'chunk_size': chunk_size}
+        state = self._load_state(dest, signature) or {'signature': signature, 'done': []}
+        done = self._verify_chunks(dest, set(state['done']), chunk_size)
+
+        with self._lock:
+            self._total = total_size
+            self._downloaded = sum(min(chunk_size, total_size - i * chunk_size) for i in done)
+
+        mode = 'r+b' if done and os.path.exists(dest) else 'wb'
+        with open(dest, mode) as f:
+            if mode == 'wb':
+                _preallocate(f, total_size)
+            write_lock = threading.Lock()
+
+            def handle(index):
+                start = index * chunk_size
+                end = min(start + chunk_size, total_size) - 1
+
+                def sink(offset, data):
+                    with write_lock:
+                        f.seek(start + offset)
+                        f.write(data)
+
+                self._fetch(url, dict(headers or {}, Range=f'bytes={start}-{end}'),
+                            sink, expected=end - start + 1, partial=True)
+                with write_lock:
+                    _sync(f)
+                    done.add(index)
+                    state['done'] = sorted(done)
+                    self._save_state(dest, state)
+
+            self._run_parallel([i for i in range(chunk_count) if i not in done], handle)
+
+        self._clear_state(dest)
+        self._report(0, force=True)
+        return total_size
+
+    @staticmethod
+    def _verify_chunks(dest, done, chunk_size, probe_size=4096):
+        """
+        检查记录为已完成的块：预分配的空间是全零的，块开头仍为全零说明数据没有写入磁盘
+        （例如断电），这样的块重新下载
+        """
+        if not done:
+            return done
+        verified = set()
+        with open(dest, 'rb') as f:
+            for index in done:
+                f.seek(index * chunk_size)
+                if f.read(probe_size).strip(b'\0'):
+                    verified.add(index)
+        return verified
+
+    def _download_single(self, url, dest, headers=None):
+        """服务器不支持Range时退化为单连接顺序下载"""
+        with open(dest, 'wb') as f:
+            def sink(offset, data):
+                if offset == 0:
+                    # 重试时从头重新接收，丢弃上一次写入的部分
+                    f.seek(0)
+                    f.truncate()
+                f.write(data)
+
+            size = self._fetch(url, headers, sink)
+        with self._lock:
+            self._total = size
+        self._report(0, force=True)
+        return size
+
+    # ---- 并发下载片段，按顺序写入 ----
+
+    def download_fragments(self, fragment_urls, dest, headers=None):
+        fragment_urls = list(fragment_urls)
+        signature = {'fragments': len(fragment_urls), 'first': fragment_urls[0].split('?')[0] if fragment_urls else ''}
+        state = self._load_state(dest, signature) or {'signature': signature, 'written': 0, 'offset': 0}
+
+        with self._lock:
+            self._total = None
+            self._downloaded = state['offset']
+
+        mode = 'r+b' if state['written'] and os.path.exists(dest) else 'wb'
+        with open(dest, mode) as f:
+            # 截掉上次中断时可能写了一半的数据
+            f.truncate(state['offset'])
+            f.seek(state['offset'])
+
+            pending = {}
+            next_index = state['written']
+            window = self.workers * 2
+            self._abort.clear()
+
+            def fetch(index):
+                parts = []
+
+                def sink(offset, data):
+                    if offset == 0:
+                        # 重试时从头开始接收这个片段
+                        parts.clear()
+                    parts.append(data)
+
+                self._fetch(fragment_urls[index], headers, sink)
+                return index, b''.join(parts)
+
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                submitted = next_index
+                running = set()
+                try:
+                    while next_index < len(fragment_urls):
+                        # 只预取有限数量的片段，内存占用与并发数成正比
+                        while submitted < len(fragment_urls) and submitted < next_index + window:
+                            running.add(executor.submit(fetch, submitted))
+                            submitted += 1
+                        finished, running = wait(running, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            index, data = future.result()
+                            pending[index] = data
+                        while next_index in pending:
+                            data = pending.pop(next_index)
+                            f.write(data)
+                            next_index += 1
+                            state['written'] = next_index
+                            state['offset'] += len(data)
+                        _sync(f)
+                        self._save_state(dest, state)
+                except BaseException:
+                    self._abort.set()
+                    for future in running:
+                        future.cancel()
+                    raise
+
+        self._clear_state(dest)
+        with self._lock:
+            self._total = self._downloaded
+        self._report(0, force=True)
+        return state['offset']
+
+    def close(self):
+        self.pool.close()
+
+
+def parse_m3u8_segments(playlist_text, base_url):
+    """
+    解析简单的HLS媒体播放列表，返回片段URL列表
+
+    加密、字节范围或初始化片段等复杂播放列表返回None，由调用方改用其他下载方式
+    """
+    segments = []
+    for line in playlist_text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#'):
+            if line.startswith('#EXT-X-KEY') and 'METHOD=NONE' not in line:
+                return None
+            if line.startswith(('#EXT-X-BYTERANGE', '#EXT-X-MAP', '#EXT-X-STREAM-INF')):
+                return None
+            continue
+        segments.append(urljoin(base_url, line))
+    return segments or None
@@ -0,0 +1,101 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+class FrameRenderer:
+    """
+    在解码线程中把帧缩放到显示区域大小，写入预先分配的复用缓冲区
+
+    使用三个缓冲区轮换：一个正在被界面绘制，一个是最新发布的帧，
+    另一个供解码线程写入，因此不需要为每帧分配内存，也不会排队旧帧。
+    只有显示区域大小或视频宽高比变化时才重新分配缓冲区。
+    """
+
+    def __init__(self, buffer_count=3, interpolation=cv2.INTER_AREA, on_frame=None):
+        self.buffer_count = max(3, buffer_count)
+        self.interpolation = interpolation
+        self.on_frame = on_frame
+        self._lock = threading.Lock()
+        self._target_size = (0, 0)
+        self._buffers = []
+        self._buffer_shape = None
+        self._published = None
+        self._in_use = None
+        self._pending = False
+        self.submitted_frames = 0
+        self.skipped_frames = 0
+        self.allocations = 0
+
+    def set_target_size(self, width, height):
+        """设置显示区域大小（像素），在界面线程的resize事件中调用"""
+        with self._lock:
+            self._target_size = (max(0, int(width)), max(0, int(height)))
+
+    def _fit_size(self, frame_width, frame_height):
+        target_width, target_height = self._target_size
+        if target_width <= 0 or target_height <= 0:
+            return None
+        scale = min(target_width / frame_width, target_height / frame_height)
+        return max(1, int(frame_width * scale)), max(1, int(frame_height * scale))
+
+    def _ensure_buffers(self, width, height, channels):
+        shape = (height, width, channels)
+        if self._buffer_shape == shape:
+            return
+        self._buffers = [np.empty(shape, dtype=np.uint8) for _ in range(self.buffer_count)]
+        self._buffer_shape = shape
+        self._published = None
+        self._in_use = None
+        self.allocations += 1
+
+    def submit(self, frame):
+        """在解码线程中调用：缩放并发布一帧，返回是否发布成功"""
+        h, w = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        with self._lock:
+            size = self._fit_size(w, h)
+            if size is None:
+                self.skipped_frames += 1
+                return False
+            self._ensure_buffers(size[0], size[1], channels)
+            index = next(i for i in range(self.buffer_count)
+                         if i != self._published and i != self._in_use)
+            buffer = self._buffers[index]
+
+        if (w, h) == size:
+            np.copyto(buffer, frame.reshape(buffer.shape))
+        else:
+            cv2.resize(frame, size, dst=buffer, interpolation=self.interpolation)
+
+        with self._lock:
+            if self._buffers and self._buffers[index] is buffer:
+                if self._pending:
+                    # 上一帧还没有被绘制就被新帧替换
+                    self.skipped_frames += 1
+                self._published = index
+                notify = not self._pending
+                self._pending = True
+                self.submitted_frames += 1
+            else:
+                # 写入期间缓冲区被重新分配，丢弃这一帧
+                return False
+        if notify and self.on_frame:
+            self.on_frame()
+        return True
+
+    def acquire(self):
+        """在界面线程中调用：取得最新一帧的缓冲区用于绘制，没有帧时返回None"""
+        with self._lock:
+            self._pending = False
+            if self._published is None:
+                return None
+            self._in_use = self._published
+            return self._buffers[self._in_use]
+
+    def clear(self):
+        with self._lock:
+            self._published = None
+            self._in_use = None
+            self._pending = False
@@ -0,0 +1,153 @@
+"""
+下载任务状态的持久化，程序重启后恢复未完成的任务并从断点继续
+
+每个任务记录URL、下载选项（包括固定下来的文件名时间戳和选中的格式）、
+已下载字节数、临时文件和片段进度。恢复前用check_partial_file检查临时文件的完整性。
+"""
+import json
+import os
+import threading
+import time
+import uuid
+
+STORE_FILENAME = '.download_jobs.json'
+
+# 恢复任务时需要保留的下载选项
+PERSISTED_OPTIONS = ('download_dir', 'resolution', 'engine', 'byte_budget', 'rate_limit',
+                     'expand_playlist', 'timestamp', 'selected_format', 'store_key',
+                     'playlist', 'playlist_items', 'match_title', 'reject_title',
+                     'min_duration', 'max_duration', 'playlist_done', 'progressive')
+
+ZERO_BLOCK = 64 * 1024
+
+
+def partial_progress(tmpfilename):
+    """读取临时文件旁边的进度文件，返回片段进度（dict），没有时返回None"""
+    native_state = tmpfilename + '.native.json'
+    ytdl_state = tmpfilename.rsplit('.part', 1)[0] + '.ytdl' if tmpfilename.endswith('.part') else None
+    try:
+        if os.path.exists(native_state):
+            with open(native_state, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if 'done' in state:
+                return {'engine': 'native', 'chunks_done': len(state['done'])}
+            return {'engine': 'native', 'fragments_written': state.get('written', 0),
+                    'offset': state.get('offset', 0)}
+        if ytdl_state and os.path.exists(ytdl_state):
+            with open(ytdl_state, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            fragment = state.get('downloader', {}).get('current_fragment', {})
+            return {'engine': 'yt-dlp', 'fragment_index': fragment.get('index')}
+    except (OSError, ValueError):
+        return None
+    return None
+
+
+def check_partial_file(tmpfilename, confirmed_bytes=None):
+    """
+    继续下载前检查临时文件，返回可以保留的字节数
+
+    有片段进度文件时由对应的下载器自己校验；顺序写入的临时文件截掉进度回调
+    没有确认过的尾部，以及崩溃后可能留下的全零块
+    """
+    if not os.path.exists(tmpfilename):
+        return 0
+    if partial_progress(tmpfilename) is not None:
+        return os.path.getsize(tmpfilename)
+    size = os.path.getsize(tmpfilename)
+    keep = min(size, confirmed_bytes) if confirmed_bytes else size
+    with open(tmpfilename, 'r+b') as f:
+        while keep > 0:
+            start = max(0, keep - ZERO_BLOCK)
+            f.seek(start)
+            if f.read(keep - start).strip(b'\0'):
+                break
+            keep = start
+        if keep != size:
+            f.truncate(keep)
+    return keep
+
+
+class JobStore:
+    """
+    把任务状态保存在JSON文件中
+
+    任务以options['store_key']标识（重启后任务id会变化）。force=False的更新（进度、批量入队）
+    最多每min_interval秒写一次文件，其余时间只标记为未保存，由下一次写入或flush()带上。
+    """
+
+    def __init__(self, path, min_interval=2.0):
+        self.path = path
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._records = {}
+        self._last_write = 0.0
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._records = {record['key']: record for record in data.get('jobs', [])
+                         if record.get('key') and record.get('url')}
+
+    def _write(self):
+        """调用方须持有锁"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'jobs': list(self._records.values())}, f,
+                      ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+        self._last_write = time.monotonic()
+        self._dirty = False
+
+    def _commit(self, force):
+        """调用方须持有锁"""
+        if force or time.monotonic() - self._last_write >= self.min_interval:
+            self._write()
+        else:
+            self._dirty = True
+
+    @staticmethod
+    def key_for(job):
+        return job.options.setdefault('store_key', uuid.uuid4().hex)
+
+    def save(self, job, force=True, **fields):
+        """保存任务当前状态，fields中的值会合并到记录中（例如partial_files）"""
+        key = self.key_for(job)
+        with self._lock:
+            record = self._records.get(key, {'key': key, 'created_at': time.time()})
+            record.update({
+                'url': job.url,
+                'priority': job.priority,
+                'state': job.state,
+                'options': {k: v for k, v in job.options.items() if k in PERSISTED_OPTIONS},
+                'bytes_downloaded': job.bytes_downloaded,
+                'updated_at': time.time(),
+            })
+            record.update(fields)
+            self._records[key] = record
+            self._commit(force)
+
+    def remove(self, job, force=True):
+        key = job.options.get('store_key')
+        with self._lock:
+            if self._records.pop(key, None) is not None:
+                self._commit(force)
+
+    def unfinished(self):
+        """返回需要恢复的任务记录，按创建时间排序"""
+        with self._lock:
+            records = [json.loads(json.dumps(r)) for r in self._records.values()]
+        return sorted(records, key=lambda r: r.get('created_at', 0))
+
+    def flush(self):
+        """写入尚未保存的更新"""
+        with self._lock:
+            if self._dirty:
+                self._write()
@@ -1,362 +1,469 @@
 import sys
 import os
-import cv2
 import numpy as np
 import threading
-from moviepy.editor import VideoFileClip
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
-                           QHBoxLayout, QLineEdit, QPushButton, QTextEdit,
-                           QComboBox, QLabel, QMessageBox, QSlider, QFileDialog)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal, QMutex
-from PyQt6.QtGui import QImage, QPixmap
-import yt_dlp
+                           QHBoxLayout, QPushButton,
+                           QComboBox, QLabel, QMessageBox, QSlider, QFileDialog,
+                           QPlainTextEdit, QSpinBox, QListWidget, QListWidgetItem, QDialog,
+                           QCheckBox)
+from PyQt6.QtCore import Qt, QThread, QObject, QTimer, QSize, pyqtSignal, QMutex
+from PyQt6.QtGui import QImage, QPainter, QIcon, QPixmap
 import time
-import subprocess
+from download_archive import DownloadArchive, ARCHIVE_FILENAME
+from job_store import JobStore, STORE_FILENAME
+from toolchain import get_toolchain
+from bandwidth import BandwidthScheduler
+from progress_aggregator import ProgressAggregator
+from previews import PreviewGenerator
+from download_queue import JobState, parse_url_list, load_url_file
+from downloader_core import BatchDownloader, format_speed, metadata_cache
+from decode_engine import FrameDecoder
+from progressive import ProgressiveSource
+from av_clock import MasterClock, FrameScheduler
+from audio_engine import AudioEngine, open_sink
+from frame_render import FrameRenderer
+import process_stats
+import metrics
 
-class VideoDownloader(QThread):
-    finished = pyqtSignal(str)
-    error = pyqtSignal(str)
-    progress = pyqtSignal(str)
+# 播放器解码缓冲区占用的内存上限：高分辨率视频缓冲的帧数相应减少
+FRAME_CACHE_BYTES = 64 * 1024 * 1024
 
-    def __init__(self, url, download_dir):
+class DownloadManager(QObject):
+    """
+    把BatchDownloader的状态变化转成信号，在GUI线程中处理
+
+    进度和日志只写入ProgressAggregator，由界面定时拉取，不为每次回调发信号。
+    core为'async'（或设置 YTDL_DOWNLOAD_CORE=async）时改用async_downloader的异步下载核心，
+    回调在事件循环线程中调用，信号照常排队到GUI线程。
+    """
+    job_changed = pyqtSignal(int, str)
+    # 边下边播的任务开始写入文件 (任务ID, 最终文件路径)
+    target_ready = pyqtSignal(int, str)
+
+    def __init__(self, max_workers=3, per_host_limit=2, archive=None, store=None, core=None):
         super().__init__()
-        self.url = url
-        self.download_dir = download_dir
-        self.selected_format = None
-        self.preferred_resolution = None
+        self.progress = ProgressAggregator()
+        self.bandwidth = BandwidthScheduler()
+        batch_class = BatchDownloader
+        if (core or os.environ.get('YTDL_DOWNLOAD_CORE')) == 'async':
+            from async_downloader import AsyncBatchDownloader as batch_class
+        self.batch = batch_class(
+            max_workers=max_workers,
+            per_host_limit=per_host_limit,
+            archive=archive,
+            bandwidth=self.bandwidth,
+            store=store,
+            on_event=self._on_event,
+            on_message=lambda job, msg: self.progress.log(job.id, msg),
+            on_progress=lambda job, d: self.progress.update(job.id, d),
+            on_target=lambda job, path: self.target_ready.emit(job.id, path),
+            progress_messages=False,
+        )
+        self.queue = self.batch.queue
 
-    def check_ffmpeg(self):
-        """检查是否安装了FFmpeg"""
-        try:
-            subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
-            return True
-        except (subprocess.SubprocessError, FileNotFoundError):
-            return False
+    def _on_event(self, job, event):
+        if event in ('finished', 'failed', 'cancelled'):
+            self.progress.finish(job.id)
+        if event == 'finished':
+            self.progress.log(job.id, f"下载完成: {job.result}")
+        elif event == 'failed':
+            self.progress.log(job.id, f"错误: {job.error}")
+        self.job_changed.emit(job.id, event)
 
-    def get_format_for_resolution(self):
-        """获取指定分辨率的视频格式"""
-        try:
-            self.progress.emit("正在获取可用的视频格式...")
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True
-            }
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(self.url, download=False)
-                formats = []
-                
-                # 只收集视频格式，音频将单独处理
-                for f in info['formats']:
-                    if f.get('vcodec') != 'none' and f.get('acodec') == 'none':  # 只要纯视频流
-                        format_id = f['format_id']
-                        height = f.get('height', 0)
-                        formats.append({
-                            'format_id': format_id,
-                            'height': height
-                        })
-                
-                # 如果指定了分辨率，选择最接近的
-                if self.preferred_resolution and formats:
-                    target_height = int(self.preferred_resolution.replace('p', ''))
-                    closest_format = min(formats, 
-                                      key=lambda x: abs(x.get('height', 0) - target_height))
-                    # 使用格式ID+最佳音频
-                    self.selected_format = f"{closest_format['format_id']}+bestaudio/best"
-                    self.progress.emit(f"已选择分辨率: {closest_format['height']}p")
-                else:
-                    # 如果没有指定分辨率或没找到合适格式，使用best
-                    self.selected_format = "bestvideo+bestaudio/best"
-                    self.progress.emit("已选择最佳可用格式")
-                
-        except Exception as e:
-            error_msg = f"获取视频格式失败: {str(e)}"
-            self.error.emit(error_msg)
-            self.progress.emit(error_msg)
+    def add_urls(self, urls, download_dir, resolution=None, priority=0, engine='ffmpeg',
+                 progressive=False):
+        return self.batch.add_urls(urls, download_dir, resolution, priority, engine,
+                                   progressive=progressive)
 
-    def run(self):
-        try:
-            self.progress.emit("开始下载视频...")
-            
-            # 检查FFmpeg
-            if not self.check_ffmpeg():
-                error_msg = (
-                    "未检测到FFmpeg。请按照以下步骤安装：\n"
-                    "1. 访问 https://github.com/BtbN/FFmpeg-Builds/releases\n"
-                    "2. 下载 ffmpeg-master-latest-win64-gpl.zip\n"
-                    "3. 解压文件\n"
-                    "4. 将解压后的 ffmpeg-master-latest-win64-gpl\\bin 目录添加到系统环境变量\n"
-                    "5. 重启应用程序"
-                )
-                self.error.emit(error_msg)
-                self.progress.emit(error_msg)
-                return
+    def restore(self):
+        """恢复上次退出时未完成的任务"""
+        if self.batch.store is None:
+            return []
+        return self.batch.restore()
+
+    def shutdown(self):
+        self.batch.shutdown()
+
+class PreviewManager(QObject):
+    """在进程池中为下载完成的视频生成预览，完成后通过信号通知GUI线程"""
+    preview_ready = pyqtSignal(object)
+
+    def __init__(self, workers=None):
+        super().__init__()
+        # 预览在后台进行，默认只占用一半的CPU，不影响下载和播放
+        self.generator = PreviewGenerator(workers=workers or max(1, (os.cpu_count() or 2) // 2),
+                                          on_result=self.preview_ready.emit)
+
+    def submit(self, path):
+        self.generator.submit(path)
+
+    def shutdown(self):
+        self.generator.shutdown(wait=False)
+
+class PlaybackSession:
+    """
+    一次播放：一个文件的解码器、音频引擎和首帧计时
+
+    会话由播放线程关闭，关闭后解码线程、解码子进程和音频引擎都已结束。
+    """
+
+    def __init__(self, path, is_complete=None):
+        self.path = path
+        # 边下边播时为下载结束后返回True的函数，解码器在播放线程中创建
+        self.is_complete = is_complete
+        self.decoder = None
+        self.audio = None
+        self.load_started = time.perf_counter()
+        self.first_frame_seconds = None
+
+    def close(self):
+        if self.decoder:
+            try:
+                self.decoder.close()
+            except Exception:
+                pass
+            self.decoder = None
+        if self.audio:
+            try:
+                self.audio.close()
+            except Exception:
+                pass
+            self.audio = None
 
-            # 获取合适的格式
-            self.get_format_for_resolution()
-            
-            if not os.path.exists(self.download_dir):
-                os.makedirs(self.download_dir)
-                self.progress.emit(f"创建下载目录: {self.download_dir}")
-            
-            # 添加时间戳到文件名
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            output_template = os.path.join(
-                self.download_dir, 
-                f'%(title)s_{timestamp}.%(ext)s'
-            )
-            
-            ydl_opts = {
-                'format': self.selected_format,
-                'outtmpl': output_template,
-                'progress_hooks': [self.progress_hook],
-                'merge_output_format': 'mp4',
-                'postprocessors': [{
-                    'key': 'FFmpegVideoConvertor',
-                    'preferedformat': 'mp4',
-                }],
-                'prefer_ffmpeg': True,
-                'keepvideo': False,
-                # 添加重试和超时设置
-                'retries': 10,  # 重试次数
-                'fragment_retries': 10,  # 片段重试次数
-                'skip_unavailable_fragments': True,  # 跳过不可用片段
-                'ignoreerrors': True,  # 忽略错误继续下载
-                'socket_timeout': 30,  # 套接字超时时间
-                'extractor_retries': 5,  # 提取器重试次数
-                'file_access_retries': 5,  # 文件访问重试次数
-                'hls_prefer_native': False,  # 使用ffmpeg下载HLS
-                'external_downloader': 'ffmpeg',  # 使用ffmpeg作为外部下载器
-                'external_downloader_args': {  # ffmpeg参数
-                    'ffmpeg': [
-                        '-reconnect', '1',
-                        '-reconnect_streamed', '1',
-                        '-reconnect_delay_max', '30',
-                    ]
-                }
-            }
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                self.progress.emit("正在下载视频和音频...")
-                try:
-                    info = ydl.extract_info(self.url, download=True)
-                    if info is None:
-                        raise Exception("下载失败，请检查网络连接或尝试降低视频质量")
-                    
-                    video_path = ydl.prepare_filename(info)
-                    
-                    if os.path.exists(video_path):
-                        size_mb = os.path.getsize(video_path) / (1024 * 1024)
-                        self.progress.emit(f"文件已下载到: {video_path}")
-                        self.progress.emit(f"文件大小: {size_mb:.1f} MB")
-                        self.finished.emit(video_path)
-                    else:
-                        raise Exception("下载的文件未找到")
-                        
-                except Exception as e:
-                    self.progress.emit(f"下载过程中出错: {str(e)}")
-                    self.progress.emit("尝试使用较低质量重新下载...")
-                    
-                    # 如果下载失败，尝试使用较低质量
-                    ydl_opts['format'] = 'best[height<=720]'
-                    info = ydl.extract_info(self.url, download=True)
-                    video_path = ydl.prepare_filename(info)
-                    
-                    if os.path.exists(video_path):
-                        size_mb = os.path.getsize(video_path) / (1024 * 1024)
-                        self.progress.emit(f"已使用较低质量完成下载: {video_path}")
-                        self.progress.emit(f"文件大小: {size_mb:.1f} MB")
-                        self.finished.emit(video_path)
-                    else:
-                        raise Exception("下载失败，请稍后重试")
-                
-        except Exception as e:
-            error_msg = str(e)
-            if "ffmpeg is not installed" in error_msg:
-                error_msg = (
-                    "未检测到FFmpeg。请按照以下步骤安装：\n"
-                    "1. 访问 https://github.com/BtbN/FFmpeg-Builds/releases\n"
-                    "2. 下载 ffmpeg-master-latest-win64-gpl.zip\n"
-                    "3. 解压文件\n"
-                    "4. 将解压后的 ffmpeg-master-latest-win64-gpl\\bin 目录添加到系统环境变量\n"
-                    "5. 重启应用程序"
-                )
-            self.error.emit(error_msg)
-            self.progress.emit(f"下载出错: {error_msg}")
-
-    def progress_hook(self, d):
-        if d['status'] == 'downloading':
-            # 计算下载进度
-            total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
-            downloaded = d.get('downloaded_bytes', 0)
-            
-            if total > 0:
-                percent = (downloaded / total) * 100
-                speed = d.get('speed', 0)
-                
-                if speed:
-                    speed_str = self.format_speed(speed)
-                    # 转换ANSI颜色代码为HTML
-                    progress_text = (
-                        f'下载进度: <span style="color: #5c8eff;">{percent:.1f}%</span> '
-                        f'速度: <span style="color: #00aa00;">{speed_str}</span>'
-                    )
-                    self.progress.emit(progress_text)
-
-    def format_speed(self, speed):
-        """格式化速度显示"""
-        if speed < 1024:
-            return f"{speed:.2f}B/s"
-        elif speed < 1024 * 1024:
-            return f"{speed/1024:.2f}KiB/s"
-        elif speed < 1024 * 1024 * 1024:
-            return f"{speed/(1024*1024):.2f}MiB/s"
-        else:
-            return f"{speed/(1024*1024*1024):.2f}GiB/s"
-
-    def progress_hook(self, d):
-        if d['status'] == 'downloading':
-            percent = d.get('_percent_str', 'N/A')
-            speed = d.get('_speed_str', 'N/A')
-            self.progress.emit(f"下载进度: {percent} 速度: {speed}")
-        elif d['status'] == 'finished':
-            self.progress.emit(f"下载完成，正在处理文件...")
 
 class MediaPlayer(QThread):
+    """
+    播放线程：只启动一次，之后每次加载文件只是交给它一个新的会话
+
+    上一个会话在播放线程中关闭后才开始下一个；stop()不等待线程退出，
+    可以在任何线程中调用（包括处理播放错误的槽），shutdown()才结束线程。
+    """
     error_occurred = pyqtSignal(str)
     frame_ready = pyqtSignal(np.ndarray)
+    # 从开始加载到显示第一帧的秒数
+    first_frame_shown = pyqtSignal(float)
     
-    def __init__(self):
+    def __init__(self, frame_cache_bytes=FRAME_CACHE_BYTES):
         super().__init__()
         self.video_path = None
         self.playing = False
         self.volume = 1.0
-        self.video_clip = None
-        self.audio_clip = None
+        self.frame_cache_bytes = frame_cache_bytes
+        self.session = None  # 正在播放的会话，只在播放线程中替换和关闭
+        self.audio_sink = None  # 音频输出在播放器的生命周期内只打开一次，换文件时只换引擎
         self.current_time = 0
         self.mutex = QMutex()
-        self.audio_thread = None
+        self.clock = MasterClock()
+        self.scheduler = None
+        self.renderer = None  # 设置后在解码线程中缩放帧，不再通过信号传递整帧
+        self.sessions_played = 0
+        self.metrics = metrics.get_registry()
+        self._pending = None
+        self._alive = True
+        self._cond = threading.Condition()
+        self._idle = threading.Event()
+        self._idle.set()
+
+    @property
+    def decoder(self):
+        session = self.session
+        return session.decoder if session else None
+
+    @property
+    def audio(self):
+        session = self.session
+        return session.audio if session else None
+
+    @property
+    def first_frame_seconds(self):
+        session = self.session
+        return session.first_frame_seconds if session else None
+
+    @property
+    def busy(self):
+        """有正在播放或等待开始的会话"""
+        return not self._idle.is_set()
         
     def load_media(self, video_path):
+        self.stop()
+        session = PlaybackSession(video_path)
         try:
-            self.cleanup()
-                
-            self.video_clip = VideoFileClip(video_path)
-            self.audio_clip = self.video_clip.audio
-            self.current_time = 0
-            self.video_path = video_path
-            print(f"媒体已加载: {video_path}")
-            
-            if self.audio_clip:
-                self.audio_clip.volumex = self.volume
-                
-            return True
+            # 视频帧由解码引擎顺序解码，音频由音频引擎解码到环形缓冲区
+            session.decoder = FrameDecoder(video_path, buffer_bytes=self.frame_cache_bytes)
+            session.audio = AudioEngine(video_path)
+            session.audio.set_volume(self.volume)
         except Exception as e:
+            session.close()
             print(f"加载媒体时出错: {str(e)}")
             self.error_occurred.emit(f"加载媒体时出错: {str(e)}")
             return False
+        self._submit(session)
+        print(f"媒体已加载: {video_path}")
+        return True
             
-    def play_audio(self):
-        if self.audio_clip:
-            self.audio_clip.preview()
+    def load_progressive(self, video_path, is_complete):
+        """
+        播放正在下载的文件，is_complete()在下载结束后返回True
+
+        文件头可能还没写入，解码器在播放线程中创建；音频要等下载完成才能读取，这种模式只播放画面
+        """
+        self.stop()
+        self._submit(PlaybackSession(video_path, is_complete))
+        return True
+
+    def _submit(self, session):
+        """把会话交给播放线程，线程没有运行时启动它"""
+        with self._cond:
+            self._pending = session
+            self.video_path = session.path
+            self.current_time = 0
+            self.playing = True
+            self._idle.clear()
+            self._cond.notify_all()
+        if not self.isRunning():
+            self.start()
             
-    def run(self):
-        if not self.video_clip:
-            self.error_occurred.emit("未加载媒体文件")
+    def start_audio(self, session):
+        """文件有音轨时开始输出音频，并以音频播放位置作为主时钟"""
+        if not session.audio or not session.audio.wait_ready():
+            self.clock.set_audio_source(None)
             return
+        if self.audio_sink is None:
+            self.audio_sink = open_sink()
+        self.audio_sink.set_engine(session.audio)
+        self.audio_sink.start()
+        self.clock.set_audio_source(session.audio.position)
+        session.audio.play()
             
-        try:
-            self.playing = True
-            fps = self.video_clip.fps
-            frame_interval = 1.0 / fps if fps > 0 else 0.033
-            duration = self.video_clip.duration
-            print(f"视频FPS: {fps}, 帧间隔: {frame_interval}秒")
+    def close_audio_output(self):
+        """关闭音频设备"""
+        if self.audio_sink:
+            self.audio_sink.close()
+            self.audio_sink = None
             
-            if self.audio_clip and not self.audio_thread:
-                self.audio_thread = threading.Thread(target=self.play_audio)
-                self.audio_thread.daemon = True
-                self.audio_thread.start()
+    def sync_stats(self):
+        """返回音视频同步计数：漂移、丢帧、迟到帧和重复帧"""
+        if not self.scheduler:
+            return {}
+        return self.scheduler.stats()
+
+    def resource_stats(self):
+        """进程的内存、子进程和线程数，以及帧缓冲区当前占用的字节数"""
+        stats = process_stats.snapshot()
+        decoder = self.decoder
+        stats['frame_cache_bytes'] = decoder.buffered_bytes() if decoder else 0
+        stats['frame_cache_budget'] = self.frame_cache_bytes
+        stats['sessions_played'] = self.sessions_played
+        return stats
             
-            while self.playing:
-                try:
-                    if self.current_time >= duration:
-                        self.current_time = 0
-                        if self.audio_thread:
-                            self.audio_thread.join()
-                            self.audio_thread = threading.Thread(target=self.play_audio)
-                            self.audio_thread.daemon = True
-                            self.audio_thread.start()
-                            
-                    frame = self.video_clip.get_frame(self.current_time)
-                    
-                    self.mutex.lock()
-                    if self.playing:
-                        self.frame_ready.emit(frame)
-                    self.mutex.unlock()
-                    
-                    start_time = time.time()
-                    self.current_time += frame_interval
-                    
-                    elapsed = time.time() - start_time
-                    wait_time = max(0, frame_interval - elapsed)
-                    if wait_time > 0:
-                        self.msleep(int(wait_time * 1000))
-                            
-                except Exception as e:
-                    print(f"处理帧时出错: {str(e)}")
-                    self.error_occurred.emit(f"处理帧时出错: {str(e)}")
+    def run(self):
+        while True:
+            with self._cond:
+                while self._alive and self._pending is None:
+                    self._cond.wait()
+                if not self._alive:
                     break
-        except Exception as e:
-            print(f"播放出错: {str(e)}")
-            self.error_occurred.emit(f"播放出错: {str(e)}")
-        finally:
-            self.cleanup()
-            
-    def cleanup(self):
-        self.playing = False
-        if self.video_clip:
+                session, self._pending = self._pending, None
+                self.session = session
+            self.scheduler = None
             try:
-                self.video_clip.close()
-            except:
-                pass
-            self.video_clip = None
+                with self.metrics.span('playback', attrs={'path': session.path},
+                                       mode='file' if session.is_complete is None else 'progressive') as span:
+                    try:
+                        self.play_session(session)
+                    finally:
+                        self._record_playback(session, span)
+            except Exception as e:
+                print(f"播放出错: {str(e)}")
+                self.error_occurred.emit(f"播放出错: {str(e)}")
+            finally:
+                self._end_session(session)
+
+    def _record_playback(self, session, span):
+        """会话结束时把同步计数、首帧时间和音频欠载计入指标"""
+        stats = self.sync_stats()
+        for result in ('presented', 'dropped', 'late', 'repeated'):
+            if stats.get(f'{result}_frames'):
+                self.metrics.inc('player_frames_total', stats[f'{result}_frames'], result=result)
+        if session.first_frame_seconds is not None:
+            self.metrics.observe('player_first_frame_seconds', session.first_frame_seconds)
+        if session.audio and session.audio.underruns:
+            self.metrics.inc('audio_underruns_total', session.audio.underruns)
+        span.set(first_frame_seconds=session.first_frame_seconds, **stats)
+
+    def _end_session(self, session):
+        if self.audio_sink:
+            self.audio_sink.set_engine(None)
+        self.clock.set_audio_source(None)
+        session.close()
+        self.sessions_played += 1
+        with self._cond:
+            self.session = None
+            if self._pending is None:
+                self._idle.set()
+        print("媒体资源已释放")
             
-        if self.audio_clip:
+    def play_session(self, session):
+        """在当前线程中播放一个会话，直到播放被停止或出错"""
+        if session.is_complete is not None:
+            is_complete = session.is_complete
             try:
-                self.audio_clip.close()
-            except:
-                pass
-            self.audio_clip = None
-            
-        if self.audio_thread and self.audio_thread.is_alive():
-            self.audio_thread.join(timeout=1.0)
-            self.audio_thread = None
+                # 等待文件头时停止播放也会让读取结束
+                session.decoder = FrameDecoder(session.path, buffer_bytes=self.frame_cache_bytes,
+                                               source=ProgressiveSource(
+                                                   session.path, lambda: not self.playing or is_complete()))
+            except Exception as e:
+                if self.playing:
+                    self.error_occurred.emit(f"加载媒体时出错: {str(e)}")
+                return
+        decoder = session.decoder
+        if not decoder:
+            self.error_occurred.emit("未加载媒体文件")
+            return
             
-        print("媒体资源已释放")
+        fps = decoder.fps
+        duration = decoder.duration
+        self.scheduler = FrameScheduler(self.clock, fps)
+        frame_interval = self.scheduler.frame_interval
+        print(f"视频FPS: {fps}, 帧间隔: {frame_interval}秒, 帧缓冲: {decoder.buffer_size}帧")
+        
+        self.clock.start(0)
+        self.start_audio(session)
+        
+        while self.playing:
+            try:
+                if decoder.eof and decoder.error is not None:
+                    # 解码源出错，不再循环播放
+                    raise decoder.error
+                if decoder.eof or (duration and self.current_time >= duration):
+                    print(f"同步统计: {self.scheduler.stats()}")
+                    self.current_time = 0
+                    decoder.seek(0)
+                    # 循环播放：音频引擎只清空缓冲区从头解码，不重启线程
+                    if session.audio:
+                        session.audio.seek(0)
+                    self.clock.start(0)
+                        
+                item = decoder.read(timeout=frame_interval)
+                if item is None:
+                    if decoder.stalled:
+                        # 解码追上了下载，暂停时钟等待数据，恢复后不把之后的帧当作迟到
+                        self.clock.pause()
+                    elif not decoder.eof:
+                        # 解码跟不上，画面停留在上一帧
+                        self.scheduler.frame_repeated()
+                    continue
+                pts, frame = item
+                self.current_time = pts
+                if session.is_complete is not None and not self.scheduler.presented_frames:
+                    # 边下边播从第一帧开始计时
+                    self.clock.start(pts)
+                elif not self.clock.running:
+                    self.clock.resume()
+                
+                action, wait_time = self.scheduler.schedule(pts)
+                if action == FrameScheduler.DROP:
+                    continue
+                
+                # 按主时钟等待到帧的显示时间，解码和发送耗时已经包含在时钟里
+                while wait_time > 0 and self.playing:
+                    time.sleep(min(wait_time, 0.05))
+                    wait_time = pts - self.clock.time()
+                
+                self.mutex.lock()
+                if self.playing:
+                    self.scheduler.frame_presented(pts)
+                    if self.renderer:
+                        self.renderer.submit(frame)
+                    else:
+                        self.frame_ready.emit(frame)
+                    if session.first_frame_seconds is None:
+                        session.first_frame_seconds = time.perf_counter() - session.load_started
+                        self.first_frame_shown.emit(session.first_frame_seconds)
+                self.mutex.unlock()
+                
+                self.current_time = pts + frame_interval
+                        
+            except Exception as e:
+                print(f"处理帧时出错: {str(e)}")
+                self.error_occurred.emit(f"处理帧时出错: {str(e)}")
+                break
             
-    def stop(self):
-        print("正在停止播放...")
+    def stop(self, timeout=5.0):
+        """
+        停止当前会话，等到播放线程关闭了它的解码器和音频引擎（在播放线程中调用时不等待）
+        """
         self.mutex.lock()
         self.playing = False
         self.current_time = 0
         self.mutex.unlock()
-        self.cleanup()
-        self.wait()
-        print("播放已停止")
+        with self._cond:
+            pending, self._pending = self._pending, None
+            if self.session is None:
+                self._idle.set()
+        if pending:
+            pending.close()
+        if QThread.currentThread() is not self:
+            self._idle.wait(timeout)
         
     def set_volume(self, volume):
         self.volume = volume / 100.0
-        if self.audio_clip:
-            self.audio_clip.volumex = self.volume
+        audio = self.audio
+        if audio:
+            audio.set_volume(self.volume)
         print(f"设置音量: {volume}%")
-        
-    def __del__(self):
+
+    def shutdown(self):
+        """程序退出时结束播放线程并关闭音频设备"""
         self.stop()
+        with self._cond:
+            self._alive = False
+            self._cond.notify_all()
+        self.wait()
+        self.close_audio_output()
+
+class VideoWidget(QWidget):
+    """直接绘制FrameRenderer缓冲区的视频显示控件"""
+    frame_available = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setAttribute(Qt.WidgetAttribute.WA_OpaquePaintEvent, False)
+        self.renderer = FrameRenderer(on_frame=self.frame_available.emit)
+        # 解码线程发出的信号排队到界面线程，多帧之间只重绘一次
+        self.frame_available.connect(self.update)
+
+    def resizeEvent(self, event):
+        ratio = self.devicePixelRatioF()
+        self.renderer.set_target_size(self.width() * ratio, self.height() * ratio)
+        super().resizeEvent(event)
+
+    def paintEvent(self, event):
+        buffer = self.renderer.acquire()
+        if buffer is None:
+            return
+        h, w = buffer.shape[:2]
+        image = QImage(buffer.data, w, h, buffer.strides[0], QImage.Format.Format_RGB888)
+        ratio = self.devicePixelRatioF()
+        image.setDevicePixelRatio(ratio)
+        x = int((self.width() - w / ratio) / 2)
+        y = int((self.height() - h / ratio) / 2)
+        painter = QPainter(self)
+        painter.drawImage(x, y, image)
+        painter.end()
+
+    def clear(self):
+        self.renderer.clear()
+        self.update()
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("YouTube视频下载器和播放器")
         self.setMinimumSize(800, 600)
+        # 设置了YTDL_METRICS_LOG / YTDL_METRICS_PORT时打开指标输出
+        metrics.configure_from_env()
         
         # 创建主窗口部件
         main_widget = QWidget()
@@ -388,7 +495,7 @@ class MainWindow(QMainWindow):
                 border-radius: 4px;
                 background-color: white;
             }
-            QTextEdit {
+            QPlainTextEdit {
                 border: 1px solid #ccc;
                 border-radius: 4px;
                 background-color: white;
@@ -407,8 +514,9 @@ class MainWindow(QMainWindow):
         url_label = QLabel("视频URL:")
         url_input_layout.addWidget(url_label)
         
-        self.url_input = QLineEdit()
-        self.url_input.setPlaceholderText("输入YouTube视频URL")
+        self.url_input = QPlainTextEdit()
+        self.url_input.setPlaceholderText("输入YouTube视频URL（每行一个，支持播放列表）")
+        self.url_input.setMaximumHeight(70)
         url_input_layout.addWidget(self.url_input)
         url_layout.addLayout(url_input_layout)
         
@@ -462,6 +570,46 @@ class MainWindow(QMainWindow):
         
         controls_layout.addLayout(resolution_layout)
         
+        # 下载引擎选择
+        engine_layout = QHBoxLayout()
+        engine_layout.addWidget(QLabel("下载引擎:"))
+        self.engine_combo = QComboBox()
+        self.engine_combo.addItem("FFmpeg", 'ffmpeg')
+        self.engine_combo.addItem("内置并行", 'native')
+        engine_layout.addWidget(self.engine_combo)
+        controls_layout.addLayout(engine_layout)
+        
+        # 边下边播：下载开始后立即播放正在写入的文件
+        self.progressive_check = QCheckBox("边下边播")
+        controls_layout.addWidget(self.progressive_check)
+        
+        # 并发数
+        concurrency_layout = QHBoxLayout()
+        concurrency_layout.addWidget(QLabel("并发数:"))
+        self.concurrency_spin = QSpinBox()
+        self.concurrency_spin.setRange(1, 16)
+        self.concurrency_spin.setValue(3)
+        self.concurrency_spin.valueChanged.connect(self.on_concurrency_changed)
+        concurrency_layout.addWidget(self.concurrency_spin)
+        controls_layout.addLayout(concurrency_layout)
+        
+        # 总速度上限，下载过程中修改立即生效
+        rate_layout = QHBoxLayout()
+        rate_layout.addWidget(QLabel("限速:"))
+        self.rate_limit_spin = QSpinBox()
+        self.rate_limit_spin.setRange(0, 1024 * 1024)
+        self.rate_limit_spin.setSingleStep(256)
+        self.rate_limit_spin.setSuffix(" KiB/s")
+        self.rate_limit_spin.setSpecialValueText("不限速")
+        self.rate_limit_spin.valueChanged.connect(self.on_rate_limit_changed)
+        rate_layout.addWidget(self.rate_limit_spin)
+        controls_layout.addLayout(rate_layout)
+        
+        # 导入URL列表按钮
+        self.import_button = QPushButton("导入列表")
+        self.import_button.clicked.connect(self.import_url_file)
+        controls_layout.addWidget(self.import_button)
+        
         # 下载按钮
         self.start_button = QPushButton("下载")
         self.start_button.clicked.connect(self.start_download)
@@ -471,6 +619,41 @@ class MainWindow(QMainWindow):
         url_layout.addLayout(controls_layout)
         layout.addLayout(url_layout)
         
+        # 下载队列
+        self.job_list = QListWidget()
+        self.job_list.setMaximumHeight(120)
+        self.job_list.setIconSize(QSize(64, 36))
+        self.job_list.itemDoubleClicked.connect(self.show_selected_preview)
+        layout.addWidget(self.job_list)
+        
+        queue_controls = QHBoxLayout()
+        queue_controls.setAlignment(Qt.AlignmentFlag.AlignLeft)
+        
+        self.pause_button = QPushButton("暂停")
+        self.pause_button.clicked.connect(self.pause_selected_job)
+        queue_controls.addWidget(self.pause_button)
+        
+        self.resume_button = QPushButton("继续")
+        self.resume_button.clicked.connect(self.resume_selected_job)
+        queue_controls.addWidget(self.resume_button)
+        
+        self.cancel_button = QPushButton("取消")
+        self.cancel_button.clicked.connect(self.cancel_selected_job)
+        queue_controls.addWidget(self.cancel_button)
+        
+        self.top_button = QPushButton("优先")
+        self.top_button.clicked.connect(self.prioritize_selected_job)
+        queue_controls.addWidget(self.top_button)
+        
+        self.preview_button = QPushButton("预览")
+        self.preview_button.clicked.connect(self.show_selected_preview)
+        queue_controls.addWidget(self.preview_button)
+        
+        self.queue_stats_label = QLabel()
+        queue_controls.addWidget(self.queue_stats_label)
+        
+        layout.addLayout(queue_controls)
+        
         # 视频控制按钮
         video_controls = QHBoxLayout()
         video_controls.setAlignment(Qt.AlignmentFlag.AlignLeft)
@@ -495,23 +678,25 @@ class MainWindow(QMainWindow):
         container_layout = QVBoxLayout(self.video_container)
         container_layout.setContentsMargins(0, 0, 0, 0)
         
-        self.video_label = QLabel()
-        self.video_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        container_layout.addWidget(self.video_label)
+        self.video_widget = VideoWidget()
+        container_layout.addWidget(self.video_widget)
         
         layout.addWidget(self.video_container)
         
         # 进度显示
-        self.progress_text = QTextEdit()
+        self.progress_text = QPlainTextEdit()
         self.progress_text.setReadOnly(True)
         self.progress_text.setMaximumHeight(100)
-        self.progress_text.setAcceptRichText(True)
+        # 只保留最近的日志行，长时间下载时不会无限增长
+        self.progress_text.setMaximumBlockCount(500)
         layout.addWidget(self.progress_text)
         
         # 初始化媒体播放器
         self.media_player = MediaPlayer()
-        self.media_player.frame_ready.connect(self.update_frame)
+        self.media_player.renderer = self.video_widget.renderer
         self.media_player.error_occurred.connect(self.handle_error)
+        self.media_player.first_frame_shown.connect(
+            lambda seconds: self.progress_text.appendPlainText(f"首帧用时: {seconds:.2f}秒"))
         
         # 初始化下载目录
         self.download_dir = os.path.join(os.getcwd(), 'downloads')
@@ -519,9 +704,36 @@ class MainWindow(QMainWindow):
             os.makedirs(self.download_dir)
         self.update_storage_path_label()
         
-        # 添加帧缓存
-        self._current_frame = None
-        self._frame_mutex = QMutex()
+        # 在后台探测ffmpeg的能力，下载、转码和播放共用探测结果
+        get_toolchain().warm_up()
+
+        # 初始化下载队列
+        self.download_manager = DownloadManager(
+            max_workers=self.concurrency_spin.value(),
+            archive=DownloadArchive(os.path.join(self.download_dir, ARCHIVE_FILENAME)),
+            store=JobStore(os.path.join(self.download_dir, STORE_FILENAME)))
+        self.download_manager.job_changed.connect(self.on_job_changed)
+        self.download_manager.target_ready.connect(self.on_target_ready)
+        self._job_items = {}
+        self._job_labels = {}
+        self._job_status = {}
+        
+        # 下载完成的视频在后台生成预览，完成后显示为任务的图标
+        self.preview_manager = PreviewManager()
+        self.preview_manager.preview_ready.connect(self.on_preview_ready)
+        self._previews = {}
+        self._preview_jobs = {}
+        restored = self.download_manager.restore()
+        if restored:
+            self.progress_text.appendPlainText(f"恢复了 {len(restored)} 个未完成的任务")
+        
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self.update_queue_stats)
+        self.stats_timer.start(1000)
+        
+        self.progress_timer = QTimer(self)
+        self.progress_timer.timeout.connect(self.refresh_progress)
+        self.progress_timer.start(250)
 
     def update_storage_path_label(self):
         """更新存储位置显示"""
@@ -534,54 +746,31 @@ class MainWindow(QMainWindow):
             return False
             
         try:
-            if self.media_player.load_media(video_path):
-                self.media_player.start()
-                return True
-            return False
+            return self.media_player.load_media(video_path)
         except Exception as e:
             self.handle_error(f"加载视频失败: {str(e)}")
             return False
             
     def update_frame(self, frame):
+        """显示一帧（用于没有连接渲染器的帧来源），缩放后交给视频控件绘制"""
         try:
-            if not self.video_label.isVisible():
-                return
-                
-            container_size = self.video_container.size()
-            if container_size.width() <= 0 or container_size.height() <= 0:
-                return
-                
-            self._frame_mutex.lock()
-            self._current_frame = frame.copy()
-            self._frame_mutex.unlock()
-            
-            h, w = frame.shape[:2]
-            scale = min(container_size.width() / w, container_size.height() / h)
-            new_size = (int(w * scale), int(h * scale))
-            
-            scaled_frame = cv2.resize(frame, new_size, interpolation=cv2.INTER_AREA)
-            
-            h, w = scaled_frame.shape[:2]
-            bytes_per_line = 3 * w
-            qt_image = QImage(scaled_frame.data, w, h, bytes_per_line, QImage.Format.Format_RGB888)
-            
-            pixmap = QPixmap.fromImage(qt_image)
-            self.video_label.setPixmap(pixmap)
-            
+            self.video_widget.renderer.submit(frame)
         except Exception as e:
             print(f"更新帧时出错: {str(e)}")
             
     def stop_video(self):
         print("停止播放")
         self.media_player.stop()
-        self.video_label.clear()
+        self.video_widget.clear()
+        self.progress_text.appendPlainText(
+            f"播放已停止，{process_stats.format_snapshot(self.media_player.resource_stats())}")
         
     def select_download_dir(self):
         dir_path = QFileDialog.getExistingDirectory(self, "选择存储位置", self.download_dir)
         if dir_path:
             self.download_dir = dir_path
             self.update_storage_path_label()
-            self.progress_text.append(f"已选择存储位置: {self.download_dir}")
+            self.progress_text.appendPlainText(f"已选择存储位置: {self.download_dir}")
 
     def open_video_file(self):
         file_path, _ = QFileDialog.getOpenFileName(
@@ -594,48 +783,184 @@ class MainWindow(QMainWindow):
             self.load_video(file_path)
 
     def start_download(self):
-        url = self.url_input.text().strip()
-        if not url:
+        urls = parse_url_list(self.url_input.toPlainText())
+        if not urls:
             QMessageBox.warning(self, "错误", "请输入视频URL")
             return
-            
-        self.progress_text.clear()
-        self.start_button.setEnabled(False)
-        self.start_button.setText("下载中...")
+        self.enqueue_urls(urls)
+        self.url_input.clear()
         
-        self.downloader = VideoDownloader(url, self.download_dir)
+    def import_url_file(self):
+        file_path, _ = QFileDialog.getOpenFileName(
+            self,
+            "选择URL列表文件",
+            self.download_dir,
+            "文本文件 (*.txt);;所有文件 (*.*)"
+        )
+        if not file_path:
+            return
+        try:
+            urls = load_url_file(file_path)
+        except Exception as e:
+            QMessageBox.warning(self, "错误", f"读取URL列表失败: {str(e)}")
+            return
+        if urls:
+            self.enqueue_urls(urls)
         
+    def enqueue_urls(self, urls):
         selected_resolution = self.resolution_combo.currentText()
-        if selected_resolution != '自动':
-            self.downloader.preferred_resolution = selected_resolution
-        
-        self.downloader.finished.connect(self.on_download_finished)
-        self.downloader.error.connect(self.on_download_error)
-        self.downloader.progress.connect(self.on_download_progress)
-        
-        self.downloader.start()
+        resolution = selected_resolution if selected_resolution != '自动' else None
+        engine = self.engine_combo.currentData()
+        jobs = self.download_manager.add_urls(urls, self.download_dir, resolution, engine=engine,
+                                              progressive=self.progressive_check.isChecked())
+        self.progress_text.appendPlainText(f"已添加 {len(jobs)} 个下载任务")
+        
+    def on_concurrency_changed(self, value):
+        self.download_manager.queue.set_limits(max_workers=value)
+        
+    def on_rate_limit_changed(self, value):
+        self.download_manager.bandwidth.set_global_rate(value * 1024 if value else None)
+        
+    def selected_job_id(self):
+        item = self.job_list.currentItem()
+        if item is None:
+            return None
+        return item.data(Qt.ItemDataRole.UserRole)
+        
+    def pause_selected_job(self):
+        job_id = self.selected_job_id()
+        if job_id is not None:
+            self.download_manager.queue.pause(job_id)
+        
+    def resume_selected_job(self):
+        job_id = self.selected_job_id()
+        if job_id is not None:
+            self.download_manager.queue.resume(job_id)
+        
+    def cancel_selected_job(self):
+        job_id = self.selected_job_id()
+        if job_id is not None:
+            self.download_manager.queue.cancel(job_id)
+        
+    def prioritize_selected_job(self):
+        job_id = self.selected_job_id()
+        if job_id is None:
+            return
+        queue = self.download_manager.queue
+        top = max((job.priority for job in queue.jobs.values()), default=0)
+        queue.set_priority(job_id, top + 1)
         
-    def on_download_error(self, error_msg):
-        self.progress_text.append(f"错误: {error_msg}")
-        self.start_button.setEnabled(True)
-        self.start_button.setText("下载")
+    def on_job_changed(self, job_id, event):
+        job = self.download_manager.queue.jobs.get(job_id)
+        if job is None:
+            return
+        item = self._job_items.get(job_id)
+        if item is None:
+            item = QListWidgetItem()
+            item.setData(Qt.ItemDataRole.UserRole, job_id)
+            self.job_list.addItem(item)
+            self._job_items[job_id] = item
+        state = "已暂停" if self.download_manager.queue.is_paused(job_id) else {
+            JobState.PENDING: "等待中",
+            JobState.RUNNING: "下载中",
+            JobState.PAUSED: "已暂停",
+            JobState.FINISHED: "已完成",
+            JobState.FAILED: "失败",
+            JobState.CANCELLED: "已取消",
+        }[job.state]
+        self._job_labels[job_id] = f"#{job.id} [{state}] {job.url}"
+        self.update_job_item(job_id)
+        if event == 'finished' and isinstance(job.result, str) and os.path.isfile(job.result):
+            self._preview_jobs[os.path.abspath(job.result)] = job_id
+            self.preview_manager.submit(job.result)
+        
+    def on_target_ready(self, job_id, path):
+        """边下边播：没有正在播放的视频时，从正在下载的文件开始播放"""
+        job = self.download_manager.queue.jobs.get(job_id)
+        if job is None or self.media_player.busy:
+            return
+        done_states = (JobState.FINISHED, JobState.FAILED, JobState.CANCELLED)
+        self.progress_text.appendPlainText(f"边下边播: {os.path.basename(path)}")
+        self.media_player.load_progressive(path, lambda: job.state in done_states)
         
-    def on_download_progress(self, progress_msg):
-        self.progress_text.append(progress_msg)
+    def on_preview_ready(self, result):
+        if 'error' in result:
+            self.progress_text.appendPlainText(f"生成预览失败: {result['error']}")
+            return
+        job_id = self._preview_jobs.pop(os.path.abspath(result['path']), None)
+        item = self._job_items.get(job_id)
+        if item is None:
+            return
+        self._previews[job_id] = result['sheet']
+        item.setIcon(QIcon(result['thumb']))
         
-    def on_download_finished(self, video_path):
-        self.progress_text.append(f"下载完成: {video_path}")
-        self.start_button.setEnabled(True)
-        self.start_button.setText("下载")
+    def show_selected_preview(self):
+        job_id = self.selected_job_id()
+        sheet = self._previews.get(job_id)
+        if sheet is None:
+            return
+        dialog = QDialog(self)
+        dialog.setWindowTitle(os.path.basename(self.download_manager.queue.jobs[job_id].result))
+        dialog.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        label = QLabel(dialog)
+        label.setPixmap(QPixmap(sheet))
+        QVBoxLayout(dialog).addWidget(label)
+        dialog.show()
+        
+    def update_job_item(self, job_id):
+        item = self._job_items.get(job_id)
+        if item is None:
+            return
+        text = self._job_labels.get(job_id, f"#{job_id}")
+        status = self._job_status.get(job_id)
+        if status:
+            text += f"  {status}"
+        item.setText(text)
+        
+    def refresh_progress(self):
+        """定时拉取合并后的进度：每个任务一行状态，新日志追加到日志框"""
+        lines, log_lines = self.download_manager.progress.poll()
+        for job_id, status in lines.items():
+            if status is None:
+                self._job_status.pop(job_id, None)
+            else:
+                self._job_status[job_id] = status
+            self.update_job_item(job_id)
+        if log_lines:
+            self.progress_text.appendPlainText("\n".join(log_lines))
+        
+    def update_queue_stats(self):
+        stats = self.download_manager.batch.stats()
+        cache_stats = metadata_cache.stats()
+        jobs = stats['jobs']
+        text = (
+            f"下载中 {jobs[JobState.RUNNING]} / 等待 {jobs[JobState.PENDING]} / "
+            f"完成 {jobs[JobState.FINISHED]} / 失败 {jobs[JobState.FAILED]}  "
+            f"速度: {format_speed(stats['current_speed'])} "
+            f"(平均 {format_speed(stats['average_speed'])})  "
+            f"缓存命中: {cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']}"
+        )
+        if stats.get('archive', {}).get('hits'):
+            text += f"  已下载跳过: {stats['archive']['hits']}"
+        if stats['retries']['retries']:
+            text += f"  重试: {stats['retries']['retries']}"
+        self.queue_stats_label.setText(text)
         
     def handle_error(self, error_msg):
         print(f"错误: {error_msg}")
         QMessageBox.critical(self, "错误", error_msg)
         self.stop_video()
 
+    def closeEvent(self, event):
+        self.download_manager.shutdown()
+        self.preview_manager.shutdown()
+        self.media_player.shutdown()
+        metrics.shutdown()
+        super().closeEvent(event)
+
     def append_progress(self, text):
         """添加进度信息到进度框"""
-        self.progress_text.append(text)
+        self.progress_text.appendPlainText(text)
         # 滚动到底部
         scrollbar = self.progress_text.verticalScrollBar()
         scrollbar.setValue(scrollbar.maximum())
@@ -0,0 +1,344 @@
+"""
+下载完成后的批量后期处理：换容器（remux）、提取音频、截取片段（clip）和生成低分辨率副本（resize）
+
+步骤用JSON描述，例如:
+    [{"step": "audio", "codec": "mp3"},
+     {"step": "clip", "start": 10, "end": 20},
+     {"step": "resize", "height": 360}]
+
+同一个文件的多个步骤合并为一次ffmpeg调用（一个输入、多个输出），文件只读取和解码一次；
+只有截取片段且没有需要完整解码的步骤时，片段单独用输入端的-ss定位，只读取需要的范围。
+输出先写到临时文件，成功后再替换为最终文件名。多个文件在进程池中并行处理。
+"""
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import subprocess
+import threading
+import time
+
+# 每种步骤可以设置的参数和默认值
+STEP_DEFAULTS = {
+    'remux': {'format': 'mkv'},
+    'audio': {'codec': 'aac', 'bitrate': '192k', 'format': None},
+    'clip': {'start': 0.0, 'end': None, 'duration': None, 'copy': False, 'height': None,
+             'crf': 20, 'preset': 'veryfast'},
+    'resize': {'height': 360, 'crf': 28, 'preset': 'veryfast', 'audio': 'copy'},
+}
+
+# 音频编码 -> (ffmpeg编码器候选, 默认扩展名)
+AUDIO_CODECS = {
+    'copy': ((), 'm4a'),
+    'aac': (('aac', 'libfdk_aac', 'aac_at'), 'm4a'),
+    'mp3': (('libmp3lame',), 'mp3'),
+    'opus': (('libopus', 'opus'), 'opus'),
+}
+
+# 重新编码的片段和低分辨率副本用x264和AAC编码，输出到MP4；源文件是这些容器时才直接复制音频
+ENCODED_FORMAT = 'mp4'
+MP4_EXTENSIONS = ('.mp4', '.m4v', '.mov')
+
+
+def _number(text):
+    return f'{text:g}' if isinstance(text, float) else str(text)
+
+
+def normalize_steps(steps):
+    """检查步骤并补全默认参数，返回新的步骤列表；步骤无效时抛出ValueError"""
+    normalized = []
+    for index, step in enumerate(steps):
+        if not isinstance(step, dict) or step.get('step') not in STEP_DEFAULTS:
+            raise ValueError(f"第 {index + 1} 个步骤无效: {step!r}，可用的步骤: {', '.join(STEP_DEFAULTS)}")
+        kind = step['step']
+        unknown = set(step) - set(STEP_DEFAULTS[kind]) - {'step', 'name'}
+        if unknown:
+            raise ValueError(f"{kind} 步骤不支持的参数: {', '.join(sorted(unknown))}")
+        step = dict(STEP_DEFAULTS[kind], **step)
+        if kind == 'audio':
+            if step['codec'] not in AUDIO_CODECS:
+                raise ValueError(f"不支持的音频编码: {step['codec']}，可用的编码: {', '.join(AUDIO_CODECS)}")
+            step['format'] = step['format'] or AUDIO_CODECS[step['codec']][1]
+        elif kind == 'clip':
+            start = float(step['start'])
+            end = step['end'] if step['end'] is not None else (
+                start + float(step['duration']) if step['duration'] is not None else None)
+            if end is None or float(end) <= start or start < 0:
+                raise ValueError(f"clip 步骤需要有效的 start 和 end（或 duration）: {step!r}")
+            step['start'], step['end'] = start, float(end)
+        elif kind == 'resize' and (not step['height'] or int(step['height']) <= 0):
+            raise ValueError(f"resize 步骤的高度无效: {step['height']}")
+        if not step.get('name'):
+            if kind == 'clip':
+                step['name'] = f"clip_{_number(step['start'])}-{_number(step['end'])}"
+            elif kind == 'resize':
+                step['name'] = f"{int(step['height'])}p"
+            else:
+                step['name'] = kind
+        if any(other['name'] == step['name'] for other in normalized):
+            raise ValueError(f"步骤的输出名称重复: {step['name']}，用 name 参数区分")
+        normalized.append(step)
+    return normalized
+
+
+def load_pipeline(spec):
+    """从JSON文件路径、JSON字符串或列表读取步骤，返回补全后的步骤列表"""
+    if isinstance(spec, str):
+        if os.path.isfile(spec):
+            with open(spec, 'r', encoding='utf-8') as f:
+                spec = json.load(f)
+        else:
+            spec = json.loads(spec)
+    if isinstance(spec, dict):
+        spec = spec.get('steps', [])
+    return normalize_steps(spec)
+
+
+def output_path(path, step, output_dir=None):
+    directory, name = os.path.split(os.path.abspath(path))
+    stem, ext = os.path.splitext(name)
+    if step['step'] in ('remux', 'audio'):
+        ext = '.' + step['format']
+    elif step['step'] == 'resize' or (step['step'] == 'clip' and not step['copy']):
+        # 例如webm（VP9/Opus）不能容纳x264和AAC
+        ext = '.' + ENCODED_FORMAT
+    return os.path.join(output_dir or directory, f"{stem}.{step['name']}{ext}")
+
+
+def plan_passes(steps, shared=True):
+    """
+    把步骤分成若干次ffmpeg调用，返回 [(输入端定位的片段步骤或None, [步骤, ...])]
+
+    shared为True时，有resize步骤（需要完整解码视频）就让所有步骤共用这一次解码，
+    否则片段单独定位读取，其余的复制流和音频步骤合并为一次调用。
+    """
+    if not shared:
+        return [(step if step['step'] == 'clip' else None, [step]) for step in steps]
+    full_decode = any(step['step'] == 'resize' for step in steps)
+    passes = []
+    main = [step for step in steps if full_decode or step['step'] != 'clip']
+    if main:
+        passes.append((None, main))
+    if not full_decode:
+        passes.extend((step, [step]) for step in steps if step['step'] == 'clip')
+    return passes
+
+
+def _video_args(encoder, preset, crf):
+    args = ['-c:v', encoder]
+    if encoder == 'libx264':
+        args += ['-preset', preset, '-crf', str(crf), '-pix_fmt', 'yuv420p']
+    return args
+
+
+def output_args(step, encoders, seeked=False, threads=0, source_ext='.mp4'):
+    """单个输出的ffmpeg参数；seeked为True时输入已经定位到片段开头，source_ext为源文件的扩展名"""
+    kind = step['step']
+    args = []
+    if kind == 'remux':
+        args += ['-map', '0', '-c', 'copy']
+    elif kind == 'audio':
+        args += ['-map', '0:a:0', '-vn']
+        if step['codec'] == 'copy':
+            args += ['-c:a', 'copy']
+        else:
+            args += ['-c:a', encoders[step['codec']], '-b:a', step['bitrate']]
+    elif kind == 'clip':
+        if seeked:
+            args += ['-t', f"{step['end'] - step['start']:.3f}"]
+        else:
+            args += ['-ss', f"{step['start']:.3f}", '-to', f"{step['end']:.3f}"]
+        args += ['-map', '0:v:0?', '-map', '0:a:0?']
+        if step['copy']:
+            args += ['-c', 'copy']
+        else:
+            if step['height']:
+                args += ['-vf', f"scale=-2:{int(step['height'])}"]
+            args += _video_args(encoders['video'], step['preset'], step['crf']) + ['-c:a', encoders['aac']]
+        args += ['-avoid_negative_ts', 'make_zero']
+    elif kind == 'resize':
+        args += ['-map', '0:v:0', '-map', '0:a:0?', '-vf', f"scale=-2:{int(step['height'])}"]
+        args += _video_args(encoders['video'], step['preset'], step['crf'])
+        copy_audio = step['audio'] == 'copy' and source_ext.lower() in MP4_EXTENSIONS
+        args += ['-c:a', 'copy'] if copy_audio else ['-c:a', encoders['aac']]
+    if threads and kind != 'remux':
+        args += ['-threads', str(threads)]
+    return args
+
+
+def _tmp_path(path):
+    root, ext = os.path.splitext(path)
+    return f'{root}.tmp{ext}'
+
+
+def run_pass(path, seek_step, steps, outputs, ffmpeg='ffmpeg', encoders=None, threads=0):
+    """执行一次ffmpeg调用，所有输出都成功后才替换为最终文件"""
+    cmd = [ffmpeg, '-hide_banner', '-v', 'error', '-nostdin', '-y']
+    if seek_step is not None and seek_step['start'] > 0:
+        cmd += ['-ss', f"{seek_step['start']:.3f}"]
+    cmd += ['-i', path]
+    tmps = [_tmp_path(outputs[id(step)]) for step in steps]
+    for step, tmp in zip(steps, tmps):
+        cmd += output_args(step, encoders, seeked=seek_step is not None, threads=threads,
+                           source_ext=os.path.splitext(path)[1]) + [tmp]
+    try:
+        result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0:
+            raise IOError(result.stderr.decode('utf-8', 'replace').strip()[-500:] or f"ffmpeg退出码 {result.returncode}")
+        for step, tmp in zip(steps, tmps):
+            os.replace(tmp, outputs[id(step)])
+    finally:
+        for tmp in tmps:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+def is_fresh(source, path):
+    try:
+        return os.path.getmtime(path) >= os.path.getmtime(source)
+    except OSError:
+        return False
+
+
+def run_pipeline(path, steps, ffmpeg='ffmpeg', encoders=None, threads=0, shared=True,
+                 output_dir=None, force=False):
+    """
+    对一个文件执行所有步骤，返回每个步骤的输出和用时
+
+    在进程池的工作进程中执行，参数和返回值都只用基本类型。共用一次调用的步骤平分这次调用的用时
+    （pass_seconds为整次调用的用时），结果的passes中列出每次调用包含的步骤。
+    已有的输出不早于源文件时跳过对应的步骤。
+    """
+    started = time.perf_counter()
+    encoders = encoders or {'video': 'libx264', 'aac': 'aac', 'mp3': 'libmp3lame', 'opus': 'libopus'}
+    outputs = {id(step): output_path(path, step, output_dir) for step in steps}
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    pending = [step for step in steps if force or not is_fresh(path, outputs[id(step)])]
+    pending_ids = {id(step) for step in pending}
+    results = [{'step': step['step'], 'name': step['name'], 'output': outputs[id(step)],
+                'cached': id(step) not in pending_ids, 'seconds': 0.0} for step in steps]
+    by_step = {id(step): result for step, result in zip(steps, results)}
+    passes = []
+    for seek_step, pass_steps in plan_passes(pending, shared):
+        pass_started = time.perf_counter()
+        run_pass(path, seek_step, pass_steps, outputs, ffmpeg, encoders, threads)
+        seconds = time.perf_counter() - pass_started
+        passes.append({'steps': [step['name'] for step in pass_steps], 'seconds': seconds,
+                       'seeked': seek_step is not None})
+        for step in pass_steps:
+            by_step[id(step)].update(seconds=seconds / len(pass_steps), pass_seconds=seconds,
+                                     shared=len(pass_steps) > 1, bytes=os.path.getsize(outputs[id(step)]))
+    return {'path': path, 'steps': results, 'passes': passes, 'cached': not pending,
+            'seconds': time.perf_counter() - started}
+
+
+def pick_encoders():
+    """按本机ffmpeg的能力选择各类编码器，在主进程中探测一次后传给工作进程"""
+    from toolchain import AAC_ENCODERS, MP4_VIDEO_ENCODERS, get_toolchain
+
+    toolchain = get_toolchain()
+    encoders = {'video': toolchain.pick_encoder(MP4_VIDEO_ENCODERS) or 'libx264',
+                'aac': toolchain.pick_encoder(AAC_ENCODERS) or 'aac'}
+    for codec, (candidates, _) in AUDIO_CODECS.items():
+        if candidates and codec != 'aac':
+            encoders[codec] = toolchain.pick_encoder(candidates) or candidates[0]
+    return encoders
+
+
+class PipelineRunner:
+    """
+    在进程池中对多个文件执行同一组步骤
+
+    workers默认为CPU核数，每个ffmpeg的编码线程数按核数平均分配，进程之间不互相争抢。
+    on_result(result) 在每个文件完成后从后台线程调用；失败时result中有'error'。
+    每个步骤的用时记入指标（stage_duration_seconds{stage=步骤, component=pipeline}）。
+    """
+
+    def __init__(self, steps, workers=None, threads=None, shared=True, output_dir=None, on_result=None):
+        from toolchain import get_toolchain
+
+        self.steps = normalize_steps(steps)
+        cores = os.cpu_count() or 1
+        self.workers = workers or cores
+        self.threads = threads if threads is not None else max(1, cores // self.workers)
+        self.shared = shared
+        self.output_dir = output_dir
+        self.on_result = on_result
+        self.ffmpeg = get_toolchain().ffmpeg_path or 'ffmpeg'
+        self.encoders = pick_encoders()
+        self._executor = None
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.cached = 0
+        self.failed = 0
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _done(self, path, future):
+        from metrics import get_registry
+
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {'path': path, 'error': str(e)}
+        with self._lock:
+            if 'error' in result:
+                self.failed += 1
+            elif result['cached']:
+                self.cached += 1
+            else:
+                self.processed += 1
+        registry = get_registry()
+        for step in result.get('steps', []):
+            if not step['cached']:
+                registry.record_span(step['step'], step['seconds'], component='pipeline',
+                                     attrs={'path': path, 'output': step['output'], 'shared': step['shared']})
+        if self.on_result:
+            self.on_result(result)
+        return result
+
+    def submit(self, path, force=False):
+        """提交一个文件，立即返回future"""
+        future = self._pool().submit(run_pipeline, path, self.steps, ffmpeg=self.ffmpeg, encoders=self.encoders,
+                                     threads=self.threads, shared=self.shared, output_dir=self.output_dir,
+                                     force=force)
+        future.add_done_callback(lambda f: self._done(path, f))
+        return future
+
+    def run_all(self, paths, force=False):
+        """处理所有文件并等待完成，返回统计（含每个步骤的总用时）"""
+        started = time.perf_counter()
+        futures = {self.submit(path, force): path for path in paths}
+        results = []
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append({'path': futures[future], 'error': str(e)})
+        elapsed = time.perf_counter() - started
+        step_seconds = {}
+        for result in results:
+            for step in result.get('steps', []):
+                step_seconds[step['name']] = step_seconds.get(step['name'], 0.0) + step['seconds']
+        return {
+            'files': len(results),
+            'processed': sum(1 for r in results if 'error' not in r and not r['cached']),
+            'cached': sum(1 for r in results if r.get('cached')),
+            'errors': [r for r in results if 'error' in r],
+            'passes': sum(len(r.get('passes', [])) for r in results),
+            'step_seconds': step_seconds,
+            'seconds': elapsed,
+            'files_per_second': len(results) / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
@@ -0,0 +1,176 @@
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+_YOUTUBE_ID_PATTERNS = [
+    re.compile(r'(?:youtube\.com|youtube-nocookie\.com)/(?:watch\?(?:.*&)?v=|embed/|shorts/|live/|v/)([0-9A-Za-z_-]{11})'),
+    re.compile(r'youtu\.be/([0-9A-Za-z_-]{11})'),
+]
+
+
+@lru_cache(maxsize=4096)
+def normalize_video_key(url):
+    """
+    把URL归一化为缓存键，例如 youtube:dQw4w9WgXcQ
+
+    YouTube链接直接用正则匹配，其他站点尝试用yt-dlp提取器离线解析视频ID，
+    都不匹配时使用去掉片段和排序查询参数后的URL。
+    """
+    url = url.strip()
+    for pattern in _YOUTUBE_ID_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return f"youtube:{match.group(1)}"
+
+    try:
+        from yt_dlp.extractor import gen_extractor_classes
+        for ie in gen_extractor_classes():
+            if ie.ie_key() == 'Generic' or not ie.suitable(url):
+                continue
+            video_id = ie.get_temp_id(url)
+            if video_id:
+                return f"{ie.ie_key().lower()}:{video_id}"
+            break
+    except Exception:
+        pass
+
+    parsed = urlparse(url)
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return "url:" + urlunparse((parsed.scheme.lower(), parsed.netloc.lower(),
+                                parsed.path, parsed.params, query, ''))
+
+
+class MetadataCache:
+    """
+    extract_info元数据缓存：内存LRU加可选的磁盘存储，按视频ID作为键，超过TTL自动失效
+
+    格式探测、下载和降级重试共用同一份元数据，下载时通过process_ie_result处理缓存的info，
+    不再重复调用提取器。
+    """
+
+    def __init__(self, max_entries=256, ttl=3600, disk_dir=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.disk_dir, f"{name}.json")
+
+    def _load_from_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('key') != key:
+            return None
+        if time.time() - entry.get('timestamp', 0) > self.ttl:
+            self.expired += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry['timestamp'], entry['info']
+
+    def _save_to_disk(self, key, timestamp, info):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'key': key, 'timestamp': timestamp, 'info': info}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"写入元数据缓存失败: {str(e)}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def get(self, url):
+        """返回缓存的info字典副本，未命中或已过期时返回None"""
+        key = normalize_video_key(url)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                timestamp, info = entry
+                if now - timestamp <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(info)
+                del self._entries[key]
+                self.expired += 1
+
+            entry = self._load_from_disk(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, *entry)
+            return copy.deepcopy(entry[1])
+
+    def put(self, url, info):
+        """缓存一份已经过sanitize_info处理的info字典"""
+        if not info:
+            return
+        key = normalize_video_key(url)
+        timestamp = time.time()
+        info = copy.deepcopy(info)
+        with self._lock:
+            self._remember(key, timestamp, info)
+        self._save_to_disk(key, timestamp, info)
+
+    def _remember(self, key, timestamp, info):
+        self._entries[key] = (timestamp, info)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, url):
+        key = normalize_video_key(url)
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.disk_dir:
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
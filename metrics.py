@@ -0,0 +1,298 @@
+"""
+结构化指标和计时：计数器、直方图和按阶段计时的区间（span）
+
+指标都在内存中累加，每次记录只是一次加锁的字典操作，可以一直开着；
+区间结束时把事件交给注册的输出：JsonLinesSink写JSON lines日志，
+MetricsServer在本地端口以Prometheus文本格式提供当前的全部指标。
+
+设置 YTDL_METRICS_LOG（日志文件路径）或 YTDL_METRICS_PORT（端口）环境变量后，
+configure_from_env()会打开对应的输出，图形界面和命令行启动时都会调用。
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = 'ytdl_'
+
+# 耗时（秒）
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+# 速度（字节/秒）
+SPEED_BUCKETS = (64e3, 256e3, 1e6, 2e6, 5e6, 10e6, 25e6, 50e6, 100e6)
+# 大小（字节）
+SIZE_BUCKETS = (1e5, 1e6, 1e7, 5e7, 1e8, 5e8, 1e9, 5e9)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Span:
+    """
+    计时区间，用作上下文管理器；退出时按是否有异常记录状态（ok / error / cancelled）
+
+    set()附加的属性只写入事件，不作为指标的标签。
+    """
+
+    __slots__ = ('registry', 'stage', 'labels', 'attrs', 'started', 'wall_started')
+
+    def __init__(self, registry, stage, labels, attrs):
+        self.registry = registry
+        self.stage = stage
+        self.labels = labels
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.wall_started = time.time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            status = 'ok'
+        elif exc_type.__name__ in ('JobCancelled', 'DownloadCancelled', 'DownloadInterrupted'):
+            status = 'cancelled'
+        else:
+            status = 'error'
+            self.attrs.setdefault('error', str(exc)[:200])
+        self.registry.record_span(self.stage, time.perf_counter() - self.started, status=status,
+                                  started=self.wall_started, attrs=self.attrs, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """计数器、直方图、瞬时值和区间事件的输出"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self.sinks = []
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, buckets=DURATION_BUCKETS, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def span(self, stage, attrs=None, **labels):
+        """
+        with registry.span('extract', engine='ffmpeg', attrs={'url': url}) as span: ...
+
+        标签（数量有限的取值，例如阶段、引擎）进入指标；attrs（例如URL、任务编号）只写入事件
+        """
+        return Span(self, stage, labels, dict(attrs or {}))
+
+    def record_span(self, stage, seconds, status='ok', started=None, attrs=None, **labels):
+        """记录一个已经结束的区间（例如由开始和结束两个回调界定的阶段）"""
+        self.observe('stage_duration_seconds', seconds, stage=stage, **labels)
+        if status != 'ok':
+            self.inc('stage_failures_total', stage=stage, status=status, **labels)
+        if self.sinks:
+            event = {'type': 'span', 'stage': stage, 'status': status,
+                     'start': round(started if started is not None else time.time() - seconds, 6),
+                     'seconds': round(seconds, 6)}
+            event.update(labels)
+            event.update(attrs or {})
+            self.emit(event)
+
+    def event(self, name, **fields):
+        """不计时的事件（例如一次重试），只写入输出"""
+        if self.sinks:
+            self.emit(dict({'type': 'event', 'name': name, 'time': round(time.time(), 6)}, **fields))
+
+    def emit(self, event):
+        for sink in list(self.sinks):
+            try:
+                sink.write(event)
+            except Exception:
+                pass
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+        return sink
+
+    def remove_sink(self, sink):
+        if sink in self.sinks:
+            self.sinks.remove(sink)
+
+    def snapshot(self):
+        """当前所有指标：{'counters': {...}, 'gauges': {...}, 'histograms': {...}}，键为 名称{标签}"""
+        def name_of(key):
+            name, labels = key
+            return name + ('{' + ','.join(f'{k}={v}' for k, v in labels) + '}' if labels else '')
+
+        with self._lock:
+            return {
+                'counters': {name_of(k): v for k, v in self._counters.items()},
+                'gauges': {name_of(k): v for k, v in self._gauges.items()},
+                'histograms': {name_of(k): {'count': h.count, 'sum': h.sum}
+                               for k, h in self._histograms.items()},
+            }
+
+    def prometheus_text(self):
+        """Prometheus文本格式（0.0.4）"""
+        def labels_text(labels, extra=()):
+            items = [f'{k}="{_escape(v)}"' for k, v in list(labels) + list(extra)]
+            return '{' + ','.join(items) + '}' if items else ''
+
+        lines = []
+        with self._lock:
+            for kind, metrics in (('counter', self._counters), ('gauge', self._gauges)):
+                for name in sorted({key[0] for key in metrics}):
+                    lines.append(f'# TYPE {PREFIX}{name} {kind}')
+                    for (metric, labels), value in sorted(metrics.items()):
+                        if metric == name:
+                            lines.append(f'{PREFIX}{name}{labels_text(labels)} {value}')
+            for name in sorted({key[0] for key in self._histograms}):
+                lines.append(f'# TYPE {PREFIX}{name} histogram')
+                for (metric, labels), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(float(bound))
+                        lines.append(f'{PREFIX}{name}_bucket{labels_text(labels, [("le", le)])} {cumulative}')
+                    lines.append(f'{PREFIX}{name}_sum{labels_text(labels)} {histogram.sum}')
+                    lines.append(f'{PREFIX}{name}_count{labels_text(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class JsonLinesSink:
+    """把事件逐行追加到文件中（JSON lines），多个线程可以同时写入"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def write(self, event):
+        line = json.dumps(event, ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line)
+            # 不为每一行刷新磁盘，最多延迟一秒
+            now = time.monotonic()
+            if now - self._last_flush >= 1.0:
+                self._file.flush()
+                self._last_flush = now
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = None
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.registry.prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """在本地端口提供 /metrics（Prometheus文本格式），port为0时自动选择端口"""
+
+    def __init__(self, registry=None, port=0, host='127.0.0.1'):
+        handler = type('RegistryMetricsHandler', (_MetricsHandler,), {'registry': registry or get_registry()})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.url = f'http://{host}:{self.port}/metrics'
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True, name="metrics-server")
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+_registry = MetricsRegistry()
+_configured = {}
+
+
+def get_registry():
+    """整个程序共享的指标注册表"""
+    return _registry
+
+
+def configure(log_path=None, port=None):
+    """打开JSON lines日志和/或指标服务，重复调用不会重复打开，返回 {'log': ..., 'server': ...}"""
+    if log_path and 'log' not in _configured:
+        _configured['log'] = _registry.add_sink(JsonLinesSink(log_path))
+    if port is not None and 'server' not in _configured:
+        _configured['server'] = MetricsServer(_registry, port=int(port))
+    return dict(_configured)
+
+
+def configure_from_env():
+    port = os.environ.get('YTDL_METRICS_PORT')
+    return configure(os.environ.get('YTDL_METRICS_LOG') or None, int(port) if port else None)
+
+
+def shutdown():
+    """关闭configure()打开的输出"""
+    log = _configured.pop('log', None)
+    if log is not None:
+        _registry.remove_sink(log)
+        log.close()
+    server = _configured.pop('server', None)
+    if server is not None:
+        server.close()
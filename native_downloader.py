@@ -0,0 +1,121 @@
+import time
+
+import yt_dlp
+from yt_dlp.downloader.common import FileDownloader
+
+from fragment_downloader import (ConnectionPool, ParallelDownloader, DownloadInterrupted,
+                                 parse_m3u8_segments)
+
+# 所有内置引擎下载共享的keep-alive连接池
+shared_pool = ConnectionPool(max_idle_per_host=32)
+
+NATIVE_PROTOCOLS = ('http', 'https', 'http_dash_segments', 'm3u8', 'm3u8_native')
+
+
+class UnsupportedByNativeEngine(Exception):
+    """内置引擎无法处理该格式，改用yt-dlp默认下载器"""
+
+
+class ParallelFD(FileDownloader):
+    """使用ParallelDownloader并发获取字节范围或片段的yt-dlp下载器"""
+
+    FD_NAME = 'parallel'
+    default_workers = 8
+
+    @staticmethod
+    def can_download(info):
+        protocol = info.get('protocol') or 'https'
+        if protocol not in NATIVE_PROTOCOLS or info.get('is_live'):
+            return False
+        if protocol == 'http_dash_segments' and not info.get('fragments'):
+            return False
+        return not (info.get('url') or '').startswith('data:')
+
+    def _fragment_urls(self, info_dict, engine, headers):
+        fragments = info_dict.get('fragments')
+        if fragments:
+            base = info_dict.get('fragment_base_url') or info_dict.get('url')
+            return [f.get('url') or yt_dlp.utils.urljoin(base, f['path']) for f in fragments]
+        if info_dict.get('protocol') in ('m3u8', 'm3u8_native'):
+            response, release = engine.pool.request(info_dict['url'], headers)
+            text = response.read().decode('utf-8', 'replace')
+            release()
+            segments = parse_m3u8_segments(text, info_dict['url'])
+            if not segments:
+                raise UnsupportedByNativeEngine()
+            return segments
+        return None
+
+    def real_download(self, filename, info_dict):
+        tmpfilename = self.temp_name(filename)
+        headers = info_dict.get('http_headers') or {}
+        started = time.time()
+
+        def progress(downloaded, total):
+            now = time.time()
+            speed = self.calc_speed(started, now, downloaded)
+            self._hook_progress({
+                'status': 'downloading',
+                'downloaded_bytes': downloaded,
+                'total_bytes': total,
+                'tmpfilename': tmpfilename,
+                'filename': filename,
+                'elapsed': now - started,
+                'speed': speed,
+                'eta': self.calc_eta(speed, total - downloaded) if total and speed else None,
+                # 已经由ParallelDownloader按rate_limiter限速，进度回调中不需要再限速
+                'rate_limited': engine.rate_limiter is not None,
+                # 内部重试时重新下载的字节
+                'wasted_bytes': engine.wasted_bytes,
+            }, info_dict)
+
+        engine = ParallelDownloader(
+            workers=self.params.get('concurrent_fragment_downloads') or self.default_workers,
+            retries=self.params.get('fragment_retries', 10),
+            pool=shared_pool,
+            progress_hook=progress,
+            rate_limiter=self.params.get('rate_limiter'),
+            trace=self.params.get('trace'),
+        )
+        self.to_screen(f"[download] 内置并行引擎 ({engine.workers} 个连接): {filename}")
+        try:
+            fragment_urls = self._fragment_urls(info_dict, engine, headers)
+            if fragment_urls:
+                size = engine.download_fragments(fragment_urls, tmpfilename, headers)
+            else:
+                size = engine.download_url(info_dict['url'], tmpfilename, headers,
+                                           info_dict.get('filesize') or info_dict.get('filesize_approx'))
+        except DownloadInterrupted as e:
+            self.report_error(str(e))
+            return False
+
+        self.try_rename(tmpfilename, filename)
+        self._hook_progress({
+            'status': 'finished',
+            'downloaded_bytes': size,
+            'total_bytes': size,
+            'filename': filename,
+            'elapsed': time.time() - started,
+        }, info_dict)
+        return True
+
+
+class NativeYoutubeDL(yt_dlp.YoutubeDL):
+    """把支持的格式交给ParallelFD下载，其余情况仍使用yt-dlp自己的下载器"""
+
+    def dl(self, name, info, subtitle=False, test=False):
+        if subtitle or test or name == '-' or not ParallelFD.can_download(info):
+            return super().dl(name, info, subtitle, test)
+        if not info.get('url'):
+            self.raise_no_formats(info, True)
+
+        fd = ParallelFD(self, self.params)
+        for ph in self._progress_hooks:
+            fd.add_progress_hook(ph)
+        new_info = self._copy_infodict(info)
+        if new_info.get('http_headers') is None:
+            new_info['http_headers'] = self._calc_headers(new_info)
+        try:
+            return fd.download(name, new_info, subtitle)
+        except UnsupportedByNativeEngine:
+            return super().dl(name, info, subtitle, test)
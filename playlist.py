@@ -0,0 +1,170 @@
+"""
+播放列表和频道的流式展开
+
+iter_playlist只向提取器请求扁平的条目列表（extract_flat），按页逐条返回，
+调用方可以在列出后面的页之前就开始下载前面的视频。范围和标题、时长过滤在逐条返回前完成，
+超出范围后不再请求后续的页。
+"""
+import itertools
+import re
+from urllib.parse import urlparse, parse_qs
+
+# 嵌套播放列表（频道 -> 标签页 -> 列表）最多展开的层数
+MAX_DEPTH = 3
+
+# 任务选项中与播放列表展开有关的键，子任务不继承
+PLAYLIST_OPTIONS = ('playlist', 'playlist_items', 'match_title', 'reject_title',
+                    'min_duration', 'max_duration', 'playlist_done')
+
+
+def is_playlist_url(url):
+    """根据URL判断是否为播放列表或频道"""
+    parsed = urlparse(url)
+    path = parsed.path.rstrip('/')
+    query = parse_qs(parsed.query)
+    if 'list' in query and 'v' not in query:
+        return True
+    return (path.endswith('/playlist') or path.endswith('/videos')
+            or '/channel/' in path or '/c/' in path or path.split('/')[-1].startswith('@'))
+
+
+def parse_items(spec):
+    """解析 '1-10,15,20-' 形式的序号范围（从1开始），返回 [(开始, 结束或None)]"""
+    ranges = []
+    for part in (spec or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, sep, end = part.partition('-')
+        try:
+            first = int(start) if start else 1
+            last = (int(end) if end else None) if sep else first
+        except ValueError:
+            raise ValueError(f"无法解析的播放列表范围: {part}")
+        if first < 1 or (last is not None and last < first):
+            raise ValueError(f"无效的播放列表范围: {part}")
+        ranges.append((first, last))
+    return ranges
+
+
+class PlaylistFilter:
+    """
+    在逐条返回之前过滤播放列表条目
+
+    items为序号范围（见parse_items）；match_title/reject_title为标题的正则表达式；
+    min_duration/max_duration为时长范围（秒），扁平条目中没有时长时不按时长过滤。
+    """
+
+    def __init__(self, items=None, match_title=None, reject_title=None,
+                 min_duration=None, max_duration=None):
+        self.ranges = parse_items(items) if isinstance(items, str) else list(items or [])
+        self.match_title = re.compile(match_title, re.I) if match_title else None
+        self.reject_title = re.compile(reject_title, re.I) if reject_title else None
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        # 所有范围都有结束序号时，超过最大序号就可以停止列出
+        self.last_index = (max(end for _, end in self.ranges)
+                           if self.ranges and all(end is not None for _, end in self.ranges) else None)
+
+    @classmethod
+    def from_options(cls, options):
+        return cls(options.get('playlist_items'), options.get('match_title'), options.get('reject_title'),
+                   options.get('min_duration'), options.get('max_duration'))
+
+    def exhausted(self, index):
+        return self.last_index is not None and index > self.last_index
+
+    def accepts_index(self, index):
+        if not self.ranges:
+            return True
+        return any(start <= index and (end is None or index <= end) for start, end in self.ranges)
+
+    def accepts(self, entry):
+        title = entry.get('title') or ''
+        if self.match_title and not self.match_title.search(title):
+            return False
+        if self.reject_title and self.reject_title.search(title):
+            return False
+        duration = entry.get('duration')
+        if duration is not None:
+            if self.min_duration is not None and duration < self.min_duration:
+                return False
+            if self.max_duration is not None and duration > self.max_duration:
+                return False
+        return True
+
+
+def entry_url(entry):
+    return entry.get('url') or entry.get('webpage_url') or entry.get('id')
+
+
+def _iter_entries(entries):
+    """
+    逐条迭代entries；分页列表逐页请求，不按下标访问
+
+    yt-dlp的PagedList按下标访问时会缓存所有已请求的页，而且关闭缓存后不能按下标访问。
+    """
+    from yt_dlp.utils import PagedList
+
+    if not isinstance(entries, PagedList):
+        yield from entries or ()
+        return
+    for pagenum in itertools.count():
+        page = entries.getpage(pagenum)
+        yield from page
+        if len(page) < entries._pagesize:
+            return
+
+
+def _walk(ydl, info, depth):
+    """逐条返回info中的视频条目，嵌套的播放列表展开到MAX_DEPTH层"""
+    if info is None:
+        return
+    kind = info.get('_type', 'video')
+    if kind == 'playlist' or 'entries' in info:
+        # entries可能是生成器或分页列表，逐条迭代时才请求下一页
+        for entry in _iter_entries(info.get('entries')):
+            if not entry:
+                continue
+            entry_kind = entry.get('_type')
+            if depth < MAX_DEPTH and (entry_kind == 'playlist' or 'entries' in entry):
+                yield from _walk(ydl, entry, depth + 1)
+            elif depth < MAX_DEPTH and entry_kind in ('url', 'url_transparent') and is_playlist_url(entry_url(entry)):
+                yield from _walk(ydl, ydl.extract_info(entry_url(entry), download=False, process=False), depth + 1)
+            else:
+                yield entry
+    elif kind in ('url', 'url_transparent') and depth < MAX_DEPTH:
+        # 频道首页等会重定向到另一个列表
+        yield from _walk(ydl, ydl.extract_info(info['url'], download=False, process=False), depth + 1)
+    else:
+        yield info
+
+
+def iter_playlist(url, playlist_filter=None, start=0, extractors=()):
+    """
+    逐条返回播放列表中通过过滤的视频 (序号, URL, 扁平条目)
+
+    start为已经处理过的序号，恢复任务时跳过这些条目；extractors为额外注册的yt-dlp提取器类。
+    """
+    import yt_dlp
+
+    playlist_filter = playlist_filter or PlaylistFilter()
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': 'in_playlist',
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        for extractor in extractors:
+            ydl.add_info_extractor(extractor())
+        # 额外的提取器排在通用提取器之后，需要显式指定
+        ie_key = next((extractor.ie_key() for extractor in extractors if extractor.suitable(url)), None)
+        info = ydl.extract_info(url, download=False, process=False, ie_key=ie_key)
+        for index, entry in enumerate(_walk(ydl, info, 0), 1):
+            if playlist_filter.exhausted(index):
+                return
+            if index <= start or not playlist_filter.accepts_index(index) or not playlist_filter.accepts(entry):
+                continue
+            video_url = entry_url(entry)
+            if video_url:
+                yield index, video_url, entry
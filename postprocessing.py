@@ -0,0 +1,145 @@
+import os
+import re
+import subprocess
+
+from yt_dlp.postprocessor.common import PostProcessor
+from yt_dlp.postprocessor.ffmpeg import FFmpegPostProcessor
+from yt_dlp.utils import replace_extension
+
+from toolchain import AAC_ENCODERS, MP4_VIDEO_ENCODERS, get_toolchain
+
+# MP4容器可以直接容纳（无需转码）的编码，按编码字符串的前缀匹配，例如 avc1.64001F
+MP4_VIDEO_CODECS = ('avc1', 'avc3', 'h264', 'hev1', 'hvc1', 'h265', 'hevc',
+                    'av01', 'av1', 'vp09', 'vp9', 'mp4v', 'mpeg4')
+MP4_AUDIO_CODECS = ('mp4a', 'aac', 'mp3', 'opus', 'ac-3', 'ac3', 'ec-3', 'eac3',
+                    'flac', 'alac')
+
+
+def _codec_name(codec):
+    if not codec or codec == 'none':
+        return None
+    return codec.split('.')[0].lower()
+
+
+def mp4_compatible(codec, allowed):
+    name = _codec_name(codec)
+    return name is None or name in allowed
+
+
+def plan_postprocess(ext, vcodec, acodec, target_ext='mp4'):
+    """
+    根据容器和编码决定如何得到目标格式的文件
+
+    返回 (动作, 需要转码的流)：'none' 已经是目标格式，'remux' 只复制流更换容器，
+    'transcode' 只对不兼容的流（'video'/'audio'）重新编码
+    """
+    if (ext or '').lower() == target_ext:
+        return 'none', ()
+    streams = []
+    if not mp4_compatible(vcodec, MP4_VIDEO_CODECS):
+        streams.append('video')
+    if not mp4_compatible(acodec, MP4_AUDIO_CODECS):
+        streams.append('audio')
+    if streams:
+        return 'transcode', tuple(streams)
+    return 'remux', ()
+
+
+class TargetFilePP(PostProcessor):
+    """
+    在下载开始前报告输出文件的路径（下载期间写入 路径.part），边下边播时播放器据此打开文件
+
+    视频+音频分开下载时字节写入 .fNNN 临时文件，这里报告的是合并后的文件，所以边下边播只用合并格式。
+    """
+
+    def __init__(self, downloader=None, on_target=None):
+        super().__init__(downloader)
+        self.on_target = on_target
+
+    def run(self, info):
+        path = info.get('_filename')
+        if path and self.on_target:
+            self.on_target(path)
+        return [], info
+
+
+class SmartRemuxPP(FFmpegPostProcessor):
+    """
+    代替FFmpegVideoConvertor把下载结果转换为mp4
+
+    编码兼容时只复制流（-c copy），否则只重新编码不兼容的流，
+    转码使用可配置的x264预设和线程数；本机的ffmpeg没有libx264时改用其他可用的编码器。
+    信息字典中没有编码信息时用ffprobe（或ffmpeg）检测。
+    """
+
+    def __init__(self, downloader=None, target_ext='mp4', preset='veryfast', threads=0,
+                 crf=20, audio_bitrate='192k'):
+        super().__init__(downloader)
+        self.target_ext = target_ext
+        self.preset = preset
+        self.threads = threads
+        self.crf = crf
+        self.audio_bitrate = audio_bitrate
+        self.toolchain = get_toolchain()
+        self.last_action = None
+
+    def _probe_codecs(self, path):
+        """返回文件中第一个视频流和音频流的编码，没有ffprobe时解析 ffmpeg -i 的输出"""
+        codecs = {}
+        try:
+            if self.toolchain.ffprobe_path:
+                for stream in self.get_metadata_object(path).get('streams', []):
+                    codecs.setdefault(stream.get('codec_type'), stream.get('codec_name'))
+            else:
+                result = subprocess.run([self.toolchain.ffmpeg_path or self.executable, '-hide_banner',
+                                         '-i', path], capture_output=True, text=True, errors='replace')
+                for kind, codec in re.findall(r'Stream #\S+.*?: (Video|Audio): (\w+)', result.stderr):
+                    codecs.setdefault(kind.lower(), codec)
+        except Exception:
+            return 'unknown', 'unknown'
+        return codecs.get('video'), codecs.get('audio')
+
+    def _codecs(self, info):
+        vcodec, acodec = info.get('vcodec'), info.get('acodec')
+        if vcodec in (None, 'unknown') or acodec in (None, 'unknown'):
+            vcodec, acodec = self._probe_codecs(info['filepath'])
+        return vcodec, acodec
+
+    def _options(self, streams):
+        options = list(self.stream_copy_opts())
+        if 'video' in streams:
+            encoder = self.toolchain.pick_encoder(MP4_VIDEO_ENCODERS) or 'libx264'
+            options += ['-c:v', encoder]
+            if encoder == 'libx264':
+                options += ['-preset', self.preset, '-crf', str(self.crf)]
+        if 'audio' in streams:
+            encoder = self.toolchain.pick_encoder(AAC_ENCODERS) or 'aac'
+            options += ['-c:a', encoder, '-b:a', self.audio_bitrate]
+        if self.threads:
+            options += ['-threads', str(self.threads)]
+        return options
+
+    @PostProcessor._restrict_to(images=False)
+    def run(self, info):
+        filename, source_ext = info['filepath'], info['ext'].lower()
+        if source_ext == self.target_ext:
+            self.last_action = 'none'
+            self.to_screen(f'"{filename}" 已经是{self.target_ext}格式，无需处理')
+            return [], info
+
+        vcodec, acodec = self._codecs(info)
+        action, streams = plan_postprocess(source_ext, vcodec, acodec, self.target_ext)
+        self.last_action = action
+        outpath = replace_extension(filename, self.target_ext, source_ext)
+        if action == 'remux':
+            self.to_screen(f'编码兼容({vcodec}/{acodec})，只转换容器: {outpath}')
+            self.run_ffmpeg(filename, outpath, list(self.stream_copy_opts()))
+        else:
+            self.to_screen(f'转码 {"/".join(streams)} ({vcodec}/{acodec}，预设 {self.preset}): {outpath}')
+            self.run_ffmpeg(filename, outpath, self._options(streams))
+
+        info['filepath'] = outpath
+        info['format'] = info['ext'] = self.target_ext
+        if os.path.abspath(outpath) == os.path.abspath(filename):
+            return [], info
+        return [filename], info
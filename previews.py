@@ -0,0 +1,221 @@
+"""
+下载结果的预览：每个视频抽取若干关键帧，拼成一张缩略图总览（contact sheet），
+另存一张小的WebP缩略图，都放在视频所在目录的 .previews 子目录中
+
+抽帧只做关键帧定位（-noaccurate_seek -skip_frame nokey），不解码整个文件；
+每个文件只启动一个ffmpeg进程，多个文件在进程池中并行处理。
+cv2和numpy只在生成预览时导入，不生成预览时导入本模块不加载它们。
+"""
+import concurrent.futures
+import math
+import multiprocessing
+import os
+import subprocess
+import threading
+import time
+
+PREVIEW_DIRNAME = '.previews'
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.webm', '.mov', '.avi', '.m4v', '.flv')
+
+
+def preview_paths(video_path):
+    """返回 (总览图路径, 缩略图路径)"""
+    directory, name = os.path.split(os.path.abspath(video_path))
+    base = os.path.join(directory, PREVIEW_DIRNAME, name)
+    return base + '.sheet.jpg', base + '.thumb.webp'
+
+
+def is_fresh(video_path):
+    """预览已经存在并且不早于视频文件"""
+    try:
+        mtime = os.path.getmtime(video_path)
+        return all(os.path.getmtime(path) >= mtime for path in preview_paths(video_path))
+    except OSError:
+        return False
+
+
+def find_videos(directory):
+    """目录（不含子目录）中的视频文件，按名称排序"""
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.lower().endswith(VIDEO_EXTENSIONS) and not name.endswith('.part')
+                  and os.path.isfile(os.path.join(directory, name)))
+
+
+def sample_times(duration, count):
+    """在时长中均匀取count个时间点（每段的中点）"""
+    if not duration or duration <= 0:
+        return [0.0]
+    return [duration * (i + 0.5) / count for i in range(count)]
+
+
+def extract_keyframes(path, times, width, height, ffmpeg='ffmpeg'):
+    """
+    在每个时间点之前最近的关键帧处取一帧，缩放为width x height，返回RGB帧列表
+
+    所有时间点作为同一个文件的多个输入交给一个ffmpeg进程，解码器只解码关键帧。
+    文件损坏或某个时间点取不到帧时返回的帧会少于时间点数。
+    """
+    import numpy as np
+
+    cmd = [ffmpeg, '-v', 'error', '-nostdin']
+    chains = []
+    for i, t in enumerate(times):
+        cmd += ['-noaccurate_seek', '-skip_frame', 'nokey', '-ss', f'{t:.3f}', '-i', path]
+        # 定位到关键帧后时间戳为负，重置后才会被输出
+        chains.append(f'[{i}:v]trim=end_frame=1,setpts=PTS-STARTPTS,scale={width}:{height},setsar=1[v{i}]')
+    labels = ''.join(f'[v{i}]' for i in range(len(times)))
+    cmd += ['-filter_complex', ';'.join(chains) + f';{labels}concat=n={len(times)}:v=1[out]',
+            '-map', '[out]', '-fps_mode', 'passthrough', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-']
+    result = subprocess.run(cmd, capture_output=True, timeout=120)
+    frame_size = width * height * 3
+    data = result.stdout
+    frames = [np.frombuffer(data, dtype=np.uint8, count=frame_size, offset=i * frame_size).reshape(height, width, 3)
+              for i in range(len(data) // frame_size)]
+    if not frames and result.returncode != 0:
+        raise IOError(result.stderr.decode('utf-8', 'replace').strip() or f"无法读取视频帧: {path}")
+    return frames
+
+
+def contact_sheet(frames, columns):
+    """把帧按columns列拼成一张图，最后一行不足时留黑"""
+    import numpy as np
+
+    height, width = frames[0].shape[:2]
+    rows = math.ceil(len(frames) / columns)
+    sheet = np.zeros((rows * height, columns * width, 3), dtype=np.uint8)
+    for i, frame in enumerate(frames):
+        row, column = divmod(i, columns)
+        sheet[row * height:(row + 1) * height, column * width:(column + 1) * width] = frame
+    return sheet
+
+
+def _write_image(path, rgb, params):
+    """先写临时文件再替换，中途中断不会留下不完整的预览"""
+    import cv2
+
+    root, ext = os.path.splitext(path)
+    tmp = f'{root}.tmp{ext}'
+    if not cv2.imwrite(tmp, cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR), params):
+        raise IOError(f"无法写入预览图: {path}")
+    os.replace(tmp, path)
+
+
+def generate_preview(path, count=9, columns=3, tile_width=320, thumb_width=160,
+                     ffmpeg='ffmpeg', force=False):
+    """
+    为一个视频生成总览图和缩略图，已有的预览不早于视频时直接返回
+
+    在进程池的工作进程中执行，参数和返回值都只用基本类型。
+    """
+    import cv2
+
+    from decode_engine import CaptureSource
+
+    started = time.perf_counter()
+    sheet_path, thumb_path = preview_paths(path)
+    result = {'path': path, 'sheet': sheet_path, 'thumb': thumb_path, 'frames': 0, 'cached': False}
+    if not force and is_fresh(path):
+        result.update(cached=True, seconds=time.perf_counter() - started)
+        return result
+
+    # 只读取容器信息，不解码
+    probe = CaptureSource(path, hwaccel=False)
+    duration, width, height = probe.duration, probe.width, probe.height
+    probe.close()
+    if not width or not height:
+        raise IOError(f"无法读取视频尺寸: {path}")
+    tile_height = max(2, round(tile_width * height / width / 2) * 2)
+    frames = extract_keyframes(path, sample_times(duration, count), tile_width, tile_height, ffmpeg)
+    if not frames:
+        raise IOError(f"没有取到关键帧: {path}")
+
+    os.makedirs(os.path.dirname(sheet_path), exist_ok=True)
+    _write_image(sheet_path, contact_sheet(frames, min(columns, len(frames))),
+                 [cv2.IMWRITE_JPEG_QUALITY, 85])
+    thumb = frames[len(frames) // 2]
+    thumb_height = max(2, round(thumb_width * tile_height / tile_width / 2) * 2)
+    _write_image(thumb_path, cv2.resize(thumb, (thumb_width, thumb_height), interpolation=cv2.INTER_AREA),
+                 [cv2.IMWRITE_WEBP_QUALITY, 75])
+    result.update(frames=len(frames), seconds=time.perf_counter() - started)
+    return result
+
+
+class PreviewGenerator:
+    """
+    在进程池中为多个视频生成预览
+
+    on_result(result) 在每个文件完成后从后台线程调用；失败时result中有'error'。
+    工作进程用spawn启动，不复制GUI进程的线程和Qt状态。
+    """
+
+    def __init__(self, workers=None, count=9, columns=3, tile_width=320, thumb_width=160,
+                 on_result=None):
+        from toolchain import get_toolchain
+
+        self.workers = workers or os.cpu_count() or 1
+        self.options = {'count': count, 'columns': columns, 'tile_width': tile_width,
+                        'thumb_width': thumb_width}
+        self.on_result = on_result
+        # 工作进程中不再各自探测ffmpeg
+        self.ffmpeg = get_toolchain().ffmpeg_path or 'ffmpeg'
+        self._executor = None
+        self._lock = threading.Lock()
+        self.generated = 0
+        self.cached = 0
+        self.failed = 0
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _done(self, path, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {'path': path, 'error': str(e)}
+        with self._lock:
+            if 'error' in result:
+                self.failed += 1
+            elif result['cached']:
+                self.cached += 1
+            else:
+                self.generated += 1
+        if self.on_result:
+            self.on_result(result)
+        return result
+
+    def submit(self, path, force=False):
+        """提交一个视频，立即返回future"""
+        future = self._pool().submit(generate_preview, path, ffmpeg=self.ffmpeg, force=force,
+                                     **self.options)
+        future.add_done_callback(lambda f: self._done(path, f))
+        return future
+
+    def generate_all(self, paths, force=False):
+        """为所有视频生成预览并等待完成，返回统计（含每秒处理的文件数）"""
+        started = time.perf_counter()
+        futures = {self.submit(path, force): path for path in paths}
+        results = []
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append({'path': futures[future], 'error': str(e)})
+        elapsed = time.perf_counter() - started
+        return {
+            'files': len(results),
+            'generated': sum(1 for r in results if 'error' not in r and not r['cached']),
+            'cached': sum(1 for r in results if r.get('cached')),
+            'errors': [r for r in results if 'error' in r],
+            'seconds': elapsed,
+            'files_per_second': len(results) / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
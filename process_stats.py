@@ -0,0 +1,63 @@
+"""
+当前进程的资源占用：常驻内存（RSS）、子进程数和线程数
+
+安装了psutil时用psutil，否则在Linux上读取 /proc；两者都不可用时对应的值为None。
+"""
+import os
+import threading
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def rss_bytes():
+    """当前进程的常驻内存字节数"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def child_processes():
+    """当前进程仍在运行的直接子进程（不含僵尸进程）的pid列表"""
+    pid = os.getpid()
+    if psutil is not None:
+        return [p.pid for p in psutil.Process(pid).children()
+                if p.status() != psutil.STATUS_ZOMBIE]
+    if not os.path.isdir('/proc'):
+        return None
+    children = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                # comm可能包含空格和括号，从最后一个右括号之后开始解析
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if fields[0] != 'Z' and int(fields[1]) == pid:
+            children.append(int(name))
+    return children
+
+
+def snapshot():
+    """返回 {'rss_bytes', 'child_processes', 'threads'}"""
+    children = child_processes()
+    return {
+        'rss_bytes': rss_bytes(),
+        'child_processes': len(children) if children is not None else None,
+        'threads': threading.active_count(),
+    }
+
+
+def format_snapshot(stats):
+    rss = stats.get('rss_bytes')
+    memory = f"{rss / (1024 * 1024):.1f}MB" if rss is not None else "未知"
+    children = stats.get('child_processes')
+    return f"内存 {memory}，子进程 {children if children is not None else '未知'}，线程 {stats.get('threads')}"
@@ -0,0 +1,165 @@
+import math
+import threading
+import time
+from collections import deque
+
+from downloader_core import format_speed
+
+
+def format_bytes(size):
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f}KiB"
+    if size < 1024 * 1024 * 1024:
+        return f"{size / (1024 * 1024):.1f}MiB"
+    return f"{size / (1024 * 1024 * 1024):.2f}GiB"
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+class JobProgress:
+    """单个任务当前文件的进度，speed为平滑后的速度（字节/秒）"""
+
+    def __init__(self):
+        self.filename = None
+        self.downloaded = 0
+        self.total = None
+        self.speed = None
+        self.finished = False
+        self._last_time = None
+
+    @property
+    def percent(self):
+        if self.finished:
+            return 100.0
+        if not self.total:
+            return None
+        return min(100.0, self.downloaded * 100 / self.total)
+
+    @property
+    def eta(self):
+        if not self.total or not self.speed:
+            return None
+        return max(0.0, (self.total - self.downloaded) / self.speed)
+
+    def line(self):
+        if self.finished:
+            return "下载完成，正在处理文件..."
+        parts = []
+        if self.percent is not None:
+            parts.append(f"{self.percent:.1f}%")
+        if self.total:
+            parts.append(f"{format_bytes(self.downloaded)}/{format_bytes(self.total)}")
+        else:
+            parts.append(format_bytes(self.downloaded))
+        if self.speed:
+            parts.append(format_speed(self.speed))
+        parts.append(f"剩余 {format_eta(self.eta)}")
+        return " ".join(parts)
+
+
+class ProgressAggregator:
+    """
+    汇总多个任务的下载进度，供界面定时拉取
+
+    下载线程调用update()/log()只更新内存中的状态，不触发界面刷新；
+    界面线程用定时器调用poll()，每个任务只取最新的一条状态，日志保存在固定大小的环形缓冲区中。
+    速度用指数移动平均平滑，time_constant越大越平稳。
+    """
+
+    def __init__(self, log_size=500, time_constant=3.0, time_source=time.monotonic):
+        self.time_constant = time_constant
+        self.time_source = time_source
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._dirty = set()
+        self._log = deque(maxlen=log_size)
+        self._log_serial = 0
+        self._polled_serial = 0
+        self.updates = 0
+        self.polls = 0
+        self.dropped_lines = 0
+
+    def update(self, job_id, d):
+        """记录yt-dlp的进度字典，在下载线程中调用"""
+        status = d.get('status')
+        if status not in ('downloading', 'finished'):
+            return
+        now = self.time_source()
+        with self._lock:
+            progress = self._jobs.get(job_id)
+            if progress is None:
+                progress = self._jobs[job_id] = JobProgress()
+            filename = d.get('filename')
+            downloaded = d.get('downloaded_bytes') or 0
+            if filename != progress.filename:
+                # 开始下载下一个文件（例如音频流），速度估计沿用
+                progress.filename = filename
+                progress.downloaded = downloaded
+                progress._last_time = now
+            elif progress._last_time is not None and now > progress._last_time:
+                elapsed = now - progress._last_time
+                instant = max(0, downloaded - progress.downloaded) / elapsed
+                if progress.speed is None:
+                    progress.speed = instant
+                else:
+                    alpha = 1 - math.exp(-elapsed / self.time_constant)
+                    progress.speed += alpha * (instant - progress.speed)
+                progress.downloaded = downloaded
+                progress._last_time = now
+            progress.total = d.get('total_bytes') or d.get('total_bytes_estimate') or progress.total
+            progress.finished = status == 'finished'
+            if progress.finished and progress.total is None:
+                progress.total = downloaded
+            self._dirty.add(job_id)
+            self.updates += 1
+
+    def log(self, job_id, msg):
+        """添加一行日志，job_id为None时表示与任务无关的消息"""
+        line = f"[#{job_id}] {msg}" if job_id is not None else msg
+        with self._lock:
+            self._log.append(line)
+            self._log_serial += 1
+
+    def finish(self, job_id):
+        """任务结束，清除它的状态行"""
+        with self._lock:
+            if self._jobs.pop(job_id, None) is not None:
+                self._dirty.add(job_id)
+
+    def status(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def poll(self):
+        """
+        在界面线程中调用，返回 (状态行, 新日志)
+
+        状态行是 {job_id: 文字} 字典，只包含上次poll以来有变化的任务，任务结束时文字为None
+        """
+        with self._lock:
+            lines = {}
+            for job_id in self._dirty:
+                progress = self._jobs.get(job_id)
+                lines[job_id] = progress.line() if progress is not None else None
+            self._dirty.clear()
+            new_count = self._log_serial - self._polled_serial
+            if new_count > len(self._log):
+                # 两次poll之间的日志超出了缓冲区，最早的行已被覆盖
+                self.dropped_lines += new_count - len(self._log)
+                new_count = len(self._log)
+            log_lines = list(self._log)[len(self._log) - new_count:] if new_count else []
+            self._polled_serial = self._log_serial
+            self.polls += 1
+        return lines, log_lines
+
+    def recent_log(self):
+        """环形缓冲区中保留的全部日志"""
+        with self._lock:
+            return list(self._log)
@@ -0,0 +1,224 @@
+"""
+边下边播：下载时写出可以顺序读取的文件布局，播放器从正在增长的文件解码
+
+ffmpeg外部下载器输出分片MP4（moov在开头，之后每个关键帧一个分片），
+文件不完整时也能从头顺序解码。GrowingFile读到已写入的末尾时等待下载继续，
+ProgressiveSource通过管道把它交给ffmpeg解码，接口与decode_engine中的解码源相同。
+
+限制：只能跟随一个文件。分开下载的视频和音频会先写入 .fNNN 临时文件，下载完才合并为最终文件，
+所以边下边播的任务只选择自带音频的合并格式（downloader_core.PROGRESSIVE_FORMAT），
+只提供分开的视频和音频的网站上画质可能比普通下载低。
+"""
+import os
+import re
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+from toolchain import get_toolchain
+
+# ffmpeg外部下载器的输出参数：分片MP4，文件写到一半也可以播放；
+# 关键帧间隔很长的视频也至少每秒写出一个分片，不必等到下一个关键帧
+STREAMABLE_MP4_ARGS = ['-movflags', '+frag_keyframe+empty_moov+default_base_moof',
+                       '-frag_duration', '1000000']
+
+_OUTPUT_STREAM = re.compile(r'Stream #0:\d+.*?: Video: rawvideo.*?, (\d+)x(\d+)[ ,]')
+_OUTPUT_FPS = re.compile(r', ([\d.]+) fps')
+
+
+class WriterRestarted(Exception):
+    """下载重新开始，文件被截短"""
+
+
+class GrowingFile:
+    """
+    只读打开正在下载的文件（先找 .part 临时文件，再找最终文件），
+    读到已写入的末尾时等待，直到is_complete()为真
+    """
+
+    def __init__(self, path, is_complete, poll_interval=0.05):
+        self.path = path
+        self.is_complete = is_complete
+        self.poll_interval = poll_interval
+        self.file = None
+        self.offset = 0
+        self.waiting = False
+        self.waited = 0.0  # 等待下载的总时间（秒）
+        self.closed = False
+
+    def _open(self):
+        while not self.closed:
+            for path in (self.path + '.part', self.path):
+                try:
+                    # 打开后即使 .part 被重命名为最终文件，句柄仍然有效
+                    self.file = open(path, 'rb')
+                    return
+                except FileNotFoundError:
+                    pass
+            if self.is_complete():
+                raise FileNotFoundError(self.path)
+            self._wait()
+
+    def _wait(self):
+        self.waiting = True
+        started = time.monotonic()
+        time.sleep(self.poll_interval)
+        self.waited += time.monotonic() - started
+
+    def read(self, size):
+        """返回至多size字节；下载完成并且读完时返回b''"""
+        if self.file is None:
+            self._open()
+        while not self.closed:
+            data = self.file.read(size)
+            if data:
+                self.waiting = False
+                self.offset += len(data)
+                return data
+            if os.fstat(self.file.fileno()).st_size < self.offset:
+                raise WriterRestarted(self.path)
+            if self.is_complete():
+                # 完成之前可能又写入了最后一段
+                data = self.file.read(size)
+                self.offset += len(data)
+                self.waiting = False
+                return data
+            self._wait()
+        return b''
+
+    def close(self):
+        self.closed = True
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class ProgressiveSource:
+    """
+    从正在下载的文件解码：GrowingFile的数据经stdin管道交给ffmpeg，从stdout读取rawvideo帧
+
+    管道输入不能定位，seek时从文件开头重新解码并丢弃目标之前的帧；
+    尺寸和帧率从ffmpeg的输出流信息中读取，构造时会等到文件头写入为止。
+    """
+
+    def __init__(self, path, is_complete, hwaccel=True, duration=None, poll_interval=0.05):
+        self.path = path
+        self.is_complete = is_complete
+        self.poll_interval = poll_interval
+        self.hwaccel = hwaccel
+        self.duration = duration or 0.0
+        self.width = self.height = None
+        self.fps = 30.0
+        self.frame_count = 0
+        self.position = 0.0
+        self.process = None
+        self.growing = None
+        self.restarts = 0
+        self._waited = 0.0
+        self._start(0.0)
+
+    @property
+    def waiting(self):
+        """解码已经追上下载，正在等待写入"""
+        return self.growing is not None and self.growing.waiting
+
+    @property
+    def waited(self):
+        return self._waited + (self.growing.waited if self.growing else 0.0)
+
+    def _start(self, t):
+        self.close()
+        self.growing = GrowingFile(self.path, self.is_complete, self.poll_interval)
+        toolchain = get_toolchain()
+        cmd = [toolchain.ffmpeg_path or 'ffmpeg', '-hide_banner', '-nostats', '-loglevel', 'info']
+        if self.hwaccel and toolchain.hwaccels:
+            cmd += ['-hwaccel', 'auto']
+        # 分片MP4的文件头已经包含编码参数，只探测很少的数据就开始解码
+        cmd += ['-probesize', '65536', '-analyzeduration', '0', '-i', 'pipe:0']
+        if t > 0:
+            cmd += ['-ss', f'{t:.3f}']
+        cmd += ['-an', '-sn', '-f', 'rawvideo', '-pix_fmt', 'rgb24', 'pipe:1']
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+        self.position = t
+        self._restart_needed = False
+        self._stream_info = threading.Event()
+        threading.Thread(target=self._feed, args=(self.process, self.growing), daemon=True,
+                         name="progressive-feed").start()
+        threading.Thread(target=self._read_log, args=(self.process,), daemon=True,
+                         name="progressive-log").start()
+        self._stream_info.wait()
+        if self.width is None:
+            raise IOError(f"无法解码视频: {self.path}")
+        self.frame_size = self.width * self.height * 3
+
+    def _feed(self, process, growing):
+        try:
+            while True:
+                data = growing.read(256 * 1024)
+                if not data:
+                    break
+                process.stdin.write(data)
+        except WriterRestarted:
+            # 下载从头重新开始，关闭输入让ffmpeg结束，read()会重新启动解码
+            self._restart_needed = True
+        except (OSError, ValueError):
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    def _read_log(self, process):
+        """读取ffmpeg的输出流信息，之后继续读完stderr，避免管道写满"""
+        in_output = False
+        for line in iter(process.stderr.readline, b''):
+            text = line.decode('utf-8', 'replace')
+            if text.startswith('Output #0'):
+                in_output = True
+            match = _OUTPUT_STREAM.search(text) if in_output and not self._stream_info.is_set() else None
+            if match:
+                self.width, self.height = int(match.group(1)), int(match.group(2))
+                fps = _OUTPUT_FPS.search(text)
+                if fps:
+                    self.fps = float(fps.group(1))
+                self._stream_info.set()
+        self._stream_info.set()
+
+    def read(self):
+        data = self.process.stdout.read(self.frame_size)
+        if len(data) < self.frame_size:
+            if self._restart_needed:
+                self.restarts += 1
+                self._start(self.position)
+                return self.read()
+            if self.is_complete() and not self.duration:
+                self.duration = self.position
+            return None
+        pts = self.position
+        self.position += 1.0 / self.fps
+        frame = np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, 3)
+        return pts, frame
+
+    def skip(self):
+        return self.read() is not None
+
+    def seek(self, t):
+        self._start(t)
+
+    def close(self):
+        if self.growing is not None:
+            self._waited += self.growing.waited
+            self.growing.close()
+            self.growing = None
+        if self.process is not None:
+            try:
+                self.process.kill()
+                self.process.wait(timeout=2)
+                self.process.stdout.close()
+            except Exception:
+                pass
+            self.process = None
@@ -0,0 +1,128 @@
+"""
+下载失败的分类和重试策略
+
+classify_failure把异常归类为网络波动、服务器限流、格式不可用、地区/登录限制、磁盘错误等，
+RetryPolicy按类别决定是否重试以及等待多久（指数退避加随机抖动）。
+只有格式确实不可用时才降低质量，其余可重试的错误从断点继续原来的格式。
+"""
+import errno
+import random
+import re
+import time
+
+
+class FailureKind:
+    NETWORK = 'network'             # 连接中断、超时、5xx等暂时性错误
+    THROTTLED = 'throttled'         # 429等服务器限流
+    FORMAT = 'format_unavailable'   # 选中的格式不存在或已失效
+    ACCESS = 'geo_auth'             # 地区限制、需要登录、私有视频
+    UNAVAILABLE = 'unavailable'     # 视频不存在或已删除（404/410）
+    DISK = 'disk'                   # 磁盘已满、没有写入权限
+    UNKNOWN = 'unknown'
+
+
+# 给用户看的说明
+FAILURE_LABELS = {
+    FailureKind.NETWORK: "网络错误",
+    FailureKind.THROTTLED: "服务器限流",
+    FailureKind.FORMAT: "格式不可用",
+    FailureKind.ACCESS: "地区限制或需要登录",
+    FailureKind.UNAVAILABLE: "视频不存在或已删除",
+    FailureKind.DISK: "磁盘错误",
+    FailureKind.UNKNOWN: "未知错误",
+}
+
+_DISK_ERRNOS = {errno.ENOSPC, errno.EDQUOT, errno.EROFS, errno.EFBIG}
+
+# 按顺序匹配错误消息，前面的规则优先
+_MESSAGE_RULES = [
+    (FailureKind.DISK, re.compile(r'No space left|Disk quota|Read-only file system|unable to (?:write|open for writing)', re.I)),
+    (FailureKind.THROTTLED, re.compile(r'HTTP(?: Error)? 429|Too Many Requests|rate.?limit', re.I)),
+    (FailureKind.FORMAT, re.compile(r'Requested format is not available|No video formats found|format .*not available', re.I)),
+    (FailureKind.ACCESS, re.compile(r'geo.?restrict|available in your country|Sign in|\blog ?in\b|members.only|'
+                                    r'Private video|age.restricted|HTTP(?: Error)? 40[13]', re.I)),
+    (FailureKind.UNAVAILABLE, re.compile(r'HTTP(?: Error)? 4(?:04|10)|Video unavailable|has been removed|'
+                                         r'does not exist', re.I)),
+    (FailureKind.NETWORK, re.compile(r'HTTP(?: Error)? 5\d\d|HTTP(?: Error)? 408|timed? ?out|Connection|'
+                                     r'IncompleteRead|ContentTooShort|Temporary failure|Network is unreachable|'
+                                     r'Name or service not known|EOF occurred|Broken pipe|reset by peer|'
+                                     r'exited with code|giving up after|Did not get any data|downloaded file is empty', re.I)),
+]
+
+
+def _exception_chain(exc):
+    """依次返回异常本身、yt-dlp包装的原始异常和__cause__/__context__"""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        yield exc
+        exc_info = getattr(exc, 'exc_info', None)
+        if exc_info and exc_info[1] is not None and id(exc_info[1]) not in seen:
+            exc = exc_info[1]
+        else:
+            exc = exc.__cause__ or exc.__context__
+
+
+def classify_failure(error):
+    """返回错误的FailureKind，error可以是异常或错误消息"""
+    if isinstance(error, BaseException):
+        chain = list(_exception_chain(error))
+        for exc in chain:
+            if isinstance(exc, OSError) and exc.errno in _DISK_ERRNOS:
+                return FailureKind.DISK
+        message = ' | '.join(str(exc) for exc in chain)
+    else:
+        message = str(error)
+    for kind, pattern in _MESSAGE_RULES:
+        if pattern.search(message):
+            return kind
+    return FailureKind.UNKNOWN
+
+
+class RetryPolicy:
+    """
+    按失败类别决定是否重试
+
+    第n次重试前等待 base_delay * 2**(n-1) 秒（不超过max_delay），再乘以 1±jitter 的随机系数，
+    避免多个任务同时重试；限流时从throttled_delay开始退避。未知错误只重试一次。
+    """
+
+    RETRYABLE = (FailureKind.NETWORK, FailureKind.THROTTLED)
+
+    def __init__(self, max_attempts=5, base_delay=2.0, throttled_delay=15.0, max_delay=120.0,
+                 jitter=0.5, max_downgrades=2, random_source=random.random):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.throttled_delay = throttled_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.max_downgrades = max_downgrades
+        self.random_source = random_source
+
+    def should_retry(self, kind, attempt):
+        """attempt为已经失败的次数"""
+        if kind in self.RETRYABLE:
+            return attempt < self.max_attempts
+        if kind == FailureKind.UNKNOWN:
+            return attempt < 2
+        return False
+
+    def delay(self, kind, attempt):
+        base = self.throttled_delay if kind == FailureKind.THROTTLED else self.base_delay
+        delay = min(self.max_delay, base * 2 ** max(0, attempt - 1))
+        return delay * (1 - self.jitter + 2 * self.jitter * self.random_source())
+
+    def sleep_function(self, kind=FailureKind.NETWORK):
+        """给yt-dlp的retry_sleep_functions使用，参数n从0开始"""
+        return lambda n: self.delay(kind, n + 1)
+
+    def wait(self, seconds, checkpoint=None, step=0.25):
+        """等待seconds秒，期间定期调用checkpoint()以便响应取消和暂停"""
+        deadline = time.monotonic() + seconds
+        while True:
+            if checkpoint:
+                checkpoint()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(step, remaining))
@@ -0,0 +1,150 @@
+"""
+FormatRanker的格式选择：用手写的信息字典检查评分规则
+
+运行: python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from format_ranking import FormatRanker, load_rules
+
+MiB = 1024 * 1024
+
+
+def video(format_id, height, vcodec='avc1.640028', fps=30, tbr=None, filesize=None):
+    return {'format_id': format_id, 'height': height, 'vcodec': vcodec, 'acodec': 'none',
+            'fps': fps, 'tbr': tbr, 'filesize': filesize}
+
+
+def audio(format_id, abr=128, acodec='mp4a.40.2', filesize=None):
+    return {'format_id': format_id, 'vcodec': 'none', 'acodec': acodec, 'abr': abr, 'filesize': filesize}
+
+
+def combined(format_id, height, vcodec='avc1.42001E', acodec='mp4a.40.2', fps=30, tbr=None):
+    return {'format_id': format_id, 'height': height, 'vcodec': vcodec, 'acodec': acodec,
+            'fps': fps, 'tbr': tbr}
+
+
+def ranker(**overrides):
+    return FormatRanker(load_rules(overrides=overrides))
+
+
+def test_picks_highest_resolution_with_best_audio():
+    info = {'duration': 60, 'formats': [
+        video('137', 1080), video('136', 720), video('135', 480),
+        audio('140', abr=128), audio('139', abr=48),
+    ]}
+    choice = ranker().select(info)
+    assert choice.format_spec == '137+140/best'
+    assert choice.height == 1080
+
+
+def test_target_height_prefers_closest_and_penalises_above_target():
+    info = {'formats': [video('1080', 1080), video('720', 720), video('480', 480), audio('a')]}
+    assert ranker(target_height=720).select(info).video['format_id'] == '720'
+    # 600p与480p和720p的距离相同，高于目标的格式额外扣分
+    choices = ranker(target_height=600).rank(info)
+    assert [c.video['format_id'] for c in choices[:2]] == ['480', '720']
+
+
+def test_unknown_height_ranks_below_known_height():
+    info = {'formats': [video('unknown', None), video('360', 360), audio('a')]}
+    choices = ranker().rank(info)
+    assert [c.video['format_id'] for c in choices] == ['360', 'unknown']
+    unknown = choices[1]
+    assert unknown.height is None
+    assert unknown.reason.startswith('未知分辨率 avc1')
+
+
+def test_unknown_height_alone_is_still_selected():
+    info = {'formats': [video('only', None), audio('a')]}
+    assert ranker().select(info).format_spec == 'only+a/best'
+
+
+def test_byte_budget_exceeded_ranks_below_unknown_size():
+    # 1080p超出预算3倍，扣分多于无法估算大小的格式
+    info = {'formats': [
+        video('big', 1080, filesize=40 * MiB), video('unknown', 720),
+        audio('a', filesize=MiB),
+    ]}
+    choices = ranker(byte_budget=10 * MiB).rank(info)
+    assert [c.video['format_id'] for c in choices] == ['unknown', 'big']
+    assert choices[0].size is None
+    assert choices[1].size == 41 * MiB
+    assert 'size' in choices[1].reason
+
+
+def test_byte_budget_slightly_exceeded_beats_unknown_size():
+    info = {'formats': [
+        video('fits', 1080, filesize=10 * MiB), video('unknown', 1080),
+        audio('a', filesize=MiB),
+    ]}
+    choices = ranker(byte_budget=10 * MiB).rank(info)
+    assert [c.video['format_id'] for c in choices] == ['fits', 'unknown']
+    assert choices[0].size == 11 * MiB
+
+
+def test_byte_budget_uses_bitrate_and_duration():
+    # 没有filesize时按码率和时长估算：4000kbps * 100秒 = 50MB
+    info = {'duration': 100, 'formats': [
+        video('1080', 1080, tbr=4000), video('480', 480, tbr=800), audio('a', abr=128),
+    ]}
+    choices = ranker(byte_budget=20 * 1000 * 1000).rank(info)
+    assert choices[0].video['format_id'] == '480'
+    assert choices[0].size == 800 * 125 * 100 + 128 * 125 * 100
+    assert ranker().select(info).video['format_id'] == '1080'
+
+
+def test_codec_cost_prefers_cheaper_decoder():
+    info = {'formats': [
+        video('vp9', 1080, vcodec='vp09.00.40.08'), video('av1', 1080, vcodec='av01.0.08M.08'),
+        video('h264', 1080, vcodec='avc1.640028'), audio('a'),
+    ]}
+    assert [c.video['format_id'] for c in ranker().rank(info)] == ['h264', 'vp9', 'av1']
+    cheap_vp9 = ranker(codec_cost={'vp09': 0, 'avc1': 5})
+    assert cheap_vp9.select(info).video['format_id'] == 'vp9'
+
+
+def test_max_fps_penalises_high_frame_rate():
+    info = {'formats': [video('60', 1080, fps=60), video('30', 1080, fps=30), audio('a')]}
+    choices = ranker(max_fps=30).rank(info)
+    assert [c.video['format_id'] for c in choices] == ['30', '60']
+    assert choices[1].score - choices[0].score == 1.0
+    assert 'fps 1.00' in choices[1].reason
+    # 不限制帧率时两者得分相同
+    unlimited = ranker().rank(info)
+    assert unlimited[0].score == unlimited[1].score
+
+
+def test_combined_only_formats():
+    info = {'formats': [combined('22', 720), combined('18', 360)]}
+    choice = ranker().select(info)
+    assert choice.audio is None
+    assert choice.format_spec == '22/best'
+
+
+def test_combined_only_option_skips_split_formats():
+    info = {'formats': [video('137', 1080), audio('140'), combined('18', 360)]}
+    assert ranker().select(info).format_spec == '137+140/best'
+    choices = ranker().rank(info, combined_only=True)
+    assert [c.format_spec for c in choices] == ['18/best']
+
+
+def test_no_formats():
+    assert ranker().select({'formats': []}) is None
+    assert ranker().select({}) is None
+    # 只有视频、没有音频时不组合
+    assert ranker().select({'formats': [video('137', 1080)]}) is None
+
+
+def test_reason_text():
+    info = {'formats': [video('137', 1080, fps=30, filesize=50 * MiB), audio('140', abr=128, filesize=2 * MiB)]}
+    assert ranker().select(info).reason == '1080p avc1 30fps + mp4a 128kbps，预计52.0MiB'
+
+    info = {'formats': [video('137', 1080, fps=60), audio('140', abr=64, acodec='opus')]}
+    reason = ranker(target_height=720, max_fps=30, byte_budget=MiB).select(info).reason
+    assert reason.startswith('1080p avc1 60fps + opus 64kbps，预计未知大小（扣分: ')
+    for penalty in ('resolution 5.40', 'fps 1.00', 'audio 1.50', 'size 2.00'):
+        assert penalty in reason
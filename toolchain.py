@@ -0,0 +1,198 @@
+"""
+FFmpeg工具链的能力探测，整个程序共享一份结果
+
+可执行文件的路径和版本、可用的编码器、解码器和硬件加速方式只探测一次，
+下载、后期处理和播放都从这里查询，不再为每个任务启动ffmpeg子进程。
+路径每隔一段时间重新查找一次（只查找PATH，不启动进程），ffmpeg被安装、升级或删除后自动重新探测。
+"""
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+# 转码为mp4时依次尝试的视频编码器：软件编码器优先，硬件编码器编译进了ffmpeg不代表本机可用；
+# 都没有时使用ffmpeg内置的mpeg4
+MP4_VIDEO_ENCODERS = ('libx264', 'libopenh264', 'h264_videotoolbox', 'h264_nvenc', 'h264_qsv',
+                      'h264_amf', 'h264_mf', 'mpeg4')
+AAC_ENCODERS = ('aac', 'libfdk_aac', 'aac_at')
+
+
+def _run(cmd):
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, errors='replace', timeout=15)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def _parse_codec_list(output):
+    """解析 ffmpeg -encoders / -decoders 的输出，返回名称集合"""
+    names = set()
+    started = False
+    for line in (output or '').splitlines():
+        if line.strip().startswith('------'):
+            started = True
+            continue
+        parts = line.split()
+        if started and len(parts) >= 2:
+            names.add(parts[1])
+    return names
+
+
+def _parse_hwaccels(output):
+    lines = (output or '').splitlines()
+    for i, line in enumerate(lines):
+        if line.startswith('Hardware acceleration methods'):
+            return [name.strip() for name in lines[i + 1:] if name.strip()]
+    return []
+
+
+class Toolchain:
+    """
+    ffmpeg/ffprobe的路径、版本和能力
+
+    available、version只需要一次 ffmpeg -version；encoders、decoders、hwaccels第一次用到时才探测。
+    """
+
+    def __init__(self, ffmpeg='ffmpeg', ffprobe='ffprobe', recheck_interval=30.0,
+                 time_source=time.monotonic):
+        self.ffmpeg_name = ffmpeg
+        self.ffprobe_name = ffprobe
+        self.recheck_interval = recheck_interval
+        self.time_source = time_source
+        self._lock = threading.RLock()
+        self._checked_at = None
+        self._identity = None
+        self._cache = {}
+        self.probes = 0  # 启动子进程的次数
+
+    def _locate(self):
+        """按名称查找可执行文件，返回 (ffmpeg路径, ffprobe路径, 修改时间)"""
+        ffmpeg = shutil.which(self.ffmpeg_name)
+        ffprobe = None
+        if ffmpeg:
+            # 优先使用与ffmpeg同一目录下的ffprobe
+            sibling = os.path.join(os.path.dirname(ffmpeg), os.path.basename(self.ffprobe_name))
+            ffprobe = shutil.which(sibling) or shutil.which(self.ffprobe_name)
+        try:
+            mtime = os.path.getmtime(ffmpeg) if ffmpeg else None
+        except OSError:
+            mtime = None
+        return ffmpeg, ffprobe, mtime
+
+    def _refresh(self):
+        """调用方须持有锁；可执行文件变化后丢弃之前的探测结果"""
+        now = self.time_source()
+        if self._checked_at is not None and now - self._checked_at < self.recheck_interval:
+            return
+        self._checked_at = now
+        identity = self._locate()
+        if identity != self._identity:
+            self._identity = identity
+            self._cache = {}
+
+    def _probe(self, key, args, parse):
+        with self._lock:
+            self._refresh()
+            if key not in self._cache:
+                ffmpeg = self._identity[0]
+                output = None
+                if ffmpeg:
+                    self.probes += 1
+                    output = _run([ffmpeg, '-hide_banner'] + args)
+                self._cache[key] = parse(output)
+            return self._cache[key]
+
+    def refresh(self):
+        """立即重新查找并丢弃探测结果（例如用户刚安装了ffmpeg）"""
+        with self._lock:
+            self._checked_at = None
+            self._identity = None
+            self._refresh()
+
+    @property
+    def ffmpeg_path(self):
+        with self._lock:
+            self._refresh()
+            return self._identity[0] if self.available else None
+
+    @property
+    def ffprobe_path(self):
+        with self._lock:
+            self._refresh()
+            return self._identity[1]
+
+    @property
+    def version(self):
+        """ffmpeg版本字符串，不可用时为None"""
+        def parse(output):
+            match = re.search(r'version (\S+)', output or '')
+            return match.group(1) if match else None
+        return self._probe('version', ['-version'], parse)
+
+    @property
+    def available(self):
+        return self.version is not None
+
+    @property
+    def encoders(self):
+        return self._probe('encoders', ['-encoders'], _parse_codec_list)
+
+    @property
+    def decoders(self):
+        return self._probe('decoders', ['-decoders'], _parse_codec_list)
+
+    @property
+    def hwaccels(self):
+        return self._probe('hwaccels', ['-hwaccels'], _parse_hwaccels)
+
+    def has_encoder(self, name):
+        return name in self.encoders
+
+    def has_decoder(self, name):
+        return name in self.decoders
+
+    def pick_encoder(self, candidates):
+        """返回candidates中第一个可用的编码器，都不可用时返回None"""
+        encoders = self.encoders
+        for name in candidates:
+            if name in encoders:
+                return name
+        return None
+
+    def warm_up(self):
+        """在后台线程中探测全部能力，之后的查询不再启动子进程"""
+        def probe():
+            if self.available:
+                self.encoders, self.decoders, self.hwaccels
+        thread = threading.Thread(target=probe, daemon=True, name="toolchain-probe")
+        thread.start()
+        return thread
+
+    def summary(self):
+        available = self.available
+        return {
+            'ffmpeg': self.ffmpeg_path,
+            'ffprobe': self.ffprobe_path,
+            'version': self.version,
+            'video_encoder': self.pick_encoder(MP4_VIDEO_ENCODERS) if available else None,
+            'aac_encoder': self.pick_encoder(AAC_ENCODERS) if available else None,
+            'encoders': len(self.encoders) if available else 0,
+            'decoders': len(self.decoders) if available else 0,
+            'hwaccels': self.hwaccels if available else [],
+        }
+
+
+_toolchain = None
+_toolchain_lock = threading.Lock()
+
+
+def get_toolchain():
+    """程序共享的Toolchain"""
+    global _toolchain
+    with _toolchain_lock:
+        if _toolchain is None:
+            _toolchain = Toolchain()
+        return _toolchain